@@ -2,13 +2,15 @@
 Agent communication protocol for inter-agent messaging and coordination.
 """
 
+import os
 import asyncio
 import logging
+import itertools
 from typing import Dict, List, Optional, Any, Callable, Awaitable
 from datetime import datetime, timedelta
 from enum import Enum
 from dataclasses import dataclass
-from collections import defaultdict, deque
+from collections import defaultdict
 
 from .base import AgentMessage, AgentType, BaseAgent
 from .registry import get_agent_registry
@@ -38,6 +40,15 @@ class MessagePriority(str, Enum):
     URGENT = "urgent"
 
 
+# Queue order of the priorities (lower is handled first)
+PRIORITY_ORDER = {
+    MessagePriority.URGENT.value: 0,
+    MessagePriority.HIGH.value: 1,
+    MessagePriority.NORMAL.value: 2,
+    MessagePriority.LOW.value: 3
+}
+
+
 @dataclass
 class MessageHandler:
     """Handler for specific message types."""
@@ -47,16 +58,33 @@ class MessageHandler:
 
 
 class CommunicationProtocol:
-    """Protocol for managing inter-agent communication."""
+    """
+    Protocol for managing inter-agent communication.
+    
+    Messages wait in a priority queue (urgent first, FIFO within a priority) that
+    a pool of worker tasks drains as soon as a message arrives. A sender awaiting
+    a response waits on a future of its message, which the worker resolves with
+    the handler's answer, or with None when there is nobody to answer.
+    """
     
-    def __init__(self):
+    def __init__(self, workers: int = 4):
+        """
+        Initialize the protocol.
+        
+        Args:
+            workers: Number of messages handled concurrently
+        """
         self.registry = get_agent_registry()
+        self.workers = workers
         self._message_handlers: Dict[str, Dict[MessageType, MessageHandler]] = defaultdict(dict)
-        self._message_queue: deque = deque()
-        self._pending_responses: Dict[str, AgentMessage] = {}
+        self._message_queue: Optional[asyncio.PriorityQueue] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._sequence = itertools.count()
+        self._pending_responses: Dict[str, asyncio.Future] = {}
         self._conversation_threads: Dict[str, List[AgentMessage]] = defaultdict(list)
         self._is_running = False
-        self._processing_task: Optional[asyncio.Task] = None
+        self._worker_tasks: List[asyncio.Task] = []
+        self._messages_processed = 0
     
     def register_handler(self, 
                         agent_id: str, 
@@ -140,14 +168,20 @@ class CommunicationProtocol:
             thread_id = f"{from_agent}-{to_agent}"
             self._conversation_threads[thread_id].append(message)
             
+            # Register the response future before a worker can pick the message up
+            response_future = None
+            if requires_response:
+                response_future = asyncio.get_running_loop().create_future()
+                self._pending_responses[message.message_id] = response_future
+            
             # Queue the message for processing
-            self._message_queue.append(message)
+            self._enqueue(message)
             
             logger.debug(f"Queued message from {from_agent} to {to_agent}: {message_type}")
             
             # If response is required, wait for it
-            if requires_response:
-                return await self._wait_for_response(message, timeout_seconds or 30)
+            if response_future is not None:
+                return await self._wait_for_response(message, response_future, timeout_seconds or 30)
             
             return None
             
@@ -325,50 +359,56 @@ class CommunicationProtocol:
             logger.error(f"Failed to request capability {capability_name} from {from_agent}: {e}")
             return None
     
-    async def _wait_for_response(self, original_message: AgentMessage, timeout_seconds: int) -> Optional[AgentMessage]:
-        """Wait for a response to a message."""
+    def _queue(self) -> asyncio.PriorityQueue:
+        """The message queue of the running event loop, carrying over messages queued on another loop."""
+        loop = asyncio.get_running_loop()
+        if self._message_queue is None or self._loop is not loop:
+            queue = asyncio.PriorityQueue()
+            while self._message_queue is not None and not self._message_queue.empty():
+                queue.put_nowait(self._message_queue.get_nowait())
+            self._message_queue = queue
+            self._loop = loop
+        return self._message_queue
+    
+    def _enqueue(self, message: AgentMessage) -> None:
+        """Queue a message by its priority, keeping send order within a priority."""
+        rank = PRIORITY_ORDER.get(message.metadata.get("priority"), PRIORITY_ORDER[MessagePriority.NORMAL.value])
+        self._queue().put_nowait((rank, next(self._sequence), message))
+    
+    async def _wait_for_response(self,
+                                 original_message: AgentMessage,
+                                 response_future: asyncio.Future,
+                                 timeout_seconds: int) -> Optional[AgentMessage]:
+        """Wait for the future of a message to be resolved with its response."""
         try:
-            # Store the message as pending
-            self._pending_responses[original_message.message_id] = original_message
-            
-            # Wait for response with timeout
-            start_time = datetime.utcnow()
-            while (datetime.utcnow() - start_time).total_seconds() < timeout_seconds:
-                # Check if response has arrived
-                response_key = f"response_to_{original_message.message_id}"
-                if response_key in self._pending_responses:
-                    response = self._pending_responses.pop(response_key)
-                    self._pending_responses.pop(original_message.message_id, None)
-                    return response
-                
-                await asyncio.sleep(0.1)  # Small delay to prevent busy waiting
-            
-            # Timeout occurred
-            self._pending_responses.pop(original_message.message_id, None)
+            return await asyncio.wait_for(response_future, timeout_seconds)
+        except asyncio.TimeoutError:
             logger.warning(f"Response timeout for message {original_message.message_id}")
             return None
-            
         except Exception as e:
             logger.error(f"Error waiting for response: {e}")
             return None
+        finally:
+            self._pending_responses.pop(original_message.message_id, None)
     
-    async def _process_message_queue(self) -> None:
-        """Process messages in the queue."""
-        while self._is_running:
+    def _resolve_response(self, message: AgentMessage, response: Optional[AgentMessage]) -> None:
+        """Hand a response (or None when there is none) to the sender waiting for it."""
+        future = self._pending_responses.get(message.message_id)
+        if future is not None and not future.done():
+            future.set_result(response)
+    
+    async def _worker(self, queue: asyncio.PriorityQueue) -> None:
+        """Handle messages as they arrive until cancelled."""
+        while True:
+            _, _, message = await queue.get()
             try:
-                if not self._message_queue:
-                    await asyncio.sleep(0.1)
-                    continue
-                
-                # Get next message (priority queue would be better for production)
-                message = self._message_queue.popleft()
-                
-                # Process the message
                 await self._handle_message(message)
-                
             except Exception as e:
                 logger.error(f"Error processing message queue: {e}")
-                await asyncio.sleep(1)  # Prevent tight error loop
+                self._resolve_response(message, None)
+            finally:
+                self._messages_processed += 1
+                queue.task_done()
     
     async def _handle_message(self, message: AgentMessage) -> None:
         """Handle a single message."""
@@ -377,6 +417,7 @@ class CommunicationProtocol:
             target_agent = self.registry.get_agent(message.to_agent)
             if not target_agent:
                 logger.warning(f"Target agent {message.to_agent} not found for message")
+                self._resolve_response(message, None)
                 return
             
             # Deliver message to target agent
@@ -394,9 +435,7 @@ class CommunicationProtocol:
                     
                     # If handler returned a response and original message required one
                     if response and message.requires_response:
-                        # Store the response
-                        response_key = f"response_to_{message.message_id}"
-                        self._pending_responses[response_key] = response
+                        self._resolve_response(message, response)
                         
                         # Add to conversation thread
                         thread_id = f"{message.to_agent}-{message.from_agent}"
@@ -415,13 +454,15 @@ class CommunicationProtocol:
                             metadata={"error": True, "original_message_id": message.message_id}
                         )
                         
-                        response_key = f"response_to_{message.message_id}"
-                        self._pending_responses[response_key] = error_response
+                        self._resolve_response(message, error_response)
             
+            # Nobody answered: release the sender instead of letting it time out
+            self._resolve_response(message, None)
             logger.debug(f"Processed message from {message.from_agent} to {message.to_agent}")
             
         except Exception as e:
             logger.error(f"Error handling message: {e}")
+            self._resolve_response(message, None)
     
     async def start(self) -> None:
         """Start the communication protocol."""
@@ -430,8 +471,12 @@ class CommunicationProtocol:
             return
         
         self._is_running = True
-        self._processing_task = asyncio.create_task(self._process_message_queue())
-        logger.info("Started communication protocol")
+        queue = self._queue()
+        self._worker_tasks = [
+            asyncio.create_task(self._worker(queue), name=f"agent-messages-{i}")
+            for i in range(self.workers)
+        ]
+        logger.info(f"Started communication protocol with {self.workers} workers")
     
     async def stop(self) -> None:
         """Stop the communication protocol."""
@@ -440,15 +485,36 @@ class CommunicationProtocol:
         
         self._is_running = False
         
-        if self._processing_task:
-            self._processing_task.cancel()
-            try:
-                await self._processing_task
-            except asyncio.CancelledError:
-                pass
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+        
+        # Messages still queued stay queued for the next start; their senders stop waiting
+        for future in self._pending_responses.values():
+            if not future.done():
+                future.set_result(None)
         
         logger.info("Stopped communication protocol")
     
+    async def join(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until every queued message has been handled.
+        
+        Args:
+            timeout: Maximum seconds to wait (None waits indefinitely)
+            
+        Returns:
+            True if the queue drained, False on timeout
+        """
+        if self._message_queue is None:
+            return True
+        try:
+            await asyncio.wait_for(self._message_queue.join(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+    
     def get_conversation_history(self, agent1: str, agent2: str) -> List[AgentMessage]:
         """Get conversation history between two agents."""
         thread1 = f"{agent1}-{agent2}"
@@ -466,7 +532,9 @@ class CommunicationProtocol:
         """Get communication protocol statistics."""
         return {
             "is_running": self._is_running,
-            "queue_size": len(self._message_queue),
+            "workers": len(self._worker_tasks),
+            "queue_size": self._message_queue.qsize() if self._message_queue is not None else 0,
+            "messages_processed": self._messages_processed,
             "pending_responses": len(self._pending_responses),
             "conversation_threads": len(self._conversation_threads),
             "registered_handlers": sum(len(handlers) for handlers in self._message_handlers.values()),
@@ -502,7 +570,9 @@ def get_communication_protocol() -> CommunicationProtocol:
     global _communication_protocol
     
     if _communication_protocol is None:
-        _communication_protocol = CommunicationProtocol()
+        _communication_protocol = CommunicationProtocol(
+            workers=int(os.getenv("COMMUNICATION_WORKERS", "4"))
+        )
     
     return _communication_protocol
 
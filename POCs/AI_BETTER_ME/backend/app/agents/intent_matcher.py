@@ -0,0 +1,107 @@
+"""
+Single-pass keyword matcher for pattern-based intent classification.
+"""
+import re
+import logging
+from typing import Dict, Any, Hashable, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Intent patterns of the form \b(term|term|...)\b with literal terms
+_KEYWORD_PATTERN = re.compile(r"^\\b\((?P<terms>[\w\s|'-]+)\)\\b$")
+
+
+class IntentPatternMatcher:
+    """
+    Counts intent pattern hits per label with one scan over the input.
+
+    Every pattern shaped like \\b(term|term|...)\\b contributes its literal terms to
+    one combined, case-insensitive alternation, ordered longest first so a phrase
+    such as "meal planning" wins over "meal" at the same position. The hits each
+    term stands for are precomputed when the matcher is built by running every
+    original pattern over the term itself, so a phrase also scores the shorter
+    terms it contains ("meal planning" counts for both "meal" and "meal planning")
+    and a term listed under several labels scores for each of them, as one findall
+    per pattern would. Only two phrases that partially overlap in the text ("x y"
+    and "y z" in "x y z") differ: the scan counts the one that starts first.
+
+    Patterns of any other shape are kept as separately compiled regexes and
+    scanned one by one.
+    """
+
+    def __init__(self, patterns: Dict[Hashable, List[str]]):
+        """
+        Compile the patterns.
+
+        Args:
+            patterns: Regex patterns per label (e.g. per agent type)
+        """
+        self.labels = list(patterns)
+        terms = set()
+        keyword_patterns: List[Tuple[Hashable, "re.Pattern"]] = []
+        self._fallback: List[Tuple[Hashable, "re.Pattern"]] = []
+
+        for label, label_patterns in patterns.items():
+            for pattern in label_patterns:
+                regex = self._compile(pattern)
+                keywords = _KEYWORD_PATTERN.match(pattern)
+                if keywords:
+                    terms.update(term.strip().lower() for term in keywords.group("terms").split("|") if term.strip())
+                    keyword_patterns.append((label, regex))
+                else:
+                    self._fallback.append((label, regex))
+
+        # Case-folded term -> [(label, hits)] from every keyword pattern, found by matching the term alone
+        self._term_hits: Dict[str, List[Tuple[Hashable, int]]] = {}
+        for term in terms:
+            hits: Dict[Hashable, int] = {}
+            for label, regex in keyword_patterns:
+                found = len(regex.findall(term))
+                if found:
+                    hits[label] = hits.get(label, 0) + found
+            self._term_hits[term.casefold()] = list(hits.items())
+
+        alternation = "|".join(re.escape(term) for term in sorted(terms, key=len, reverse=True))
+        self._combined = re.compile(rf"\b(?:{alternation})\b", flags=re.IGNORECASE) if terms else None
+
+    @staticmethod
+    def _compile(pattern: str) -> "re.Pattern":
+        """Compile a pattern case-insensitively, treating an invalid regex as a literal."""
+        try:
+            return re.compile(pattern, flags=re.IGNORECASE)
+        except re.error:
+            logger.warning(f"Invalid intent pattern, matching it literally: {pattern}")
+            return re.compile(re.escape(pattern), flags=re.IGNORECASE)
+
+    def match(self, text: str) -> Dict[Hashable, Dict[str, Any]]:
+        """
+        Count pattern hits in a text.
+
+        Args:
+            text: Text to classify
+
+        Returns:
+            Labels with at least one hit, in pattern order, each with its "score"
+            (number of hits) and the matched "matches" in text order
+        """
+        scores: Dict[Hashable, int] = {}
+        matches: Dict[Hashable, List[str]] = {}
+
+        if self._combined is not None:
+            for found in self._combined.finditer(text):
+                word = found.group()
+                # The regex matches under Unicode case folding ("ſleep" for "sleep"), so look up the folded word
+                for label, hits in self._term_hits.get(word.casefold(), ()):
+                    scores[label] = scores.get(label, 0) + hits
+                    matches.setdefault(label, []).append(word)
+
+        for label, regex in self._fallback:
+            found = regex.findall(text)
+            if found:
+                scores[label] = scores.get(label, 0) + len(found)
+                matches.setdefault(label, []).extend(map(str, found))
+
+        return {
+            label: {"score": scores[label], "matches": matches[label]}
+            for label in self.labels if label in scores
+        }
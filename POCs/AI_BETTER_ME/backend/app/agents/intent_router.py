@@ -0,0 +1,271 @@
+"""
+Embedding-based nearest-centroid intent router with online updates.
+"""
+import os
+import json
+import asyncio
+import logging
+import threading
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Labelled seed examples (agent type value, message), starting from the intent classification script's cases
+SEED_EXAMPLES: List[Tuple[str, str]] = [
+    ("health", "Help with Meal Planning for Next Week"),
+    ("health", "Create a workout routine I can do at home"),
+    ("health", "How can I sleep better at night?"),
+    ("health", "Give me some healthy dinner recipes"),
+    ("health", "I want to build a daily meditation habit"),
+    ("productivity", "I need to organize my tasks for the project deadline"),
+    ("productivity", "Help me prioritize my todo list"),
+    ("productivity", "How do I stay focused while working from home?"),
+    ("productivity", "Break my quarterly goal into milestones"),
+    ("productivity", "Improve my team's workflow for code reviews"),
+    ("finance", "Track my monthly expenses and create a budget"),
+    ("finance", "How much should I save for retirement?"),
+    ("finance", "Should I pay off my credit card debt or invest?"),
+    ("finance", "Help me cut my spending on subscriptions"),
+    ("finance", "Plan a savings goal for a new car"),
+    ("scheduling", "Schedule a meeting with my team for next Tuesday"),
+    ("scheduling", "Book a dentist appointment for Friday morning"),
+    ("scheduling", "When am I free this week?"),
+    ("scheduling", "Reschedule my call with Sarah to tomorrow"),
+    ("scheduling", "Set a reminder for my mom's birthday"),
+    ("journal", "I want to reflect on my progress this week"),
+    ("journal", "Help me write a gratitude journal entry"),
+    ("journal", "I've been feeling anxious lately and want to process it"),
+    ("journal", "Look back at what I learned this month"),
+    ("journal", "Celebrate a personal milestone I reached today"),
+    ("general", "What's the weather like today?"),
+    ("general", "Tell me a fun fact"),
+    ("general", "What's the capital of Australia?"),
+    ("general", "Hi, how are you?"),
+]
+
+
+class EmbeddingIntentRouter:
+    """
+    Routes a message to the label whose centroid is closest to its embedding.
+
+    Each label's centroid is the mean of its examples' unit-normalized embeddings,
+    updated online as examples arrive; once a label has max_weight examples the
+    mean turns into an exponential moving average, so centroids follow how users
+    actually phrase requests. A route is confident when the best cosine similarity
+    is at least min_similarity and beats the runner-up by min_margin; otherwise the
+    caller should fall back to a slower classifier (the LLM).
+
+    Centroids are only comparable with embeddings from the model that built them,
+    so the router records that model's embedding namespace when it is seeded and
+    callers must reseed it when the namespace changes (two models can share a
+    dimension, so route() cannot tell). Learned examples are appended to a JSONL
+    log (label and text, not the embedding) and replayed on every seeding, so they
+    survive restarts and are re-embedded by the new model after a switch.
+    """
+
+    def __init__(
+        self,
+        min_margin: float = 0.05,
+        min_similarity: float = 0.3,
+        max_weight: int = 500,
+        log_path: Optional[str] = None,
+        max_logged_examples: int = 1000
+    ):
+        """
+        Initialize the router.
+
+        Args:
+            min_margin: Minimum lead of the best label's similarity over the runner-up
+            min_similarity: Minimum cosine similarity to the best centroid
+            max_weight: Number of examples after which a centroid becomes a moving average
+            log_path: JSONL file of learned examples, or None to keep them in memory only
+            max_logged_examples: Most recent logged examples replayed (and kept in the log) when seeding
+        """
+        self.min_margin = min_margin
+        self.min_similarity = min_similarity
+        self.max_weight = max_weight
+        self.log_path = log_path
+        self.max_logged_examples = max_logged_examples
+
+        self._sums: Dict[str, np.ndarray] = {}
+        self._counts: Dict[str, int] = {}
+        self._labels: List[str] = []
+        self._matrix: Optional[np.ndarray] = None
+        self.namespace: Optional[str] = None
+        self._log_lock = threading.Lock()
+        self._stats = {"confident": 0, "deferred": 0, "learned": 0}
+
+    @property
+    def ready(self) -> bool:
+        """Whether there are at least two labels to choose between."""
+        return len(self._sums) >= 2
+
+    @property
+    def dimension(self) -> Optional[int]:
+        """Embedding dimension of the centroids (None before any example)."""
+        return next(iter(self._sums.values())).shape[0] if self._sums else None
+
+    async def seed(self,
+                   examples: Sequence[Tuple[str, str]],
+                   embed: Callable[[List[str]], Awaitable[Any]],
+                   namespace: Optional[str] = None) -> None:
+        """
+        Rebuild the centroids from labelled examples plus the logged ones.
+
+        The log is read, and trimmed to max_logged_examples records, in a worker thread.
+
+        Args:
+            examples: (label, text) pairs
+            embed: Coroutine function embedding a list of texts into one row per text
+            namespace: Embedding namespace (model) of embed, recorded with the centroids
+        """
+        labelled = list(examples) + await asyncio.to_thread(self._load_log)
+        embeddings = await embed([text for _, text in labelled])
+
+        self._sums, self._counts = {}, {}
+        self._matrix = None
+        for (label, _), embedding in zip(labelled, embeddings):
+            if embedding is not None:
+                self.add_example(label, embedding)
+        self.namespace = namespace
+        logger.info(f"Intent router seeded with {len(labelled)} examples across {len(self._sums)} labels")
+
+    def add_example(self, label: str, embedding: Sequence[float]) -> bool:
+        """
+        Fold one labelled embedding into its label's centroid.
+
+        Args:
+            label: Label of the example
+            embedding: Embedding of the example's text
+
+        Returns:
+            False if the embedding was rejected (zero vector or wrong dimension)
+        """
+        vector = self._unit(embedding)
+        if vector is None or (self.dimension is not None and vector.shape[0] != self.dimension):
+            return False
+
+        if label not in self._sums:
+            self._sums[label] = np.zeros_like(vector)
+            self._counts[label] = 0
+        if self._counts[label] >= self.max_weight:
+            self._sums[label] *= 1.0 - 1.0 / self.max_weight
+        else:
+            self._counts[label] += 1
+        self._sums[label] += vector
+        self._matrix = None
+        return True
+
+    async def learn(self, label: str, text: str, embedding: Sequence[float]) -> bool:
+        """
+        Learn from a routing decision made elsewhere (e.g. by the LLM) and log it.
+
+        The centroid is updated at once; the log is appended to in a worker thread.
+
+        Args:
+            label: Label the message was routed to
+            text: The message
+            embedding: Embedding of the message
+
+        Returns:
+            Whether the example was accepted
+        """
+        if not self.add_example(label, embedding):
+            return False
+        self._stats["learned"] += 1
+        if self.log_path:
+            await asyncio.to_thread(self._append_log, label, text)
+        return True
+
+    def _append_log(self, label: str, text: str) -> None:
+        """Append one example to the JSONL log (blocking file I/O, run off the event loop)."""
+        try:
+            with self._log_lock:
+                os.makedirs(os.path.dirname(self.log_path) or ".", exist_ok=True)
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps({"label": label, "text": text}) + "\n")
+        except OSError as e:
+            logger.warning(f"Failed to log routing example: {e}")
+
+    def route(self, embedding: Sequence[float]) -> Optional[Dict[str, Any]]:
+        """
+        Find the nearest centroid.
+
+        Args:
+            embedding: Embedding of the message
+
+        Returns:
+            Dict with label, similarity, margin and confident, or None when the router
+            is not ready or the embedding is unusable
+        """
+        vector = self._unit(embedding)
+        if not self.ready or vector is None or vector.shape[0] != self.dimension:
+            return None
+
+        if self._matrix is None:
+            self._labels = list(self._sums)
+            self._matrix = np.vstack([self._unit(self._sums[label]) for label in self._labels])
+        scores = self._matrix @ vector
+        order = np.argsort(scores)[::-1]
+        best, runner_up = float(scores[order[0]]), float(scores[order[1]])
+        confident = best >= self.min_similarity and best - runner_up >= self.min_margin
+
+        self._stats["confident" if confident else "deferred"] += 1
+        return {
+            "label": self._labels[order[0]],
+            "similarity": best,
+            "margin": best - runner_up,
+            "confident": confident
+        }
+
+    def _load_log(self) -> List[Tuple[str, str]]:
+        """
+        Most recent logged (label, text) examples, trimming the log down to them.
+
+        Only the last max_logged_examples records are ever replayed, so older and torn
+        lines are dropped from the file instead of being read again on every seeding.
+        Blocking file I/O, run off the event loop.
+        """
+        if not self.log_path:
+            return []
+        examples: Deque[Tuple[str, str]] = deque(maxlen=self.max_logged_examples)
+        try:
+            with self._log_lock:
+                if not os.path.exists(self.log_path):
+                    return []
+                lines = 0
+                with open(self.log_path, encoding="utf-8") as f:
+                    for line in f:
+                        lines += 1
+                        try:
+                            record = json.loads(line)
+                            examples.append((record["label"], record["text"]))
+                        except (json.JSONDecodeError, KeyError, TypeError):
+                            continue  # Torn or foreign line
+                if lines > len(examples):
+                    temp_path = f"{self.log_path}.tmp"
+                    with open(temp_path, "w", encoding="utf-8") as f:
+                        for label, text in examples:
+                            f.write(json.dumps({"label": label, "text": text}) + "\n")
+                    os.replace(temp_path, self.log_path)
+        except OSError as e:
+            logger.warning(f"Failed to read routing examples: {e}")
+        return list(examples)
+
+    @staticmethod
+    def _unit(vector: Sequence[float]) -> Optional[np.ndarray]:
+        """Normalize a vector, or None for a zero vector (e.g. a dummy embedding)."""
+        array = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(array)
+        return array / norm if norm else None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get centroid sizes and routing outcome counters."""
+        return {
+            **self._stats,
+            "namespace": self.namespace,
+            "labels": dict(self._counts)
+        }
@@ -1,19 +1,26 @@
 """
 Main Orchestrator Agent - Primary coordinator for the AI agent ecosystem.
 """
-import logging
+import os
 import re
-from typing import Dict, Any, Optional, List
+import time
+import asyncio
+import logging
+from typing import Dict, Any, Optional, List, Tuple
 from datetime import datetime
 from langchain_core.messages import HumanMessage, AIMessage
 from .base import BaseAgent, AgentType, AgentCapability, AgentState
 from .prompts import PromptLibrary, get_agent_prompt
 from .registry import get_agent_registry
 from .communication import get_communication_protocol, MessageType
+from .intent_matcher import IntentPatternMatcher
+from .intent_router import EmbeddingIntentRouter, SEED_EXAMPLES
 from ..llm.service import get_llm_service
 from ..llm.base import CompletionRequest, ChatMessage
 from ..services.knowledge_base import get_knowledge_base_service
-from ..services.interaction_recorder import get_interaction_recorder
+from ..services.post_processing import get_post_processing_pipeline
+from ..services.events import emit_event, stream_completion, suppress_answer_tokens, ROUTING_EVENT
+from ..langgraph.formatting import analyze_response_quality
 logger = logging.getLogger(__name__)
 
 class OrchestratorAgent(BaseAgent):
@@ -96,6 +103,22 @@ class OrchestratorAgent(BaseAgent):
                 r'\b(progress|development|self-improvement|personal growth)\b'
             ]
         }
+        self._intent_matcher = IntentPatternMatcher(self.intent_patterns)
+        
+        # Nearest-centroid router over the query embedding; the LLM is only asked when it is unsure
+        self._intent_router = EmbeddingIntentRouter(
+            min_margin=float(os.getenv("INTENT_ROUTER_MIN_MARGIN", "0.05")),
+            log_path=os.getenv("INTENT_ROUTER_LOG_PATH", "data/routing_examples.jsonl") or None
+        )
+        self._router_seeding: Optional[asyncio.Task] = None
+        self._router_seeding_namespace: Optional[str] = None
+        self._router_retry_at = 0.0
+        self._learning_tasks = set()
+        
+        # Cross-domain requests fan out to several specialists at once
+        self.fan_out_timeout = float(os.getenv("ORCHESTRATOR_FAN_OUT_TIMEOUT", "20"))
+        self.fan_out_max_agents = int(os.getenv("ORCHESTRATOR_FAN_OUT_MAX_AGENTS", "3"))
+        self._speculative_tasks = set()
     
     async def execute(self, state: AgentState):
         """Execute the orchestrator's main logic. Returns dict to merge into state for LangGraph workflow."""
@@ -135,21 +158,17 @@ class OrchestratorAgent(BaseAgent):
                     "agent": agent_id
                 }
 
-            # Robustly get user preferences
-            try:
-                user_preferences = await self.knowledge_base.get_user_preferences()
-                if hasattr(user_preferences, "model_dump"):
-                    user_preferences_dict = user_preferences.model_dump()
-                elif isinstance(user_preferences, dict):
-                    user_preferences_dict = user_preferences
-                else:
-                    user_preferences_dict = {}
-            except Exception as e:
-                logger.warning(f"Failed to parse stored preferences: {e}. Using defaults.")
-                user_preferences_dict = {}
+            # Start context retrieval speculatively: it does not depend on the routing
+            # decision, so the embedding call runs while the intent is being classified
+            prefetch = self._start_prefetch(user_input)
+
+            # Cross-domain requests go to every relevant specialist in parallel
+            required_agents = self._detect_required_agents(user_input)
+            if len(required_agents) > 1:
+                return await self._execute_fan_out(user_input, context, required_agents, await prefetch)
 
             # Classify intent
-            intent_result = await self._classify_intent(user_input, context)
+            intent_result = await self._classify_intent(user_input, context, prefetch)
             target_agent_type = intent_result.get("agent_type")
             confidence = intent_result.get("confidence", 0.0)
 
@@ -168,8 +187,15 @@ class OrchestratorAgent(BaseAgent):
                 ]
             }
 
+            delegating = confidence >= 0.5 and target_agent_type and target_agent_type != AgentType.GENERAL
+            await emit_event(ROUTING_EVENT, {
+                **reasoning["classification"],
+                "method": intent_result.get("method"),
+                "delegated_to": target_agent_type.value if delegating else None
+            })
+
             # If confidence is reasonable and we have a specific agent, delegate
-            if confidence >= 0.5 and target_agent_type and target_agent_type != AgentType.GENERAL:
+            if delegating:
                 reasoning["steps"].append({
                     "agent": "orchestrator",
                     "action": f"Delegating to {target_agent_type.value} agent",
@@ -177,7 +203,9 @@ class OrchestratorAgent(BaseAgent):
                 })
                 
                 # Delegate to appropriate agent
-                delegation_result = await self._delegate_to_agent(target_agent_type, user_input, context)
+                delegation_result = await self._delegate_to_agent(
+                    target_agent_type, user_input, context, prefetched=await prefetch
+                )
                 if delegation_result:
                     reasoning.update({
                         "finalAgent": target_agent_type.value,
@@ -265,11 +293,11 @@ class OrchestratorAgent(BaseAgent):
                     # Intelligently record interaction if not already done by specialized agent
                     if not hasattr(target_agent, '__class__') or 'specialized' not in target_agent.__class__.__name__.lower():
                         try:
-                            recorder = get_interaction_recorder()
-                            await recorder.record_if_valuable(
+                            get_post_processing_pipeline().submit(
                                 user_input=user_input,
                                 agent_response=response,
-                                agent_type=str(target_agent_type.value)
+                                agent_type=str(target_agent_type.value),
+                                extract_preferences=False
                             )
                         except Exception as e:
                             logger.warning(f"Failed to record interaction: {e}")
@@ -332,16 +360,44 @@ class OrchestratorAgent(BaseAgent):
                 }
             }
     
-    async def _classify_intent(self, user_input: str, context: Dict[str, Any]) -> Dict[str, Any]:
-        """Classify user intent to determine appropriate agent."""
+    async def _classify_intent(self,
+                               user_input: str,
+                               context: Dict[str, Any],
+                               prefetch: Optional["asyncio.Task"] = None) -> Dict[str, Any]:
+        """
+        Classify user intent to determine appropriate agent.
+        
+        Tries the keyword patterns, then the embedding router, and only asks the LLM
+        when neither is confident. Confident LLM decisions are fed back to the router.
+        
+        Args:
+            user_input: User's message
+            context: Conversation context
+            prefetch: Running context prefetch of this message, whose query embedding the router reuses
+        """
         try:
             # First, try pattern-based classification for speed
             pattern_result = self._pattern_based_classification(user_input)
             if pattern_result["confidence"] > 0.8:
                 return pattern_result
             
+            # Then the embedding router, on the embedding retrieval needs anyway
+            query_embedding = None
+            if self._ensure_intent_router(await self._get_embedding_namespace()):
+                query_embedding = await self._get_query_embedding(user_input, prefetch)
+                router_result = self._embedding_based_classification(query_embedding)
+                if router_result:
+                    return router_result
+            
             # Use LLM for more complex classification
             llm_result = await self._llm_based_classification(user_input, context)
+            if llm_result["confidence"] >= 0.8 and query_embedding is not None:
+                # Learned off the response path; the log append runs in a worker thread
+                learning = asyncio.create_task(
+                    self._intent_router.learn(llm_result["agent_type"].value, user_input, query_embedding)
+                )
+                self._learning_tasks.add(learning)
+                learning.add_done_callback(self._learning_tasks.discard)
             
             # Combine results, preferring LLM if confidence is high
             if llm_result["confidence"] > pattern_result["confidence"]:
@@ -354,34 +410,15 @@ class OrchestratorAgent(BaseAgent):
             return {"agent_type": AgentType.GENERAL, "confidence": 0.5, "reason": "Classification error"}
     
     def _pattern_based_classification(self, user_input: str) -> Dict[str, Any]:
-        """Classify intent using regex patterns (compiled, case-insensitive)."""
-        import re
-        user_input_lower = user_input.lower()
-        scores = {}
-
-        for agent_type, patterns in self.intent_patterns.items():
-            score = 0
-            matches = []
-            for pattern in patterns:
-                # compile with IGNORECASE to be robust
-                try:
-                    regex = re.compile(pattern, flags=re.IGNORECASE)
-                except re.error:
-                    # fall back to a safe word match (escape)
-                    regex = re.compile(re.escape(pattern), flags=re.IGNORECASE)
-
-                found = regex.findall(user_input)
-                if found:
-                    score += len(found)
-                    matches.extend(found)
-
-            if score > 0:
-                scores[agent_type] = {
-                    "score": score,
-                    "matches": matches,
-                    # Normalize confidence a bit more sensibly
-                    "confidence": min(0.2 + (score * 0.25), 0.99)
-                }
+        """Classify intent using the intent patterns (precompiled, one case-insensitive scan)."""
+        scores = {
+            agent_type: {
+                **hits,
+                # Normalize confidence a bit more sensibly
+                "confidence": min(0.2 + (hits["score"] * 0.25), 0.99)
+            }
+            for agent_type, hits in self._intent_matcher.match(user_input).items()
+        }
 
         if not scores:
             return {"agent_type": AgentType.GENERAL, "confidence": 0.3, "reason": "No pattern matches"}
@@ -395,6 +432,80 @@ class OrchestratorAgent(BaseAgent):
             "method": "pattern_based"
         }
     
+    async def _get_query_embedding(self, user_input: str, prefetch: Optional["asyncio.Task"] = None) -> Optional[List[float]]:
+        """Query embedding of a message, from its context prefetch when one is running."""
+        prefetched = await prefetch if prefetch is not None else await self.knowledge_base.prefetch_context(user_input)
+        if not prefetched or prefetched.get("query_text") != user_input:
+            return None
+        return prefetched.get("query_embedding")
+    
+    async def _get_embedding_namespace(self) -> Optional[str]:
+        """Embedding namespace (provider and model) query embeddings currently come from."""
+        try:
+            llm_service = await get_llm_service()
+            return llm_service.get_embedding_namespace()
+        except Exception as e:
+            logger.warning(f"Failed to get embedding namespace: {e}")
+            return None
+    
+    def _ensure_intent_router(self, namespace: Optional[str]) -> bool:
+        """
+        Whether the embedding router can classify embeddings of the given namespace.
+        
+        Seeds it in the background on first use and reseeds it when the embedding
+        model changes (and again a minute after a failed seeding), so classification
+        never waits for the seed embeddings; meanwhile the LLM classifies.
+        
+        Args:
+            namespace: Current embedding namespace
+        """
+        if namespace is None:
+            return False
+        if self._intent_router.ready and self._intent_router.namespace == namespace:
+            return True
+        seeding = self._router_seeding is not None and not self._router_seeding.done()
+        if not seeding and (namespace != self._router_seeding_namespace or time.monotonic() >= self._router_retry_at):
+            self._router_seeding_namespace = namespace
+            self._router_retry_at = time.monotonic() + 60.0
+            self._router_seeding = asyncio.create_task(self._seed_intent_router(namespace))
+        return False
+    
+    def _embedding_based_classification(self, query_embedding: Optional[List[float]]) -> Optional[Dict[str, Any]]:
+        """
+        Route a message with the embedding router.
+        
+        Args:
+            query_embedding: Embedding of the message
+            
+        Returns:
+            Classification result, or None when the router's margin is too low for the LLM to be skipped
+        """
+        if query_embedding is None:
+            return None
+        
+        routed = self._intent_router.route(query_embedding)
+        if not routed or not routed["confident"]:
+            return None
+        try:
+            agent_type = AgentType(routed["label"])
+        except ValueError:
+            return None
+        return {
+            "agent_type": agent_type,
+            # A clear margin is worth as much as a strong keyword match
+            "confidence": round(0.7 + min(routed["margin"], 0.1) * 2.5, 2),
+            "reason": f"Nearest intent centroid (similarity {routed['similarity']:.2f}, margin {routed['margin']:.2f})",
+            "method": "embedding_router"
+        }
+    
+    async def _seed_intent_router(self, namespace: str) -> None:
+        """Embed the seed and logged routing examples and build the router's centroids for a namespace."""
+        try:
+            llm_service = await get_llm_service()
+            await self._intent_router.seed(SEED_EXAMPLES, llm_service.generate_embeddings, namespace)
+        except Exception as e:
+            logger.warning(f"Failed to seed intent router: {e}")
+    
     async def _llm_based_classification(self, user_input: str, context: Dict[str, Any]) -> Dict[str, Any]:
         try:
             llm_service = await get_llm_service()
@@ -414,7 +525,7 @@ class OrchestratorAgent(BaseAgent):
                 temperature=0.0
             )
 
-            response = await llm_service.chat_completion(request)
+            response = await llm_service.chat_completion(request, hedge=True, cache_route="intent_classification")
             response_text = response.content.strip()
 
             # attempt to parse JSON
@@ -475,7 +586,7 @@ class OrchestratorAgent(BaseAgent):
                 temperature=0.6  # Slightly lower for more focused responses
             )
             
-            response = await self.llm_service.chat_completion(request)
+            response = await stream_completion(self.llm_service, request)
             response_text = response.content.strip()
             
             # Analyze the response to provide better reasoning
@@ -522,34 +633,27 @@ class OrchestratorAgent(BaseAgent):
 
     def _analyze_response_quality(self, user_input: str, response: str) -> Dict[str, Any]:
         """Analyze response quality for improvement insights."""
-        metrics = {
-            "length": len(response),
-            "word_count": len(response.split()),
-            "has_structure": any(marker in response for marker in ["**", "*", "-", "1.", "2.", "3."]),
-            "has_examples": any(word in response.lower() for word in ["example", "for instance", "such as"]),
-            "has_actionable": any(word in response.lower() for word in ["you can", "try", "consider", "would you like"]),
-            "addresses_query": user_input.lower()[:20] in response.lower() or any(word in response.lower() for word in user_input.lower().split()[:5])
-        }
-        
-        # Calculate quality score
-        quality_score = 0
-        if metrics["word_count"] > 20: quality_score += 1
-        if metrics["has_structure"]: quality_score += 1
-        if metrics["has_examples"]: quality_score += 1
-        if metrics["has_actionable"]: quality_score += 1
-        if metrics["addresses_query"]: quality_score += 1
-        
-        quality_levels = ["Poor", "Basic", "Good", "Excellent", "Outstanding"]
-        quality = quality_levels[min(quality_score, 4)]
-        
-        return {
-            "quality": quality,
-            "score": quality_score,
-            "metrics": metrics
-        }
+        return analyze_response_quality(user_input, response)
 
-    async def _delegate_to_agent(self, target_agent_type: AgentType, user_input: str, context: Dict[str, Any]) -> str:
-        """Delegate the request to the appropriate specialist agent."""
+    def _start_prefetch(self, user_input: str) -> "asyncio.Task":
+        """
+        Start prefetching the agent-independent context of a message in the background.
+        
+        A prefetch nobody ends up using (the orchestrator answers directly) is left to
+        finish; it only warms the embedding cache.
+        """
+        task = asyncio.create_task(self.knowledge_base.prefetch_context(user_input))
+        # Hold a reference so the task is not garbage collected mid-flight
+        self._speculative_tasks.add(task)
+        task.add_done_callback(self._speculative_tasks.discard)
+        return task
+    
+    async def _delegate_to_agent(self,
+                                 target_agent_type: AgentType,
+                                 user_input: str,
+                                 context: Dict[str, Any],
+                                 prefetched: Optional[Dict[str, Any]] = None) -> str:
+        """Delegate the request to the appropriate specialist agent, handing over any prefetched context."""
         try:
             # Get the target agent from registry
             target_agent = self.registry.get_agent_by_type(target_agent_type)
@@ -562,7 +666,8 @@ class OrchestratorAgent(BaseAgent):
                 "user_input": user_input,
                 "context": context,
                 "conversation_id": context.get("conversation_id"),
-                "agent": target_agent.agent_id
+                "agent": target_agent.agent_id,
+                "prefetched_context": prefetched
             }
             
             # Execute the agent
@@ -610,11 +715,11 @@ class OrchestratorAgent(BaseAgent):
             enhanced_response = f"{response}\n\nIs there anything else I can help you with today?"
             
             # Intelligently record the coordination interaction
-            recorder = get_interaction_recorder()
-            await recorder.record_if_valuable(
+            get_post_processing_pipeline().submit(
                 user_input=original_input,
                 agent_response=enhanced_response,
-                agent_type="orchestrator"
+                agent_type="orchestrator",
+                extract_preferences=False
             )
             
             return enhanced_response
@@ -635,6 +740,7 @@ class OrchestratorAgent(BaseAgent):
                 "registry_stats": registry_stats,
                 "communication_stats": communication_stats,
                 "knowledge_base_stats": knowledge_stats.model_dump(),
+                "intent_router_stats": self._intent_router.get_stats(),
                 "timestamp": datetime.utcnow().isoformat()
             }
             
@@ -642,23 +748,209 @@ class OrchestratorAgent(BaseAgent):
             logger.error(f"Error getting system status: {e}")
             return {"error": str(e), "timestamp": datetime.utcnow().isoformat()}
     
-    async def handle_complex_request(self, user_input: str, required_agents: List[AgentType]) -> str:
-        """Handle complex requests that require multiple agents."""
-        try:
-            responses = []
+    def _detect_required_agents(self, user_input: str) -> List[AgentType]:
+        """
+        Find the specialist domains a request spans, using the intent patterns.
+        
+        A domain counts when it has a registered agent, matched at least one term no
+        other domain matched (so "meeting", shared by productivity and scheduling,
+        is not evidence for both) and scored at least half of the top domain. A
+        request whose top domain has a single hit is too weak a signal to pay for
+        several agents and stays on the single-agent path.
+        
+        Args:
+            user_input: The user's message
             
-            for agent_type in required_agents:
-                agents = self.registry.get_agents_by_type(agent_type)
-                if agents:
-                    agent = agents[0]
-                    # This would involve more complex coordination logic
-                    # For now, we'll just note that this capability exists
-                    responses.append(f"Coordinating with {agent_type.value} agent...")
+        Returns:
+            Up to fan_out_max_agents agent types, highest score first; empty unless
+            at least two domains qualify
+        """
+        hits = {
+            agent_type: result for agent_type, result in self._intent_matcher.match(user_input).items()
+            if agent_type not in (AgentType.GENERAL, AgentType.ORCHESTRATOR)
+            and self.registry.get_agent_by_type(agent_type)
+        }
+        if len(hits) < 2:
+            return []
+        
+        terms = {agent_type: {match.lower() for match in result["matches"]} for agent_type, result in hits.items()}
+        top_score = max(result["score"] for result in hits.values())
+        if top_score < 2:
+            return []
+        required = [
+            agent_type for agent_type in sorted(hits, key=lambda t: hits[t]["score"], reverse=True)
+            if hits[agent_type]["score"] * 2 >= top_score
+            and terms[agent_type] - set().union(*(other for t, other in terms.items() if t != agent_type))
+        ][:self.fan_out_max_agents]
+        return required if len(required) > 1 else []
+    
+    async def _execute_fan_out(self,
+                               user_input: str,
+                               context: Dict[str, Any],
+                               agent_types: List[AgentType],
+                               prefetched: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Answer a cross-domain request through _fan_out and return the state update with its reasoning."""
+        names = [agent_type.value for agent_type in agent_types]
+        reasoning = {
+            "classification": {
+                "agent_type": "multi_agent",
+                "confidence": 0.9,
+                "reason": f"Request spans {', '.join(names)}"
+            },
+            "steps": [
+                {
+                    "agent": "orchestrator",
+                    "action": "Analyzing user request and classifying intent",
+                    "result": f"Identified as a cross-domain request ({', '.join(names)})"
+                }
+            ]
+        }
+        await emit_event(ROUTING_EVENT, {
+            **reasoning["classification"],
+            "method": "pattern_based",
+            "delegated_to": ", ".join(names)
+        })
+        
+        response, partials = await self._fan_out(user_input, context, agent_types, prefetched=prefetched)
+        for partial in partials:
+            reasoning["steps"].append({
+                "agent": partial["agent_type"],
+                "action": "Processing its part of the request in parallel",
+                "result": partial["error"] or f"Answered in {partial['latency_ms']:.0f}ms"
+            })
+        answered = [partial["agent_type"] for partial in partials if partial["response"]]
+        reasoning["steps"].append({
+            "agent": "orchestrator",
+            "action": "Synthesizing the specialists' answers",
+            "result": f"Combined {len(answered)} of {len(partials)} answers"
+        })
+        reasoning.update({
+            "finalAgent": answered[0] if len(answered) == 1 else "orchestrator",
+            "fanOut": {
+                "agents": names,
+                "answered": answered,
+                "latency_ms": {partial["agent_type"]: partial["latency_ms"] for partial in partials}
+            }
+        })
+        
+        if response is None:
+            response = await self._handle_directly(user_input, context)
+            reasoning["finalAgent"] = "orchestrator"
+            reasoning["error"] = "No specialist answered; handled by orchestrator."
+        return {
+            "response": response,
+            "reasoning": reasoning
+        }
+    
+    async def _fan_out(self,
+                       user_input: str,
+                       context: Dict[str, Any],
+                       agent_types: List[AgentType],
+                       timeout: Optional[float] = None,
+                       prefetched: Optional[Dict[str, Any]] = None) -> Tuple[Optional[str], List[Dict[str, Any]]]:
+        """
+        Run several specialists concurrently and merge their answers.
+        
+        Every agent gets the same timeout, so the wait tracks the slowest agent
+        within the budget rather than the sum of all of them.
+        
+        Args:
+            user_input: The user's message
+            context: Conversation context passed to every agent
+            agent_types: Specialists to run
+            timeout: Seconds each agent may take (defaults to fan_out_timeout)
+            prefetched: Result of KnowledgeBaseService.prefetch_context, shared by all agents
             
-            if responses:
-                return "I'm coordinating with multiple specialists to handle your complex request: " + ", ".join(responses)
-            else:
-                return "I'll handle this complex request step by step for you."
+        Returns:
+            (merged response or None if no agent answered, one partial result dict per
+            agent with agent_type, response, error and latency_ms)
+        """
+        timeout = self.fan_out_timeout if timeout is None else timeout
+        
+        async def run_agent(agent_type: AgentType) -> Dict[str, Any]:
+            partial = {"agent_type": agent_type.value, "response": None, "error": None, "latency_ms": 0.0}
+            # Each branch runs in its own task; only the merged answer reaches the client
+            suppress_answer_tokens()
+            agent = self.registry.get_agent_by_type(agent_type)
+            started = time.perf_counter()
+            try:
+                if not agent:
+                    partial["error"] = f"No {agent_type.value} agent available"
+                    return partial
+                result = await asyncio.wait_for(agent.execute({
+                    "user_input": user_input,
+                    "context": context,
+                    "conversation_id": context.get("conversation_id"),
+                    "agent": agent.agent_id,
+                    "prefetched_context": prefetched
+                }), timeout)
+                partial["response"] = self._extract_agent_response(result)
+                if partial["response"] is None:
+                    partial["error"] = "Invalid or failed response"
+            except asyncio.TimeoutError:
+                partial["error"] = f"Timed out after {timeout:.1f}s"
+            except Exception as e:
+                partial["error"] = str(e)
+            finally:
+                partial["latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            if partial["error"]:
+                logger.warning(f"Fan-out to {agent_type.value} agent failed: {partial['error']}")
+            return partial
+        
+        partials = await asyncio.gather(*(run_agent(agent_type) for agent_type in agent_types))
+        return await self._synthesize(user_input, partials), partials
+    
+    @staticmethod
+    def _extract_agent_response(result: Any) -> Optional[str]:
+        """Get the answer from an agent's execute() result, or None if it failed."""
+        if isinstance(result, str):
+            return result or None
+        if isinstance(result, tuple) and len(result) == 2:
+            return result[0] or None
+        if isinstance(result, dict):
+            reasoning = result.get("reasoning")
+            if result.get("status") == "error" or (isinstance(reasoning, dict) and reasoning.get("error")):
+                return None
+            return result.get("response") or None
+        return None
+    
+    async def _synthesize(self, user_input: str, partials: List[Dict[str, Any]]) -> Optional[str]:
+        """Merge the specialists' answers in one LLM call, concatenating them if that call fails."""
+        answers = {partial["agent_type"]: partial["response"] for partial in partials if partial["response"]}
+        if not answers:
+            return None
+        if len(answers) == 1:
+            return next(iter(answers.values()))
+        
+        try:
+            if self.llm_service is None:
+                self.llm_service = await get_llm_service()
+            request = CompletionRequest(
+                messages=[
+                    ChatMessage(role="system", content=PromptLibrary.get_orchestrator_prompt()),
+                    ChatMessage(role="user", content=PromptLibrary.get_synthesis_prompt(user_input, answers))
+                ],
+                max_tokens=1000,
+                temperature=0.4
+            )
+            response = await self.llm_service.chat_completion(request, cache_route="fan_out_synthesis")
+            if response.content.strip():
+                return response.content
+        except Exception as e:
+            logger.error(f"Failed to synthesize fan-out answers: {e}")
+        
+        return "\n\n".join(f"**{agent_type.title()}**\n{answer}" for agent_type, answer in answers.items())
+    
+    async def handle_complex_request(self,
+                                     user_input: str,
+                                     required_agents: List[AgentType],
+                                     context: Optional[Dict[str, Any]] = None) -> str:
+        """Handle complex requests that require multiple agents, running them in parallel."""
+        try:
+            response, _ = await self._fan_out(user_input, context or {}, required_agents)
+            if response:
+                return response
+            return "I'll handle this complex request step by step for you."
                 
         except Exception as e:
             logger.error(f"Error handling complex request: {e}")
@@ -253,6 +253,24 @@ Classify with high confidence (0.8+) if the intent clearly matches a domain.
 Provide confidence between 0.5-0.7 for somewhat unclear cases.
 Use confidence below 0.5 only for truly ambiguous requests."""
     
+    @classmethod
+    def get_synthesis_prompt(cls, user_input: str, partial_answers: dict) -> str:
+        """Get a prompt merging several specialists' answers to one cross-domain request."""
+        answers = "\n\n".join(
+            f"**{agent_type.upper()} agent:**\n{answer}" for agent_type, answer in partial_answers.items()
+        )
+        return f"""The user asked a question that spans several domains, and each specialist answered its part:
+
+User Input: "{user_input}"
+
+{answers}
+
+Combine these into one answer to the user's question:
+- Resolve overlaps and conflicts between the specialists (e.g. a meal plan must fit the budget and the schedule)
+- Keep every concrete recommendation, number and next step that still applies
+- Organize the answer by what the user needs to do, not by agent
+- Do not mention the agents or that the answer was combined"""
+    
     @classmethod
     def get_capability_matching_prompt(cls, required_capabilities: list) -> str:
         """Get a prompt for capability matching."""
@@ -3,7 +3,8 @@ Agent registry for managing active agents and their capabilities.
 """
 
 import logging
-from typing import Dict, List, Optional, Set, Any
+import weakref
+from typing import Callable, Dict, List, Optional, Set, Any
 from datetime import datetime, timedelta
 from collections import defaultdict
 
@@ -21,6 +22,36 @@ class AgentRegistry:
         self._capabilities_index: Dict[str, List[BaseAgent]] = defaultdict(list)
         self._message_queue: List[AgentMessage] = []
         self._orchestrator_agent: Optional[BaseAgent] = None
+        self._listeners: List[Callable[[], Optional[Callable[[str, BaseAgent], None]]]] = []
+    
+    def add_listener(self, callback: Callable[[str, BaseAgent], None]) -> None:
+        """
+        Call callback(event, agent) after every registration and unregistration.
+        
+        Bound methods are held weakly, so a listening object (e.g. a workflow) can be
+        garbage collected without removing itself.
+        
+        Args:
+            callback: Called with "registered" or "unregistered" and the agent
+        """
+        if hasattr(callback, "__self__"):
+            self._listeners.append(weakref.WeakMethod(callback))
+        else:
+            self._listeners.append(lambda: callback)
+    
+    def _notify(self, event: str, agent: BaseAgent) -> None:
+        """Call the live listeners, dropping the collected ones."""
+        live = []
+        for listener in self._listeners:
+            callback = listener()
+            if callback is None:
+                continue
+            live.append(listener)
+            try:
+                callback(event, agent)
+            except Exception as e:
+                logger.error(f"Registry listener failed on {event} {agent.agent_id}: {e}")
+        self._listeners = live
     
     def register_agent(self, agent: BaseAgent) -> bool:
         """
@@ -50,6 +81,7 @@ class AgentRegistry:
                 self._orchestrator_agent = agent
             
             logger.info(f"Registered agent: {agent.agent_id} ({agent.agent_type.value})")
+            self._notify("registered", agent)
             return True
             
         except Exception as e:
@@ -90,6 +122,7 @@ class AgentRegistry:
                 self._orchestrator_agent = None
             
             logger.info(f"Unregistered agent: {agent_id}")
+            self._notify("unregistered", agent)
             return True
             
         except Exception as e:
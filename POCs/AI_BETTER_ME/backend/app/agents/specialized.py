@@ -14,7 +14,8 @@ from ..llm.service import get_llm_service
 from ..llm.base import CompletionRequest, ChatMessage
 from ..services.knowledge_base import get_knowledge_base_service
 from ..models.knowledge import KnowledgeEntryType
-from ..services.interaction_recorder import get_interaction_recorder
+from ..services.post_processing import get_post_processing_pipeline
+from ..services.events import stream_completion
 
 logger = logging.getLogger(__name__)
 
@@ -59,7 +60,8 @@ class HealthAgent(BaseAgent):
             context = await self.knowledge_base.get_contextual_knowledge_for_agent(
                 user_input=user_input,
                 agent_type="health",
-                max_results=10
+                max_results=10,
+                prefetched=state.get("prefetched_context")
             )
             
             logger.info(f"Retrieved context with keys: {list(context.keys())}")
@@ -76,21 +78,13 @@ class HealthAgent(BaseAgent):
                 logger.info("Processing as general health query")
                 response = await self._handle_general_health_query(user_input, context)
             
-            # Intelligently record interaction if valuable
-            recorder = get_interaction_recorder()
-            await recorder.record_if_valuable(
+            # Record the interaction and extract preferences off the response path
+            get_post_processing_pipeline().submit(
                 user_input=user_input,
                 agent_response=response,
                 agent_type="health"
             )
             
-            # Extract and store any new preferences
-            await self.knowledge_base.extract_and_store_preferences(
-                user_input=user_input,
-                agent_type="health",
-                agent_response=response
-            )
-            
             return {
                 "response": response,
                 "reasoning": {
@@ -149,7 +143,7 @@ class HealthAgent(BaseAgent):
                 max_tokens=1000
             )
             
-            response = await llm_service.chat_completion(request)
+            response = await stream_completion(llm_service, request)
             logger.info(f"Generated meal planning response: {response.content[:200]}...")
             return response.content
             
@@ -216,7 +210,7 @@ class HealthAgent(BaseAgent):
                 max_tokens=800
             )
             
-            response = await llm_service.chat_completion(request)
+            response = await stream_completion(llm_service, request)
             return response.content
             
         except Exception as e:
@@ -282,12 +276,12 @@ class ProductivityAgent(BaseAgent):
             else:
                 response = await self._handle_general_productivity(user_input, contextual_knowledge)
             
-            # Intelligently record interaction if valuable
-            recorder = get_interaction_recorder()
-            await recorder.record_if_valuable(
+            # Record the interaction (if valuable) off the response path
+            get_post_processing_pipeline().submit(
                 user_input=user_input,
                 agent_response=response,
-                agent_type="productivity"
+                agent_type="productivity",
+                extract_preferences=False
             )
             
             return {"response": response, "status": "success"}
@@ -327,7 +321,7 @@ class ProductivityAgent(BaseAgent):
                 max_tokens=1000
             )
             
-            response = await llm_service.chat_completion(request)
+            response = await stream_completion(llm_service, request)
             return response.content
             
         except Exception as e:
@@ -365,7 +359,7 @@ class ProductivityAgent(BaseAgent):
                 max_tokens=1000
             )
             
-            response = await llm_service.chat_completion(request)
+            response = await stream_completion(llm_service, request)
             return response.content
             
         except Exception as e:
@@ -403,7 +397,7 @@ class ProductivityAgent(BaseAgent):
                 max_tokens=1000
             )
             
-            response = await llm_service.chat_completion(request)
+            response = await stream_completion(llm_service, request)
             return response.content
             
         except Exception as e:
@@ -435,7 +429,7 @@ class ProductivityAgent(BaseAgent):
                 max_tokens=800
             )
             
-            response = await llm_service.chat_completion(request)
+            response = await stream_completion(llm_service, request)
             return response.content
             
         except Exception as e:
@@ -519,12 +513,12 @@ class FinanceAgent(BaseAgent):
             else:
                 response = await self._handle_general_finance(user_input, contextual_knowledge)
             
-            # Intelligently record interaction if valuable
-            recorder = get_interaction_recorder()
-            await recorder.record_if_valuable(
+            # Record the interaction (if valuable) off the response path
+            get_post_processing_pipeline().submit(
                 user_input=user_input,
                 agent_response=response,
-                agent_type="finance"
+                agent_type="finance",
+                extract_preferences=False
             )
             
             return {"response": response, "status": "success"}
@@ -564,7 +558,7 @@ class FinanceAgent(BaseAgent):
                 max_tokens=1000
             )
             
-            response = await llm_service.chat_completion(request)
+            response = await stream_completion(llm_service, request)
             return response.content
             
         except Exception as e:
@@ -603,7 +597,7 @@ class FinanceAgent(BaseAgent):
                 max_tokens=1000
             )
             
-            response = await llm_service.chat_completion(request)
+            response = await stream_completion(llm_service, request)
             return response.content
             
         except Exception as e:
@@ -642,7 +636,7 @@ class FinanceAgent(BaseAgent):
                 max_tokens=1000
             )
             
-            response = await llm_service.chat_completion(request)
+            response = await stream_completion(llm_service, request)
             return response.content
             
         except Exception as e:
@@ -675,7 +669,7 @@ class FinanceAgent(BaseAgent):
                 max_tokens=800
             )
             
-            response = await llm_service.chat_completion(request)
+            response = await stream_completion(llm_service, request)
             return response.content
             
         except Exception as e:
@@ -759,12 +753,12 @@ class SchedulingAgent(BaseAgent):
             else:
                 response = await self._handle_general_scheduling(user_input, contextual_knowledge)
             
-            # Intelligently record interaction if valuable
-            recorder = get_interaction_recorder()
-            await recorder.record_if_valuable(
+            # Record the interaction (if valuable) off the response path
+            get_post_processing_pipeline().submit(
                 user_input=user_input,
                 agent_response=response,
-                agent_type="scheduling"
+                agent_type="scheduling",
+                extract_preferences=False
             )
             
             return {"response": response, "status": "success"}
@@ -805,7 +799,7 @@ class SchedulingAgent(BaseAgent):
                 max_tokens=800
             )
             
-            response = await llm_service.chat_completion(request)
+            response = await stream_completion(llm_service, request)
             return response.content
             
         except Exception as e:
@@ -844,7 +838,7 @@ class SchedulingAgent(BaseAgent):
                 max_tokens=1000
             )
             
-            response = await llm_service.chat_completion(request)
+            response = await stream_completion(llm_service, request)
             return response.content
             
         except Exception as e:
@@ -883,7 +877,7 @@ class SchedulingAgent(BaseAgent):
                 max_tokens=800
             )
             
-            response = await llm_service.chat_completion(request)
+            response = await stream_completion(llm_service, request)
             return response.content
             
         except Exception as e:
@@ -916,7 +910,7 @@ class SchedulingAgent(BaseAgent):
                 max_tokens=800
             )
             
-            response = await llm_service.chat_completion(request)
+            response = await stream_completion(llm_service, request)
             return response.content
             
         except Exception as e:
@@ -1002,12 +996,12 @@ class JournalAgent(BaseAgent):
             else:
                 response = await self._handle_general_journaling(user_input, contextual_knowledge)
             
-            # Intelligently record interaction if valuable
-            recorder = get_interaction_recorder()
-            await recorder.record_if_valuable(
+            # Record the interaction (if valuable) off the response path
+            get_post_processing_pipeline().submit(
                 user_input=user_input,
                 agent_response=response,
-                agent_type="journal"
+                agent_type="journal",
+                extract_preferences=False
             )
             
             return {"response": response, "status": "success"}
@@ -1048,7 +1042,7 @@ class JournalAgent(BaseAgent):
                 max_tokens=1000
             )
             
-            response = await llm_service.chat_completion(request)
+            response = await stream_completion(llm_service, request)
             return response.content
             
         except Exception as e:
@@ -1087,7 +1081,7 @@ class JournalAgent(BaseAgent):
                 max_tokens=1000
             )
             
-            response = await llm_service.chat_completion(request)
+            response = await stream_completion(llm_service, request)
             return response.content
             
         except Exception as e:
@@ -1126,7 +1120,7 @@ class JournalAgent(BaseAgent):
                 max_tokens=1000
             )
             
-            response = await llm_service.chat_completion(request)
+            response = await stream_completion(llm_service, request)
             return response.content
             
         except Exception as e:
@@ -1166,7 +1160,7 @@ class JournalAgent(BaseAgent):
                 max_tokens=1000
             )
             
-            response = await llm_service.chat_completion(request)
+            response = await stream_completion(llm_service, request)
             return response.content
             
         except Exception as e:
@@ -1199,7 +1193,7 @@ class JournalAgent(BaseAgent):
                 max_tokens=800
             )
             
-            response = await llm_service.chat_completion(request)
+            response = await stream_completion(llm_service, request)
             return response.content
             
         except Exception as e:
@@ -1261,7 +1255,8 @@ class JournalAgent(BaseAgent):
             context = await self.knowledge_base.get_contextual_knowledge_for_agent(
                 user_input=user_input,
                 agent_type="productivity",
-                max_results=10
+                max_results=10,
+                prefetched=state.get("prefetched_context")
             )
             
             # Determine specific productivity action needed
@@ -1272,20 +1267,13 @@ class JournalAgent(BaseAgent):
             else:
                 response = await self._handle_general_productivity(user_input, context)
             
-            # Intelligently record interaction if valuable
-            recorder = get_interaction_recorder()
-            await recorder.record_if_valuable(
+            # Record the interaction and extract preferences off the response path
+            get_post_processing_pipeline().submit(
                 user_input=user_input,
                 agent_response=response,
                 agent_type="productivity"
             )
             
-            await self.knowledge_base.extract_and_store_preferences(
-                user_input=user_input,
-                agent_type="productivity",
-                agent_response=response
-            )
-            
             return {
                 "response": response,
                 "reasoning": {
@@ -1341,7 +1329,7 @@ class JournalAgent(BaseAgent):
                 max_tokens=1000
             )
             
-            response = await llm_service.chat_completion(request)
+            response = await stream_completion(llm_service, request)
             return response.content
             
         except Exception as e:
@@ -1410,7 +1398,7 @@ class JournalAgent(BaseAgent):
                 max_tokens=800
             )
             
-            response = await llm_service.chat_completion(request)
+            response = await stream_completion(llm_service, request)
             return response.content
             
         except Exception as e:
@@ -2,8 +2,11 @@
 API endpoints for knowledge base operations.
 """
 
+import json
+import logging
 from typing import List, Optional, Dict, Any
 from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from app.models.knowledge import (
     KnowledgeEntry,
@@ -16,6 +19,8 @@ from app.models.knowledge import (
 )
 from app.services.knowledge_base import get_knowledge_base_service
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(prefix="/api/knowledge", tags=["knowledge"])
 
 
@@ -30,6 +35,26 @@ class CreateEntryRequest(BaseModel):
     tags: Optional[List[str]] = None
 
 
+class BatchCreateEntriesRequest(BaseModel):
+    """Request model for creating many knowledge entries at once."""
+    entries: List[CreateEntryRequest]
+
+
+class BatchItemResult(BaseModel):
+    """Per-item outcome of a batch create."""
+    index: int
+    success: bool
+    entry_id: Optional[str] = None
+    error: Optional[str] = None
+
+
+class BatchCreateEntriesResponse(BaseModel):
+    """Response model for batch entry creation."""
+    created: int
+    failed: int
+    results: List[BatchItemResult]
+
+
 class UpdateEntryRequest(BaseModel):
     """Request model for updating knowledge entries."""
     title: Optional[str] = None
@@ -75,6 +100,24 @@ async def create_entry(request: CreateEntryRequest):
         raise HTTPException(status_code=500, detail=f"Failed to create entry: {str(e)}")
 
 
+@router.post("/entries:batch", response_model=BatchCreateEntriesResponse)
+async def create_entries_batch(request: BatchCreateEntriesRequest):
+    """Create many knowledge base entries with batched embedding and a single index write."""
+    try:
+        kb_service = get_knowledge_base_service()
+        results = await kb_service.create_entries_bulk(
+            [item.model_dump() for item in request.entries]
+        )
+        created = sum(1 for result in results if result["success"])
+        return BatchCreateEntriesResponse(
+            created=created,
+            failed=len(results) - created,
+            results=results
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to create entries: {str(e)}")
+
+
 @router.get("/entries/{entry_id}", response_model=Optional[KnowledgeEntry])
 async def get_entry(entry_id: str):
     """Get a knowledge entry by ID."""
@@ -273,6 +316,19 @@ async def get_knowledge_stats():
         raise HTTPException(status_code=500, detail=f"Failed to get stats: {str(e)}")
 
 
+@router.get("/index/recall", response_model=Dict[str, Any])
+async def get_index_recall(
+    k: int = Query(10, description="Number of neighbours compared"),
+    num_queries: int = Query(100, description="Number of sampled queries")
+):
+    """Report the vector index's recall@k and latency against an exact flat baseline."""
+    try:
+        kb_service = get_knowledge_base_service()
+        return await kb_service.evaluate_index_recall(k=k, num_queries=num_queries)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to evaluate index recall: {str(e)}")
+
+
 @router.delete("/clear")
 async def clear_knowledge_base():
     """Clear all entries from the knowledge base."""
@@ -300,13 +356,35 @@ class EmbeddingVisualizationData(BaseModel):
 
 @router.get("/embeddings/visualization", response_model=List[EmbeddingVisualizationData])
 async def get_embeddings_for_visualization():
-    """Get all embeddings with 3D coordinates for visualization."""
+    """
+    Stream all embeddings with 3D coordinates for visualization as a JSON array.
+    
+    A failure before the first entry is a 500. A failure after the response has
+    started ends the stream without the closing bracket, so clients get invalid
+    JSON instead of a truncated array that looks complete.
+    """
     try:
         kb_service = get_knowledge_base_service()
-        visualization_data = await kb_service.get_embeddings_visualization_data()
-        return visualization_data
+        items = kb_service.iter_embeddings_visualization_data()
+        first = await anext(items, None)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get embeddings visualization data: {str(e)}")
+    
+    async def stream_json_array():
+        yield "["
+        if first is None:
+            yield "]"
+            return
+        yield json.dumps(first)
+        try:
+            async for item in items:
+                yield "," + json.dumps(item)
+        except Exception as e:
+            logger.error(f"Embeddings visualization stream failed part-way, leaving the array unterminated: {e}")
+            return
+        yield "]"
+    
+    return StreamingResponse(stream_json_array(), media_type="application/json")
 
 
 @router.get("/embeddings/{entry_id}/details")
@@ -0,0 +1,107 @@
+"""
+Response formatting modes, the response quality heuristic and the deterministic formatter.
+"""
+import re
+from typing import Any, Dict
+
+# Formatting modes of the workflow's final step
+FORMATTING_OFF = "off"  # pass the agent's answer through unchanged
+FORMATTING_DETERMINISTIC = "deterministic"  # rule-based formatting only
+FORMATTING_CONDITIONAL = "conditional"  # LLM pass only when the quality heuristic flags the answer
+FORMATTING_ALWAYS = "always"  # LLM pass for every answer
+FORMATTING_MODES = (FORMATTING_OFF, FORMATTING_DETERMINISTIC, FORMATTING_CONDITIONAL, FORMATTING_ALWAYS)
+
+# Agent-specific emojis and greeting styles
+AGENT_STYLES = {
+    "orchestrator": {"emoji": "🧠", "style": "Professional and coordinated"},
+    "productivity": {"emoji": "⚡", "style": "Energetic and action-oriented"},
+    "health": {"emoji": "🌿", "style": "Caring and supportive"},
+    "finance": {"emoji": "💰", "style": "Practical and detailed"},
+    "scheduling": {"emoji": "📅", "style": "Organized and time-focused"},
+    "journal": {"emoji": "📝", "style": "Reflective and thoughtful"},
+    "general": {"emoji": "🤖", "style": "Helpful and adaptable"}
+}
+
+_BLANK_LINES = re.compile(r"\n{3,}")
+_TRAILING_SPACE = re.compile(r"[ \t]+\n")
+_BULLET = re.compile(r"^(\s*)[•●▪◦·]\s*", re.MULTILINE)
+_NUMBERED = re.compile(r"^(\s*)(\d+)[)\]]\s+", re.MULTILINE)
+
+
+def analyze_response_quality(user_input: str, response: str) -> Dict[str, Any]:
+    """
+    Score a response with cheap text heuristics (no LLM call).
+
+    Args:
+        user_input: The user's message
+        response: The answer to score
+
+    Returns:
+        Dict with "quality" (Poor..Outstanding), "score" (0-5) and the raw "metrics"
+    """
+    metrics = {
+        "length": len(response),
+        "word_count": len(response.split()),
+        "has_structure": any(marker in response for marker in ["**", "*", "-", "1.", "2.", "3."]),
+        "has_examples": any(word in response.lower() for word in ["example", "for instance", "such as"]),
+        "has_actionable": any(word in response.lower() for word in ["you can", "try", "consider", "would you like"]),
+        "addresses_query": user_input.lower()[:20] in response.lower() or any(word in response.lower() for word in user_input.lower().split()[:5])
+    }
+
+    # Calculate quality score
+    quality_score = 0
+    if metrics["word_count"] > 20: quality_score += 1
+    if metrics["has_structure"]: quality_score += 1
+    if metrics["has_examples"]: quality_score += 1
+    if metrics["has_actionable"]: quality_score += 1
+    if metrics["addresses_query"]: quality_score += 1
+
+    quality_levels = ["Poor", "Basic", "Good", "Excellent", "Outstanding"]
+    quality = quality_levels[min(quality_score, 4)]
+
+    return {
+        "quality": quality,
+        "score": quality_score,
+        "metrics": metrics
+    }
+
+
+def apply_basic_formatting(raw_response: str, final_agent: str, user_input: str) -> str:
+    """
+    Format a response with deterministic rules.
+
+    Normalizes whitespace and list markers to markdown, prefixes the agent's emoji
+    (once), ends the text with punctuation and adds a follow-up line unless the
+    answer already asks the user something.
+
+    Args:
+        raw_response: The agent's answer
+        final_agent: Agent that produced the answer (selects the emoji)
+        user_input: The user's message
+
+    Returns:
+        The formatted response
+    """
+    style = AGENT_STYLES.get(final_agent, AGENT_STYLES["general"])
+
+    text = raw_response.replace("\r\n", "\n").strip()
+    text = _TRAILING_SPACE.sub("\n", text)
+    text = _BLANK_LINES.sub("\n\n", text)
+    text = _BULLET.sub(r"\1- ", text)
+    text = _NUMBERED.sub(r"\1\2. ", text)
+
+    if not text.startswith(style["emoji"]):
+        text = f"{style['emoji']} {text}"
+
+    if len(raw_response.strip()) < 50:
+        # Short response - add context
+        if "?" not in text:
+            text += "\n\nIs there anything else I can help you with?"
+        return text
+
+    # Longer response - ensure it ends well
+    if not text.endswith(("?", "!", ".", ")", "*", "`")):
+        text += "."
+    if "?" not in text.rsplit("\n", 1)[-1]:
+        text += "\n\nLet me know if you need any clarification or have other questions!"
+    return text
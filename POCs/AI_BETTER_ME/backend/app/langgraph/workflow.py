@@ -1,8 +1,12 @@
 """
 LangGraph workflow for multi-agent orchestration and structured logging.
 """
+import os
+import time
+import random
 import logging
 import json
+from typing import Any, AsyncIterator, Callable, Dict, Optional, Tuple
 from langgraph.graph import START, StateGraph, END
 from datetime import datetime
 
@@ -11,6 +15,16 @@ from app.agents.registry import get_agent_registry
 from app.llm.service import get_llm_service
 from app.llm.base import CompletionRequest, ChatMessage
 from app.agents.prompts import PromptLibrary
+from app.services.events import emit_event, RESET_EVENT, STREAM_ANSWER_TOKENS, TOKEN_EVENT
+from app.langgraph.formatting import (
+    FORMATTING_OFF,
+    FORMATTING_DETERMINISTIC,
+    FORMATTING_CONDITIONAL,
+    FORMATTING_ALWAYS,
+    FORMATTING_MODES,
+    analyze_response_quality,
+    apply_basic_formatting
+)
 
 logger = logging.getLogger("langgraph")
 if not logger.hasHandlers():
@@ -21,9 +35,44 @@ if not logger.hasHandlers():
 logger.setLevel(logging.INFO)
 
 class AgentGraphWorkflow:
-    def __init__(self):
+    def __init__(
+        self,
+        formatting_mode: Optional[str] = None,
+        formatting_quality_threshold: Optional[int] = None,
+        log_sample_rate: Optional[float] = None
+    ):
+        """
+        Build the agent graph.
+        
+        Args:
+            formatting_mode: Final formatting step mode (off, deterministic, conditional or always);
+                defaults to RESPONSE_FORMATTING_MODE, else conditional
+            formatting_quality_threshold: Quality score (0-5) below which conditional mode runs the
+                LLM pass; defaults to RESPONSE_FORMATTING_QUALITY_THRESHOLD, else 2
+            log_sample_rate: Fraction of runs whose steps are logged at INFO (the rest log at DEBUG);
+                defaults to WORKFLOW_LOG_SAMPLE_RATE, else 0.05
+        """
+        self.formatting_mode = (formatting_mode or os.getenv("RESPONSE_FORMATTING_MODE", FORMATTING_CONDITIONAL)).lower()
+        if self.formatting_mode not in FORMATTING_MODES:
+            logger.warning(f"Unknown formatting mode {self.formatting_mode!r}, using {FORMATTING_CONDITIONAL}")
+            self.formatting_mode = FORMATTING_CONDITIONAL
+        if formatting_quality_threshold is None:
+            formatting_quality_threshold = int(os.getenv("RESPONSE_FORMATTING_QUALITY_THRESHOLD", "2"))
+        self.formatting_quality_threshold = formatting_quality_threshold
+        self._formatting_counts: Dict[str, int] = {}
+        
+        if log_sample_rate is None:
+            log_sample_rate = float(os.getenv("WORKFLOW_LOG_SAMPLE_RATE", "0.05"))
+        self.log_sample_rate = log_sample_rate
+        
         self.registry = get_agent_registry()
-        self.graph = StateGraph(dict)
+        self.graph, self.compiled_graph = self._build_graph()
+        # Recompile when agents come or go; runs in flight keep the graph they started with
+        self.registry.add_listener(self._on_agents_changed)
+    
+    def _build_graph(self) -> Tuple[StateGraph, Any]:
+        """Build and compile the graph over the currently registered agents."""
+        graph = StateGraph(dict)
         
         # Add agent nodes
         agents = self.registry.get_all_agents()
@@ -51,27 +100,27 @@ class AgentGraphWorkflow:
             # Wrap the node callable to ensure proper state handling for LangGraph
             def create_node_wrapper(agent_execute_method):
                 async def node_wrapper(state):
-                    logger.debug(f"Node wrapper calling {agent_execute_method} with state: {state}")
+                    logger.debug("Node wrapper calling %s with state: %s", agent_execute_method, state)
                     result = await agent_execute_method(state)
-                    logger.debug(f"Node wrapper received result: {result}")
+                    logger.debug("Node wrapper received result: %s", result)
                     return result
                 return node_wrapper
             
             wrapped_callable = create_node_wrapper(node_callable)
-            self.graph.add_node(node_name, wrapped_callable)
+            graph.add_node(node_name, wrapped_callable)
 
         # Add the response formatting node
-        self.graph.add_node("format_response_final_step", self._format_response_final_step)
+        graph.add_node("format_response_final_step", self._format_response_final_step)
 
         # Route only through orchestrator - it will handle delegation internally
-        agent_names = list(self.graph.nodes.keys())
+        agent_names = list(graph.nodes.keys())
         orchestrator_name = None
         
         logger.info(f"Searching for orchestrator in agent names: {agent_names}")
         
         # Find the orchestrator among registered agents
         for name in agent_names:
-            logger.debug(f"Checking agent name: {name}, contains orchestrator: {'orchestrator' in name.lower()}")
+            logger.debug("Checking agent name: %s, contains orchestrator: %s", name, "orchestrator" in name.lower())
             if "orchestrator" in name.lower():
                 orchestrator_name = name
                 logger.info(f"Found orchestrator: {orchestrator_name}")
@@ -79,9 +128,9 @@ class AgentGraphWorkflow:
         
         if orchestrator_name:
             # Route through orchestrator then to response formatter
-            self.graph.add_edge(START, orchestrator_name)
-            self.graph.add_edge(orchestrator_name, "format_response_final_step")
-            self.graph.add_edge("format_response_final_step", END)
+            graph.add_edge(START, orchestrator_name)
+            graph.add_edge(orchestrator_name, "format_response_final_step")
+            graph.add_edge("format_response_final_step", END)
         else:
             logger.warning("No orchestrator found - falling back to sequential execution")
             # Fallback to original sequential behavior if no orchestrator
@@ -89,95 +138,139 @@ class AgentGraphWorkflow:
                 # Remove format node from agent_names for fallback
                 fallback_agents = [name for name in agent_names if name != "format_response_final_step"]
                 if fallback_agents:
-                    self.graph.add_edge(START, fallback_agents[0])
+                    graph.add_edge(START, fallback_agents[0])
                     for i in range(len(fallback_agents) - 1):
-                        self.graph.add_edge(fallback_agents[i], fallback_agents[i + 1])
-                    self.graph.add_edge(fallback_agents[-1], "format_response_final_step")
-                    self.graph.add_edge("format_response_final_step", END)
+                        graph.add_edge(fallback_agents[i], fallback_agents[i + 1])
+                    graph.add_edge(fallback_agents[-1], "format_response_final_step")
+                    graph.add_edge("format_response_final_step", END)
         
-        # Compile the graph for LangGraph dev
-        self.compiled_graph = self.graph.compile()
+        # Compile once; the compiled graph is reused by every run until the agents change
+        return graph, graph.compile()
+    
+    def _on_agents_changed(self, event: str, agent: Any) -> None:
+        """Registry listener: swap in a graph compiled over the new set of agents."""
+        try:
+            graph, compiled_graph = self._build_graph()
+        except Exception as e:
+            logger.error(f"Failed to rebuild workflow after agent {agent.agent_id} was {event}: {e}")
+            return
+        # One attribute assignment each; a run reads compiled_graph once and keeps that object
+        self.graph, self.compiled_graph = graph, compiled_graph
+        logger.info(f"Workflow graph recompiled after agent {agent.agent_id} was {event}")
     
     def get_compiled_graph(self):
         """Return the compiled LangGraph for langgraph dev server."""
         return self.compiled_graph
 
     async def _format_response_final_step(self, state):
-        """Final step to format and enhance the response with context and personalization."""
+        """
+        Final step to format the response according to the workflow's formatting mode.
+        
+        - off: the agent's answer is passed through unchanged
+        - deterministic: rule-based formatting only (no LLM call)
+        - conditional: an LLM formatting pass only when the quality heuristic scores the
+          answer below formatting_quality_threshold, deterministic formatting otherwise
+        - always: an LLM formatting pass for every answer
+        
+        The answering agent may already have streamed its draft as token events, so a
+        reset event comes first; whatever the path, the final text is then emitted as
+        token events (the LLM pass streams token by token).
+        """
         try:
-            logger.info("Starting response formatting step")
+            logger.info(f"Starting response formatting step (mode: {self.formatting_mode})")
             
             # Extract information from state
             user_input = state.get("user_input", "")
             raw_response = state.get("response", "")
             reasoning = state.get("reasoning", {})
             context = state.get("context", {})
-            conversation_id = state.get("conversation_id", "")
+            await emit_event(RESET_EVENT, {})
             
             # Don't format if response is already well-formatted or if it's an error
             if not raw_response or "I apologize" in raw_response:
+                self._count_formatting("skipped")
+                if raw_response:
+                    await emit_event(TOKEN_EVENT, {"content": raw_response})
+                return state
+            
+            if self.formatting_mode == FORMATTING_OFF:
+                self._count_formatting(FORMATTING_OFF)
+                await emit_event(TOKEN_EVENT, {"content": raw_response})
                 return state
             
             # Get the final agent that provided the response
             final_agent = reasoning.get("finalAgent", "orchestrator") if isinstance(reasoning, dict) else "orchestrator"
             
-            # Create formatting prompt based on the agent type and context
-            formatting_prompt = self._build_formatting_prompt(
-                user_input=user_input,
-                raw_response=raw_response,
-                final_agent=final_agent,
-                reasoning=reasoning,
-                context=context
-            )
+            use_llm = self.formatting_mode == FORMATTING_ALWAYS
+            if self.formatting_mode == FORMATTING_CONDITIONAL:
+                quality = analyze_response_quality(user_input, raw_response)
+                use_llm = quality["score"] < self.formatting_quality_threshold
+                logger.debug(f"Response quality {quality['quality']} ({quality['score']}), LLM formatting: {use_llm}")
             
-            # Use LLM to format the response
-            try:
-                llm_service = await get_llm_service()
-                
-                request = CompletionRequest(
-                    messages=[
-                        ChatMessage(role="system", content=formatting_prompt),
-                        ChatMessage(role="user", content=f"Please enhance and format this response:\n\n{raw_response}")
-                    ],
-                    max_tokens=800,
-                    temperature=0.3
-                )
-                
-                formatted_response = await llm_service.chat_completion(request)
-                
-                # Handle various response types from LLM
-                if hasattr(formatted_response, 'content'):
-                    content = formatted_response.content
-                    if isinstance(content, dict):
-                        # If content is dict, try to extract text/message
-                        enhanced_response = content.get('content', content.get('message', str(content)))
-                    elif isinstance(content, str):
-                        enhanced_response = content.strip()
-                    else:
-                        enhanced_response = str(content).strip()
-                else:
-                    # Fallback if no content attribute
-                    enhanced_response = str(formatted_response).strip()
-                
-                # Update the state with the enhanced response
-                state["response"] = enhanced_response
-                state["formatting_applied"] = True
-                
-                logger.info("Response formatting completed successfully")
-                
-            except Exception as e:
-                logger.warning(f"LLM formatting failed: {e}, using fallback formatting")
-                # Fallback: basic formatting
-                enhanced_response = self._apply_basic_formatting(raw_response, final_agent, user_input)
-                state["response"] = enhanced_response
-                state["formatting_applied"] = True
+            if use_llm:
+                try:
+                    state["response"] = await self._format_with_llm(user_input, raw_response, final_agent, reasoning, context)
+                    state["formatting_applied"] = True
+                    self._count_formatting("llm")
+                    logger.info("Response formatting completed successfully")
+                    return state
+                except Exception as e:
+                    logger.warning(f"LLM formatting failed: {e}, using fallback formatting")
+                    self._count_formatting("llm_fallback")
+                    # Drop whatever part of the pass already streamed before sending the fallback
+                    await emit_event(RESET_EVENT, {})
+            else:
+                self._count_formatting(FORMATTING_DETERMINISTIC)
             
+            enhanced_response = self._apply_basic_formatting(raw_response, final_agent, user_input)
+            await emit_event(TOKEN_EVENT, {"content": enhanced_response})
+            state["response"] = enhanced_response
+            state["formatting_applied"] = True
             return state
             
         except Exception as e:
             logger.error(f"Error in format_response_final_step: {e}")
             # Return original state if formatting fails
             return state
+    
+    async def _format_with_llm(self, user_input: str, raw_response: str, final_agent: str, reasoning: dict, context: dict) -> str:
+        """Run the LLM formatting pass, streaming its tokens as events."""
+        formatting_prompt = self._build_formatting_prompt(
+            user_input=user_input,
+            raw_response=raw_response,
+            final_agent=final_agent,
+            reasoning=reasoning,
+            context=context
+        )
+        
+        llm_service = await get_llm_service()
+        request = CompletionRequest(
+            messages=[
+                ChatMessage(role="system", content=formatting_prompt),
+                ChatMessage(role="user", content=f"Please enhance and format this response:\n\n{raw_response}")
+            ],
+            max_tokens=800,
+            temperature=0.3
+        )
+        
+        # Stream the pass so streaming clients receive the answer token by token;
+        # identical raw responses (canned replies) reuse an earlier formatting
+        parts = []
+        async for chunk in llm_service.chat_completion_stream(request, cache=True, cache_route="format_response"):
+            parts.append(chunk)
+            await emit_event(TOKEN_EVENT, {"content": chunk})
+        enhanced_response = "".join(parts).strip()
+        if not enhanced_response:
+            raise Exception("Empty formatted response")
+        return enhanced_response
+    
+    def _count_formatting(self, outcome: str) -> None:
+        """Count which formatting path handled a response."""
+        self._formatting_counts[outcome] = self._formatting_counts.get(outcome, 0) + 1
+    
+    def get_formatting_stats(self) -> Dict[str, Any]:
+        """Get the formatting mode and how often each formatting path fired."""
+        return {"mode": self.formatting_mode, "counts": dict(self._formatting_counts)}
 
     def _build_formatting_prompt(self, user_input: str, raw_response: str, final_agent: str, reasoning: dict, context: dict) -> str:
         """Build a comprehensive formatting prompt based on context."""
@@ -222,55 +315,45 @@ Now enhance the following response:"""
         return base_prompt
 
     def _apply_basic_formatting(self, raw_response: str, final_agent: str, user_input: str) -> str:
-        """Apply basic formatting when LLM formatting fails."""
-        
-        # Agent-specific emojis and greeting styles
-        agent_styles = {
-            "orchestrator": {"emoji": "🧠", "style": "Professional and coordinated"},
-            "productivity": {"emoji": "⚡", "style": "Energetic and action-oriented"},
-            "health": {"emoji": "🌿", "style": "Caring and supportive"},
-            "finance": {"emoji": "💰", "style": "Practical and detailed"},
-            "scheduling": {"emoji": "📅", "style": "Organized and time-focused"},
-            "journal": {"emoji": "📝", "style": "Reflective and thoughtful"},
-            "general": {"emoji": "🤖", "style": "Helpful and adaptable"}
-        }
-        
-        style = agent_styles.get(final_agent, agent_styles["general"])
-        
-        # Basic enhancement
-        if len(raw_response.strip()) < 50:
-            # Short response - add context
-            enhanced = f"{style['emoji']} {raw_response}\n\nIs there anything else I can help you with?"
-        else:
-            # Longer response - just add emoji and ensure it ends well
-            enhanced = f"{style['emoji']} {raw_response}"
-            if not raw_response.endswith(("?", "!", ".")):
-                enhanced += "."
-            enhanced += "\n\nLet me know if you need any clarification or have other questions!"
-        
-        return enhanced
+        """Apply deterministic formatting (the deterministic mode, and the fallback when LLM formatting fails)."""
+        return apply_basic_formatting(raw_response, final_agent, user_input)
 
     async def run(self, state):
-        log_steps = []
-        logger.info(json.dumps({
-            "timestamp": datetime.utcnow().isoformat(),
-            "step": "workflow_start",
+        # Use one compiled graph for the whole run, even if agents change meanwhile
+        workflow = self.compiled_graph
+        level = logging.INFO if random.random() < self.log_sample_rate else logging.DEBUG
+        started = time.perf_counter()
+        self._log_step(level, "workflow_start", lambda: {
             "input_state": state,
-            "input_state_type": str(type(state))
-        }, indent=2))
-        workflow = self.graph.compile()
-        logger.info(json.dumps({
-            "timestamp": datetime.utcnow().isoformat(),
-            "step": "workflow_compiled",
+            "input_state_type": str(type(state)),
             "nodes": list(workflow.nodes.keys())
-        }, indent=2))
+        })
         result = await workflow.ainvoke(state)
-        logger.info(json.dumps({
-            "timestamp": datetime.utcnow().isoformat(),
-            "step": "workflow_complete",
+        self._log_step(level, "workflow_complete", lambda: {
             "result": result,
-            "result_type": str(type(result))
-        }, indent=2))
+            "result_type": str(type(result)),
+            "duration_ms": round((time.perf_counter() - started) * 1000, 1)
+        })
+        response, reasoning = self._normalize_result(result)
+
+        self._log_step(level, "workflow_return", lambda: {
+            "response": response,
+            "reasoning": reasoning
+        })
+        return response, reasoning
+
+    @staticmethod
+    def _log_step(level: int, step: str, fields: Callable[[], Dict[str, Any]]) -> None:
+        """Log a structured workflow step; fields are only built and serialized if the level is enabled."""
+        if logger.isEnabledFor(level):
+            logger.log(level, json.dumps({
+                "timestamp": datetime.utcnow().isoformat(),
+                "step": step,
+                **fields()
+            }, default=str))
+
+    def _normalize_result(self, result: Any) -> Tuple[Optional[Any], Any]:
+        """Reduce a graph result to (response, reasoning); response is None if no agent answered."""
         # Guarantee result is a dict
         if isinstance(result, tuple) and len(result) == 2:
             result = {"response": result[0], "reasoning": result[1]}
@@ -282,20 +365,38 @@ Now enhance the following response:"""
         reasoning = result.get("reasoning") or result.get("reason") or result.get("orchestrator_output")
 
         # If it looks like the original state (no response produced), warn and return None
-        if not response and isinstance(result, dict) and {"user_input", "conversation_id"}.issubset(set(result.keys())):
+        if not response and {"user_input", "conversation_id"}.issubset(set(result.keys())):
             logger.warning("Workflow returned original input-state (agents likely returned None or skipped processing).")
-            logger.info(json.dumps({
-                "timestamp": datetime.utcnow().isoformat(),
-                "step": "workflow_return",
-                "response": None,
-                "reasoning": reasoning
-            }, indent=2))
             return None, reasoning
 
-        logger.info(json.dumps({
-            "timestamp": datetime.utcnow().isoformat(),
-            "step": "workflow_return",
-            "response": response,
-            "reasoning": reasoning
-        }, indent=2))
         return response, reasoning
+
+    async def stream(self, state) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Run the workflow and yield progress events as they are produced.
+
+        Events come from the compiled graph's astream_events and are reduced to plain
+        dicts keyed by "event":
+        - node: a graph node started ({"node"})
+        - routing: the orchestrator's intent classification and delegation decision
+        - context: a summary of the knowledge retrieved for the answering agent
+        - token: a piece of the answer ({"content"}); specialists stream their draft as it
+          is generated, then the formatting step sends the final text (the LLM pass token
+          by token, other modes in one piece)
+        - reset: discard the tokens received so far; the formatting step sends one before
+          the final text
+        - final: the complete response and reasoning; authoritative even when tokens
+          were streamed, since the formatting step can fall back after a failed pass
+
+        Closing the iterator (e.g. when the client disconnects) cancels the run.
+        """
+        config = {"configurable": {STREAM_ANSWER_TOKENS: True}}
+        async for event in self.compiled_graph.astream_events(state, config=config, version="v2"):
+            kind = event["event"]
+            if kind == "on_custom_event":
+                yield {"event": event["name"], **event["data"]}
+            elif kind == "on_chain_start" and event.get("metadata", {}).get("langgraph_node") == event["name"]:
+                yield {"event": "node", "node": event["name"]}
+            elif kind == "on_chain_end" and not event.get("parent_ids"):
+                response, reasoning = self._normalize_result(event["data"].get("output"))
+                yield {"event": "final", "response": response, "reasoning": reasoning}
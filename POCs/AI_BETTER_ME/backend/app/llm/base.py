@@ -2,8 +2,10 @@
 Base LLM provider interface and common types.
 """
 
+import asyncio
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any, Optional, AsyncGenerator
+from typing import List, Dict, Any, Optional, AsyncGenerator, Tuple
+import numpy as np
 from pydantic import BaseModel
 from enum import Enum
 
@@ -62,6 +64,15 @@ class BaseLLMProvider(ABC):
     def __init__(self, provider_type: LLMProviderType):
         self.provider_type = provider_type
         self._is_initialized = False
+        
+        # Embedding identity used to namespace cached vectors
+        self.embedding_model: Optional[str] = None
+        self.embedding_dimension: Optional[int] = None
+        
+        # Batch embedding limits (providers may override from configuration)
+        self.embedding_batch_size = 96
+        self.embedding_batch_max_tokens = 8000
+        self.embedding_max_concurrency = 4
     
     @abstractmethod
     async def initialize(self) -> None:
@@ -83,6 +94,68 @@ class BaseLLMProvider(ABC):
         """Generate embeddings for text."""
         pass
     
+    async def generate_embeddings(self, texts: List[str]) -> np.ndarray:
+        """
+        Generate embeddings for many texts.
+        
+        Texts are split into sub-batches bounded by embedding_batch_size items and
+        embedding_batch_max_tokens estimated tokens, and at most
+        embedding_max_concurrency sub-batches are in flight at once.
+        
+        Args:
+            texts: Texts to embed
+            
+        Returns:
+            A C-contiguous float32 matrix with one row per input text, in input order
+        """
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        
+        semaphore = asyncio.Semaphore(max(1, self.embedding_max_concurrency))
+        
+        async def embed_range(start: int, end: int) -> Tuple[int, np.ndarray]:
+            async with semaphore:
+                vectors = await self._embed_batch(texts[start:end])
+            return start, np.asarray(vectors, dtype=np.float32)
+        
+        chunks = await asyncio.gather(
+            *(embed_range(start, end) for start, end in self._split_embedding_batches(texts))
+        )
+        
+        embeddings = np.empty((len(texts), chunks[0][1].shape[1]), dtype=np.float32)
+        for start, matrix in chunks:
+            embeddings[start:start + len(matrix)] = matrix
+        return embeddings
+    
+    def _split_embedding_batches(self, texts: List[str]) -> List[Tuple[int, int]]:
+        """Split texts into [start, end) ranges that respect the item and token limits."""
+        ranges = []
+        start, batch_tokens = 0, 0
+        for i, text in enumerate(texts):
+            tokens = self._estimate_tokens(text)
+            if i > start and (i - start >= self.embedding_batch_size or
+                              batch_tokens + tokens > self.embedding_batch_max_tokens):
+                ranges.append((start, i))
+                start, batch_tokens = i, 0
+            batch_tokens += tokens
+        ranges.append((start, len(texts)))
+        return ranges
+    
+    @staticmethod
+    def _estimate_tokens(text: str) -> int:
+        """Cheap token estimate (~4 characters per token) used for batch sizing."""
+        return len(text) // 4 + 1
+    
+    async def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed one sub-batch. Providers with a native batch API should override this;
+        the default issues concurrent single-text requests.
+        """
+        responses = await asyncio.gather(
+            *(self.generate_embedding(EmbeddingRequest(text=text)) for text in texts)
+        )
+        return [response.embedding for response in responses]
+    
     @abstractmethod
     async def health_check(self) -> HealthCheckResult:
         """Check if the provider is healthy and accessible."""
@@ -93,6 +166,10 @@ class BaseLLMProvider(ABC):
         """Get list of available models for this provider."""
         pass
     
+    async def close(self) -> None:
+        """Release pooled connections; providers holding long-lived clients override this."""
+        pass
+    
     @property
     def is_initialized(self) -> bool:
         """Check if provider is initialized."""
@@ -0,0 +1,95 @@
+"""
+Circuit breaker tracking passive provider health from real call outcomes.
+"""
+
+import time
+import logging
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """
+    Closed / open / half-open breaker for one provider.
+
+    While closed, calls flow and consecutive failures are counted; reaching the
+    threshold opens the breaker. An open breaker rejects calls until reset_timeout
+    has passed, then turns half-open and lets a single trial through (a real call or
+    a background probe). A successful trial closes the breaker, a failed one opens
+    it for another reset_timeout.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """
+        Initialize the breaker.
+
+        Args:
+            failure_threshold: Consecutive failures that open the breaker
+            reset_timeout: Seconds an open breaker waits before allowing a trial call
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_started_at: Optional[float] = None
+        self._last_error: Optional[str] = None
+
+    @property
+    def state(self) -> str:
+        """Current state, turning open into half-open once the reset timeout has passed."""
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._trial_started_at = None
+        return self._state
+
+    def allow_request(self) -> bool:
+        """Whether a call may go to the provider now (without reserving a trial)."""
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN:
+            # A trial that never reported back (cancelled caller) frees the slot after reset_timeout
+            return self._trial_started_at is None or time.monotonic() - self._trial_started_at >= self.reset_timeout
+        return False
+
+    def try_acquire(self) -> bool:
+        """Reserve a call; in half-open state only one trial is let through at a time."""
+        if not self.allow_request():
+            return False
+        if self._state == self.HALF_OPEN:
+            self._trial_started_at = time.monotonic()
+        return True
+
+    def record_success(self) -> None:
+        """Record a successful call, closing the breaker."""
+        if self._state != self.CLOSED:
+            logger.info("Circuit closed after successful trial")
+        self._state = self.CLOSED
+        self._failures = 0
+        self._trial_started_at = None
+
+    def record_failure(self, error: Optional[str] = None) -> None:
+        """Record a failed call, opening the breaker at the threshold or after a failed trial."""
+        self._failures += 1
+        self._last_error = error
+        if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+            if self._state != self.OPEN:
+                logger.warning(f"Circuit opened after {self._failures} failures: {error}")
+            self._state = self.OPEN
+            self._opened_at = time.monotonic()
+            self._trial_started_at = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get breaker state for diagnostics."""
+        return {
+            "state": self.state,
+            "consecutive_failures": self._failures,
+            "last_error": self._last_error
+        }
@@ -0,0 +1,186 @@
+"""
+Adaptive concurrency limiting with priority admission for LLM provider calls.
+"""
+
+import time
+import heapq
+import asyncio
+import itertools
+import logging
+from enum import IntEnum
+from typing import Dict, Any, List, Optional
+
+from .latency import LatencyTracker
+
+logger = logging.getLogger(__name__)
+
+
+class CallPriority(IntEnum):
+    """Admission priority of an LLM call; lower values are admitted first."""
+    INTERACTIVE = 0  # user-facing chat and routing
+    NORMAL = 1
+    BACKGROUND = 2  # extraction and recording work nobody is waiting on
+
+
+class AdaptiveLimiter:
+    """
+    AIMD concurrency limit for one provider, with a priority queue in front of it.
+
+    Calls beyond the current limit wait in a queue ordered by priority, then arrival.
+    The limit adapts to observed latency: each completed call is compared with a
+    slow-moving latency baseline, and a call slower than latency_tolerance times the
+    baseline (or a failed call) cuts the limit multiplicatively, at most once per
+    baseline latency. While the limit is saturated and latency stays near the
+    baseline, it grows by about one per limit's worth of completions.
+    """
+
+    def __init__(
+        self,
+        max_limit: int = 8,
+        min_limit: int = 1,
+        initial_limit: Optional[int] = None,
+        latency_tolerance: float = 2.0,
+        backoff: float = 0.75,
+        baseline_alpha: float = 0.05
+    ):
+        """
+        Initialize the limiter.
+
+        Args:
+            max_limit: Upper bound of concurrent calls
+            min_limit: Lower bound of concurrent calls
+            initial_limit: Starting limit (defaults to a quarter of max_limit)
+            latency_tolerance: Latency, as a multiple of the baseline, treated as overload
+            backoff: Factor applied to the limit on overload
+            baseline_alpha: EWMA weight of new samples in the latency baseline
+        """
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.latency_tolerance = latency_tolerance
+        self.backoff = backoff
+        self.baseline_alpha = baseline_alpha
+
+        self._limit = float(initial_limit if initial_limit is not None else max(min_limit, max_limit // 4))
+        self._in_flight = 0
+        self._baseline: Optional[float] = None
+        self._last_decrease = 0.0
+        self._waiters: List[list] = []
+        self._sequence = itertools.count()
+
+        self._queue_wait: Dict[CallPriority, LatencyTracker] = {priority: LatencyTracker() for priority in CallPriority}
+        self._admitted: Dict[CallPriority, int] = {priority: 0 for priority in CallPriority}
+        self._max_wait: Dict[CallPriority, float] = {priority: 0.0 for priority in CallPriority}
+
+    @property
+    def limit(self) -> int:
+        """Current number of calls allowed in flight."""
+        return max(self.min_limit, int(self._limit))
+
+    @property
+    def in_flight(self) -> int:
+        """Calls currently admitted."""
+        return self._in_flight
+
+    def queued(self, priority: Optional[CallPriority] = None) -> int:
+        """Calls waiting for admission, optionally of one priority."""
+        return sum(
+            1 for entry in self._waiters
+            if not entry[2].done() and (priority is None or entry[0] == priority)
+        )
+
+    async def acquire(self, priority: CallPriority = CallPriority.NORMAL) -> None:
+        """
+        Wait for a slot; every successful acquire must be paired with release().
+
+        Args:
+            priority: Admission priority of the call
+        """
+        started = time.perf_counter()
+        if self._in_flight < self.limit and not self.queued():
+            self._in_flight += 1
+            self._record_admission(priority, 0.0)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, [priority, next(self._sequence), future])
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Admitted just as the caller gave up; hand the slot on
+                self._in_flight -= 1
+                self._admit_waiters()
+            raise
+        self._record_admission(priority, time.perf_counter() - started)
+
+    def release(self, latency: Optional[float] = None, success: bool = True) -> None:
+        """
+        Free a slot and adapt the limit.
+
+        Args:
+            latency: Duration of the call in seconds (None to skip adaptation)
+            success: Whether the call succeeded; failures count as overload
+        """
+        saturated = self._in_flight >= self.limit
+        self._in_flight -= 1
+        if not success:
+            self._decrease()
+        elif latency is not None:
+            self._observe(latency, saturated)
+        self._admit_waiters()
+
+    def _observe(self, latency: float, saturated: bool) -> None:
+        """Feed one successful call's latency into the limit."""
+        if self._baseline is None:
+            self._baseline = latency
+            return
+
+        if latency > self.latency_tolerance * self._baseline:
+            self._decrease()
+        elif saturated:
+            self._limit = min(float(self.max_limit), self._limit + 1.0 / self._limit)
+        self._baseline += self.baseline_alpha * (latency - self._baseline)
+
+    def _decrease(self) -> None:
+        """Cut the limit, at most once per baseline latency so one burst counts once."""
+        now = time.monotonic()
+        if now - self._last_decrease < (self._baseline or 0.0):
+            return
+        self._last_decrease = now
+        new_limit = max(float(self.min_limit), self._limit * self.backoff)
+        if int(new_limit) != int(self._limit):
+            logger.info(f"Concurrency limit lowered to {int(new_limit)}")
+        self._limit = new_limit
+
+    def _admit_waiters(self) -> None:
+        """Admit queued calls in priority order while slots are free."""
+        while self._waiters and self._in_flight < self.limit:
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                continue
+            self._in_flight += 1
+            future.set_result(None)
+
+    def _record_admission(self, priority: CallPriority, wait: float) -> None:
+        """Record queue time of an admitted call."""
+        self._admitted[priority] += 1
+        self._queue_wait[priority].record(wait)
+        self._max_wait[priority] = max(self._max_wait[priority], wait)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get limit and queue-time metrics."""
+        return {
+            "limit": self.limit,
+            "in_flight": self._in_flight,
+            "latency_baseline_ms": round((self._baseline or 0.0) * 1000, 1),
+            "queues": {
+                priority.name.lower(): {
+                    "queued": self.queued(priority),
+                    "admitted": self._admitted[priority],
+                    "wait_p50_ms": round(self._queue_wait[priority].percentile(0.5) * 1000, 1) if self._admitted[priority] else 0.0,
+                    "wait_p95_ms": round(self._queue_wait[priority].percentile(0.95) * 1000, 1) if self._admitted[priority] else 0.0,
+                    "wait_max_ms": round(self._max_wait[priority] * 1000, 1)
+                }
+                for priority in CallPriority
+            }
+        }
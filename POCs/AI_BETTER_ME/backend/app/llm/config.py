@@ -25,15 +25,57 @@ class LLMConfig(BaseModel):
     # Ollama configuration
     ollama_endpoint: str = "http://localhost:11434"
     ollama_model: str = "llama3.2:3b"
+    ollama_http_pool_size: int = 16
+    ollama_keepalive_timeout: float = 60.0
     
     # Common parameters
     max_tokens: int = 4000
     temperature: float = 0.7
     
+    # Batch embedding settings
+    embedding_batch_size: int = 96
+    embedding_batch_max_tokens: int = 8000
+    embedding_max_concurrency: int = 4
+    
+    # Embedding cache settings
+    embedding_cache_enabled: bool = True
+    embedding_cache_size: int = 4096
+    embedding_cache_path: Optional[str] = "data/embedding_cache.db"
+    
+    # Response cache settings
+    response_cache_enabled: bool = True
+    response_cache_size: int = 2048
+    response_cache_ttl: float = 3600.0
+    response_cache_max_temperature: float = 0.0  # above this, responses are cached only on explicit opt-in
+    response_cache_semantic_enabled: bool = False
+    response_cache_similarity_threshold: float = 0.95
+    
     # Health check settings
     health_check_timeout: float = 30.0
     health_check_interval: float = 300.0  # 5 minutes
     
+    # Circuit breaker settings (passive health from real calls)
+    circuit_failure_threshold: int = 5
+    circuit_reset_timeout: float = 30.0
+    
+    # Latency-aware routing settings
+    latency_routing_enabled: bool = True
+    latency_ewma_alpha: float = 0.2
+    latency_switch_ratio: float = 1.5  # route away when another provider is this many times faster
+    latency_min_samples: int = 10
+    latency_explore_ratio: float = 0.05
+    
+    # Request hedging settings (short calls only)
+    hedging_enabled: bool = True
+    hedge_budget_ratio: float = 0.1  # at most ~10% of hedge-eligible calls are duplicated
+    hedge_min_delay: float = 1.0  # hedging delay until the provider's p95 is known
+    
+    # Adaptive concurrency settings (chat calls; limits start at a quarter of the maximum)
+    concurrency_limit_enabled: bool = True
+    ollama_max_concurrency: int = 4  # Ollama generates one response at a time per loaded model by default
+    openai_max_concurrency: int = 32
+    concurrency_latency_tolerance: float = 2.0
+    
     class Config:
         use_enum_values = True
     
@@ -45,14 +87,22 @@ class LLMConfig(BaseModel):
                 "model": self.openai_model,
                 "base_url": self.openai_base_url,
                 "max_tokens": self.max_tokens,
-                "temperature": self.temperature
+                "temperature": self.temperature,
+                "embedding_batch_size": self.embedding_batch_size,
+                "embedding_batch_max_tokens": self.embedding_batch_max_tokens,
+                "embedding_max_concurrency": self.embedding_max_concurrency
             }
         elif provider_type == LLMProviderType.OLLAMA:
             return {
                 "endpoint": self.ollama_endpoint,
                 "model": self.ollama_model,
                 "max_tokens": self.max_tokens,
-                "temperature": self.temperature
+                "temperature": self.temperature,
+                "embedding_batch_size": self.embedding_batch_size,
+                "embedding_batch_max_tokens": self.embedding_batch_max_tokens,
+                "embedding_max_concurrency": self.embedding_max_concurrency,
+                "http_pool_size": self.ollama_http_pool_size,
+                "http_keepalive_timeout": self.ollama_keepalive_timeout
             }
         else:
             raise ValueError(f"Unsupported provider type: {provider_type}")
@@ -80,10 +130,43 @@ class LLMConfig(BaseModel):
             
             ollama_endpoint=env_vars.get("OLLAMA_ENDPOINT", "http://localhost:11434"),
             ollama_model=env_vars.get("OLLAMA_MODEL", "llama3.2:3b"),
+            ollama_http_pool_size=int(env_vars.get("OLLAMA_HTTP_POOL_SIZE", "16")),
+            ollama_keepalive_timeout=float(env_vars.get("OLLAMA_KEEPALIVE_TIMEOUT", "60.0")),
             
             max_tokens=int(env_vars.get("LLM_MAX_TOKENS", "4000")),
             temperature=float(env_vars.get("LLM_TEMPERATURE", "0.7")),
             
+            embedding_batch_size=int(env_vars.get("EMBEDDING_BATCH_SIZE", "96")),
+            embedding_batch_max_tokens=int(env_vars.get("EMBEDDING_BATCH_MAX_TOKENS", "8000")),
+            embedding_max_concurrency=int(env_vars.get("EMBEDDING_MAX_CONCURRENCY", "4")),
+            
+            embedding_cache_enabled=env_vars.get("EMBEDDING_CACHE_ENABLED", "true").lower() == "true",
+            embedding_cache_size=int(env_vars.get("EMBEDDING_CACHE_SIZE", "4096")),
+            embedding_cache_path=env_vars.get("EMBEDDING_CACHE_PATH", "data/embedding_cache.db") or None,
+            
+            response_cache_enabled=env_vars.get("RESPONSE_CACHE_ENABLED", "true").lower() == "true",
+            response_cache_size=int(env_vars.get("RESPONSE_CACHE_SIZE", "2048")),
+            response_cache_ttl=float(env_vars.get("RESPONSE_CACHE_TTL", "3600.0")),
+            response_cache_max_temperature=float(env_vars.get("RESPONSE_CACHE_MAX_TEMPERATURE", "0.0")),
+            response_cache_semantic_enabled=env_vars.get("RESPONSE_CACHE_SEMANTIC_ENABLED", "false").lower() == "true",
+            response_cache_similarity_threshold=float(env_vars.get("RESPONSE_CACHE_SIMILARITY_THRESHOLD", "0.95")),
+            
             health_check_timeout=float(env_vars.get("LLM_HEALTH_CHECK_TIMEOUT", "30.0")),
-            health_check_interval=float(env_vars.get("LLM_HEALTH_CHECK_INTERVAL", "300.0"))
+            health_check_interval=float(env_vars.get("LLM_HEALTH_CHECK_INTERVAL", "300.0")),
+            
+            circuit_failure_threshold=int(env_vars.get("LLM_CIRCUIT_FAILURE_THRESHOLD", "5")),
+            circuit_reset_timeout=float(env_vars.get("LLM_CIRCUIT_RESET_TIMEOUT", "30.0")),
+            
+            latency_routing_enabled=env_vars.get("LLM_LATENCY_ROUTING_ENABLED", "true").lower() == "true",
+            latency_switch_ratio=float(env_vars.get("LLM_LATENCY_SWITCH_RATIO", "1.5")),
+            latency_explore_ratio=float(env_vars.get("LLM_LATENCY_EXPLORE_RATIO", "0.05")),
+            
+            hedging_enabled=env_vars.get("LLM_HEDGING_ENABLED", "true").lower() == "true",
+            hedge_budget_ratio=float(env_vars.get("LLM_HEDGE_BUDGET_RATIO", "0.1")),
+            hedge_min_delay=float(env_vars.get("LLM_HEDGE_MIN_DELAY", "1.0")),
+            
+            concurrency_limit_enabled=env_vars.get("LLM_CONCURRENCY_LIMIT_ENABLED", "true").lower() == "true",
+            ollama_max_concurrency=int(env_vars.get("OLLAMA_MAX_CONCURRENCY", "4")),
+            openai_max_concurrency=int(env_vars.get("OPENAI_MAX_CONCURRENCY", "32")),
+            concurrency_latency_tolerance=float(env_vars.get("LLM_CONCURRENCY_LATENCY_TOLERANCE", "2.0"))
         )
\ No newline at end of file
@@ -0,0 +1,242 @@
+"""
+Content-addressed embedding cache with an in-memory LRU tier and a SQLite tier.
+"""
+
+import os
+import hashlib
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingCache:
+    """
+    Cache of embeddings keyed by (namespace, sha256(text)).
+
+    The namespace identifies the provider, embedding model and dimension that produced
+    a vector, so embeddings from different models never mix. Lookups hit the in-memory
+    LRU first, then the on-disk SQLite tier, promoting disk hits into memory.
+    """
+
+    def __init__(self, max_entries: int = 4096, db_path: Optional[str] = "data/embedding_cache.db"):
+        """
+        Initialize the embedding cache.
+
+        Args:
+            max_entries: Maximum number of embeddings held in the in-memory tier
+            db_path: Path of the SQLite database for the on-disk tier, or None for memory only
+        """
+        self.max_entries = max_entries
+        self.db_path = db_path
+
+        self._memory: "OrderedDict[Tuple[str, str], np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+
+        self._memory_hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+
+        if db_path:
+            self._open_db()
+
+    def _open_db(self) -> None:
+        """Open (and create if needed) the on-disk tier."""
+        try:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "namespace TEXT NOT NULL, digest TEXT NOT NULL, vector BLOB NOT NULL, "
+                "PRIMARY KEY (namespace, digest))"
+            )
+            self._db.commit()
+        except Exception as e:
+            logger.error(f"Failed to open embedding cache database, using memory only: {e}")
+            self._db = None
+
+    @staticmethod
+    def make_namespace(provider: str, model: Optional[str], dimension: Optional[int]) -> str:
+        """Build the cache namespace for a provider, embedding model and dimension."""
+        return f"{provider}:{model or 'default'}:{dimension or 'native'}"
+
+    @staticmethod
+    def _digest(text: str) -> str:
+        """Content address of a text."""
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def get(self, namespace: str, text: str) -> Optional[np.ndarray]:
+        """
+        Look up the embedding for a text.
+
+        Args:
+            namespace: Cache namespace from make_namespace
+            text: The embedded text
+
+        Returns:
+            The cached float32 vector, or None on a miss
+        """
+        return self.get_many(namespace, [text])[0]
+
+    def get_many(self, namespace: str, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """
+        Look up embeddings for many texts.
+
+        Args:
+            namespace: Cache namespace from make_namespace
+            texts: The embedded texts
+
+        Returns:
+            One cached float32 vector (or None on a miss) per text, in input order
+        """
+        keys = [(namespace, self._digest(text)) for text in texts]
+        results: List[Optional[np.ndarray]] = [None] * len(texts)
+        disk_lookups: List[int] = []
+
+        with self._lock:
+            for i, key in enumerate(keys):
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    self._memory_hits += 1
+                    results[i] = vector
+                else:
+                    disk_lookups.append(i)
+
+            if disk_lookups and self._db is not None:
+                try:
+                    for i in disk_lookups:
+                        row = self._db.execute(
+                            "SELECT vector FROM embeddings WHERE namespace = ? AND digest = ?", keys[i]
+                        ).fetchone()
+                        if row is not None:
+                            vector = np.frombuffer(row[0], dtype=np.float32)
+                            self._remember(keys[i], vector)
+                            self._disk_hits += 1
+                            results[i] = vector
+                except Exception as e:
+                    logger.error(f"Embedding cache disk lookup failed: {e}")
+
+            self._misses += sum(1 for result in results if result is None)
+
+        return results
+
+    def put(self, namespace: str, text: str, embedding) -> None:
+        """
+        Store the embedding for a text in both tiers.
+
+        Args:
+            namespace: Cache namespace from make_namespace
+            text: The embedded text
+            embedding: The embedding vector
+        """
+        self.put_many(namespace, [text], [embedding])
+
+    def put_many(self, namespace: str, texts: List[str], embeddings) -> None:
+        """
+        Store embeddings for many texts in both tiers.
+
+        Args:
+            namespace: Cache namespace from make_namespace
+            texts: The embedded texts
+            embeddings: One embedding vector per text (a matrix or list of vectors)
+        """
+        rows = []
+        with self._lock:
+            for text, embedding in zip(texts, embeddings):
+                key = (namespace, self._digest(text))
+                vector = np.array(embedding, dtype=np.float32)
+                vector.setflags(write=False)
+                self._remember(key, vector)
+                rows.append((key[0], key[1], vector.tobytes()))
+
+            if rows and self._db is not None:
+                try:
+                    self._db.executemany(
+                        "INSERT OR REPLACE INTO embeddings (namespace, digest, vector) VALUES (?, ?, ?)", rows
+                    )
+                    self._db.commit()
+                except Exception as e:
+                    logger.error(f"Embedding cache disk write failed: {e}")
+
+    def _remember(self, key: Tuple[str, str], vector: np.ndarray) -> None:
+        """Insert into the in-memory tier, evicting the least recently used entry."""
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def invalidate(self, namespace: Optional[str] = None) -> None:
+        """
+        Drop cached embeddings from both tiers.
+
+        Args:
+            namespace: Only drop this namespace; drop everything when None
+        """
+        with self._lock:
+            if namespace is None:
+                self._memory.clear()
+            else:
+                for key in [key for key in self._memory if key[0] == namespace]:
+                    del self._memory[key]
+
+            if self._db is not None:
+                try:
+                    if namespace is None:
+                        self._db.execute("DELETE FROM embeddings")
+                    else:
+                        self._db.execute("DELETE FROM embeddings WHERE namespace = ?", (namespace,))
+                    self._db.commit()
+                except Exception as e:
+                    logger.error(f"Embedding cache invalidation failed: {e}")
+
+        logger.info(f"Invalidated embedding cache namespace: {namespace or 'all'}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get cache hit-rate metrics."""
+        with self._lock:
+            hits = self._memory_hits + self._disk_hits
+            lookups = hits + self._misses
+            return {
+                "memory_hits": self._memory_hits,
+                "disk_hits": self._disk_hits,
+                "misses": self._misses,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "max_entries": self.max_entries,
+                "disk_enabled": self._db is not None
+            }
+
+    def close(self) -> None:
+        """Close the on-disk tier."""
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+# Global cache instance, shared by every LLMService so swapping services keeps warm entries
+_embedding_cache: Optional[EmbeddingCache] = None
+
+
+def get_embedding_cache(max_entries: int = 4096, db_path: Optional[str] = "data/embedding_cache.db") -> EmbeddingCache:
+    """Get the global embedding cache instance."""
+    global _embedding_cache
+    if _embedding_cache is None:
+        _embedding_cache = EmbeddingCache(max_entries=max_entries, db_path=db_path)
+    return _embedding_cache
+
+
+def shutdown_embedding_cache() -> None:
+    """Close the global embedding cache instance."""
+    global _embedding_cache
+    if _embedding_cache is not None:
+        _embedding_cache.close()
+        _embedding_cache = None
@@ -3,12 +3,16 @@ LLM provider factory with health checks and fallback mechanisms.
 """
 
 import asyncio
+import time
+import random
 import logging
-from typing import Optional, Dict, Any
-from datetime import datetime, timedelta
+from typing import Optional, Dict, Any, List, Tuple
+from datetime import datetime
 
 from .base import BaseLLMProvider, LLMProviderType, HealthCheckResult
+from .circuit_breaker import CircuitBreaker
 from .config import LLMConfig
+from .latency import LatencyTracker
 from .openai_provider import OpenAIProvider
 from .ollama_provider import OllamaProvider
 
@@ -16,15 +20,41 @@ logger = logging.getLogger(__name__)
 
 
 class LLMProviderFactory:
-    """Factory for creating and managing LLM providers with health checks and fallback."""
+    """
+    Factory for creating and managing LLM providers with health checks and fallback.
+    
+    Health is never checked on the request path. A background task probes every
+    provider concurrently and publishes the results by swapping in a new
+    _health_status dict, so get_provider only reads the latest snapshot. Real call
+    outcomes, reported through record_success/record_failure, drive a circuit
+    breaker per provider that takes a failing provider out of rotation between probes.
+    
+    Among usable providers, chat calls are routed by EWMA latency: when another
+    provider has been consistently faster than the preferred one by
+    latency_switch_ratio, calls go there, with a small exploration share keeping
+    every estimate fresh. Embedding calls stay on the current provider (see
+    get_embedding_provider). Latency is also tracked per call class (the caller's
+    route), and hedging waits on the p95 of the hedged call's own class, since a
+    short classification and a long generation have very different latencies.
+    """
+    
+    # Minimum seconds between probe rounds requested on demand
+    MIN_PROBE_INTERVAL = 1.0
     
     def __init__(self, config: LLMConfig):
         self.config = config
         self._providers: Dict[LLMProviderType, BaseLLMProvider] = {}
         self._health_status: Dict[LLMProviderType, HealthCheckResult] = {}
         self._last_health_check: Dict[LLMProviderType, datetime] = {}
+        self._breakers: Dict[LLMProviderType, CircuitBreaker] = {}
+        self._latency: Dict[LLMProviderType, LatencyTracker] = {}
+        self._route_latency: Dict[Tuple[LLMProviderType, str], LatencyTracker] = {}
+        self._first_token_latency: Dict[Tuple[LLMProviderType, str], LatencyTracker] = {}
         self._current_provider: Optional[BaseLLMProvider] = None
         self._fallback_provider: Optional[BaseLLMProvider] = None
+        self._health_task: Optional[asyncio.Task] = None
+        self._probe_requested: Optional[asyncio.Event] = None
+        self._last_probe_round = 0.0
     
     async def initialize(self) -> None:
         """Initialize the factory and providers."""
@@ -54,7 +84,8 @@ class LLMProviderFactory:
             
             if not self._current_provider:
                 raise Exception("No providers could be initialized")
-                raise Exception("No providers could be initialized")
+            
+            self._start_health_monitor()
                 
         except Exception as e:
             logger.error(f"Failed to initialize LLM providers: {e}")
@@ -103,14 +134,22 @@ class LLMProviderFactory:
                     model=provider_config_dict["model"],
                     max_tokens=provider_config_dict["max_tokens"],
                     temperature=provider_config_dict["temperature"],
-                    base_url=provider_config_dict["base_url"]
+                    base_url=provider_config_dict["base_url"],
+                    embedding_batch_size=provider_config_dict["embedding_batch_size"],
+                    embedding_batch_max_tokens=provider_config_dict["embedding_batch_max_tokens"],
+                    embedding_max_concurrency=provider_config_dict["embedding_max_concurrency"]
                 )
             elif provider_type == LLMProviderType.OLLAMA:
                 provider = provider_cls(
                     endpoint=provider_config_dict["endpoint"],
                     model=provider_config_dict["model"],
                     max_tokens=provider_config_dict["max_tokens"],
-                    temperature=provider_config_dict["temperature"]
+                    temperature=provider_config_dict["temperature"],
+                    embedding_batch_size=provider_config_dict["embedding_batch_size"],
+                    embedding_batch_max_tokens=provider_config_dict["embedding_batch_max_tokens"],
+                    embedding_max_concurrency=provider_config_dict["embedding_max_concurrency"],
+                    http_pool_size=provider_config_dict["http_pool_size"],
+                    http_keepalive_timeout=provider_config_dict["http_keepalive_timeout"]
                 )
             else:
                 logger.error(f"Unsupported provider type: {provider_type}")
@@ -127,76 +166,248 @@ class LLMProviderFactory:
             return None
     
     async def get_provider(self) -> BaseLLMProvider:
-        """Get the current active provider with automatic fallback."""
-        # Check if we need to perform health checks
-        await self._check_provider_health()
+        """
+        Get the current active provider with automatic fallback.
         
-        # Return current provider if healthy
-        if (self._current_provider and 
-            self._is_provider_healthy(self._current_provider.provider_type)):
-            return self._current_provider
+        Only reads the published health snapshot and the circuit breakers; it never
+        waits on a health probe.
+        """
+        available = [
+            provider for provider in self._candidate_providers()
+            if self._is_provider_available(provider.provider_type, reserve=False)
+        ]
+        if not available:
+            # Nothing usable right now; have the monitor re-probe instead of probing inline
+            self._request_probe()
+            raise Exception("No healthy providers available")
         
-        # Try fallback if primary is unhealthy
-        if (self._fallback_provider and 
-            self._is_provider_healthy(self._fallback_provider.provider_type)):
-            logger.warning(f"Switching to fallback provider: {self._fallback_provider.provider_type}")
-            self._current_provider = self._fallback_provider
-            return self._current_provider
+        if available[0] is not self._current_provider:
+            logger.warning(f"Switching to provider: {available[0].provider_type}")
+            self._current_provider = available[0]
         
-        # If both are unhealthy, try to reinitialize primary
-        if self._current_provider:
-            try:
-                await self._current_provider.initialize()
-                health = await self._current_provider.health_check()
-                self._health_status[self._current_provider.provider_type] = health
-                self._last_health_check[self._current_provider.provider_type] = datetime.now()
-                
-                if health.is_healthy:
-                    return self._current_provider
-            except Exception as e:
-                logger.error(f"Failed to reinitialize primary provider: {e}")
+        provider = self._route_by_latency(available)
+        self._get_breaker(provider.provider_type).try_acquire()
+        return provider
+    
+    async def get_embedding_provider(self) -> BaseLLMProvider:
+        """
+        Get the provider for embedding calls.
         
-        raise Exception("No healthy providers available")
+        Embeddings from different models are not comparable even at the same
+        dimension, so embedding calls always go to the current provider, whose model
+        the vector index and embedding cache hold, and skip latency routing and
+        exploration. Another provider is used only while the current one is down.
+        """
+        available = [
+            provider for provider in self._candidate_providers()
+            if self._is_provider_available(provider.provider_type, reserve=False)
+        ]
+        if not available:
+            self._request_probe()
+            raise Exception("No healthy providers available")
+        
+        provider = self._current_provider if self._current_provider in available else available[0]
+        if provider is not self._current_provider:
+            logger.warning(f"Current provider unavailable, embedding with {provider.provider_type}")
+        self._get_breaker(provider.provider_type).try_acquire()
+        return provider
     
-    async def _check_provider_health(self) -> None:
-        """Check health of all providers if needed."""
-        now = datetime.now()
+    def _route_by_latency(self, available: List[BaseLLMProvider]) -> BaseLLMProvider:
+        """Pick a provider among usable ones, preferring the first unless another is clearly faster."""
+        preferred = available[0]
+        if not self.config.latency_routing_enabled or len(available) < 2:
+            return preferred
         
-        for provider_type, provider in self._providers.items():
-            last_check = self._last_health_check.get(provider_type)
+        def ewma(provider: BaseLLMProvider) -> Optional[float]:
+            tracker = self._latency.get(provider.provider_type)
+            return tracker.ewma if tracker and tracker.count >= self.config.latency_min_samples else None
+        
+        preferred_latency = ewma(preferred)
+        if preferred_latency is None:
+            return preferred
+        
+        if random.random() < self.config.latency_explore_ratio:
+            return random.choice(available)
+        
+        measured = [(latency, provider) for provider in available[1:] if (latency := ewma(provider)) is not None]
+        if measured:
+            fastest_latency, fastest = min(measured, key=lambda item: item[0])
+            if fastest_latency * self.config.latency_switch_ratio < preferred_latency:
+                return fastest
+        return preferred
+    
+    def get_hedge_provider(self, primary: BaseLLMProvider) -> Optional[BaseLLMProvider]:
+        """Get a usable provider other than primary to send a hedged request to."""
+        for provider in self._candidate_providers():
+            if provider is not primary and self._is_provider_available(provider.provider_type):
+                return provider
+        return None
+    
+    def get_hedge_delay(self, provider_type: LLMProviderType, route: str = "default") -> float:
+        """Seconds to wait on a provider before hedging: its p95 latency for the call class once enough samples exist."""
+        tracker = self._route_latency.get((provider_type, route))
+        if tracker is None or tracker.count < self.config.latency_min_samples:
+            return self.config.hedge_min_delay
+        return tracker.percentile(0.95)
+    
+    def _candidate_providers(self) -> List[BaseLLMProvider]:
+        """Providers in preference order: current, fallback, then any other initialized one."""
+        candidates = []
+        for provider in (self._current_provider, self._fallback_provider, *self._providers.values()):
+            if provider is not None and provider not in candidates:
+                candidates.append(provider)
+        return candidates
+    
+    def _get_breaker(self, provider_type: LLMProviderType) -> CircuitBreaker:
+        """Get the circuit breaker of a provider, creating it on first use."""
+        breaker = self._breakers.get(provider_type)
+        if breaker is None:
+            breaker = CircuitBreaker(
+                failure_threshold=self.config.circuit_failure_threshold,
+                reset_timeout=self.config.circuit_reset_timeout
+            )
+            self._breakers[provider_type] = breaker
+        return breaker
+    
+    def _is_provider_available(self, provider_type: LLMProviderType, reserve: bool = True) -> bool:
+        """
+        Check whether a provider may take a call now.
+        
+        A provider that has not been probed yet (just initialized, or switched to without
+        a health check) counts as healthy until the monitor says otherwise.
+        
+        Args:
+            provider_type: Provider to check
+            reserve: Reserve the trial call when the provider's breaker is half-open
+        """
+        health = self._health_status.get(provider_type)
+        if health is not None and not health.is_healthy:
+            return False
+        breaker = self._get_breaker(provider_type)
+        return breaker.try_acquire() if reserve else breaker.allow_request()
+    
+    def record_success(self, provider_type: LLMProviderType, latency: Optional[float] = None, route: str = "default") -> None:
+        """
+        Report a successful call to a provider.
+        
+        Args:
+            provider_type: Provider that served the call
+            latency: Call duration in seconds, for calls that feed latency routing
+            route: Call class the latency is also tracked under, for hedging delays
+        """
+        if provider_type in self._providers:
+            self._get_breaker(provider_type).record_success()
+            if latency is not None:
+                for trackers, key in ((self._latency, provider_type), (self._route_latency, (provider_type, route))):
+                    tracker = trackers.get(key)
+                    if tracker is None:
+                        tracker = trackers[key] = LatencyTracker(alpha=self.config.latency_ewma_alpha)
+                    tracker.record(latency)
+    
+    def record_first_token(self, provider_type: LLMProviderType, latency: float, route: str = "default") -> None:
+        """
+        Report a streamed call's time to first token.
+        
+        Kept apart from whole-call latencies, which a stream's length would distort, so
+        it feeds neither routing nor hedging.
+        
+        Args:
+            provider_type: Provider that served the call
+            latency: Seconds from sending the request to the first chunk
+            route: Call class the latency is tracked under
+        """
+        tracker = self._first_token_latency.get((provider_type, route))
+        if tracker is None:
+            tracker = self._first_token_latency[(provider_type, route)] = LatencyTracker(alpha=self.config.latency_ewma_alpha)
+        tracker.record(latency)
+    
+    def record_failure(self, provider_type: LLMProviderType, error: Optional[str] = None) -> None:
+        """Report a failed call to a provider."""
+        if provider_type in self._providers:
+            breaker = self._get_breaker(provider_type)
+            breaker.record_failure(error)
+            if breaker.state != CircuitBreaker.CLOSED:
+                self._request_probe()
+    
+    def _start_health_monitor(self) -> None:
+        """Start the background health monitor if it is not running."""
+        if self._health_task is None or self._health_task.done():
+            self._probe_requested = asyncio.Event()
+            self._health_task = asyncio.create_task(self._health_monitor())
+    
+    def _request_probe(self) -> None:
+        """Wake the health monitor for an early probe round (rate limited)."""
+        if self._probe_requested is not None and time.monotonic() - self._last_probe_round >= self.MIN_PROBE_INTERVAL:
+            self._probe_requested.set()
+    
+    async def _health_monitor(self) -> None:
+        """Probe all providers every health_check_interval, sooner while any is unhealthy."""
+        while True:
+            self._probe_requested.clear()
+            try:
+                await self._probe_providers()
+            except Exception as e:
+                logger.error(f"Health probe round failed: {e}")
             
-            # Check if we need to perform health check
-            if (not last_check or 
-                now - last_check > timedelta(seconds=self.config.health_check_interval)):
-                
-                try:
-                    health = await asyncio.wait_for(
-                        provider.health_check(),
-                        timeout=self.config.health_check_timeout
-                    )
-                    self._health_status[provider_type] = health
-                    self._last_health_check[provider_type] = now
-                    
-                    if not health.is_healthy:
-                        logger.warning(f"Provider {provider_type} is unhealthy: {health.error}")
-                    
-                except asyncio.TimeoutError:
-                    logger.error(f"Health check timeout for provider: {provider_type}")
-                    self._health_status[provider_type] = HealthCheckResult(
-                        is_healthy=False,
-                        provider_type=provider_type,
-                        error="Health check timeout"
-                    )
-                    self._last_health_check[provider_type] = now
-                    
-                except Exception as e:
-                    logger.error(f"Health check failed for provider {provider_type}: {e}")
-                    self._health_status[provider_type] = HealthCheckResult(
-                        is_healthy=False,
-                        provider_type=provider_type,
-                        error=str(e)
-                    )
-                    self._last_health_check[provider_type] = now
+            delay = self.config.health_check_interval
+            degraded = any(not health.is_healthy for health in self._health_status.values()) or \
+                any(breaker.state != CircuitBreaker.CLOSED for breaker in self._breakers.values())
+            if degraded:
+                delay = min(delay, self.config.circuit_reset_timeout)
+            
+            try:
+                await asyncio.wait_for(self._probe_requested.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+    
+    async def _probe_providers(self) -> None:
+        """Probe every provider concurrently, publishing each result as it arrives."""
+        self._last_probe_round = time.monotonic()
+        await asyncio.gather(*(
+            self._probe_provider(provider_type, provider)
+            for provider_type, provider in list(self._providers.items())
+        ))
+    
+    async def _probe_provider(self, provider_type: LLMProviderType, provider: BaseLLMProvider) -> None:
+        """Run one health check and publish it to the snapshot."""
+        try:
+            health = await asyncio.wait_for(
+                provider.health_check(),
+                timeout=self.config.health_check_timeout
+            )
+            if not health.is_healthy:
+                logger.warning(f"Provider {provider_type} is unhealthy: {health.error}")
+        
+        except asyncio.TimeoutError:
+            logger.error(f"Health check timeout for provider: {provider_type}")
+            health = HealthCheckResult(
+                is_healthy=False,
+                provider_type=provider_type,
+                error="Health check timeout"
+            )
+        
+        except Exception as e:
+            logger.error(f"Health check failed for provider {provider_type}: {e}")
+            health = HealthCheckResult(
+                is_healthy=False,
+                provider_type=provider_type,
+                error=str(e)
+            )
+        
+        self._publish_health(provider_type, health)
+        
+        # A probe after the open period doubles as the half-open trial
+        breaker = self._get_breaker(provider_type)
+        if breaker.state == CircuitBreaker.HALF_OPEN:
+            if health.is_healthy:
+                breaker.record_success()
+            else:
+                breaker.record_failure(health.error)
+    
+    def _publish_health(self, provider_type: LLMProviderType, health: HealthCheckResult) -> None:
+        """Publish a health result by swapping in a new snapshot (readers never see a partial update)."""
+        self._health_status = {**self._health_status, provider_type: health}
+        self._last_health_check[provider_type] = datetime.now()
     
     def _is_provider_healthy(self, provider_type: LLMProviderType) -> bool:
         """Check if a provider is currently healthy."""
@@ -223,10 +434,10 @@ class LLMProviderFactory:
             else:
                 # Check health
                 health = await provider.health_check()
-                self._health_status[provider_type] = health
-                self._last_health_check[provider_type] = datetime.now()
+                self._publish_health(provider_type, health)
                 
                 if health.is_healthy:
+                    self._get_breaker(provider_type).record_success()
                     self._current_provider = provider
                     logger.info(f"Switched to provider: {provider_type}")
                     return True
@@ -242,6 +453,24 @@ class LLMProviderFactory:
         """Get health status of all providers."""
         return self._health_status.copy()
     
+    def get_circuit_status(self) -> Dict[LLMProviderType, Dict[str, Any]]:
+        """Get circuit breaker state of all providers."""
+        return {provider_type: self._get_breaker(provider_type).get_stats() for provider_type in self._providers}
+    
+    def get_latency_stats(self) -> Dict[LLMProviderType, Dict[str, Any]]:
+        """Get chat latency statistics of all providers that have served calls, with a breakdown per call class."""
+        stats = {provider_type: {**tracker.get_stats(), "routes": {}} for provider_type, tracker in self._latency.items()}
+        for (provider_type, route), tracker in self._route_latency.items():
+            stats[provider_type]["routes"][route] = tracker.get_stats()
+        return stats
+    
+    def get_first_token_stats(self) -> Dict[LLMProviderType, Dict[str, Dict[str, Any]]]:
+        """Get time-to-first-token statistics of streamed calls per provider and call class."""
+        stats: Dict[LLMProviderType, Dict[str, Dict[str, Any]]] = {}
+        for (provider_type, route), tracker in self._first_token_latency.items():
+            stats.setdefault(provider_type, {})[route] = tracker.get_stats()
+        return stats
+    
     def get_current_provider_type(self) -> Optional[LLMProviderType]:
         """Get the type of the current active provider."""
         return self._current_provider.provider_type if self._current_provider else None
@@ -249,8 +478,18 @@ class LLMProviderFactory:
     async def shutdown(self) -> None:
         """Shutdown all providers."""
         logger.info("Shutting down LLM providers")
-        # Note: LangChain providers don't typically need explicit shutdown,
-        # but we could add cleanup logic here if needed
+        if self._health_task is not None:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+            self._health_task = None
+        for provider_type, provider in self._providers.items():
+            try:
+                await provider.close()
+            except Exception as e:
+                logger.error(f"Failed to close provider {provider_type}: {e}")
         self._providers.clear()
         self._current_provider = None
         self._fallback_provider = None
\ No newline at end of file
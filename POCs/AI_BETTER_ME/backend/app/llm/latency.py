@@ -0,0 +1,104 @@
+"""
+Per-provider latency tracking and the hedging budget used for latency-aware routing.
+"""
+
+from typing import Dict, Any
+
+import numpy as np
+
+
+class LatencyTracker:
+    """
+    EWMA latency plus an exponentially decayed latency histogram for one stream of calls.
+
+    The EWMA drives routing; the histogram answers percentile queries (the p95 used
+    as the hedging delay). Decaying the bucket weights on every sample lets both
+    follow a provider whose latency shifts instead of averaging over its whole life.
+    """
+
+    # Bucket upper bounds: exactly zero (e.g. unqueued calls), then log-spaced from 10ms to ~2 minutes (25% apart)
+    BUCKET_BOUNDS = np.concatenate([[0.0], 0.01 * 1.25 ** np.arange(43)])
+
+    def __init__(self, alpha: float = 0.2, decay: float = 0.98):
+        """
+        Initialize the tracker.
+
+        Args:
+            alpha: EWMA weight of the newest sample
+            decay: Factor applied to the histogram weights on every sample
+        """
+        self.alpha = alpha
+        self.decay = decay
+
+        self.ewma = 0.0
+        self.count = 0
+        self._weights = np.zeros(len(self.BUCKET_BOUNDS) + 1)
+
+    def record(self, latency: float) -> None:
+        """Record one call latency in seconds."""
+        self.ewma = latency if self.count == 0 else self.alpha * latency + (1 - self.alpha) * self.ewma
+        self.count += 1
+        self._weights *= self.decay
+        self._weights[np.searchsorted(self.BUCKET_BOUNDS, latency)] += 1.0
+
+    def percentile(self, q: float) -> float:
+        """
+        Estimate a latency percentile in seconds.
+
+        Args:
+            q: Quantile in [0, 1]
+
+        Returns:
+            Upper bound of the bucket holding the quantile (0.0 before any sample)
+        """
+        total = self._weights.sum()
+        if total == 0:
+            return 0.0
+        bucket = int(np.searchsorted(np.cumsum(self._weights), q * total))
+        return float(self.BUCKET_BOUNDS[min(bucket, len(self.BUCKET_BOUNDS) - 1)])
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get latency statistics in milliseconds."""
+        return {
+            "samples": self.count,
+            "ewma_ms": round(self.ewma * 1000, 1),
+            "p50_ms": round(self.percentile(0.5) * 1000, 1),
+            "p95_ms": round(self.percentile(0.95) * 1000, 1)
+        }
+
+
+class HedgeBudget:
+    """
+    Token bucket capping hedged (duplicate) requests to a fraction of eligible ones.
+
+    Every hedge-eligible request adds ratio tokens (up to burst) and every hedge
+    spends one, so over time at most ratio of eligible requests are sent twice.
+    """
+
+    def __init__(self, ratio: float = 0.1, burst: float = 5.0):
+        """
+        Initialize the budget.
+
+        Args:
+            ratio: Long-run fraction of eligible requests that may be hedged
+            burst: Maximum number of hedges saved up
+        """
+        self.ratio = ratio
+        self.burst = burst
+        self._tokens = burst
+
+    def on_request(self) -> None:
+        """Credit the budget for one hedge-eligible request."""
+        self._tokens = min(self.burst, self._tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        """Spend one hedge if the budget allows it."""
+        if self._tokens >= 1.0:
+            self._tokens -= 1.0
+            return True
+        return False
+
+    @property
+    def tokens(self) -> float:
+        """Hedges currently available."""
+        return self._tokens
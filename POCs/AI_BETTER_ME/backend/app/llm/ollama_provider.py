@@ -1,14 +1,14 @@
 """
-Ollama LLM provider implementation using LangChain.
+Ollama LLM provider implementation over Ollama's HTTP API (LangChain for embeddings).
 """
 
 import asyncio
+import json
 import time
 import aiohttp
 import numpy as np
 from typing import List, AsyncGenerator, Optional, Dict, Any
-from langchain_ollama import ChatOllama, OllamaEmbeddings
-from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
+from langchain_ollama import OllamaEmbeddings
 
 from .base import (
     BaseLLMProvider, 
@@ -23,7 +23,14 @@ from .base import (
 
 
 class OllamaProvider(BaseLLMProvider):
-    """Ollama provider implementation using LangChain."""
+    """
+    Ollama provider implementation.
+    
+    Chat, streaming, health and model listing requests share one long-lived aiohttp
+    session whose connection pool keeps connections to the Ollama daemon alive between
+    calls; per-request parameters travel in the request body, so no client is built
+    per call.
+    """
     
     def __init__(
         self, 
@@ -31,7 +38,13 @@ class OllamaProvider(BaseLLMProvider):
         model: str = "llama3.2:3b",
         embedding_model: str = "llama3",  # Use llama3 for embeddings by default
         max_tokens: int = 4000,
-        temperature: float = 0.7
+        temperature: float = 0.7,
+        embedding_batch_size: int = 96,
+        embedding_batch_max_tokens: int = 8000,
+        embedding_max_concurrency: int = 4,
+        stream_read_timeout: float = 120.0,
+        http_pool_size: int = 16,
+        http_keepalive_timeout: float = 60.0
     ):
         super().__init__(LLMProviderType.OLLAMA)
         self.endpoint = endpoint.rstrip('/')
@@ -39,24 +52,51 @@ class OllamaProvider(BaseLLMProvider):
         self.embedding_model = embedding_model
         self.max_tokens = max_tokens
         self.temperature = temperature
+        self.embedding_batch_size = embedding_batch_size
+        self.embedding_batch_max_tokens = embedding_batch_max_tokens
+        self.embedding_max_concurrency = embedding_max_concurrency
+        # Longest silence tolerated between streamed chunks
+        self.stream_read_timeout = stream_read_timeout
+        # Connection pool to the daemon; Ollama never closes idle keep-alive connections
+        # itself, so the client-side timeout decides how long they are kept
+        self.http_pool_size = http_pool_size
+        self.http_keepalive_timeout = http_keepalive_timeout
         
         # Standard embedding dimension for compatibility with OpenAI
         self.target_embedding_dimension = 1536
+        self.embedding_dimension = self.target_embedding_dimension
         
-        # LangChain components
-        self._chat_model: Optional[ChatOllama] = None
+        # Pooled HTTP session (bound to the event loop that created it) and LangChain embeddings
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._session_loop: Optional[asyncio.AbstractEventLoop] = None
         self._embeddings_model: Optional[OllamaEmbeddings] = None
     
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Get the pooled HTTP session, creating it on first use in the running event loop."""
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._session_loop is not loop:
+            connector = aiohttp.TCPConnector(
+                limit=self.http_pool_size,
+                keepalive_timeout=self.http_keepalive_timeout,
+                ttl_dns_cache=300
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=None, sock_connect=10)
+            )
+            self._session_loop = loop
+        return self._session
+    
+    async def close(self) -> None:
+        """Close the pooled HTTP session."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        self._session_loop = None
+    
     async def initialize(self) -> None:
-        """Initialize Ollama provider with LangChain."""
+        """Initialize Ollama provider."""
         try:
-            # Initialize chat model
-            self._chat_model = ChatOllama(
-                base_url=self.endpoint,
-                model=self.model,
-                temperature=self.temperature,
-            )
-            
             # Initialize embeddings model (using simple approach)
             self._embeddings_model = OllamaEmbeddings(
                 model=self.embedding_model
@@ -72,25 +112,6 @@ class OllamaProvider(BaseLLMProvider):
         except Exception as e:
             raise Exception(f"Failed to initialize Ollama provider: {str(e)}")
     
-    def _format_messages_for_ollama(self, messages: List[ChatMessage]) -> str:
-        """Format messages for Ollama (which expects a single prompt string)."""
-        formatted_parts = []
-        
-        for msg in messages:
-            if msg.role == "system":
-                formatted_parts.append(f"System: {msg.content}")
-            elif msg.role == "user":
-                formatted_parts.append(f"Human: {msg.content}")
-            elif msg.role == "assistant":
-                formatted_parts.append(f"Assistant: {msg.content}")
-            else:
-                formatted_parts.append(f"Human: {msg.content}")
-        
-        # Add assistant prompt at the end
-        formatted_parts.append("Assistant:")
-        
-        return "\n\n".join(formatted_parts)
-    
     def _reduce_embedding_dimension(self, embedding: List[float]) -> List[float]:
         """
         Reduce embedding dimension to target size for compatibility.
@@ -105,63 +126,93 @@ class OllamaProvider(BaseLLMProvider):
     
     async def chat_completion(self, request: CompletionRequest) -> CompletionResponse:
         """Generate a chat completion using Ollama."""
-        if not self._is_initialized or not self._chat_model:
+        if not self._is_initialized:
             raise Exception("Provider not initialized")
         
         try:
-            # Convert our messages to LangChain messages
-            langchain_messages = []
-            for msg in request.messages:
-                if msg.role == "system":
-                    langchain_messages.append(SystemMessage(content=msg.content))
-                elif msg.role == "user":
-                    langchain_messages.append(HumanMessage(content=msg.content))
-                elif msg.role == "assistant":
-                    langchain_messages.append(AIMessage(content=msg.content))
-                else:
-                    langchain_messages.append(HumanMessage(content=msg.content))
-            
-            # Update model parameters if provided in request
-            model_kwargs = {}
-            if request.temperature is not None:
-                model_kwargs["temperature"] = request.temperature
+            session = self._get_session()
+            async with session.post(f"{self.endpoint}/api/chat", json=self._chat_payload(request, False)) as response:
+                if response.status != 200:
+                    raise Exception(f"Ollama server returned status {response.status}: {await response.text()}")
+                data = await response.json()
             
-            if model_kwargs:
-                # Create a new model instance with updated parameters
-                chat_model = ChatOllama(
-                    base_url=self.endpoint,
-                    model=self.model,
-                    **model_kwargs
-                )
-            else:
-                chat_model = self._chat_model
-            
-            # Generate completion
-            response = await chat_model.ainvoke(langchain_messages)
+            if data.get("error"):
+                raise Exception(data["error"])
             
+            prompt_tokens = data.get("prompt_eval_count", 0)
+            completion_tokens = data.get("eval_count", 0)
             return CompletionResponse(
-                content=response.content.strip(),
-                model=self.model
+                content=data.get("message", {}).get("content", "").strip(),
+                model=self.model,
+                usage={
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens
+                }
             )
             
         except Exception as e:
             raise Exception(f"Ollama completion failed: {str(e)}")
     
+    def _chat_payload(self, request: CompletionRequest, stream: bool) -> Dict[str, Any]:
+        """Build an /api/chat request body."""
+        options: Dict[str, Any] = {
+            "temperature": request.temperature if request.temperature is not None else self.temperature
+        }
+        if request.max_tokens:
+            options["num_predict"] = request.max_tokens
+        
+        return {
+            "model": self.model,
+            "messages": [
+                {"role": msg.role if msg.role in ("system", "user", "assistant") else "user", "content": msg.content}
+                for msg in request.messages
+            ],
+            "stream": stream,
+            "options": options
+        }
+    
     async def chat_completion_stream(self, request: CompletionRequest) -> AsyncGenerator[str, None]:
-        """Generate a streaming chat completion using Ollama."""
-        if not self._is_initialized or not self._chat_model:
+        """
+        Stream a chat completion token by token from Ollama's /api/chat.
+        
+        Ollama answers a streaming request with one JSON object per line (NDJSON), each
+        carrying the next piece of the message. Lines are read only as the consumer asks
+        for chunks, so a slow consumer applies TCP backpressure to the server; closing the
+        generator (e.g. when the client disconnects) closes the connection, which makes
+        Ollama stop generating.
+        """
+        if not self._is_initialized:
             raise Exception("Provider not initialized")
         
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=10, sock_read=self.stream_read_timeout)
         try:
-            # For now, use non-streaming completion and yield the result
-            # This is a fallback due to LangChain version compatibility issues
-            completion_response = await self.chat_completion(request)
-            
-            # Simulate streaming by yielding the complete response
-            # In a real implementation, you might want to chunk the response
-            if completion_response.content:
-                yield completion_response.content
-                    
+            session = self._get_session()
+            async with session.post(f"{self.endpoint}/api/chat", json=self._chat_payload(request, True),
+                                    timeout=timeout) as response:
+                if response.status != 200:
+                    raise Exception(f"Ollama server returned status {response.status}: {await response.text()}")
+                
+                done = False
+                try:
+                    async for line in response.content:
+                        if not line.strip():
+                            continue
+                        
+                        chunk = json.loads(line)
+                        if chunk.get("error"):
+                            raise Exception(chunk["error"])
+                        
+                        content = chunk.get("message", {}).get("content")
+                        if content:
+                            yield content
+                        if chunk.get("done"):
+                            done = True
+                            break
+                finally:
+                    if not done:
+                        # Drop the connection instead of returning it to the pool so generation stops
+                        response.close()
         except Exception as e:
             raise Exception(f"Ollama streaming completion failed: {str(e)}")
     
@@ -185,30 +236,44 @@ class OllamaProvider(BaseLLMProvider):
         except Exception as e:
             raise Exception(f"Ollama embedding generation failed: {str(e)}")
     
+    async def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """Embed one sub-batch with a single Ollama embed request."""
+        if not self._is_initialized or not self._embeddings_model:
+            raise Exception("Provider not initialized")
+        
+        try:
+            embeddings = await self._embeddings_model.aembed_documents(texts)
+            return [self._reduce_embedding_dimension(embedding) for embedding in embeddings]
+        except Exception as e:
+            raise Exception(f"Ollama batch embedding generation failed: {str(e)}")
+    
     async def health_check(self) -> HealthCheckResult:
         """Check Ollama provider health."""
         start_time = time.time()
         
         try:
             # Check if Ollama server is running
-            async with aiohttp.ClientSession() as session:
-                async with session.get(f"{self.endpoint}/api/tags") as response:
-                    if response.status != 200:
-                        raise Exception(f"Ollama server returned status {response.status}")
-                    
-                    data = await response.json()
-                    available_models = [model["name"] for model in data.get("models", [])]
-                    
-                    # Check if our model is available
-                    if self.model not in available_models:
-                        raise Exception(f"Model '{self.model}' not found. Available models: {available_models}")
+            session = self._get_session()
+            async with session.get(f"{self.endpoint}/api/tags") as response:
+                if response.status != 200:
+                    raise Exception(f"Ollama server returned status {response.status}")
+                
+                data = await response.json()
+                available_models = [model["name"] for model in data.get("models", [])]
+                
+                # Check if our model is available
+                if self.model not in available_models:
+                    raise Exception(f"Model '{self.model}' not found. Available models: {available_models}")
             
-            # Test a simple completion
-            if self._chat_model:
-                test_message = HumanMessage(content="Hello")
-                test_response = await self._chat_model.ainvoke([test_message])
-                if not test_response or not test_response.content:
-                    raise Exception("Empty response from model")
+            # Test a simple completion; one token is enough to prove the model loads and answers
+            payload = self._chat_payload(CompletionRequest(messages=[ChatMessage(role="user", content="Hello")]), False)
+            payload["options"]["num_predict"] = 1
+            async with session.post(f"{self.endpoint}/api/chat", json=payload) as response:
+                if response.status != 200:
+                    raise Exception(f"Ollama server returned status {response.status}")
+                test_response = await response.json()
+                if test_response.get("error") or "message" not in test_response:
+                    raise Exception(test_response.get("error") or "Empty response from model")
             
             response_time = (time.time() - start_time) * 1000
             
@@ -232,13 +297,13 @@ class OllamaProvider(BaseLLMProvider):
     async def get_available_models_async(self) -> List[str]:
         """Get available Ollama models from the server."""
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(f"{self.endpoint}/api/tags") as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        return [model["name"] for model in data.get("models", [])]
-                    else:
-                        return []
+            session = self._get_session()
+            async with session.get(f"{self.endpoint}/api/tags") as response:
+                if response.status == 200:
+                    data = await response.json()
+                    return [model["name"] for model in data.get("models", [])]
+                else:
+                    return []
         except Exception:
             return []
     
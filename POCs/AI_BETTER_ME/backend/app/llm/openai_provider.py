@@ -29,7 +29,10 @@ class OpenAIProvider(BaseLLMProvider):
         model: str = "gpt-3.5-turbo",
         base_url: Optional[str] = None,
         max_tokens: int = 4000,
-        temperature: float = 0.7
+        temperature: float = 0.7,
+        embedding_batch_size: int = 96,
+        embedding_batch_max_tokens: int = 8000,
+        embedding_max_concurrency: int = 4
     ):
         super().__init__(LLMProviderType.OPENAI)
         self.api_key = api_key
@@ -37,6 +40,11 @@ class OpenAIProvider(BaseLLMProvider):
         self.base_url = base_url
         self.max_tokens = max_tokens
         self.temperature = temperature
+        self.embedding_batch_size = embedding_batch_size
+        self.embedding_batch_max_tokens = embedding_batch_max_tokens
+        self.embedding_max_concurrency = embedding_max_concurrency
+        self.embedding_model = "text-embedding-ada-002"  # Default OpenAI embedding model
+        self.embedding_dimension = 1536
         
         # LangChain components
         self._chat_model: Optional[ChatOpenAI] = None
@@ -170,12 +178,22 @@ class OpenAIProvider(BaseLLMProvider):
             
             return EmbeddingResponse(
                 embedding=embedding,
-                model="text-embedding-ada-002"  # Default OpenAI embedding model
+                model=self.embedding_model
             )
             
         except Exception as e:
             raise Exception(f"OpenAI embedding generation failed: {str(e)}")
     
+    async def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """Embed one sub-batch with a single OpenAI embeddings request."""
+        if not self._is_initialized or not self._embeddings_model:
+            raise Exception("Provider not initialized")
+        
+        try:
+            return await self._embeddings_model.aembed_documents(texts)
+        except Exception as e:
+            raise Exception(f"OpenAI batch embedding generation failed: {str(e)}")
+    
     async def health_check(self) -> HealthCheckResult:
         """Check OpenAI provider health."""
         start_time = time.time()
@@ -0,0 +1,219 @@
+"""
+Response cache for chat completions with an exact tier and an optional semantic tier.
+"""
+
+import re
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+from .base import CompletionRequest, CompletionResponse
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    """
+    In-memory LRU cache of chat completion responses with per-entry TTLs.
+
+    The exact tier is keyed by sha256 of the model namespace, sampling parameters and
+    the messages with whitespace normalized. The semantic tier indexes the embedding of
+    the last user message under a context key covering everything else (namespace,
+    parameters and the earlier messages), so a paraphrased question is only answered
+    from the cache when the rest of the conversation is identical and the embeddings
+    are at least similarity_threshold apart in cosine similarity.
+
+    Hits, misses and the tokens a hit saved are counted per route (a caller-chosen
+    label such as "intent_classification").
+    """
+
+    _WHITESPACE = re.compile(r"\s+")
+
+    def __init__(self, max_entries: int = 2048, ttl: float = 3600.0, similarity_threshold: float = 0.95):
+        """
+        Initialize the response cache.
+
+        Args:
+            max_entries: Maximum number of cached responses
+            ttl: Default seconds a response stays valid
+            similarity_threshold: Minimum cosine similarity for a semantic hit
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+
+        # exact key -> (response, expires_at, context key or None)
+        self._entries: "OrderedDict[str, Tuple[CompletionResponse, float, Optional[str]]]" = OrderedDict()
+        # context key -> {exact key: normalized query embedding}
+        self._semantic: Dict[str, Dict[str, np.ndarray]] = {}
+        self._lock = threading.Lock()
+        self._routes: Dict[str, Dict[str, int]] = {}
+
+    @classmethod
+    def _normalize(cls, text: str) -> str:
+        """Collapse whitespace so formatting-only differences share a key."""
+        return cls._WHITESPACE.sub(" ", text).strip()
+
+    @staticmethod
+    def _digest(payload: Any) -> str:
+        """Stable sha256 of a JSON-serializable payload."""
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def make_keys(self, namespace: str, request: CompletionRequest, temperature: float) -> Tuple[str, Optional[str], Optional[str]]:
+        """
+        Build the cache keys of a request.
+
+        Args:
+            namespace: Identity of the model answering (provider and model)
+            request: Completion request
+            temperature: Effective sampling temperature
+
+        Returns:
+            (exact key, semantic context key, semantic query text); the semantic parts are
+            None when the request does not end with a user message
+        """
+        messages = [[message.role, self._normalize(message.content)] for message in request.messages]
+        params = {"namespace": namespace, "temperature": temperature, "max_tokens": request.max_tokens}
+        exact_key = self._digest({**params, "messages": messages})
+
+        if not messages or messages[-1][0] != "user":
+            return exact_key, None, None
+        context_key = self._digest({**params, "messages": messages[:-1]})
+        return exact_key, context_key, messages[-1][1]
+
+    def _route(self, route: str) -> Dict[str, int]:
+        """Counters of a route."""
+        counters = self._routes.get(route)
+        if counters is None:
+            counters = self._routes[route] = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "saved_tokens": 0}
+        return counters
+
+    def _live(self, key: str, now: float) -> Optional[CompletionResponse]:
+        """Get an unexpired entry, dropping it if it has expired (caller holds the lock)."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        response, expires_at, _ = entry
+        if expires_at <= now:
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return response
+
+    def _remove(self, key: str) -> None:
+        """Drop an entry from both tiers (caller holds the lock)."""
+        _, _, context_key = self._entries.pop(key)
+        if context_key is not None:
+            bucket = self._semantic.get(context_key)
+            if bucket is not None:
+                bucket.pop(key, None)
+                if not bucket:
+                    del self._semantic[context_key]
+
+    def get(self, exact_key: str, route: str = "default") -> Optional[CompletionResponse]:
+        """Look up the exact tier, counting a hit (a miss is counted by record_miss)."""
+        with self._lock:
+            response = self._live(exact_key, time.monotonic())
+            if response is not None:
+                counters = self._route(route)
+                counters["exact_hits"] += 1
+                counters["saved_tokens"] += self._tokens_of(response)
+            return response
+
+    def get_similar(self, context_key: str, query_embedding: List[float], route: str = "default") -> Optional[CompletionResponse]:
+        """Look up the semantic tier for the closest cached query in the same context."""
+        query = self._unit(query_embedding)
+        with self._lock:
+            bucket = self._semantic.get(context_key)
+            if not bucket:
+                return None
+            keys = list(bucket)
+            scores = np.vstack([bucket[key] for key in keys]) @ query
+            best = int(np.argmax(scores))
+            if scores[best] < self.similarity_threshold:
+                return None
+            response = self._live(keys[best], time.monotonic())
+            if response is not None:
+                counters = self._route(route)
+                counters["semantic_hits"] += 1
+                counters["saved_tokens"] += self._tokens_of(response)
+            return response
+
+    def record_miss(self, route: str = "default") -> None:
+        """Count a request that had to go to the provider."""
+        with self._lock:
+            self._route(route)["misses"] += 1
+
+    def put(
+        self,
+        exact_key: str,
+        response: CompletionResponse,
+        context_key: Optional[str] = None,
+        query_embedding: Optional[List[float]] = None,
+        ttl: Optional[float] = None
+    ) -> None:
+        """
+        Store a response.
+
+        Args:
+            exact_key: Exact-tier key from make_keys
+            response: Response to cache
+            context_key: Semantic context key, to also index the response semantically
+            query_embedding: Embedding of the last user message (required with context_key)
+            ttl: Seconds the entry stays valid (defaults to the cache TTL)
+        """
+        semantic = context_key is not None and query_embedding is not None
+        with self._lock:
+            if exact_key in self._entries:
+                self._remove(exact_key)
+            self._entries[exact_key] = (
+                response,
+                time.monotonic() + (ttl if ttl is not None else self.ttl),
+                context_key if semantic else None
+            )
+            if semantic:
+                self._semantic.setdefault(context_key, {})[exact_key] = self._unit(query_embedding)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def clear(self) -> None:
+        """Drop every cached response."""
+        with self._lock:
+            self._entries.clear()
+            self._semantic.clear()
+
+    @staticmethod
+    def _unit(vector: List[float]) -> np.ndarray:
+        """Normalize a vector for cosine similarity."""
+        array = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(array)
+        return array / norm if norm else array
+
+    @staticmethod
+    def _tokens_of(response: CompletionResponse) -> int:
+        """Tokens a cached response saved: reported usage, else a 4-characters-per-token estimate."""
+        usage = response.usage or {}
+        if usage.get("total_tokens"):
+            return int(usage["total_tokens"])
+        return max(1, len(response.content) // 4)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get hit-rate and saved-token metrics per route."""
+        with self._lock:
+            routes = {}
+            for route, counters in self._routes.items():
+                hits = counters["exact_hits"] + counters["semantic_hits"]
+                total = hits + counters["misses"]
+                routes[route] = {**counters, "hit_rate": round(hits / total, 4) if total else 0.0}
+            return {
+                "enabled": True,
+                "entries": len(self._entries),
+                "semantic_entries": sum(len(bucket) for bucket in self._semantic.values()),
+                "routes": routes
+            }
@@ -3,10 +3,15 @@ LLM service that provides a high-level interface to the LLM providers.
 """
 
 import os
+import time
+import asyncio
 import logging
-from typing import AsyncGenerator, Dict, Any, List, Optional
+from typing import AsyncGenerator, Awaitable, Dict, Any, List, Optional, Tuple, TypeVar
+
+import numpy as np
 
 from .base import (
+    BaseLLMProvider,
     CompletionRequest, 
     CompletionResponse, 
     EmbeddingRequest, 
@@ -14,11 +19,17 @@ from .base import (
     HealthCheckResult,
     LLMProviderType
 )
+from .concurrency import AdaptiveLimiter, CallPriority
 from .config import LLMConfig
+from .embedding_cache import EmbeddingCache, get_embedding_cache
 from .factory import LLMProviderFactory
+from .latency import HedgeBudget
+from .response_cache import ResponseCache
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
 
 class LLMService:
     """High-level service for LLM operations with automatic provider management."""
@@ -31,6 +42,108 @@ class LLMService:
         self.config = config
         self.factory = LLMProviderFactory(config)
         self._initialized = False
+        self._embedding_cache: Optional[EmbeddingCache] = None
+        self._response_cache: Optional[ResponseCache] = None
+        self._hedge_budget = HedgeBudget(ratio=config.hedge_budget_ratio)
+        self._hedges_sent = 0
+        self._hedges_won = 0
+        self._limiters: Dict[LLMProviderType, AdaptiveLimiter] = {}
+    
+    @property
+    def embedding_cache(self) -> Optional[EmbeddingCache]:
+        """The shared embedding cache, or None when caching is disabled."""
+        if self._embedding_cache is None and self.config.embedding_cache_enabled:
+            self._embedding_cache = get_embedding_cache(
+                max_entries=self.config.embedding_cache_size,
+                db_path=self.config.embedding_cache_path
+            )
+        return self._embedding_cache
+    
+    @property
+    def response_cache(self) -> Optional[ResponseCache]:
+        """The chat response cache, or None when caching is disabled."""
+        if self._response_cache is None and self.config.response_cache_enabled:
+            self._response_cache = ResponseCache(
+                max_entries=self.config.response_cache_size,
+                ttl=self.config.response_cache_ttl,
+                similarity_threshold=self.config.response_cache_similarity_threshold
+            )
+        return self._response_cache
+    
+    def _response_cache_keys(
+        self,
+        provider: BaseLLMProvider,
+        request: CompletionRequest,
+        cache: Optional[bool]
+    ) -> Optional[Tuple[str, Optional[str], Optional[str]]]:
+        """
+        Get the response cache keys of a request, or None when it must not be cached.
+        
+        Without an explicit choice only (near-)deterministic requests are cached: at a
+        temperature above response_cache_max_temperature every call is a fresh sample,
+        so a cached answer is only reused when the caller opts in with cache=True.
+        """
+        response_cache = self.response_cache
+        if response_cache is None or cache is False:
+            return None
+        
+        temperature = request.temperature if request.temperature is not None else self.config.temperature
+        if cache is None and temperature > self.config.response_cache_max_temperature:
+            return None
+        
+        provider_type = getattr(provider.provider_type, "value", provider.provider_type)
+        return response_cache.make_keys(f"{provider_type}:{getattr(provider, 'model', '')}", request, temperature)
+    
+    async def _cached_response(
+        self,
+        keys: Tuple[str, Optional[str], Optional[str]],
+        route: str
+    ) -> Tuple[Optional[CompletionResponse], Optional[List[float]]]:
+        """
+        Look a request up in the exact tier, then the semantic tier.
+        
+        Returns:
+            (cached response or None, query embedding computed for the semantic tier or None)
+        """
+        exact_key, context_key, query = keys
+        cached = self.response_cache.get(exact_key, route)
+        if cached is not None:
+            return cached, None
+        
+        embedding = None
+        if self.config.response_cache_semantic_enabled and context_key is not None:
+            try:
+                embedding = (await self.generate_embedding(EmbeddingRequest(text=query))).embedding
+                cached = self.response_cache.get_similar(context_key, embedding, route)
+                if cached is not None:
+                    return cached, embedding
+            except Exception as e:
+                logger.warning(f"Semantic response cache lookup failed: {e}")
+        
+        self.response_cache.record_miss(route)
+        return None, embedding
+    
+    def _store_response(
+        self,
+        keys: Tuple[str, Optional[str], Optional[str]],
+        response: CompletionResponse,
+        embedding: Optional[List[float]]
+    ) -> None:
+        """Cache a fresh response (empty answers are never cached)."""
+        if response.content.strip():
+            exact_key, context_key, _ = keys
+            self.response_cache.put(exact_key, response, context_key, embedding)
+    
+    @staticmethod
+    def _embedding_namespace(provider: BaseLLMProvider) -> str:
+        """Cache namespace for the embeddings a provider produces."""
+        provider_type = getattr(provider.provider_type, "value", provider.provider_type)
+        return EmbeddingCache.make_namespace(provider_type, provider.embedding_model, provider.embedding_dimension)
+    
+    def get_embedding_namespace(self) -> Optional[str]:
+        """Get the embedding cache namespace of the current provider."""
+        provider = self.factory._current_provider
+        return self._embedding_namespace(provider) if provider else None
     
     async def initialize(self) -> None:
         """Initialize the LLM service."""
@@ -42,43 +155,317 @@ class LLMService:
             logger.error(f"Failed to initialize LLM service: {e}")
             raise
     
-    async def chat_completion(self, request: CompletionRequest) -> CompletionResponse:
-        """Generate a chat completion using the active provider."""
+    def _get_limiter(self, provider: BaseLLMProvider) -> Optional[AdaptiveLimiter]:
+        """Get the concurrency limiter of a provider, or None when limiting is disabled."""
+        if not self.config.concurrency_limit_enabled:
+            return None
+        
+        limiter = self._limiters.get(provider.provider_type)
+        if limiter is None:
+            if provider.provider_type == LLMProviderType.OLLAMA:
+                max_limit = self.config.ollama_max_concurrency
+            else:
+                max_limit = self.config.openai_max_concurrency
+            limiter = AdaptiveLimiter(max_limit=max_limit, latency_tolerance=self.config.concurrency_latency_tolerance)
+            self._limiters[provider.provider_type] = limiter
+        return limiter
+    
+    async def _call_provider(
+        self,
+        provider: BaseLLMProvider,
+        call: Awaitable[T],
+        record_latency: bool = False,
+        priority: Optional[CallPriority] = None,
+        route: str = "default"
+    ) -> T:
+        """
+        Await a provider call, reporting its outcome to the provider's circuit breaker.
+        
+        Args:
+            provider: Provider serving the call
+            call: The provider call
+            record_latency: Feed the call duration into latency routing (chat calls only)
+            priority: Admit the call through the provider's concurrency limiter at this priority
+            route: Call class the duration is tracked under, for hedging delays
+        """
+        limiter = self._get_limiter(provider) if priority is not None else None
+        if limiter:
+            try:
+                await limiter.acquire(priority)
+            except BaseException:
+                call.close()
+                raise
+        
+        started = time.perf_counter()
+        latency, failed = None, False
+        try:
+            result = await call
+            latency = time.perf_counter() - started
+        except Exception as e:
+            failed = True
+            self.factory.record_failure(provider.provider_type, str(e))
+            raise
+        finally:
+            if limiter:
+                # Cancelled calls (hedge losers, disconnected clients) release without adapting
+                limiter.release(latency, success=not failed)
+        self.factory.record_success(provider.provider_type, latency if record_latency else None, route)
+        return result
+    
+    async def chat_completion(
+        self,
+        request: CompletionRequest,
+        hedge: bool = False,
+        priority: CallPriority = CallPriority.INTERACTIVE,
+        cache: Optional[bool] = None,
+        cache_route: str = "default"
+    ) -> CompletionResponse:
+        """
+        Generate a chat completion using the active provider, served from the response cache when possible.
+        
+        Args:
+            request: Completion request
+            hedge: Allow a backup request to another provider if this one is slow; meant
+                for short, idempotent calls such as intent classification
+            priority: Admission priority when the provider is at its concurrency limit
+            cache: True to cache even sampled (temperature > 0) responses, False to bypass
+                the cache, None to cache deterministic requests only
+            cache_route: Label the cache reports hit rate and saved tokens under; also the
+                call class latency is tracked under for hedging delays
+        """
         if not self._initialized:
             raise Exception("LLM service not initialized")
         
         try:
             provider = await self.factory.get_provider()
-            return await provider.chat_completion(request)
+            keys = self._response_cache_keys(provider, request, cache)
+            embedding = None
+            if keys is not None:
+                cached, embedding = await self._cached_response(keys, cache_route)
+                if cached is not None:
+                    return cached
+            
+            if hedge and self.config.hedging_enabled:
+                response = await self._hedged_chat_completion(provider, request, priority, cache_route)
+            else:
+                response = await self._call_provider(provider, provider.chat_completion(request), True, priority, cache_route)
+            
+            if keys is not None:
+                self._store_response(keys, response, embedding)
+            return response
         except Exception as e:
             logger.error(f"Chat completion failed: {e}")
             raise
     
-    async def chat_completion_stream(self, request: CompletionRequest) -> AsyncGenerator[str, None]:
-        """Generate a streaming chat completion using the active provider."""
+    async def _hedged_chat_completion(
+        self,
+        provider: BaseLLMProvider,
+        request: CompletionRequest,
+        priority: CallPriority,
+        route: str = "default"
+    ) -> CompletionResponse:
+        """
+        Run a chat completion, firing a backup to another provider once the first passes its p95.
+        
+        The p95 is that of the call's route, so a short call is not held to the latency
+        of long generations. The first successful answer wins and the other request is
+        cancelled. Backups are only sent while the hedge budget allows, which caps the
+        extra cost.
+        """
+        self._hedge_budget.on_request()
+        primary = asyncio.create_task(
+            self._call_provider(provider, provider.chat_completion(request), True, priority, route)
+        )
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.factory.get_hedge_delay(provider.provider_type, route))
+            if done:
+                return primary.result()
+            
+            backup_provider = self.factory.get_hedge_provider(provider)
+            if backup_provider is None or not self._hedge_budget.try_spend():
+                return await primary
+            
+            logger.debug(f"Hedging slow {provider.provider_type} request to {backup_provider.provider_type}")
+            self._hedges_sent += 1
+            backup = asyncio.create_task(
+                self._call_provider(backup_provider, backup_provider.chat_completion(request), True, priority, route)
+            )
+            tasks.add(backup)
+            
+            error: Optional[BaseException] = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is backup:
+                            self._hedges_won += 1
+                        return task.result()
+                    if task is primary or error is None:
+                        error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+    
+    def get_routing_stats(self) -> Dict[str, Any]:
+        """Get per-provider latency, streamed time-to-first-token and hedging statistics."""
+        return {
+            "latency": {
+                getattr(provider_type, "value", provider_type): stats
+                for provider_type, stats in self.factory.get_latency_stats().items()
+            },
+            "first_token": {
+                getattr(provider_type, "value", provider_type): stats
+                for provider_type, stats in self.factory.get_first_token_stats().items()
+            },
+            "hedges_sent": self._hedges_sent,
+            "hedges_won": self._hedges_won,
+            "hedge_budget_available": round(self._hedge_budget.tokens, 2)
+        }
+    
+    def get_response_cache_stats(self) -> Dict[str, Any]:
+        """Get response cache hit-rate and saved-token metrics per route."""
+        cache = self.response_cache
+        return cache.get_stats() if cache else {"enabled": False}
+    
+    def get_concurrency_stats(self) -> Dict[str, Any]:
+        """Get per-provider concurrency limits and queue-time metrics."""
+        return {
+            getattr(provider_type, "value", provider_type): limiter.get_stats()
+            for provider_type, limiter in self._limiters.items()
+        }
+    
+    async def chat_completion_stream(
+        self,
+        request: CompletionRequest,
+        priority: CallPriority = CallPriority.INTERACTIVE,
+        cache: Optional[bool] = None,
+        cache_route: str = "default"
+    ) -> AsyncGenerator[str, None]:
+        """
+        Generate a streaming chat completion using the active provider.
+        
+        The call holds a concurrency slot until the stream ends or is closed. A cached
+        response is yielded as a single chunk; a fresh one is cached once it has
+        streamed to completion. The time to the first chunk is tracked per route; the
+        whole stream's duration depends on output length and is not recorded.
+        
+        Args:
+            request: Completion request
+            priority: Admission priority when the provider is at its concurrency limit
+            cache: Response cache choice, as for chat_completion
+            cache_route: Label the cache reports hit rate and saved tokens under
+        """
         if not self._initialized:
             raise Exception("LLM service not initialized")
         
         try:
             provider = await self.factory.get_provider()
-            async for chunk in provider.chat_completion_stream(request):
-                yield chunk
+            keys = self._response_cache_keys(provider, request, cache)
+            embedding = None
+            if keys is not None:
+                cached, embedding = await self._cached_response(keys, cache_route)
+                if cached is not None:
+                    yield cached.content
+                    return
+            
+            limiter = self._get_limiter(provider)
+            if limiter:
+                await limiter.acquire(priority)
+            started = time.perf_counter()
+            stream = provider.chat_completion_stream(request)
+            reported = False
+            failed = False
+            parts = []
+            try:
+                async for chunk in stream:
+                    if not reported:
+                        # The first chunk proves the provider is serving
+                        self.factory.record_first_token(provider.provider_type, time.perf_counter() - started, cache_route)
+                        self.factory.record_success(provider.provider_type)
+                        reported = True
+                    parts.append(chunk)
+                    yield chunk
+                if not reported:
+                    self.factory.record_success(provider.provider_type)
+                if keys is not None:
+                    self._store_response(keys, CompletionResponse(content="".join(parts), model=getattr(provider, "model", None)), embedding)
+            except Exception as e:
+                failed = True
+                self.factory.record_failure(provider.provider_type, str(e))
+                raise
+            finally:
+                # Close the provider stream now (not at garbage collection) when the consumer stops early
+                try:
+                    await stream.aclose()
+                finally:
+                    if limiter:
+                        # Stream durations depend on output length, so they do not adapt the limit
+                        limiter.release(None, success=not failed)
         except Exception as e:
             logger.error(f"Streaming chat completion failed: {e}")
             raise
     
     async def generate_embedding(self, request: EmbeddingRequest) -> EmbeddingResponse:
-        """Generate embeddings using the active provider."""
+        """Generate embeddings using the active provider, served from the embedding cache when possible."""
         if not self._initialized:
             raise Exception("LLM service not initialized")
         
         try:
-            provider = await self.factory.get_provider()
-            return await provider.generate_embedding(request)
+            provider = await self.factory.get_embedding_provider()
+            cache = self.embedding_cache
+            if cache is None:
+                return await self._call_provider(provider, provider.generate_embedding(request))
+            
+            namespace = self._embedding_namespace(provider)
+            cached = cache.get(namespace, request.text)
+            if cached is not None:
+                return EmbeddingResponse(embedding=cached.tolist(), model=provider.embedding_model)
+            
+            response = await self._call_provider(provider, provider.generate_embedding(request))
+            cache.put(namespace, request.text, response.embedding)
+            return response
         except Exception as e:
             logger.error(f"Embedding generation failed: {e}")
             raise
     
+    async def generate_embeddings(self, texts: List[str]) -> np.ndarray:
+        """Generate embeddings for many texts as a float32 matrix, embedding only cache misses."""
+        if not self._initialized:
+            raise Exception("LLM service not initialized")
+        
+        try:
+            provider = await self.factory.get_embedding_provider()
+            cache = self.embedding_cache
+            if cache is None or not texts:
+                return await self._call_provider(provider, provider.generate_embeddings(texts))
+            
+            namespace = self._embedding_namespace(provider)
+            cached = cache.get_many(namespace, texts)
+            misses = [i for i, vector in enumerate(cached) if vector is None]
+            if not misses:
+                return np.vstack(cached)
+            
+            # Embed each distinct missing text once
+            miss_texts = list(dict.fromkeys(texts[i] for i in misses))
+            fresh = await self._call_provider(provider, provider.generate_embeddings(miss_texts))
+            cache.put_many(namespace, miss_texts, fresh)
+            
+            rows = dict(zip(miss_texts, fresh))
+            embeddings = np.empty((len(texts), fresh.shape[1]), dtype=np.float32)
+            for i, vector in enumerate(cached):
+                embeddings[i] = vector if vector is not None else rows[texts[i]]
+            return embeddings
+        except Exception as e:
+            logger.error(f"Batch embedding generation failed: {e}")
+            raise
+    
+    def get_embedding_cache_stats(self) -> Dict[str, Any]:
+        """Get embedding cache hit-rate metrics."""
+        cache = self.embedding_cache
+        return cache.get_stats() if cache else {"enabled": False}
+    
     async def health_check(self) -> Dict[LLMProviderType, HealthCheckResult]:
         """Get health status of all providers."""
         if not self._initialized:
@@ -86,12 +473,24 @@ class LLMService:
         
         return self.factory.get_health_status()
     
+    def get_circuit_status(self) -> Dict[LLMProviderType, Dict[str, Any]]:
+        """Get circuit breaker state of all providers."""
+        return self.factory.get_circuit_status()
+    
     async def switch_provider(self, provider_type: LLMProviderType, skip_health_check: bool = False) -> bool:
         """Switch to a specific provider."""
         if not self._initialized:
             raise Exception("LLM service not initialized")
         
-        return await self.factory.switch_provider(provider_type, skip_health_check)
+        previous_namespace = self.get_embedding_namespace()
+        switched = await self.factory.switch_provider(provider_type, skip_health_check)
+        
+        # Vectors from the previous embedding model are no longer comparable
+        if switched and previous_namespace and previous_namespace != self.get_embedding_namespace():
+            if self.embedding_cache:
+                self.embedding_cache.invalidate(previous_namespace)
+        
+        return switched
     
     def get_current_provider(self) -> Optional[LLMProviderType]:
         """Get the current active provider type."""
@@ -118,16 +517,29 @@ class LLMService:
             return []
     
     async def update_config(self, new_config: LLMConfig) -> bool:
-        """Update the service configuration and reinitialize if needed."""
+        """
+        Update the service configuration and reinitialize if needed.
+        
+        The new providers are initialized before the swap, so a failed update keeps the
+        current ones; the previous factory is shut down afterwards, stopping its health
+        monitor and closing its provider sessions.
+        """
+        factory = LLMProviderFactory(new_config)
         try:
-            self.config = new_config
-            self.factory = LLMProviderFactory(new_config)
-            await self.factory.initialize()
-            logger.info("LLM service configuration updated successfully")
-            return True
+            await factory.initialize()
         except Exception as e:
             logger.error(f"Failed to update LLM service configuration: {e}")
+            await factory.shutdown()
             return False
+        
+        previous, self.factory = self.factory, factory
+        self.config = new_config
+        try:
+            await previous.shutdown()
+        except Exception as e:
+            logger.error(f"Failed to shut down the previous LLM providers: {e}")
+        logger.info("LLM service configuration updated successfully")
+        return True
     
     async def shutdown(self) -> None:
         """Shutdown the LLM service."""
@@ -0,0 +1,79 @@
+"""
+Progress events emitted while a request is answered, for streaming clients.
+
+Agents and services emit them from inside workflow nodes; AgentGraphWorkflow.stream
+surfaces them. Kept below both layers so services do not depend on the workflow.
+"""
+import logging
+from contextvars import ContextVar
+from typing import Any, Dict
+
+from langchain_core.callbacks import adispatch_custom_event
+from langchain_core.runnables.config import ensure_config
+
+from ..llm.base import CompletionRequest, CompletionResponse
+
+logger = logging.getLogger(__name__)
+
+# Custom event names surfaced by AgentGraphWorkflow.stream
+ROUTING_EVENT = "routing"
+CONTEXT_EVENT = "context"
+TOKEN_EVENT = "token"
+RESET_EVENT = "reset"
+
+# Configurable key a graph run sets to have agents stream their answers as token events
+STREAM_ANSWER_TOKENS = "stream_answer_tokens"
+
+# Cleared inside fan-out branches, whose answers are merged rather than shown as they arrive
+_answer_tokens_enabled: ContextVar[bool] = ContextVar("answer_tokens_enabled", default=True)
+
+
+async def emit_event(name: str, data: Dict[str, Any]) -> None:
+    """
+    Dispatch a custom event to astream_events consumers of the current graph run.
+
+    Outside a LangChain run (plain function calls, tests, non-graph callers) there is
+    no parent run to attach the event to, so it is dropped.
+
+    Args:
+        name: Event name (one of the *_EVENT constants)
+        data: JSON-serializable payload
+    """
+    try:
+        await adispatch_custom_event(name, data)
+    except RuntimeError:
+        pass
+    except Exception as e:
+        logger.debug(f"Failed to emit {name} event: {e}")
+
+
+def suppress_answer_tokens() -> None:
+    """Stop stream_completion emitting token events in the current task and the tasks it starts."""
+    _answer_tokens_enabled.set(False)
+
+
+async def stream_completion(llm_service: Any, request: CompletionRequest) -> CompletionResponse:
+    """
+    Generate an agent's answer, streaming it as token events when the run asks for them.
+
+    Only a graph run configured with STREAM_ANSWER_TOKENS (AgentGraphWorkflow.stream)
+    streams, through chat_completion_stream; everywhere else, and inside fan-out
+    branches, this is a plain chat_completion, so ordinary requests keep feeding
+    latency routing and concurrency adaptation. The streamed text is a draft: the
+    workflow's formatting step emits a reset event and then the final text.
+
+    Args:
+        llm_service: The LLMService to generate with
+        request: Completion request
+
+    Returns:
+        The complete response
+    """
+    streaming = ensure_config().get("configurable", {}).get(STREAM_ANSWER_TOKENS, False)
+    if not streaming or not _answer_tokens_enabled.get():
+        return await llm_service.chat_completion(request)
+    parts = []
+    async for chunk in llm_service.chat_completion_stream(request):
+        parts.append(chunk)
+        await emit_event(TOKEN_EVENT, {"content": chunk})
+    return CompletionResponse(content="".join(parts))
@@ -3,9 +3,13 @@ Knowledge base service providing CRUD operations and RAG functionality.
 """
 import json
 import uuid
+import asyncio
 import logging
 from datetime import datetime
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, AsyncIterator, Optional
+
+import numpy as np
+from pydantic import ValidationError
 
 from ..models.knowledge import (
     KnowledgeEntry,
@@ -18,7 +22,9 @@ from ..models.knowledge import (
 )
 from ..llm.service import get_llm_service
 from ..llm.base import EmbeddingRequest
+from ..llm.concurrency import CallPriority
 from .vector_store import get_vector_store
+from .events import emit_event, CONTEXT_EVENT
 
 logger = logging.getLogger(__name__)
 
@@ -129,6 +135,124 @@ class KnowledgeBaseService:
             logger.error(f"Failed to create knowledge entry: {e}")
             raise
     
+    async def _generate_embeddings(self, texts: List[str], batch_size: int = 100) -> List[Optional[np.ndarray]]:
+        """
+        Generate embeddings for many texts, batch by batch.
+        
+        Each batch is a single provider batch call. If a batch fails, its texts are
+        retried one by one so a single bad text only fails itself. Unlike
+        _generate_embedding, failures are reported as None instead of a dummy vector,
+        so bulk callers can reject just those items.
+        
+        Args:
+            texts: Texts to embed
+            batch_size: Number of texts per provider batch call
+            
+        Returns:
+            One embedding row (or None on failure) per input text, in input order
+        """
+        llm_service = await get_llm_service()
+        if not llm_service:
+            logger.warning("LLM service not initialized, using dummy embeddings")
+            return list(np.zeros((len(texts), self.vector_store.dimension), dtype=np.float32))
+        
+        embeddings: List[Optional[np.ndarray]] = []
+        for start in range(0, len(texts), batch_size):
+            batch = texts[start:start + batch_size]
+            try:
+                embeddings.extend(await llm_service.generate_embeddings(batch))
+                continue
+            except Exception as e:
+                logger.warning(f"Batch embedding generation failed, retrying per text: {e}")
+            
+            responses = await asyncio.gather(
+                *(llm_service.generate_embedding(EmbeddingRequest(text=text)) for text in batch),
+                return_exceptions=True
+            )
+            for response in responses:
+                if isinstance(response, Exception):
+                    logger.warning(f"Embedding generation failed: {response}")
+                    embeddings.append(None)
+                else:
+                    embeddings.append(np.asarray(response.embedding, dtype=np.float32))
+        return embeddings
+    
+    async def create_entries_bulk(self, 
+                                  entries: List[Dict[str, Any]],
+                                  batch_size: int = 100) -> List[Dict[str, Any]]:
+        """
+        Create many knowledge base entries with batched embedding and a single index write.
+        
+        Each item takes the same fields as create_entry. Items that fail validation or
+        embedding are reported individually and do not abort the rest of the batch.
+        
+        Args:
+            entries: Entry field dicts (entry_type, entry_sub_type, category, title, content, metadata, tags)
+            batch_size: Number of texts embedded per batch
+            
+        Returns:
+            One result dict per input item, in input order, with index, success, entry_id and error
+        """
+        results: List[Dict[str, Any]] = [
+            {"index": i, "success": False, "entry_id": None, "error": None}
+            for i in range(len(entries))
+        ]
+        
+        # Validate items up front so bad input never costs an embedding call
+        valid: List[tuple] = []
+        for i, fields in enumerate(entries):
+            try:
+                entry = KnowledgeEntry(
+                    entry_id=str(uuid.uuid4()),
+                    entry_type=fields["entry_type"],
+                    entry_sub_type=fields["entry_sub_type"],
+                    category=fields["category"],
+                    title=fields["title"],
+                    content=fields["content"],
+                    metadata=fields.get("metadata") or {},
+                    tags=fields.get("tags") or []
+                )
+                valid.append((i, entry))
+            except Exception as e:
+                results[i]["error"] = f"Invalid entry: {e}"
+        
+        if not valid:
+            return results
+        
+        try:
+            texts = [f"{entry.title} {entry.content} {' '.join(entry.tags)}" for _, entry in valid]
+            embeddings = await self._generate_embeddings(texts, batch_size=batch_size)
+            
+            accepted_entries: List[KnowledgeEntry] = []
+            accepted_embeddings: List[np.ndarray] = []
+            for (i, entry), embedding in zip(valid, embeddings):
+                if embedding is None:
+                    results[i]["error"] = "Embedding generation failed"
+                elif len(embedding) != self.vector_store.dimension:
+                    results[i]["error"] = (
+                        f"Embedding dimension {len(embedding)} does not match index dimension "
+                        f"{self.vector_store.dimension}"
+                    )
+                else:
+                    accepted_entries.append(entry)
+                    accepted_embeddings.append(embedding)
+                    results[i]["entry_id"] = entry.entry_id
+            
+            # Single index add and single persist for the whole batch
+            self.vector_store.add_entries(
+                accepted_entries,
+                np.asarray(accepted_embeddings, dtype=np.float32).reshape(-1, self.vector_store.dimension)
+            )
+            for i, _ in valid:
+                if results[i]["entry_id"]:
+                    results[i]["success"] = True
+            
+            logger.info(f"Bulk created {len(accepted_entries)} of {len(entries)} knowledge entries")
+            return results
+        except Exception as e:
+            logger.error(f"Failed to bulk create knowledge entries: {e}")
+            raise
+    
     async def get_entry(self, entry_id: str) -> Optional[KnowledgeEntry]:
         """
         Retrieve a knowledge entry by ID.
@@ -232,31 +356,18 @@ class KnowledgeBaseService:
             # Generate embedding for query
             query_embedding = await self._generate_embedding(query.query_text)
             
-            # Search vector store
+            # Search vector store with the category, type and tag filters pushed down
             results = self.vector_store.search(
                 query_embedding=query_embedding,
                 k=query.limit,
-                similarity_threshold=query.similarity_threshold
+                similarity_threshold=query.similarity_threshold,
+                categories=query.categories,
+                entry_types=query.entry_types,
+                tags=query.tags
             )
             
-            # Filter by categories, types, and tags if specified
-            filtered_results = []
-            for result in results:
-                entry = result.entry
-                
-                # Filter by categories
-                if query.categories and entry.category not in query.categories:
-                    continue
-                
-                # Filter by entry types
-                if query.entry_types and entry.entry_type not in query.entry_types:
-                    continue
-                
-                # Filter by tags
-                if query.tags and not any(tag in entry.tags for tag in query.tags):
-                    continue
-                
-                filtered_results.append(result)
+            # Guard against entries mutated in place since they were indexed
+            filtered_results = [result for result in results if self._matches_query(result.entry, query)]
             
             logger.debug(f"Knowledge search returned {len(filtered_results)} results")
             return filtered_results
@@ -267,12 +378,112 @@ class KnowledgeBaseService:
             logger.warning(f"Failed to search knowledge base: {e}")
             return []
     
+    async def multi_search(self, 
+                           queries: Dict[str, KnowledgeQuery],
+                           oversample: int = 3,
+                           query_embeddings: Optional[Dict[str, List[float]]] = None) -> Dict[str, List[KnowledgeSearchResult]]:
+        """
+        Run several filtered searches with one embedding and one index scan per distinct query text.
+        
+        The index is scanned once with the loosest threshold, restricted to the union of
+        the buckets' pre-filtered candidates, and results are split in memory, each bucket
+        applying its own filters, similarity threshold and limit. If the shared scan was
+        cut off by k, buckets left short get a dedicated pre-filtered search so filtered
+        buckets are never starved by other buckets' hits.
+        
+        Args:
+            queries: Bucket name to query; queries sharing query_text share the scan
+            oversample: Multiplier on the largest bucket limit, leaving headroom for filtered buckets
+            query_embeddings: Embeddings already computed for some query texts (e.g. prefetched)
+            
+        Returns:
+            Bucket name to its search results, ordered by similarity
+        """
+        buckets: Dict[str, List[KnowledgeSearchResult]] = {name: [] for name in queries}
+        
+        # Group buckets by query text so each text is embedded and scanned once
+        by_text: Dict[str, List[str]] = {}
+        for name, query in queries.items():
+            by_text.setdefault(query.query_text, []).append(name)
+        
+        for query_text, names in by_text.items():
+            try:
+                query_embedding = (query_embeddings or {}).get(query_text)
+                if query_embedding is None:
+                    query_embedding = await self._generate_embedding(query_text)
+                
+                # Restrict the shared scan to entries that can land in at least one bucket
+                candidates = {
+                    name: self.vector_store.select_ids(
+                        queries[name].categories, queries[name].entry_types, queries[name].tags
+                    )
+                    for name in names
+                }
+                union_ids = None
+                if all(ids is not None for ids in candidates.values()):
+                    union_ids = set().union(*candidates.values())
+                    if not union_ids:
+                        continue  # No entry can match any bucket
+                
+                k = max(queries[name].limit for name in names) * oversample
+                results = self.vector_store.search(
+                    query_embedding=query_embedding,
+                    k=k,
+                    similarity_threshold=min(queries[name].similarity_threshold for name in names),
+                    id_filter=union_ids
+                )
+            except Exception as e:
+                logger.warning(f"Failed to search knowledge base: {e}")
+                continue
+            
+            for name in names:
+                query = queries[name]
+                buckets[name] = [
+                    result for result in results
+                    if result.similarity_score >= query.similarity_threshold
+                    and self._matches_query(result.entry, query)
+                ][:query.limit]
+                
+                # The shared scan hit k, so this bucket may have more matches beyond it
+                if len(buckets[name]) < query.limit and len(results) >= k:
+                    buckets[name] = [
+                        result for result in self.vector_store.search(
+                            query_embedding=query_embedding,
+                            k=query.limit,
+                            similarity_threshold=query.similarity_threshold,
+                            id_filter=candidates[name]
+                        )
+                        if self._matches_query(result.entry, query)
+                    ]
+        
+        logger.debug(f"Multi-search filled {len(buckets)} buckets with {len(by_text)} shared index scans")
+        return buckets
+    
+    @staticmethod
+    def _matches_query(entry: KnowledgeEntry, query: KnowledgeQuery) -> bool:
+        """Check an entry against a query's category, entry type and tag filters."""
+        # Filter by categories
+        if query.categories and entry.category not in query.categories:
+            return False
+        
+        # Filter by entry types
+        if query.entry_types and entry.entry_type not in query.entry_types:
+            return False
+        
+        # Filter by tags
+        if query.tags and not any(tag in entry.tags for tag in query.tags):
+            return False
+        
+        return True
+    
     async def get_all_entries(self, 
                              category: Optional[str] = None,
                              entry_type: Optional[KnowledgeEntryType] = None) -> List[KnowledgeEntry]:
         """
         Get all knowledge entries, optionally filtered by category or type.
         
+        The filters run in the metadata store, so only matching entries are loaded.
+        
         Args:
             category: Filter by category (optional)
             entry_type: Filter by entry type (optional)
@@ -281,18 +492,7 @@ class KnowledgeBaseService:
             List of knowledge entries
         """
         try:
-            all_entries = self.vector_store.get_all_entries()
-            
-            # Apply filters
-            filtered_entries = []
-            for entry in all_entries:
-                if category and entry.category != category:
-                    continue
-                if entry_type and entry.entry_type != entry_type:
-                    continue
-                filtered_entries.append(entry)
-            
-            return filtered_entries
+            return self.vector_store.get_all_entries(category=category or None, entry_type=entry_type or None)
         except Exception as e:
             logger.error(f"Failed to get all entries: {e}")
             return []
@@ -502,25 +702,46 @@ class KnowledgeBaseService:
             The created interaction entry
         """
         try:
-            interaction_content = f"User: {user_input}\nAgent ({agent_type}): {agent_response}"
             return await self.create_entry(
-                entry_type=KnowledgeEntryType.INTERACTION,
-                entry_sub_type=KnowledgeEntrySubType.PERSONAL_INTERACTION,
-                category=agent_type,
-                title=f"Interaction with {agent_type}",
-                content=interaction_content,
-                metadata={
-                    "agent_type": agent_type,
-                    "timestamp": datetime.utcnow().isoformat(),
-                    "context": context or {},
-                    "user_input_length": len(user_input),
-                    "response_length": len(agent_response)
-                },
-                tags=["interaction", "history", agent_type]
+                **self.interaction_entry_fields(agent_type, user_input, agent_response, context)
             )
         except Exception as e:
             logger.error(f"Failed to add interaction history: {e}")
             raise
+    
+    def interaction_entry_fields(self, 
+                                 agent_type: str,
+                                 user_input: str,
+                                 agent_response: str,
+                                 context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Build the create_entry fields for an interaction history entry.
+        
+        Args:
+            agent_type: Type of agent that handled the interaction
+            user_input: User's input
+            agent_response: Agent's response
+            context: Additional context information
+        
+        Returns:
+            Entry fields accepted by create_entry and create_entries_bulk
+        """
+        interaction_content = f"User: {user_input}\nAgent ({agent_type}): {agent_response}"
+        return {
+            "entry_type": KnowledgeEntryType.INTERACTION,
+            "entry_sub_type": KnowledgeEntrySubType.PERSONAL_INTERACTION,
+            "category": agent_type,
+            "title": f"Interaction with {agent_type}",
+            "content": interaction_content,
+            "metadata": {
+                "agent_type": agent_type,
+                "timestamp": datetime.utcnow().isoformat(),
+                "context": context or {},
+                "user_input_length": len(user_input),
+                "response_length": len(agent_response)
+            },
+            "tags": ["interaction", "history", agent_type]
+        }
 
     async def extract_and_store_preferences(self, 
                                           user_input: str, 
@@ -538,18 +759,49 @@ class KnowledgeBaseService:
             List of created preference entries
         """
         try:
-            # Use LLM to extract preferences from the conversation
-            llm_service = await get_llm_service()
-            if not llm_service:
-                logger.warning("LLM service not available for preference extraction")
-                return []
+            return await self.extract_and_store_preferences_batch([{
+                "user_input": user_input,
+                "agent_type": agent_type,
+                "agent_response": agent_response
+            }])
+        except Exception as e:
+            logger.error(f"Failed to extract preferences: {e}")
+            return []
+
+    async def extract_and_store_preferences_batch(self, turns: List[Dict[str, str]]) -> List[KnowledgeEntry]:
+        """
+        Extract and store user preferences from several conversation turns at once.
+        
+        All turns share one extraction call, the preference file is saved once and the
+        preference entries are created with a single bulk index write. Unlike
+        extract_and_store_preferences, provider and storage errors are raised so a
+        caller such as the post-processing pipeline can retry the batch.
+        
+        Args:
+            turns: Dicts with user_input, agent_type and agent_response
             
-            # Simplified and faster preference extraction prompt
-            extraction_prompt = f"""
-            Extract user preferences from this conversation:
+        Returns:
+            List of created preference entries
+        """
+        if not turns:
+            return []
+        
+        # Use LLM to extract preferences from the conversations
+        llm_service = await get_llm_service()
+        if not llm_service:
+            logger.warning("LLM service not available for preference extraction")
+            return []
+        
+        conversations = "\n\n".join(
+            f"Conversation {i}:\nUser: {turn['user_input']}\nAgent: {turn['agent_response']}"
+            for i, turn in enumerate(turns)
+        )
+        
+        # Simplified and faster preference extraction prompt
+        extraction_prompt = f"""
+            Extract user preferences from these conversations:
 
-            User: {user_input}
-            Agent: {agent_response}
+            {conversations}
 
             Find explicit preferences like:
             - Foods they like/dislike
@@ -558,82 +810,161 @@ class KnowledgeBaseService:
             - Schedule preferences
             - Budget constraints
 
-            Return JSON list:
-            [{{"category": "health", "key": "preference_name", "value": "preference_value"}}]
+            Return JSON list, with the number of the conversation each preference came from:
+            [{{"conversation": 0, "category": "health", "key": "preference_name", "value": "preference_value"}}]
 
             Return [] if no clear preferences found.
             """
+        
+        from ..llm.base import CompletionRequest, ChatMessage
+        request = CompletionRequest(
+            messages=[ChatMessage(role="user", content=extraction_prompt)],
+            temperature=0.1,
+            max_tokens=500 * len(turns)  # Reduced for faster response
+        )
+        
+        # Nobody waits on extraction, so it yields to interactive calls
+        response = await llm_service.chat_completion(
+            request, priority=CallPriority.BACKGROUND, cache_route="preference_extraction"
+        )
+        
+        # Parse the response with better error handling
+        try:
+            # Try to extract JSON from response
+            response_text = response.content.strip()
+            
+            # Handle cases where response might have extra text
+            if '[' in response_text and ']' in response_text:
+                start = response_text.find('[')
+                end = response_text.rfind(']') + 1
+                json_text = response_text[start:end]
+            else:
+                json_text = response_text
             
-            from ..llm.base import CompletionRequest, ChatMessage
-            request = CompletionRequest(
-                messages=[ChatMessage(role="user", content=extraction_prompt)],
-                temperature=0.1,
-                max_tokens=500  # Reduced for faster response
-            )
+            preferences_data = json.loads(json_text)
+        except (json.JSONDecodeError, TypeError) as e:
+            logger.warning(f"Failed to parse preferences extraction response: {e}")
+            logger.debug(f"Response content: {response.content}")
+            return []
+        
+        preferences = []
+        for pref in preferences_data if isinstance(preferences_data, list) else []:
+            if isinstance(pref, dict) and 'category' in pref and 'key' in pref and 'value' in pref:
+                turn_index = pref.get('conversation', 0)
+                if not isinstance(turn_index, int) or not 0 <= turn_index < len(turns):
+                    turn_index = 0
+                preferences.append((pref, turns[turn_index]['agent_type']))
+        if not preferences:
+            logger.info("Successfully extracted 0 preferences")
+            return []
+        
+        # Apply every valid preference to one copy and save it once; a malformed one is
+        # skipped rather than failing (and retrying) the whole batch
+        prefs_dict = (await self.get_user_preferences()).model_dump()
+        applied = []
+        for pref, agent_type in preferences:
+            updated = self._apply_extracted_preference(prefs_dict, pref)
+            if updated is None:
+                logger.warning(f"Skipping malformed extracted preference: {pref}")
+                continue
+            prefs_dict = updated
+            applied.append((pref, agent_type))
+        preferences = applied
+        if not preferences:
+            logger.info("Successfully extracted 0 preferences")
+            return []
+        if not await self.update_user_preferences(UserPreferences(**prefs_dict)):
+            raise RuntimeError("Failed to save extracted preferences")
+        
+        # Create knowledge entries for tracking with a single index write
+        timestamp = datetime.utcnow().isoformat()
+        results = await self.create_entries_bulk([
+            {
+                "entry_type": KnowledgeEntryType.PREFERENCE,
+                "entry_sub_type": KnowledgeEntrySubType.PERSONAL_PREFERENCE,
+                "category": pref['category'],
+                "title": f"{pref['key']} preference",
+                "content": f"User preference: {pref['key']} = {pref['value']}",
+                "metadata": {
+                    "extracted_from_interaction": True,
+                    "agent_type": agent_type,
+                    "timestamp": timestamp
+                },
+                "tags": [pref['category'], "preference", "extracted", agent_type]
+            }
+            for pref, agent_type in preferences
+        ])
+        created_entries = [
+            entry for entry in (self.vector_store.get_entry(result["entry_id"]) for result in results if result["success"])
+            if entry is not None
+        ]
+        
+        logger.info(f"Successfully extracted {len(created_entries)} preferences from {len(turns)} conversations")
+        return created_entries
+
+    @staticmethod
+    def _apply_extracted_preference(prefs_dict: Dict[str, Any], pref: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Apply one extracted preference to a copy of the preferences.
+        
+        Args:
+            prefs_dict: Current preferences as a dict
+            pref: Extracted preference with category, key and value
             
-            response = await llm_service.chat_completion(request)
+        Returns:
+            The updated preferences, or None if the preference is malformed: its category
+            or key is not a non-empty string, its category names a field that is not a
+            dict, or the result does not validate as UserPreferences
+        """
+        category, key, value = pref['category'], pref['key'], pref['value']
+        if not isinstance(category, str) or not category or not isinstance(key, str) or not key:
+            return None
+        existing = prefs_dict.get(category, {})
+        if not isinstance(existing, dict):
+            return None
+        
+        updated = {
+            **prefs_dict,
+            category: {**existing, key: value, f"__{key}_description": f"Extracted from conversation: {value}"}
+        }
+        try:
+            UserPreferences(**updated)
+        except ValidationError:
+            return None
+        return updated
+
+    async def prefetch_context(self, user_input: str) -> Optional[Dict[str, Any]]:
+        """
+        Fetch the agent-independent part of an agent's context: the query embedding and user preferences.
+        
+        Meant to start as soon as a message arrives, concurrently with routing; the
+        result is handed to get_contextual_knowledge_for_agent of whichever agent wins.
+        
+        Args:
+            user_input: User's current input
             
-            # Parse the response with better error handling
-            try:
-                import json
-                # Try to extract JSON from response
-                response_text = response.content.strip()
-                
-                # Handle cases where response might have extra text
-                if '[' in response_text and ']' in response_text:
-                    start = response_text.find('[')
-                    end = response_text.rfind(']') + 1
-                    json_text = response_text[start:end]
-                else:
-                    json_text = response_text
-                
-                preferences_data = json.loads(json_text)
-                created_entries = []
-                
-                # Handle simplified format
-                for pref in preferences_data:
-                    if isinstance(pref, dict) and 'category' in pref and 'key' in pref and 'value' in pref:
-                        # Store preference using the existing method
-                        success = await self.add_user_preference(
-                            category=pref['category'],
-                            key=pref['key'],
-                            value=pref['value'],
-                            description=f"Extracted from conversation: {pref['value']}"
-                        )
-                        if success:
-                            # Create a knowledge entry for tracking
-                            entry = await self.create_entry(
-                                entry_type=KnowledgeEntryType.PREFERENCE,
-                                entry_sub_type=KnowledgeEntrySubType.PERSONAL_PREFERENCE,
-                                category=pref['category'],
-                                title=f"{pref['key']} preference",
-                                content=f"User preference: {pref['key']} = {pref['value']}",
-                                metadata={
-                                    "extracted_from_interaction": True,
-                                    "agent_type": agent_type,
-                                    "timestamp": datetime.utcnow().isoformat()
-                                },
-                                tags=[pref['category'], "preference", "extracted", agent_type]
-                            )
-                            if entry:
-                                created_entries.append(entry)
-                
-                logger.info(f"Successfully extracted {len(created_entries)} preferences")
-                return created_entries
-                
-            except (json.JSONDecodeError, KeyError, TypeError) as e:
-                logger.warning(f"Failed to parse preferences extraction response: {e}")
-                logger.debug(f"Response content: {response.content}")
-                return []
-                
+        Returns:
+            Dict with query_text, query_embedding and preferences, or None on failure
+        """
+        try:
+            query_embedding, preferences = await asyncio.gather(
+                self._generate_embedding(user_input),
+                self.get_user_preferences()
+            )
+            return {
+                "query_text": user_input,
+                "query_embedding": query_embedding,
+                "preferences": preferences
+            }
         except Exception as e:
-            logger.error(f"Failed to extract preferences: {e}")
-            return []
+            logger.warning(f"Failed to prefetch context: {e}")
+            return None
 
     async def get_contextual_knowledge_for_agent(self, 
                                                 user_input: str,
                                                 agent_type: str,
-                                                max_results: int = 10) -> Dict[str, Any]:
+                                                max_results: int = 10,
+                                                prefetched: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
         Get relevant knowledge context for an agent based on user input.
         
@@ -641,34 +972,54 @@ class KnowledgeBaseService:
             user_input: User's current input
             agent_type: Type of agent requesting context
             max_results: Maximum number of results per category
+            prefetched: Result of prefetch_context for this input, skipping the embedding
+                call and the preference load
             
         Returns:
             Dictionary containing relevant context organized by type
         """
         try:
+            query_embeddings = None
+            if prefetched and prefetched.get("query_text") == user_input:
+                preferences = prefetched["preferences"]
+                query_embeddings = {user_input: prefetched["query_embedding"]}
+            else:
+                preferences = await self.get_user_preferences()
+            
             # Get user preferences for this agent type
-            preferences = await self.get_user_preferences()
             agent_preferences = getattr(preferences, agent_type.lower(), {})
             
-            # Search for relevant interactions
-            search_query = KnowledgeQuery(
-                query_text=user_input,
-                categories=[agent_type],
-                entry_types=[KnowledgeEntryType.INTERACTION, KnowledgeEntryType.PREFERENCE, KnowledgeEntryType.PATTERN],
-                limit=max_results,
-                similarity_threshold=0.6
-            )
-            
-            search_results = await self.search(search_query)
-            
-            # Search for cross-category relevant information
-            general_search = KnowledgeQuery(
-                query_text=user_input,
-                limit=max_results,
-                similarity_threshold=0.7
-            )
-            
-            general_results = await self.search(general_search)
+            # One embedding and one index scan, split into per-bucket filters
+            buckets = await self.multi_search({
+                "agent_context": KnowledgeQuery(
+                    query_text=user_input,
+                    categories=[agent_type],
+                    entry_types=[KnowledgeEntryType.INTERACTION, KnowledgeEntryType.PREFERENCE, KnowledgeEntryType.PATTERN],
+                    limit=max_results,
+                    similarity_threshold=0.6
+                ),
+                "relevant_interactions": KnowledgeQuery(
+                    query_text=user_input,
+                    categories=[agent_type],
+                    entry_types=[KnowledgeEntryType.INTERACTION],
+                    limit=5,
+                    similarity_threshold=0.6
+                ),
+                "user_preferences": KnowledgeQuery(
+                    query_text=user_input,
+                    categories=[agent_type],
+                    entry_types=[KnowledgeEntryType.PREFERENCE],
+                    limit=5,
+                    similarity_threshold=0.6
+                ),
+                # Cross-category relevant information
+                "patterns_and_insights": KnowledgeQuery(
+                    query_text=user_input,
+                    entry_types=[KnowledgeEntryType.PATTERN, KnowledgeEntryType.INSIGHT],
+                    limit=3,
+                    similarity_threshold=0.7
+                )
+            }, query_embeddings=query_embeddings)
             
             # Organize results by type
             context = {
@@ -680,9 +1031,8 @@ class KnowledgeBaseService:
                         "similarity": result.similarity_score,
                         "created_at": result.entry.created_at.isoformat()
                     }
-                    for result in search_results 
-                    if result.entry.entry_type == KnowledgeEntryType.INTERACTION
-                ][:5],
+                    for result in buckets["relevant_interactions"]
+                ],
                 "user_preferences": [
                     {
                         "content": result.entry.content,
@@ -690,21 +1040,30 @@ class KnowledgeBaseService:
                         "metadata": result.entry.metadata,
                         "similarity": result.similarity_score
                     }
-                    for result in search_results 
-                    if result.entry.entry_type == KnowledgeEntryType.PREFERENCE
-                ][:5],
+                    for result in buckets["user_preferences"]
+                ],
                 "patterns_and_insights": [
                     {
                         "content": result.entry.content,
                         "metadata": result.entry.metadata,
                         "similarity": result.similarity_score
                     }
-                    for result in general_results
-                    if result.entry.entry_type in [KnowledgeEntryType.PATTERN, KnowledgeEntryType.INSIGHT]
-                ][:3],
-                "context_summary": self._generate_context_summary(user_input, agent_type, search_results)
+                    for result in buckets["patterns_and_insights"]
+                ],
+                "context_summary": self._generate_context_summary(user_input, agent_type, buckets["agent_context"])
             }
             
+            # Let streaming clients show what was retrieved while the agent is still answering
+            await emit_event(CONTEXT_EVENT, {
+                "agent_type": agent_type,
+                "summary": context["context_summary"],
+                "counts": {
+                    key: len(context[key])
+                    for key in ("relevant_interactions", "user_preferences", "patterns_and_insights")
+                },
+                "titles": [result.entry.title for result in buckets["agent_context"][:3]]
+            })
+            
             return context
             
         except Exception as e:
@@ -772,17 +1131,17 @@ class KnowledgeBaseService:
             Knowledge base statistics
         """
         try:
-            all_entries = self.vector_store.get_all_entries()
+            # Counts are aggregated by the metadata store; no entries are loaded
+            store_stats = self.vector_store.get_stats()
             
             # Count by type
+            type_counts = store_stats.get("entries_by_type", {})
             entries_by_type = {}
             for entry_type in KnowledgeEntryType:
-                entries_by_type[entry_type] = sum(1 for e in all_entries if e.entry_type == entry_type)
+                entries_by_type[entry_type] = type_counts.get(entry_type.value, 0)
             
             # Count by category
-            entries_by_category = {}
-            for entry in all_entries:
-                entries_by_category[entry.category] = entries_by_category.get(entry.category, 0) + 1
+            entries_by_category = dict(store_stats.get("entries_by_category", {}))
             
             # Get current LLM model for embedding info
             llm_service = await get_llm_service()
@@ -790,10 +1149,10 @@ class KnowledgeBaseService:
             embedding_model = f"{current_provider}_embedding" if current_provider else "unknown"
             
             return KnowledgeStats(
-                total_entries=len(all_entries),
+                total_entries=store_stats.get("total_entries", 0),
                 entries_by_type=entries_by_type,
                 entries_by_category=entries_by_category,
-                last_updated=max((e.updated_at for e in all_entries), default=datetime.utcnow()),
+                last_updated=datetime.fromisoformat(store_stats["last_updated"]),
                 embedding_model=embedding_model
             )
         except Exception as e:
@@ -806,6 +1165,23 @@ class KnowledgeBaseService:
                 embedding_model="unknown"
             )
     
+    async def evaluate_index_recall(self, k: int = 10, num_queries: int = 100) -> Dict[str, Any]:
+        """
+        Report the vector index's recall@k against an exact flat baseline.
+        
+        Args:
+            k: Number of neighbours compared
+            num_queries: Number of sampled queries
+            
+        Returns:
+            Recall and latency report from the vector store
+        """
+        try:
+            return await asyncio.to_thread(self.vector_store.evaluate_recall, k, num_queries)
+        except Exception as e:
+            logger.error(f"Failed to evaluate index recall: {e}")
+            raise
+    
     async def clear_all(self) -> bool:
         """
         Clear all entries from the knowledge base.
@@ -827,39 +1203,42 @@ class KnowledgeBaseService:
         Get all embeddings with 3D coordinates for visualization.
         
         Returns:
-            List of embedding visualization data
+            List of embedding visualization data (empty on failure)
         """
         try:
-            # Get all entries and their embeddings
-            all_entries = self.vector_store.get_all_entries()
-            embeddings_data = []
-            
-            if not all_entries:
-                return []
-            
-            # Get embeddings from vector store
-            embeddings = []
-            entries_info = []
+            return [item async for item in self.iter_embeddings_visualization_data()]
+        except Exception:
+            return []
+    
+    async def iter_embeddings_visualization_data(self, batch_size: int = 128) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Stream embeddings with 3D coordinates for visualization.
+        
+        Positions and similarity connections are computed over the vector matrix;
+        entries are loaded from the metadata store one batch at a time as they are yielded.
+        
+        Args:
+            batch_size: Number of entries loaded and scored per batch
             
-            for entry in all_entries:
-                # Get embedding from vector store
-                embedding = self.vector_store.get_embedding(entry.entry_id)
-                if embedding is not None:
-                    embeddings.append(embedding)
-                    entries_info.append(entry)
+        Yields:
+            Embedding visualization data, one entry at a time
             
-            if not embeddings:
-                return []
+        Raises:
+            Exception: Any failure, also part-way through, so consumers can tell a
+                truncated stream from a complete one
+        """
+        try:
+            faiss_ids, embeddings = self.vector_store.get_live_vectors()
+            if len(faiss_ids) == 0:
+                return
             
             # Try to use PCA for dimensionality reduction, fallback to simple projection
             try:
                 from sklearn.decomposition import PCA
-                import numpy as np
                 
                 # Reduce dimensionality to 3D using PCA
-                embeddings_array = np.array(embeddings)
                 pca = PCA(n_components=3)
-                positions_3d = pca.fit_transform(embeddings_array)
+                positions_3d = pca.fit_transform(embeddings)
                 
                 # Normalize positions to a reasonable range for visualization
                 positions_3d = positions_3d * 10  # Scale up for better visualization
@@ -869,63 +1248,58 @@ class KnowledgeBaseService:
             except Exception as pca_error:
                 logger.warning(f"PCA failed ({pca_error}), using fallback projection")
                 
-                # Fallback: use first 3 dimensions of embeddings or create simple projection
-                positions_3d = []
-                for i, embedding in enumerate(embeddings):
-                    # Use first 3 dimensions if available, otherwise create simple 2D projection
-                    if len(embedding) >= 3:
-                        x, y, z = embedding[0] * 50, embedding[1] * 50, embedding[2] * 50
-                    else:
-                        # Create a simple circular arrangement
-                        import math
-                        angle = (i / len(embeddings)) * 2 * math.pi
-                        radius = 20
-                        x = radius * math.cos(angle)
-                        y = radius * math.sin(angle)
-                        z = (i % 5 - 2) * 5  # Vary height
-                    
-                    positions_3d.append([x, y, z])
-            
-            # Create visualization data with similarity connections
-            for i, (entry, position) in enumerate(zip(entries_info, positions_3d)):
-                # Calculate similarities to other entries for connection data
-                similarities = []
-                current_embedding = embeddings[i]
+                # Fallback: use the first 3 dimensions of the embeddings
+                positions_3d = embeddings[:, :3] * 50
+            
+            entry_ids = self.vector_store.get_entry_ids(faiss_ids.tolist())
+            count = 0
+            for start in range(0, len(faiss_ids), batch_size):
+                batch_ids = faiss_ids[start:start + batch_size]
+                entries = self.vector_store.get_entries(batch_ids.tolist())
                 
-                for j, other_embedding in enumerate(embeddings):
-                    if i != j:
-                        # Calculate cosine similarity
-                        import numpy as np
-                        similarity = np.dot(current_embedding, other_embedding) / (
-                            np.linalg.norm(current_embedding) * np.linalg.norm(other_embedding)
-                        )
-                        if similarity > 0.7:  # Only include high similarity connections
-                            similarities.append({
-                                "target_id": entries_info[j].entry_id,
-                                "similarity": float(similarity)
-                            })
+                # Stored vectors are normalized, so dot products are cosine similarities
+                similarity_rows = embeddings[start:start + batch_size] @ embeddings.T
                 
-                visualization_data = {
-                    "entry_id": entry.entry_id,
-                    "title": entry.title,
-                    "content": entry.content[:200] + "..." if len(entry.content) > 200 else entry.content,
-                    "category": entry.category,
-                    "entry_type": entry.entry_type.value,
-                    "tags": entry.tags,
-                    "embedding": embeddings[i][:10] if len(embeddings[i]) > 10 else embeddings[i],  # First 10 dims for preview
-                    "position_3d": position if isinstance(position, list) else position.tolist(),
-                    "created_at": entry.created_at.isoformat(),
-                    "updated_at": entry.updated_at.isoformat(),
-                    "similarities": similarities[:5]  # Top 5 most similar entries
-                }
-                embeddings_data.append(visualization_data)
+                for row, faiss_id in enumerate(batch_ids.tolist()):
+                    entry = entries.get(faiss_id)
+                    if entry is None:
+                        continue
+                    
+                    # Only include high similarity connections, strongest first
+                    scores = similarity_rows[row]
+                    scores[start + row] = -1.0
+                    connected = np.flatnonzero(scores > 0.7)
+                    connected = connected[np.argsort(-scores[connected], kind="stable")][:5]
+                    similarities = [
+                        {"target_id": entry_ids[int(faiss_ids[j])], "similarity": float(scores[j])}
+                        for j in connected
+                        if int(faiss_ids[j]) in entry_ids
+                    ]
+                    
+                    embedding = embeddings[start + row]
+                    yield {
+                        "entry_id": entry.entry_id,
+                        "title": entry.title,
+                        "content": entry.content[:200] + "..." if len(entry.content) > 200 else entry.content,
+                        "category": entry.category,
+                        "entry_type": entry.entry_type.value,
+                        "tags": entry.tags,
+                        "embedding": embedding[:10].tolist(),  # First 10 dims for preview
+                        "position_3d": positions_3d[start + row].tolist(),
+                        "created_at": entry.created_at.isoformat(),
+                        "updated_at": entry.updated_at.isoformat(),
+                        "similarities": similarities  # Top 5 most similar entries
+                    }
+                    count += 1
+                
+                # Let other requests run between batches
+                await asyncio.sleep(0)
             
-            logger.info(f"Generated visualization data for {len(embeddings_data)} embeddings")
-            return embeddings_data
+            logger.info(f"Generated visualization data for {count} embeddings")
             
         except Exception as e:
             logger.error(f"Failed to get embeddings visualization data: {e}")
-            return []
+            raise
     
     async def get_embedding_details(self, entry_id: str) -> Optional[Dict[str, Any]]:
         """
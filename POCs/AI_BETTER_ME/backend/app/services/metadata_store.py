@@ -0,0 +1,278 @@
+"""
+SQLite-backed metadata store for knowledge base entries in the vector store.
+"""
+
+import os
+import json
+import logging
+import sqlite3
+import threading
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, Any, Iterator, List, Optional, Sequence, Tuple
+
+from ..models.knowledge import KnowledgeEntry
+
+logger = logging.getLogger(__name__)
+
+# Columns that can be filtered and aggregated on without decoding entry payloads
+FACET_COLUMNS = ("category", "entry_type")
+
+
+class MetadataStore:
+    """
+    Indexed, row-per-entry store of knowledge entry metadata keyed by faiss id.
+
+    Entries are stored without their embeddings (the vectors live only in the
+    vector index) and are decoded lazily, one row or one batch at a time. The
+    filterable fields are kept in their own columns so filter indexes, counts
+    and listings never need to decode the JSON payload of every entry.
+    """
+
+    def __init__(self, db_path: str, read_only: bool = False):
+        """
+        Initialize the metadata store.
+
+        Args:
+            db_path: Path of the SQLite database file
+            read_only: Open an existing database without ever writing to it (no schema
+                setup or journal mode change), for processes sharing a store
+        """
+        self.db_path = db_path
+        self.read_only = read_only
+        self._lock = threading.Lock()
+
+        if read_only:
+            self._db = sqlite3.connect(f"{Path(db_path).resolve().as_uri()}?mode=ro", uri=True, check_same_thread=False)
+            return
+
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "faiss_id INTEGER PRIMARY KEY, "
+            "entry_id TEXT NOT NULL UNIQUE, "
+            "entry_type TEXT NOT NULL, "
+            "category TEXT NOT NULL, "
+            "tags TEXT NOT NULL, "
+            "updated_at TEXT NOT NULL, "
+            "payload TEXT NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS entries_category ON entries (category);"
+            "CREATE INDEX IF NOT EXISTS entries_entry_type ON entries (entry_type);"
+            "CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value INTEGER NOT NULL);"
+        )
+        self._db.commit()
+
+    @staticmethod
+    def _row(faiss_id: int, entry: KnowledgeEntry) -> Tuple:
+        """Encode an entry as a table row, leaving out its embedding."""
+        return (
+            faiss_id,
+            entry.entry_id,
+            getattr(entry.entry_type, "value", entry.entry_type),
+            entry.category,
+            json.dumps(entry.tags),
+            entry.updated_at.isoformat(),
+            entry.model_dump_json(exclude={"embedding"})
+        )
+
+    @staticmethod
+    def _decode(payload: str) -> KnowledgeEntry:
+        """Decode a stored payload into an entry."""
+        return KnowledgeEntry.model_validate_json(payload)
+
+    def put_many(self, rows: Sequence[Tuple[int, KnowledgeEntry]]) -> None:
+        """
+        Insert or replace entries in one transaction.
+
+        An entry id that is already stored under another faiss id is moved to the new one.
+
+        Args:
+            rows: (faiss_id, entry) pairs
+        """
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO entries "
+                "(faiss_id, entry_id, entry_type, category, tags, updated_at, payload) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [self._row(faiss_id, entry) for faiss_id, entry in rows]
+            )
+
+    def delete(self, entry_id: str) -> Optional[int]:
+        """
+        Delete an entry.
+
+        Args:
+            entry_id: ID of the entry to delete
+
+        Returns:
+            The faiss id the entry was stored under, or None if it was not found
+        """
+        with self._lock, self._db:
+            row = self._db.execute("SELECT faiss_id FROM entries WHERE entry_id = ?", (entry_id,)).fetchone()
+            if row is None:
+                return None
+            self._db.execute("DELETE FROM entries WHERE faiss_id = ?", (row[0],))
+            return row[0]
+
+    def delete_faiss_ids(self, faiss_ids: Sequence[int]) -> None:
+        """Delete the entries stored under the given faiss ids."""
+        with self._lock, self._db:
+            self._db.executemany("DELETE FROM entries WHERE faiss_id = ?", [(int(i),) for i in faiss_ids])
+
+    def clear(self) -> None:
+        """Delete every entry."""
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM entries")
+
+    def get_faiss_id(self, entry_id: str) -> Optional[int]:
+        """Look up the faiss id of an entry."""
+        with self._lock:
+            row = self._db.execute("SELECT faiss_id FROM entries WHERE entry_id = ?", (entry_id,)).fetchone()
+        return row[0] if row else None
+
+    def get(self, entry_id: str) -> Optional[KnowledgeEntry]:
+        """Load one entry by entry id."""
+        with self._lock:
+            row = self._db.execute("SELECT payload FROM entries WHERE entry_id = ?", (entry_id,)).fetchone()
+        return self._decode(row[0]) if row else None
+
+    def get_many(self, faiss_ids: Sequence[int]) -> Dict[int, KnowledgeEntry]:
+        """
+        Load entries by faiss id.
+
+        Args:
+            faiss_ids: The faiss ids to load
+
+        Returns:
+            Entries keyed by faiss id; ids without an entry are left out
+        """
+        entries: Dict[int, KnowledgeEntry] = {}
+        ids = [int(i) for i in faiss_ids]
+        # Stay under SQLite's bound-parameter limit
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            with self._lock:
+                rows = self._db.execute(
+                    f"SELECT faiss_id, payload FROM entries WHERE faiss_id IN ({placeholders})", chunk
+                ).fetchall()
+            for faiss_id, payload in rows:
+                entries[faiss_id] = self._decode(payload)
+        return entries
+
+    def get_entry_ids(self, faiss_ids: Sequence[int]) -> Dict[int, str]:
+        """Look up entry ids by faiss id without decoding payloads."""
+        entry_ids: Dict[int, str] = {}
+        ids = [int(i) for i in faiss_ids]
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            with self._lock:
+                rows = self._db.execute(
+                    f"SELECT faiss_id, entry_id FROM entries WHERE faiss_id IN ({placeholders})", chunk
+                ).fetchall()
+            entry_ids.update(rows)
+        return entry_ids
+
+    def iter_entries(self, category: Optional[str] = None, entry_type: Optional[str] = None,
+                     batch_size: int = 256) -> Iterator[Tuple[int, KnowledgeEntry]]:
+        """
+        Stream entries in faiss id order, decoding one batch at a time.
+
+        Args:
+            category: Only yield entries in this category
+            entry_type: Only yield entries of this type
+            batch_size: Number of rows fetched per query
+
+        Yields:
+            (faiss_id, entry) pairs
+        """
+        clauses, params = ["faiss_id > ?"], []
+        if category is not None:
+            clauses.append("category = ?")
+            params.append(category)
+        if entry_type is not None:
+            clauses.append("entry_type = ?")
+            params.append(entry_type)
+        query = f"SELECT faiss_id, payload FROM entries WHERE {' AND '.join(clauses)} ORDER BY faiss_id LIMIT ?"
+
+        last_id = -1
+        while True:
+            # Keyset pagination, so the lock is never held while the caller consumes a batch
+            with self._lock:
+                rows = self._db.execute(query, [last_id, *params, batch_size]).fetchall()
+            for faiss_id, payload in rows:
+                yield faiss_id, self._decode(payload)
+            if len(rows) < batch_size:
+                return
+            last_id = rows[-1][0]
+
+    def iter_filter_keys(self, batch_size: int = 4096) -> Iterator[Tuple[int, str, str, List[str]]]:
+        """
+        Stream the filterable columns of every entry without decoding payloads.
+
+        Yields:
+            (faiss_id, category, entry_type, tags) tuples
+        """
+        last_id = -1
+        while True:
+            with self._lock:
+                rows = self._db.execute(
+                    "SELECT faiss_id, category, entry_type, tags FROM entries "
+                    "WHERE faiss_id > ? ORDER BY faiss_id LIMIT ?", (last_id, batch_size)
+                ).fetchall()
+            for faiss_id, category, entry_type, tags in rows:
+                yield faiss_id, category, entry_type, json.loads(tags)
+            if len(rows) < batch_size:
+                return
+            last_id = rows[-1][0]
+
+    def count(self) -> int:
+        """Count stored entries."""
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def count_by(self, column: str) -> Dict[str, int]:
+        """
+        Count entries per distinct value of a facet column.
+
+        Args:
+            column: One of FACET_COLUMNS
+
+        Returns:
+            Entry counts keyed by column value
+        """
+        if column not in FACET_COLUMNS:
+            raise ValueError(f"Unsupported facet column: {column}")
+        with self._lock:
+            rows = self._db.execute(f"SELECT {column}, COUNT(*) FROM entries GROUP BY {column}").fetchall()
+        return dict(rows)
+
+    def last_updated(self) -> Optional[datetime]:
+        """Get the most recent entry update time."""
+        with self._lock:
+            row = self._db.execute("SELECT MAX(updated_at) FROM entries").fetchone()
+        return datetime.fromisoformat(row[0]) if row and row[0] else None
+
+    def get_state(self, key: str, default: int = 0) -> int:
+        """Read an integer store-level setting."""
+        with self._lock:
+            row = self._db.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_state(self, key: str, value: int) -> None:
+        """Write an integer store-level setting."""
+        with self._lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)", (key, value))
+
+    def size_bytes(self) -> int:
+        """Size of the database file on disk."""
+        return os.path.getsize(self.db_path) if os.path.exists(self.db_path) else 0
+
+    def close(self) -> None:
+        """Close the database connection."""
+        with self._lock:
+            self._db.close()
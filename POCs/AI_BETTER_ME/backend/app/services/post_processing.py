@@ -0,0 +1,289 @@
+"""
+Background post-processing of finished agent turns (interaction recording and preference extraction).
+"""
+import os
+import time
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Dict, Any, List, Optional
+
+from .knowledge_base import get_knowledge_base_service
+from .interaction_recorder import get_interaction_recorder
+
+logger = logging.getLogger(__name__)
+
+# Job kinds
+RECORD_INTERACTION = "record_interaction"
+EXTRACT_PREFERENCES = "extract_preferences"
+
+
+@dataclass
+class PostProcessingJob:
+    """One finished turn waiting to be recorded or mined for preferences."""
+    kind: str
+    user_input: str
+    agent_response: str
+    agent_type: str
+    attempts: int = 0
+    submitted_at: float = 0.0
+
+
+class PostProcessingPipeline:
+    """
+    Bounded queue of post-processing jobs drained by background worker tasks.
+
+    Agents submit jobs without awaiting them, so recording and preference extraction
+    never sit on the response path. A worker takes one job, then keeps draining the
+    queue for up to batch_window seconds (or batch_size jobs); the extraction jobs
+    of that batch share one LLM call, one preference save and one bulk index write.
+
+    When the queue is full the oldest queued job is dropped, since the newest turns
+    are the most relevant. A failed job is retried with exponential backoff until it
+    has been attempted max_attempts times, then dropped.
+    """
+
+    def __init__(
+        self,
+        max_queue_size: int = 256,
+        workers: int = 2,
+        batch_size: int = 8,
+        batch_window: float = 0.5,
+        max_attempts: int = 3,
+        retry_backoff: float = 1.0
+    ):
+        """
+        Initialize the pipeline.
+
+        Args:
+            max_queue_size: Maximum number of queued jobs
+            workers: Number of worker tasks
+            batch_size: Maximum number of jobs a worker handles at once
+            batch_window: Seconds a worker waits to fill a batch
+            max_attempts: Attempts per job before it is dropped
+            retry_backoff: Delay before the first retry, doubled on each further retry
+        """
+        self.max_queue_size = max_queue_size
+        self.workers = workers
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._workers: List[asyncio.Task] = []
+        self._retries: set = set()
+        self._stats: Dict[str, int] = {
+            "submitted": 0, "completed": 0, "retried": 0,
+            "dropped_queue_full": 0, "dropped_failed": 0, "batches": 0
+        }
+        self._queue_wait_max = 0.0
+
+    def _ensure_started(self) -> asyncio.Queue:
+        """Create the queue and start the workers on the running event loop."""
+        loop = asyncio.get_running_loop()
+        if self._queue is None or self._loop is not loop:
+            self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+            self._loop = loop
+            self._workers = [
+                loop.create_task(self._worker(), name=f"post-processing-{i}")
+                for i in range(self.workers)
+            ]
+        return self._queue
+
+    def submit(self, user_input: str, agent_response: str, agent_type: str, extract_preferences: bool = True) -> None:
+        """
+        Queue a finished turn for recording and, optionally, preference extraction.
+
+        Never blocks: when the queue is full the oldest queued job is dropped.
+
+        Args:
+            user_input: User's input
+            agent_response: Agent's response
+            agent_type: Type of agent that answered
+            extract_preferences: Whether to also extract preferences from the turn
+        """
+        kinds = [RECORD_INTERACTION, EXTRACT_PREFERENCES] if extract_preferences else [RECORD_INTERACTION]
+        for kind in kinds:
+            self._enqueue(PostProcessingJob(
+                kind=kind,
+                user_input=user_input,
+                agent_response=agent_response,
+                agent_type=agent_type,
+                submitted_at=time.monotonic()
+            ))
+            self._stats["submitted"] += 1
+
+    def _enqueue(self, job: PostProcessingJob) -> None:
+        """Put a job on the queue, dropping the oldest queued job if it is full."""
+        queue = self._ensure_started()
+        if queue.full():
+            dropped = queue.get_nowait()
+            queue.task_done()
+            self._stats["dropped_queue_full"] += 1
+            logger.warning(f"Post-processing queue full, dropped oldest {dropped.kind} job")
+        queue.put_nowait(job)
+
+    async def _worker(self) -> None:
+        """Take batches off the queue until cancelled."""
+        queue = self._queue
+        while True:
+            batch = [await queue.get()]
+            deadline = time.monotonic() + self.batch_window
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                await self._process_batch(batch)
+            except Exception as e:
+                logger.error(f"Post-processing batch failed: {e}")
+            finally:
+                for _ in batch:
+                    queue.task_done()
+
+    async def _process_batch(self, batch: List[PostProcessingJob]) -> None:
+        """Run the jobs of one batch, scheduling retries for the ones that fail."""
+        self._stats["batches"] += 1
+        now = time.monotonic()
+        for job in batch:
+            if job.attempts == 0:
+                self._queue_wait_max = max(self._queue_wait_max, now - job.submitted_at)
+
+        records = [job for job in batch if job.kind == RECORD_INTERACTION]
+        extractions = [job for job in batch if job.kind == EXTRACT_PREFERENCES]
+
+        if records:
+            recorder = get_interaction_recorder()
+            outcomes = await asyncio.gather(
+                *(recorder.record_if_valuable(
+                    user_input=job.user_input,
+                    agent_response=job.agent_response,
+                    agent_type=job.agent_type
+                ) for job in records),
+                return_exceptions=True
+            )
+            for job, outcome in zip(records, outcomes):
+                if isinstance(outcome, Exception):
+                    self._retry(job, outcome)
+                else:
+                    self._stats["completed"] += 1
+
+        if extractions:
+            try:
+                await get_knowledge_base_service().extract_and_store_preferences_batch([
+                    {"user_input": job.user_input, "agent_type": job.agent_type, "agent_response": job.agent_response}
+                    for job in extractions
+                ])
+                self._stats["completed"] += len(extractions)
+            except Exception as e:
+                for job in extractions:
+                    self._retry(job, e)
+
+    def _retry(self, job: PostProcessingJob, error: Exception) -> None:
+        """Re-queue a failed job after a backoff, or drop it once it is out of attempts."""
+        job.attempts += 1
+        if job.attempts >= self.max_attempts:
+            self._stats["dropped_failed"] += 1
+            logger.error(f"Dropping {job.kind} job after {job.attempts} attempts: {error}")
+            return
+
+        self._stats["retried"] += 1
+        logger.warning(f"Retrying {job.kind} job (attempt {job.attempts + 1}): {error}")
+        task = asyncio.get_running_loop().create_task(self._requeue(job, self.retry_backoff * 2 ** (job.attempts - 1)))
+        self._retries.add(task)
+        task.add_done_callback(self._retries.discard)
+
+    async def _requeue(self, job: PostProcessingJob, delay: float) -> None:
+        """Put a job back on the queue after a delay."""
+        await asyncio.sleep(delay)
+        self._enqueue(job)
+
+    async def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until every queued job, including pending retries, has been handled.
+
+        Args:
+            timeout: Maximum seconds to wait (None waits indefinitely)
+
+        Returns:
+            True if the queue drained, False on timeout
+        """
+        if self._queue is None:
+            return True
+
+        async def drain():
+            # A failing job schedules its retry before it is marked done, so retries are visible after join
+            while True:
+                await self._queue.join()
+                if not self._retries:
+                    return
+                await asyncio.gather(*list(self._retries), return_exceptions=True)
+
+        try:
+            await asyncio.wait_for(drain(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def close(self, timeout: float = 5.0) -> None:
+        """
+        Drain the queue for up to timeout seconds, then stop the workers.
+
+        Args:
+            timeout: Maximum seconds to spend draining
+        """
+        if self._queue is None:
+            return
+        if not await self.flush(timeout):
+            logger.warning(f"Post-processing shut down with {self._queue.qsize()} jobs still queued")
+        for task in [*self._workers, *self._retries]:
+            task.cancel()
+        await asyncio.gather(*self._workers, *self._retries, return_exceptions=True)
+        self._workers = []
+        self._retries = set()
+        self._queue = None
+        self._loop = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get queue depth and job outcome counters."""
+        return {
+            **self._stats,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "pending_retries": len(self._retries),
+            "queue_wait_max_ms": round(self._queue_wait_max * 1000, 1)
+        }
+
+
+# Global pipeline instance
+_post_processing_pipeline: Optional[PostProcessingPipeline] = None
+
+
+def get_post_processing_pipeline() -> PostProcessingPipeline:
+    """Get the global post-processing pipeline instance."""
+    global _post_processing_pipeline
+
+    if _post_processing_pipeline is None:
+        _post_processing_pipeline = PostProcessingPipeline(
+            max_queue_size=int(os.getenv("POST_PROCESSING_QUEUE_SIZE", "256")),
+            workers=int(os.getenv("POST_PROCESSING_WORKERS", "2")),
+            batch_size=int(os.getenv("POST_PROCESSING_BATCH_SIZE", "8")),
+            batch_window=float(os.getenv("POST_PROCESSING_BATCH_WINDOW", "0.5"))
+        )
+
+    return _post_processing_pipeline
+
+
+async def shutdown_post_processing_pipeline() -> None:
+    """Drain and stop the global post-processing pipeline."""
+    global _post_processing_pipeline
+
+    if _post_processing_pipeline is not None:
+        await _post_processing_pipeline.close()
+        _post_processing_pipeline = None
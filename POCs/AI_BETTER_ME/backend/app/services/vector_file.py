@@ -0,0 +1,339 @@
+"""
+Memory-mapped on-disk storage for the vector store's normalized embeddings.
+"""
+
+import os
+import re
+import json
+import logging
+import threading
+from typing import List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class VectorFile:
+    """
+    Append-only float32 vector matrix with a parallel int64 id table.
+
+    Rows live in two raw files, ``{path}.f32`` (row-major float32, one row per vector)
+    and ``{path}.ids`` (the faiss id of each row). Both are opened with np.memmap, so
+    opening a store costs the same whatever its size, and every process reading the
+    store shares the page cache instead of holding a private copy.
+
+    Compaction and reset write a new generation of the pair (``{path}.{n}.f32`` and
+    ``{path}.{n}.ids``) and switch to it by replacing the small ``{path}.manifest``,
+    a single atomic rename, so a crash leaves either the old pair or the new one in
+    use, never a mix of the two. Files of other generations are leftovers and are
+    removed when the store is next opened for writing.
+
+    Appends are buffered in memory until flush() writes them, which lets the vector
+    store make them durable on its own checkpoint schedule. Faiss ids only grow, so the
+    id table stays sorted and rows are found by binary search. Once open, files are only
+    appended to or replaced (never truncated in place), so existing maps stay valid.
+    """
+
+    # Rows scored per block in scans, bounding the temporary score buffers
+    SCAN_BLOCK_ROWS = 65536
+
+    def __init__(self, path: str, dimension: int, read_only: bool = False):
+        """
+        Open (or create) the vector files.
+
+        Args:
+            path: Path prefix of the .f32 and .ids files
+            dimension: Vector dimension
+            read_only: Map the files without ever writing them (for processes sharing a store)
+        """
+        self.path = path
+        self.dimension = dimension
+        self.read_only = read_only
+        self.manifest_path = f"{path}.manifest"
+        self.generation = 0
+        self._last_generation = 0
+        self._compacted_generation: Optional[int] = None
+        self._generation_lock = threading.Lock()
+        self.vectors_path = f"{path}.f32"
+        self.ids_path = f"{path}.ids"
+
+        self._vectors: np.ndarray = np.empty((0, dimension), dtype=np.float32)
+        self._ids: np.ndarray = np.empty(0, dtype=np.int64)
+        self._pending_ids: List[np.ndarray] = []
+        self._pending_vectors: List[np.ndarray] = []
+        self._all_ids: Optional[np.ndarray] = None
+
+        self._open()
+
+    def _generation_paths(self, generation: int):
+        """Paths of the .f32 and .ids files of a generation (generation 0 has no number)."""
+        prefix = f"{self.path}.{generation}" if generation else self.path
+        return f"{prefix}.f32", f"{prefix}.ids"
+
+    def _read_generation(self) -> int:
+        """Generation named by the manifest (0 when there is none yet)."""
+        try:
+            with open(self.manifest_path, encoding="utf-8") as f:
+                return int(json.load(f)["generation"])
+        except FileNotFoundError:
+            return 0
+
+    def _allocate_generation(self) -> int:
+        """Reserve a generation number no other writer (compaction or reset) will use."""
+        with self._generation_lock:
+            self._last_generation = max(self._last_generation, self.generation) + 1
+            return self._last_generation
+
+    def _use_generation(self, generation: int) -> None:
+        """Point the file paths at a generation."""
+        self.generation = generation
+        self.vectors_path, self.ids_path = self._generation_paths(generation)
+
+    def _switch_generation(self, generation: int) -> None:
+        """Make a fully written and synced generation current with one atomic manifest rename."""
+        temp_path = f"{self.manifest_path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"generation": generation, "dimension": self.dimension}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.manifest_path)
+
+        self._use_generation(generation)
+        self._remove_other_generations()
+
+    def _remove_other_generations(self) -> None:
+        """Delete the files of every generation but the current one (readers' maps stay valid)."""
+        directory = os.path.dirname(self.path) or "."
+        base = os.path.basename(self.path)
+        pattern = re.compile(rf"^{re.escape(base)}(?:\.(\d+))?\.(?:f32|ids)$")
+        for name in os.listdir(directory):
+            found = pattern.match(name)
+            if found and int(found.group(1) or 0) != self.generation:
+                try:
+                    os.remove(os.path.join(directory, name))
+                except OSError as e:
+                    logger.warning(f"Failed to remove old vector file {name}: {e}")
+
+    def _complete_rows(self) -> int:
+        """Number of rows present in both files."""
+        vector_rows = os.path.getsize(self.vectors_path) // (self.dimension * 4) if os.path.exists(self.vectors_path) else 0
+        id_rows = os.path.getsize(self.ids_path) // 8 if os.path.exists(self.ids_path) else 0
+        return min(vector_rows, id_rows)
+
+    def _open(self) -> None:
+        """Map the current generation's files, trimming a torn tail left by an interrupted flush."""
+        self._use_generation(self._read_generation())
+        if not self.read_only:
+            # Files of another generation are an unfinished compaction or an old pair
+            self._remove_other_generations()
+
+        row_bytes = self.dimension * 4
+        rows = self._complete_rows()
+
+        torn = (os.path.exists(self.vectors_path) and os.path.getsize(self.vectors_path) != rows * row_bytes) or \
+            (os.path.exists(self.ids_path) and os.path.getsize(self.ids_path) != rows * 8)
+        if torn and not self.read_only:
+            logger.warning(f"Trimming vector file {self.path} to {rows} complete rows")
+            for file_path, size in ((self.vectors_path, rows * row_bytes), (self.ids_path, rows * 8)):
+                with open(file_path, "r+b") as f:
+                    f.truncate(size)
+
+        self._map(rows)
+
+    def refresh(self) -> None:
+        """Remap to pick up rows (or a new generation) another process has written since the last refresh."""
+        if self._pending_ids:
+            return
+        for _ in range(3):
+            try:
+                self._use_generation(self._read_generation())
+                self._map(self._complete_rows())
+                return
+            except FileNotFoundError:
+                continue  # The writer switched generations again between reading the manifest and mapping
+        logger.warning(f"Vector file {self.path} kept changing generation during refresh")
+
+    def _map(self, rows: int) -> None:
+        """(Re)map the first rows of the files read-only."""
+        if rows:
+            self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dimension))
+            self._ids = np.memmap(self.ids_path, dtype=np.int64, mode="r", shape=(rows,))
+        else:
+            self._vectors = np.empty((0, self.dimension), dtype=np.float32)
+            self._ids = np.empty(0, dtype=np.int64)
+        self._all_ids = None
+
+    @property
+    def count(self) -> int:
+        """Number of rows, including buffered ones."""
+        return len(self._ids) + sum(len(ids) for ids in self._pending_ids)
+
+    @property
+    def stored_count(self) -> int:
+        """Number of rows written to disk."""
+        return len(self._ids)
+
+    def size_bytes(self) -> int:
+        """Size of the files on disk."""
+        return sum(os.path.getsize(p) for p in (self.vectors_path, self.ids_path) if os.path.exists(p))
+
+    def ids(self) -> np.ndarray:
+        """Faiss id of every row (sorted), including buffered ones."""
+        if self._all_ids is None:
+            self._all_ids = np.concatenate([self._ids, *self._pending_ids]) if self._pending_ids else self._ids
+        return self._all_ids
+
+    def append(self, ids: np.ndarray, vectors: np.ndarray) -> None:
+        """
+        Buffer rows for the next flush.
+
+        Args:
+            ids: Faiss ids, all greater than any id already stored
+            vectors: Normalized float32 vectors, one row per id
+        """
+        if len(ids) == 0:
+            return
+        last_id = self.ids()[-1] if self.count else -1
+        if ids[0] <= last_id:
+            raise ValueError(f"Vector ids must increase: got {ids[0]} after {last_id}")
+
+        self._pending_ids.append(np.array(ids, dtype=np.int64))
+        self._pending_vectors.append(np.ascontiguousarray(vectors, dtype=np.float32).reshape(len(ids), self.dimension))
+        self._all_ids = None
+
+    def rows_of(self, faiss_ids: np.ndarray) -> np.ndarray:
+        """
+        Find the rows holding faiss ids.
+
+        Raises:
+            KeyError: If an id has no row
+        """
+        all_ids = self.ids()
+        rows = np.searchsorted(all_ids, faiss_ids)
+        if len(rows) and (rows.max() >= len(all_ids) or not np.array_equal(all_ids[rows], faiss_ids)):
+            raise KeyError("Vector file has no row for some of the requested ids")
+        return rows
+
+    def rows(self, rows: np.ndarray) -> np.ndarray:
+        """Copy the vectors of the given rows into a new float32 matrix."""
+        stored = len(self._ids)
+        if not self._pending_vectors or (len(rows) and rows.max() < stored):
+            return np.array(self._vectors[rows], dtype=np.float32)
+
+        combined = np.concatenate(self._pending_vectors)
+        vectors = np.empty((len(rows), self.dimension), dtype=np.float32)
+        on_disk = rows < stored
+        vectors[on_disk] = self._vectors[rows[on_disk]]
+        vectors[~on_disk] = combined[rows[~on_disk] - stored]
+        return vectors
+
+    def get(self, faiss_ids: np.ndarray) -> np.ndarray:
+        """Copy the vectors of faiss ids into a new float32 matrix."""
+        return self.rows(self.rows_of(faiss_ids))
+
+    def scores(self, query: np.ndarray) -> np.ndarray:
+        """
+        Inner product of a normalized query with every row, scanned block by block.
+
+        Returns:
+            One float32 score per row, in row order
+        """
+        blocks = [
+            self._vectors[start:start + self.SCAN_BLOCK_ROWS] @ query
+            for start in range(0, len(self._vectors), self.SCAN_BLOCK_ROWS)
+        ]
+        blocks.extend(vectors @ query for vectors in self._pending_vectors)
+        return np.concatenate(blocks) if blocks else np.empty(0, dtype=np.float32)
+
+    def flush(self) -> None:
+        """Append buffered rows to the files and remap them (without fsync)."""
+        if not self._pending_ids:
+            return
+
+        rows = self.count
+        with open(self.vectors_path, "ab") as f:
+            for vectors in self._pending_vectors:
+                f.write(vectors.tobytes())
+        with open(self.ids_path, "ab") as f:
+            for ids in self._pending_ids:
+                f.write(ids.tobytes())
+
+        self._pending_ids = []
+        self._pending_vectors = []
+        self._map(rows)
+
+    def sync(self) -> None:
+        """Force flushed rows to stable storage."""
+        for file_path in (self.vectors_path, self.ids_path):
+            if os.path.exists(file_path):
+                with open(file_path, "rb") as f:
+                    os.fsync(f.fileno())
+
+    def stored(self):
+        """The current maps of the stored rows, as (vectors, ids); they stay valid after later writes."""
+        return self._vectors, self._ids
+
+    def write_compacted(self, vectors: np.ndarray, ids: np.ndarray, keep: np.ndarray) -> None:
+        """
+        Write the kept rows of a stored() snapshot as the next generation, for replace_with.
+
+        Stored rows are immutable, so this can run without blocking appends.
+
+        Args:
+            vectors: Vector map from stored()
+            ids: Id map from stored()
+            keep: Boolean mask over the snapshot's rows
+        """
+        self._compacted_generation = self._allocate_generation()
+        vectors_path, ids_path = self._generation_paths(self._compacted_generation)
+        with open(vectors_path, "wb") as vf, open(ids_path, "wb") as idf:
+            for start in range(0, len(ids), self.SCAN_BLOCK_ROWS):
+                mask = keep[start:start + self.SCAN_BLOCK_ROWS]
+                vf.write(np.ascontiguousarray(vectors[start:start + self.SCAN_BLOCK_ROWS][mask]).tobytes())
+                idf.write(np.ascontiguousarray(ids[start:start + self.SCAN_BLOCK_ROWS][mask]).tobytes())
+
+    def replace_with(self, from_row: int) -> None:
+        """
+        Switch to the generation written by write_compacted.
+
+        Stored rows from from_row on (written after the compacted snapshot) are carried
+        over, and buffered rows stay buffered. The new files are synced before the
+        manifest names them.
+
+        Args:
+            from_row: First stored row not covered by the compacted files
+        """
+        generation, self._compacted_generation = self._compacted_generation, None
+        vectors_path, ids_path = self._generation_paths(generation)
+        with open(vectors_path, "ab") as vf, open(ids_path, "ab") as idf:
+            vf.write(np.ascontiguousarray(self._vectors[from_row:]).tobytes())
+            idf.write(np.ascontiguousarray(self._ids[from_row:]).tobytes())
+            vf.flush()
+            idf.flush()
+            os.fsync(vf.fileno())
+            os.fsync(idf.fileno())
+
+        self._switch_generation(generation)
+        self._map(os.path.getsize(self.ids_path) // 8)
+
+    def discard_compacted(self) -> None:
+        """Remove the files left by write_compacted."""
+        if self._compacted_generation is None:
+            return
+        for file_path in self._generation_paths(self._compacted_generation):
+            if os.path.exists(file_path):
+                os.remove(file_path)
+        self._compacted_generation = None
+
+    def reset(self) -> None:
+        """Drop every row, switching to a new generation of empty files."""
+        generation = self._allocate_generation()
+        for file_path in self._generation_paths(generation):
+            with open(file_path, "wb") as f:
+                os.fsync(f.fileno())
+        self._switch_generation(generation)
+
+        self._pending_ids = []
+        self._pending_vectors = []
+        self._map(0)
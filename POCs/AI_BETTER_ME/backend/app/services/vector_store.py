@@ -5,89 +5,740 @@ FAISS-based vector store for knowledge base embeddings.
 import os
 import pickle
 import logging
-from typing import List, Dict, Any, Optional, Tuple
+import time
+import threading
+from enum import Enum
+from typing import List, Dict, Any, Iterator, Optional, Set, Tuple, Union
 import numpy as np
 import faiss
 from datetime import datetime
 
 from ..models.knowledge import KnowledgeEntry, KnowledgeSearchResult
+from .metadata_store import MetadataStore
+from .vector_file import VectorFile
 
 logger = logging.getLogger(__name__)
 
+# Supported index types; "auto" starts flat and moves to HNSW once the store is large
+INDEX_TYPES = ("flat", "hnsw", "ivfpq", "auto")
+
 
 class VectorStore:
     """FAISS-based vector store for storing and retrieving embeddings."""
     
-    def __init__(self, dimension: int = 1536, index_path: str = "data/vector_index"):
+    def __init__(self, dimension: int = 1536, index_path: str = "data/vector_index",
+                 compaction_threshold: int = 256, write_behind: bool = False,
+                 flush_every: int = 100, flush_interval: float = 5.0,
+                 prefilter_exact_limit: int = 2048, index_type: str = "flat",
+                 ann_min_vectors: int = 10000, hnsw_m: int = 32, hnsw_ef_search: int = 64,
+                 ivf_nlist: int = 1024, ivf_nprobe: int = 16, pq_m: int = 64,
+                 read_only: bool = False):
         """
         Initialize the vector store.
         
         Args:
             dimension: Dimension of the embeddings (1536 for standardized embeddings across providers)
-            index_path: Path to store the FAISS index and metadata
+            index_path: Path to store the FAISS index; vectors go to memory-mapped files and entry
+                metadata to a SQLite file beside it
+            compaction_threshold: Number of tombstoned vectors that triggers a background compaction
+            write_behind: Journal mutations and checkpoint in the background instead of on every write
+            flush_every: Number of journaled mutations that triggers a checkpoint in write-behind mode
+            flush_interval: Maximum seconds between checkpoints in write-behind mode
+            prefilter_exact_limit: Filtered searches with at most this many candidates score the
+                candidates directly instead of running a selector-restricted index scan
+            index_type: "flat" (exact scan of the vector file), "hnsw" (low-latency graph), "ivfpq"
+                (compressed, trained once enough vectors exist) or "auto" (flat until ann_min_vectors,
+                then HNSW)
+            ann_min_vectors: Live vector count at which "auto" switches to HNSW and "ivfpq" trains
+            hnsw_m: HNSW graph degree
+            hnsw_ef_search: HNSW search breadth (recall/latency trade-off)
+            ivf_nlist: Number of IVF partitions
+            ivf_nprobe: Number of IVF partitions scanned per query
+            pq_m: Number of PQ sub-quantizers (must divide the dimension)
+            read_only: Open an existing store for searching only, e.g. from a second process
+                sharing it; no recovery, migration, rebuilds or checkpoints are run
         """
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Unsupported index type: {index_type}")
+        if index_type == "ivfpq" and dimension % pq_m:
+            raise ValueError(f"pq_m ({pq_m}) must divide the dimension ({dimension})")
+        
         self.dimension = dimension
         self.index_path = index_path
-        self.metadata_path = f"{index_path}_metadata.pkl"
+        self.metadata_path = f"{index_path}_metadata.db"
+        self.legacy_metadata_path = f"{index_path}_metadata.pkl"
+        self.journal_path = f"{index_path}_journal.log"
+        self.rotated_journal_path = f"{self.journal_path}.ckpt"
+        self.compaction_threshold = compaction_threshold
+        self.write_behind = write_behind
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.prefilter_exact_limit = prefilter_exact_limit
+        self.index_type = index_type
+        self.ann_min_vectors = ann_min_vectors
+        self.hnsw_m = hnsw_m
+        self.hnsw_ef_search = hnsw_ef_search
+        self.ivf_nlist = ivf_nlist
+        self.ivf_nprobe = ivf_nprobe
+        self.pq_m = pq_m
+        self.read_only = read_only
         
         # Create data directory if it doesn't exist
         os.makedirs(os.path.dirname(index_path), exist_ok=True)
         
-        # Initialize FAISS index
-        self.index = faiss.IndexFlatIP(dimension)  # Inner product for cosine similarity
-        self.entry_metadata: Dict[int, KnowledgeEntry] = {}
-        self.id_to_faiss_id: Dict[str, int] = {}
+        # Vectors are memory-mapped from disk; the FAISS index (None for flat stores) is only an
+        # ANN structure over them, and entries are loaded from the metadata store by id on demand
+        self.vectors = VectorFile(f"{index_path}_vectors", dimension, read_only=read_only)
+        self.index = self._create_index(self._desired_kind(0))
+        self.metadata = MetadataStore(self.metadata_path, read_only=read_only)
         self.next_faiss_id = 0
         
-        # Load existing index if available
+        # Inverted indexes from filterable metadata to live faiss ids (their keys are the live ids)
+        self._category_ids: Dict[str, Set[int]] = {}
+        self._type_ids: Dict[str, Set[int]] = {}
+        self._tag_ids: Dict[str, Set[int]] = {}
+        self._indexed_keys: Dict[int, Tuple[str, str, Tuple[str, ...]]] = {}
+        
+        # Deleted vectors stay in the vector file until compaction removes them in one batch
+        self.tombstones: Set[int] = set()
+        self._lock = threading.RLock()
+        self._checkpoint_lock = threading.Lock()
+        self._compaction_thread: Optional[threading.Thread] = None
+        self._rebuild_thread: Optional[threading.Thread] = None
+        self._rebuild_lock = threading.Lock()
+        self._clear_generation = 0
+        
+        # Write-behind journal state
+        self._journal_file = None
+        self._journal_seq = 0
+        self._pending_mutations = 0
+        self._flush_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._flusher_thread: Optional[threading.Thread] = None
+        
+        # Load existing index if available, then replay anything journaled after it
         self._load_index()
+        if not self.read_only:
+            self._recover_journal()
+        self._drop_orphaned_entries()
+        
+        # Migrate an existing index to the configured type in the background
+        self._maybe_schedule_rebuild()
+        
+        if self.write_behind and not self.read_only:
+            self._flusher_thread = threading.Thread(
+                target=self._flush_loop,
+                name="vector-store-flusher",
+                daemon=True
+            )
+            self._flusher_thread.start()
+    
+    def _create_index(self, kind: str = "flat") -> Optional[faiss.Index]:
+        """
+        Create an empty ID-addressable index (inner product for cosine similarity).
+        
+        Flat stores have no FAISS index: they are scanned straight from the memory-mapped
+        vector file, so None is returned. IVF-PQ indexes come back untrained; use
+        _build_index to get a populated one.
+        """
+        if kind == "hnsw":
+            inner = faiss.IndexHNSWFlat(self.dimension, self.hnsw_m, faiss.METRIC_INNER_PRODUCT)
+        elif kind == "ivfpq":
+            quantizer = faiss.IndexFlatIP(self.dimension)
+            inner = faiss.IndexIVFPQ(quantizer, self.dimension, self.ivf_nlist, self.pq_m, 8,
+                                     faiss.METRIC_INNER_PRODUCT)
+        else:
+            return None
+        
+        index = faiss.IndexIDMap2(inner)
+        self._configure_index(index)
+        return index
+    
+    def _configure_index(self, index: faiss.Index) -> None:
+        """Apply the configured search-time parameters to an index."""
+        inner = faiss.downcast_index(index.index) if hasattr(index, "id_map") else faiss.downcast_index(index)
+        if isinstance(inner, faiss.IndexHNSW):
+            inner.hnsw.efSearch = self.hnsw_ef_search
+        elif isinstance(inner, faiss.IndexIVF):
+            inner.nprobe = self.ivf_nprobe
+    
+    def _index_kind(self, index: Optional[faiss.Index] = None) -> str:
+        """Report which index type backs the store."""
+        index = self.index if index is None else index
+        if index is None:
+            return "flat"
+        inner = faiss.downcast_index(index.index) if hasattr(index, "id_map") else faiss.downcast_index(index)
+        if isinstance(inner, faiss.IndexHNSW):
+            return "hnsw"
+        if isinstance(inner, faiss.IndexIVFPQ):
+            return "ivfpq"
+        return "flat"
+    
+    def _desired_kind(self, live_count: int) -> str:
+        """Pick the index type the configuration calls for at a given store size."""
+        if self.index_type == "hnsw":
+            return "hnsw"
+        if self.index_type == "auto":
+            return "hnsw" if live_count >= self.ann_min_vectors else "flat"
+        if self.index_type == "ivfpq":
+            # IVF needs ~39 training points per partition and PQ 256 per code
+            min_train = max(self.ann_min_vectors, self.ivf_nlist * 39, 256)
+            return "ivfpq" if live_count >= min_train else "flat"
+        return "flat"
+    
+    def _build_index(self, kind: str, ids: np.ndarray, vectors: np.ndarray,
+                     trained: Optional[faiss.Index] = None) -> Optional[faiss.Index]:
+        """
+        Create, train if needed and populate an index of the given type.
+        
+        Args:
+            kind: Index type to build ("flat" builds nothing; the vector file is the index)
+            ids: Faiss ids to add
+            vectors: Normalized vectors, one row per id
+            trained: An empty, trained index of the same type to fill instead of training a new one
+        """
+        if kind == "flat":
+            return None
+        if trained is not None:
+            inner = trained
+            index = faiss.IndexIDMap2(inner)
+            self._configure_index(index)
+        else:
+            index = self._create_index(kind)
+            inner = faiss.downcast_index(index.index)
+        if not inner.is_trained:
+            # Train on a bounded sample so large stores don't pay for a full pass
+            sample_size = min(len(vectors), self.ivf_nlist * 256)
+            sample = vectors[np.random.default_rng(0).choice(len(vectors), sample_size, replace=False)]
+            inner.train(sample)
+        if len(ids):
+            index.add_with_ids(vectors, ids)
+        return index
+    
+    def _source_vectors(self, faiss_ids: np.ndarray) -> np.ndarray:
+        """Get the exact normalized vectors of faiss ids from the vector file (caller holds the lock)."""
+        if len(faiss_ids) == 0:
+            return np.empty((0, self.dimension), dtype=np.float32)
+        return self.vectors.get(faiss_ids)
+    
+    def _live_ids(self) -> np.ndarray:
+        """Sorted live faiss ids (caller holds the lock)."""
+        return np.array(sorted(self._indexed_keys), dtype=np.int64)
+    
+    def _live_count(self) -> int:
+        """Number of live entries."""
+        return len(self._indexed_keys)
+    
+    def _live_vectors(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Snapshot live faiss ids and their vectors (caller holds the lock)."""
+        ids = self._live_ids()
+        return ids, self._source_vectors(ids)
+    
+    def rebuild_index(self, index_type: Optional[str] = None) -> str:
+        """
+        Rebuild the index from the live vectors, dropping tombstones.
+        
+        The new index is built outside the lock so searches and writes continue;
+        mutations made meanwhile are caught up before the swap.
+        
+        Args:
+            index_type: Index type to build; defaults to what the configuration calls for
+            
+        Returns:
+            The index type now backing the store
+        """
+        self._check_writable()
+        with self._rebuild_lock:
+            with self._lock:
+                kind = index_type or self._desired_kind(self._live_count())
+                snapshot_next_id = self.next_faiss_id
+                generation = self._clear_generation
+                ids, vectors = self._live_vectors()
+                # Rebuilding an IVF-PQ index (compaction) keeps its centroids and codebooks
+                trained = None
+                if kind == "ivfpq" == self._index_kind():
+                    trained = faiss.clone_index(self.index.index)
+                    trained.reset()
+            
+            started = time.perf_counter()
+            new_index = self._build_index(kind, ids, vectors, trained=trained)
+            
+            with self._lock:
+                if generation != self._clear_generation:
+                    logger.info("Vector store was cleared during the index rebuild; discarding it")
+                    return self._index_kind()
+                
+                # Catch up on entries added while building; removed ones are already tombstones
+                added = np.array(sorted(fid for fid in self._indexed_keys if fid >= snapshot_next_id), dtype=np.int64)
+                if len(added) and new_index is not None:
+                    new_index.add_with_ids(self._source_vectors(added), added)
+                self.index = new_index
+            
+            self._save_index()
+            logger.info(f"Rebuilt vector index as {kind} with {len(ids) + len(added)} vectors "
+                        f"in {time.perf_counter() - started:.2f}s")
+            return kind
+    
+    def _maybe_schedule_rebuild(self) -> None:
+        """Start a background rebuild when the configured index type calls for a different index."""
+        if self.read_only:
+            return
+        if self._desired_kind(self._live_count()) == self._index_kind():
+            return
+        if self._rebuild_thread is not None and self._rebuild_thread.is_alive():
+            return
+        
+        def run():
+            try:
+                self.rebuild_index()
+            except Exception as e:
+                logger.error(f"Failed to rebuild vector index: {e}")
+        
+        self._rebuild_thread = threading.Thread(target=run, name="vector-store-rebuild", daemon=True)
+        self._rebuild_thread.start()
+    
+    def _check_writable(self) -> None:
+        """Refuse mutations on a store opened read-only."""
+        if self.read_only:
+            raise RuntimeError("Vector store was opened read-only")
+    
+    def _index_vectors(self, index: faiss.Index) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Extract the ids and vectors from an index file written before the vector file existed.
+        
+        Older stores rebuilt the flat index on every delete, so FAISS position i always held
+        faiss id i; ID-mapped indexes map positions through their id map. IVF-PQ vectors can
+        only be recovered approximately, by decoding their PQ codes.
+        
+        Returns:
+            Sorted faiss ids and their normalized vectors
+        """
+        if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+            ids = faiss.vector_to_array(index.id_map).astype(np.int64)
+            inner = faiss.downcast_index(index.index)
+        else:
+            ids = np.arange(index.ntotal, dtype=np.int64)
+            inner = index
+        
+        vectors = inner.reconstruct_n(0, index.ntotal)
+        faiss.normalize_L2(vectors)
+        order = np.argsort(ids, kind="stable")
+        return ids[order], vectors[order]
+    
+    def _migrate_metadata(self) -> None:
+        """
+        Import a legacy pickled metadata file into the metadata store.
+        
+        Embeddings carried by the pickled entries are dropped; the index already holds
+        the vectors. The pickle is kept beside the store with a .migrated suffix.
+        """
+        with open(self.legacy_metadata_path, 'rb') as f:
+            data = pickle.load(f)
+        
+        rows = [
+            (faiss_id, entry.model_copy(update={'embedding': None}))
+            for faiss_id, entry in data.get('entry_metadata', {}).items()
+        ]
+        self.metadata.put_many(rows)
+        self.metadata.set_state('journal_seq', data.get('journal_seq', 0))
+        os.replace(self.legacy_metadata_path, f"{self.legacy_metadata_path}.migrated")
+        logger.info(f"Migrated {len(rows)} pickled entries to the metadata store")
     
     def _load_index(self) -> None:
-        """Load existing FAISS index and metadata from disk."""
+        """
+        Open the vector store's files.
+        
+        The vector file is memory-mapped rather than read, so opening costs the same at any
+        store size; only an ANN index file (HNSW or IVF-PQ) and the metadata store's filter
+        columns are loaded. Index files from stores that kept their vectors inside FAISS are
+        moved into the vector file once.
+        """
         try:
-            if os.path.exists(self.index_path) and os.path.exists(self.metadata_path):
-                # Load FAISS index
-                self.index = faiss.read_index(self.index_path)
+            self.index = None
+            if os.path.exists(self.index_path):
+                index = faiss.read_index(self.index_path)
+                if self.vectors.count == 0 and index.ntotal > 0 and not self.read_only:
+                    ids, vectors = self._index_vectors(index)
+                    self.vectors.append(ids, vectors)
+                    self.vectors.flush()
+                    self.vectors.sync()
+                    logger.info(f"Moved {len(ids)} vectors from the FAISS index into the vector file")
                 
-                # Load metadata
-                with open(self.metadata_path, 'rb') as f:
-                    data = pickle.load(f)
-                    self.entry_metadata = data.get('entry_metadata', {})
-                    self.id_to_faiss_id = data.get('id_to_faiss_id', {})
-                    self.next_faiss_id = data.get('next_faiss_id', 0)
-                
-                logger.info(f"Loaded vector store with {self.index.ntotal} entries")
+                if self._index_kind(index) != "flat" and hasattr(index, "id_map"):
+                    self.index = index
+                    self._configure_index(self.index)
+                elif not self.read_only:
+                    # Flat stores search the vector file directly
+                    os.remove(self.index_path)
+            
+            if os.path.exists(self.legacy_metadata_path) and not self.read_only:
+                self._migrate_metadata()
+            
+            # Only the filterable columns are read; entries themselves load lazily by id
+            self._journal_seq = self.metadata.get_state('journal_seq', 0)
+            self._rebuild_filter_indexes()
+            
+            # Vectors without a live entry are deletes awaiting compaction
+            present_ids = self.vectors.ids()
+            live_ids = self._live_ids()
+            self.tombstones = set(np.setdiff1d(present_ids, live_ids, assume_unique=True).tolist())
+            self.next_faiss_id = int(max(present_ids[-1] if len(present_ids) else -1,
+                                         live_ids[-1] if len(live_ids) else -1)) + 1
+            
+            if len(present_ids) or len(live_ids):
+                logger.info(f"Loaded vector store with {len(live_ids)} entries")
             else:
                 logger.info("No existing vector store found, starting fresh")
         except Exception as e:
             logger.error(f"Failed to load vector store: {e}")
             # Reset to empty state on error
-            self.index = faiss.IndexFlatIP(self.dimension)
-            self.entry_metadata = {}
-            self.id_to_faiss_id = {}
+            self.index = self._create_index(self._desired_kind(0))
             self.next_faiss_id = 0
+            self.tombstones = set()
+            self._journal_seq = 0
+            self._rebuild_filter_indexes()
+    
+    def _drop_orphaned_entries(self) -> None:
+        """
+        Drop entries whose vectors never reached the vector file.
+        
+        Metadata rows are committed as mutations happen, while vectors are checkpointed;
+        a crash in between can leave rows the journal could not restore vectors for. A
+        read-only store sees the same gap while the owning process has not checkpointed
+        yet, so it only hides those entries.
+        """
+        live_ids = self._live_ids()
+        orphaned = live_ids[~np.isin(live_ids, self.vectors.ids())].tolist()
+        if not orphaned:
+            return
+        
+        for faiss_id in orphaned:
+            self._unindex_filters(faiss_id)
+        if self.read_only:
+            return
+        self.metadata.delete_faiss_ids(orphaned)
+        logger.warning(f"Dropped {len(orphaned)} entries whose vectors were not in the vector file")
     
     def _save_index(self) -> None:
-        """Save FAISS index and metadata to disk."""
+        """
+        Checkpoint the vectors and the FAISS index to disk.
+        
+        Entry metadata is committed to the metadata store as mutations happen, so a
+        checkpoint appends the buffered vectors to the vector file and snapshots any ANN
+        index under the lock, then syncs the vector file, writes the index through a
+        temporary file and an atomic rename, and records the journal position it covers.
+        In write-behind mode the journal is rotated at snapshot time and discarded once
+        the checkpoint is on disk.
+        """
+        if self.read_only:
+            return
+        
         try:
-            # Save FAISS index
-            faiss.write_index(self.index, self.index_path)
-            
-            # Save metadata
-            metadata = {
-                'entry_metadata': self.entry_metadata,
-                'id_to_faiss_id': self.id_to_faiss_id,
-                'next_faiss_id': self.next_faiss_id
-            }
-            
-            with open(self.metadata_path, 'wb') as f:
-                pickle.dump(metadata, f)
+            with self._checkpoint_lock:
+                with self._lock:
+                    self.vectors.flush()
+                    index_bytes = faiss.serialize_index(self.index) if self.index is not None else None
+                    journal_seq = self._journal_seq
+                    live_count = self._live_count()
+                    self._pending_mutations = 0
+                    rotated = self._rotate_journal()
+                
+                self.vectors.sync()
+                if index_bytes is not None:
+                    self._atomic_write(self.index_path, index_bytes.tobytes())
+                elif os.path.exists(self.index_path):
+                    os.remove(self.index_path)
+                self.metadata.set_state('journal_seq', journal_seq)
+                
+                if rotated and os.path.exists(self.rotated_journal_path):
+                    os.remove(self.rotated_journal_path)
             
-            logger.debug(f"Saved vector store with {self.index.ntotal} entries")
+            logger.debug(f"Saved vector store with {live_count} entries")
         except Exception as e:
             logger.error(f"Failed to save vector store: {e}")
             raise
     
+    @staticmethod
+    def _atomic_write(path: str, payload: bytes) -> None:
+        """Write a file through a temporary sibling and an atomic rename."""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    
+    def _journal(self, *record: Any) -> None:
+        """Append a mutation to the write-behind journal (caller holds the lock)."""
+        if not self.write_behind:
+            return
+        
+        if self._journal_file is None:
+            self._journal_file = open(self.journal_path, 'ab')
+        
+        self._journal_seq += 1
+        pickle.dump((self._journal_seq,) + record, self._journal_file)
+        self._journal_file.flush()
+        
+        self._pending_mutations += 1
+        if self._pending_mutations >= self.flush_every:
+            self._flush_event.set()
+    
+    def _rotate_journal(self) -> bool:
+        """Move the live journal aside so a checkpoint can supersede it (caller holds the lock)."""
+        if self._journal_file is None:
+            return False
+        
+        self._journal_file.close()
+        self._journal_file = None
+        
+        if os.path.exists(self.rotated_journal_path):
+            # A previous checkpoint failed; keep its records and append the newer ones
+            with open(self.journal_path, 'rb') as src, open(self.rotated_journal_path, 'ab') as dst:
+                dst.write(src.read())
+            os.remove(self.journal_path)
+        else:
+            os.replace(self.journal_path, self.rotated_journal_path)
+        return True
+    
+    def _read_journal(self, path: str) -> List[Tuple]:
+        """Read journal records, stopping at a torn tail left by a crash."""
+        records = []
+        if not os.path.exists(path):
+            return records
+        
+        with open(path, 'rb') as f:
+            while True:
+                try:
+                    records.append(pickle.load(f))
+                except EOFError:
+                    break
+                except Exception as e:
+                    logger.warning(f"Ignoring truncated journal record in {path}: {e}")
+                    break
+        return records
+    
+    def _recover_journal(self) -> None:
+        """Replay journaled mutations newer than the last checkpoint."""
+        try:
+            records = self._read_journal(self.rotated_journal_path) + self._read_journal(self.journal_path)
+            pending = [record for record in records if record[0] > self._journal_seq]
+            
+            if pending:
+                # The index file may already contain vectors the metadata checkpoint doesn't know about
+                present_ids = set(faiss.vector_to_array(self.index.id_map).tolist()) if self.index is not None else set()
+                
+                for record in pending:
+                    seq, op = record[0], record[1]
+                    if op == 'add':
+                        _, _, faiss_ids, entries, vectors = record
+                        self._apply_add(faiss_ids, entries, vectors, present_ids=present_ids)
+                    elif op == 'remove':
+                        self._apply_remove(record[2])
+                    elif op == 'clear':
+                        self._apply_clear()
+                        present_ids = set()
+                    self._journal_seq = seq
+                
+                logger.info(f"Replayed {len(pending)} journaled vector store mutations")
+                self._save_index()
+            
+            for path in (self.rotated_journal_path, self.journal_path):
+                if os.path.exists(path):
+                    os.remove(path)
+        except Exception as e:
+            logger.error(f"Failed to recover vector store journal: {e}")
+    
+    def _flush_loop(self) -> None:
+        """Checkpoint every flush_every mutations or flush_interval seconds."""
+        while not self._stop_event.is_set():
+            self._flush_event.wait(timeout=self.flush_interval)
+            self._flush_event.clear()
+            if self._pending_mutations:
+                try:
+                    self._save_index()
+                except Exception:
+                    pass  # Already logged; the journal still holds the mutations
+    
+    def _persist(self) -> None:
+        """Make a mutation durable: checkpoint now, or leave it to the journal in write-behind mode."""
+        if not self.write_behind:
+            self._save_index()
+    
+    def flush(self) -> None:
+        """Force a checkpoint of all pending mutations."""
+        self._save_index()
+    
+    def refresh(self) -> None:
+        """Pick up the latest checkpoint written by the process that owns a read-only store."""
+        with self._lock:
+            self.vectors.refresh()
+            self._load_index()
+            self._drop_orphaned_entries()
+    
+    def close(self) -> None:
+        """Stop the background flusher and write a final checkpoint."""
+        if self._flusher_thread is not None:
+            self._stop_event.set()
+            self._flush_event.set()
+            self._flusher_thread.join()
+            self._flusher_thread = None
+        
+        if self.write_behind and not self.read_only:
+            self._save_index()
+        self.metadata.close()
+    
+    def _apply_add(self, faiss_ids: List[int], entries: List[KnowledgeEntry], vectors: np.ndarray,
+                   present_ids: Optional[Set[int]] = None) -> None:
+        """Insert normalized vectors and their metadata under the given faiss ids."""
+        ids = np.array(faiss_ids, dtype=np.int64)
+        # A replayed add may already have reached the vector file before a crash
+        last_id = self.vectors.ids()[-1] if self.vectors.count else -1
+        new_rows = ids > last_id
+        self.vectors.append(ids[new_rows], vectors[new_rows])
+        
+        if self.index is not None:
+            if present_ids:
+                keep = np.array([faiss_id not in present_ids for faiss_id in faiss_ids], dtype=bool)
+                ids, vectors = ids[keep], vectors[keep]
+            if len(ids):
+                self.index.add_with_ids(vectors, ids)
+        
+        # Re-adding an entry id (an update, or a journal replay) moves it to its new faiss id
+        for entry in entries:
+            previous_id = self.metadata.get_faiss_id(entry.entry_id)
+            if previous_id is not None and previous_id not in faiss_ids:
+                self._unindex_filters(previous_id)
+                self.tombstones.add(previous_id)
+        
+        self.metadata.put_many(list(zip(faiss_ids, entries)))
+        for faiss_id, entry in zip(faiss_ids, entries):
+            self._unindex_filters(faiss_id)
+            self._index_filters(faiss_id, entry)
+        self.next_faiss_id = max(self.next_faiss_id, max(faiss_ids) + 1)
+    
+    def _apply_remove(self, entry_id: str) -> bool:
+        """Drop an entry's metadata and tombstone its vector."""
+        faiss_id = self.metadata.delete(entry_id)
+        if faiss_id is None:
+            return False
+        
+        self._unindex_filters(faiss_id)
+        self.tombstones.add(faiss_id)
+        return True
+    
+    def _apply_clear(self) -> None:
+        """Reset the vectors, the index and all metadata."""
+        self._clear_generation += 1
+        self.vectors.reset()
+        self.index = self._create_index(self._desired_kind(0))
+        self.metadata.clear()
+        self.next_faiss_id = 0
+        self.tombstones = set()
+        self._rebuild_filter_indexes()
+    
+    @staticmethod
+    def _filter_key(value: Any) -> str:
+        """Normalize a filter value (plain string or str enum) to its index key."""
+        return value.value if isinstance(value, Enum) else str(value)
+    
+    def _index_filters(self, faiss_id: int, entry: KnowledgeEntry) -> None:
+        """Add a live entry to the category, entry type and tag indexes."""
+        self._add_filter_keys(faiss_id, (
+            self._filter_key(entry.category),
+            self._filter_key(entry.entry_type),
+            tuple(self._filter_key(tag) for tag in entry.tags)
+        ))
+    
+    def _add_filter_keys(self, faiss_id: int, keys: Tuple[str, str, Tuple[str, ...]]) -> None:
+        """Add a live faiss id under its (category, entry type, tags) keys."""
+        self._indexed_keys[faiss_id] = keys
+        self._category_ids.setdefault(keys[0], set()).add(faiss_id)
+        self._type_ids.setdefault(keys[1], set()).add(faiss_id)
+        for tag in keys[2]:
+            self._tag_ids.setdefault(tag, set()).add(faiss_id)
+    
+    def _unindex_filters(self, faiss_id: int) -> None:
+        """
+        Remove an entry from the filter indexes.
+        
+        Uses the keys recorded at index time, since callers may have mutated the entry since.
+        """
+        keys = self._indexed_keys.pop(faiss_id, None)
+        if keys is None:
+            return
+        
+        postings = [(self._category_ids, keys[0]), (self._type_ids, keys[1])]
+        postings.extend((self._tag_ids, tag) for tag in keys[2])
+        for index, key in postings:
+            ids = index.get(key)
+            if ids is not None:
+                ids.discard(faiss_id)
+                if not ids:
+                    del index[key]
+    
+    def _rebuild_filter_indexes(self) -> None:
+        """Rebuild the filter indexes from the metadata store's filter columns."""
+        self._category_ids = {}
+        self._type_ids = {}
+        self._tag_ids = {}
+        self._indexed_keys = {}
+        for faiss_id, category, entry_type, tags in self.metadata.iter_filter_keys():
+            self._add_filter_keys(faiss_id, (category, entry_type, tuple(tags)))
+    
+    def select_ids(self, categories: Optional[List[str]] = None, entry_types: Optional[List[Any]] = None,
+                   tags: Optional[List[str]] = None) -> Optional[Set[int]]:
+        """
+        Resolve metadata filters to the set of matching live faiss ids.
+        
+        Values within one filter are OR-ed, and the filters are AND-ed together,
+        matching KnowledgeQuery semantics.
+        
+        Args:
+            categories: Categories to match
+            entry_types: Entry types to match
+            tags: Tags to match (any)
+            
+        Returns:
+            The matching faiss ids, or None if no filter was given
+        """
+        selected: Optional[Set[int]] = None
+        with self._lock:
+            for index, values in ((self._category_ids, categories),
+                                  (self._type_ids, entry_types),
+                                  (self._tag_ids, tags)):
+                if not values:
+                    continue
+                
+                ids: Set[int] = set()
+                for value in values:
+                    ids |= index.get(self._filter_key(value), set())
+                selected = ids if selected is None else selected & ids
+        return selected
+    
+    def _add_vectors(self, entries: List[KnowledgeEntry], embeddings: Union[np.ndarray, List[List[float]]]) -> None:
+        """Add entries to the index and metadata in one FAISS call without persisting."""
+        # Normalize embeddings for cosine similarity
+        self._check_writable()
+        embedding_matrix = np.array(embeddings, dtype=np.float32).reshape(len(entries), self.dimension)
+        faiss.normalize_L2(embedding_matrix)
+        
+        with self._lock:
+            # Add to FAISS index under explicit, contiguous ids
+            faiss_ids = list(range(self.next_faiss_id, self.next_faiss_id + len(entries)))
+            self._apply_add(faiss_ids, entries, embedding_matrix)
+            self._journal('add', faiss_ids, entries, embedding_matrix)
+    
+    def _tombstone(self, entry_id: str) -> bool:
+        """Drop an entry's metadata and mark its vector for compaction without persisting."""
+        self._check_writable()
+        with self._lock:
+            if not self._apply_remove(entry_id):
+                return False
+            
+            self._journal('remove', entry_id)
+            return True
+    
     def add_entry(self, entry: KnowledgeEntry, embedding: List[float]) -> None:
         """
         Add a knowledge entry with its embedding to the vector store.
@@ -97,30 +748,40 @@ class VectorStore:
             embedding: The embedding vector for the entry
         """
         try:
-            # Normalize embedding for cosine similarity
-            embedding_array = np.array([embedding], dtype=np.float32)
-            faiss.normalize_L2(embedding_array)
-            
-            # Add to FAISS index
-            faiss_id = self.next_faiss_id
-            self.index.add(embedding_array)
-            
-            # Store metadata
-            self.entry_metadata[faiss_id] = entry
-            self.id_to_faiss_id[entry.entry_id] = faiss_id
-            self.next_faiss_id += 1
-            
-            # Update entry with embedding
-            entry.embedding = embedding
+            self._add_vectors([entry], [embedding])
             
             # Save to disk
-            self._save_index()
+            self._persist()
+            self._maybe_schedule_rebuild()
             
             logger.debug(f"Added entry {entry.entry_id} to vector store")
         except Exception as e:
             logger.error(f"Failed to add entry to vector store: {e}")
             raise
     
+    def add_entries(self, entries: List[KnowledgeEntry], embeddings: Union[np.ndarray, List[List[float]]]) -> None:
+        """
+        Add many knowledge entries with a single index add and a single persist.
+        
+        Args:
+            entries: The knowledge entries to add
+            embeddings: The embedding vectors, one per entry (a float32 matrix or lists)
+        """
+        try:
+            if len(entries) != len(embeddings):
+                raise ValueError(f"Got {len(entries)} entries but {len(embeddings)} embeddings")
+            if not entries:
+                return
+            
+            self._add_vectors(entries, embeddings)
+            self._persist()
+            self._maybe_schedule_rebuild()
+            
+            logger.debug(f"Added {len(entries)} entries to vector store")
+        except Exception as e:
+            logger.error(f"Failed to add entries to vector store: {e}")
+            raise
+    
     def update_entry(self, entry: KnowledgeEntry, embedding: List[float]) -> None:
         """
         Update an existing entry in the vector store.
@@ -130,12 +791,11 @@ class VectorStore:
             embedding: The new embedding vector
         """
         try:
-            if entry.entry_id in self.id_to_faiss_id:
-                # Remove old entry
-                self.remove_entry(entry.entry_id)
-            
-            # Add updated entry
-            self.add_entry(entry, embedding)
+            # Tombstone the old vector and add the new one, then persist once
+            self._tombstone(entry.entry_id)
+            self._add_vectors([entry], [embedding])
+            self._persist()
+            self._maybe_schedule_compaction()
             
             logger.debug(f"Updated entry {entry.entry_id} in vector store")
         except Exception as e:
@@ -146,6 +806,9 @@ class VectorStore:
         """
         Remove an entry from the vector store.
         
+        The vector is tombstoned rather than removed from FAISS immediately;
+        tombstones are excluded from search and purged in batches by compaction.
+        
         Args:
             entry_id: ID of the entry to remove
             
@@ -153,30 +816,11 @@ class VectorStore:
             True if entry was removed, False if not found
         """
         try:
-            if entry_id not in self.id_to_faiss_id:
+            if not self._tombstone(entry_id):
                 return False
             
-            faiss_id = self.id_to_faiss_id[entry_id]
-            
-            # FAISS doesn't support direct removal, so we rebuild the index
-            # This is acceptable for a single-user system with moderate data
-            remaining_entries = []
-            remaining_embeddings = []
-            
-            for fid, entry in self.entry_metadata.items():
-                if fid != faiss_id and entry.embedding:
-                    remaining_entries.append(entry)
-                    remaining_embeddings.append(entry.embedding)
-            
-            # Rebuild index
-            self.index = faiss.IndexFlatIP(self.dimension)
-            self.entry_metadata = {}
-            self.id_to_faiss_id = {}
-            self.next_faiss_id = 0
-            
-            # Re-add remaining entries
-            for entry, embedding in zip(remaining_entries, remaining_embeddings):
-                self.add_entry(entry, embedding)
+            self._persist()
+            self._maybe_schedule_compaction()
             
             logger.debug(f"Removed entry {entry_id} from vector store")
             return True
@@ -184,43 +828,136 @@ class VectorStore:
             logger.error(f"Failed to remove entry from vector store: {e}")
             return False
     
+    def compact(self) -> int:
+        """
+        Purge tombstoned vectors from the vector file and the FAISS index.
+        
+        The kept rows are copied to a new vector file outside the lock, from the stored
+        rows' immutable map, and swapped in with a rename; rows appended meanwhile are
+        carried over. An ANN index is then rebuilt from the live vectors: HNSW graphs
+        don't support removal, and removing from an ID-mapped IVF index shifts its
+        positions out from under the id map.
+        
+        Returns:
+            Number of vectors removed
+        """
+        try:
+            self._check_writable()
+            with self._rebuild_lock:
+                with self._lock:
+                    if not self.tombstones:
+                        return 0
+                    
+                    self.vectors.flush()
+                    stored_vectors, stored_ids = self.vectors.stored()
+                    doomed = np.fromiter(self.tombstones, dtype=np.int64, count=len(self.tombstones))
+                    keep = ~np.isin(stored_ids, doomed)
+                    generation = self._clear_generation
+                
+                self.vectors.write_compacted(stored_vectors, stored_ids, keep)
+                
+                with self._lock:
+                    if generation != self._clear_generation:
+                        logger.info("Vector store was cleared during compaction; discarding it")
+                        self.vectors.discard_compacted()
+                        return 0
+                    
+                    self.vectors.flush()
+                    self.vectors.replace_with(len(stored_ids))
+                    self.tombstones.difference_update(doomed.tolist())
+                    kind = self._index_kind()
+            
+            if kind != "flat":
+                self.rebuild_index(kind)
+            else:
+                self._save_index()
+            
+            removed = int(len(keep) - keep.sum())
+            logger.info(f"Compacted vector store, removed {removed} tombstoned vectors")
+            return removed
+        except Exception as e:
+            logger.error(f"Failed to compact vector store: {e}")
+            return 0
+    
+    def _maybe_schedule_compaction(self) -> None:
+        """Start a background compaction once enough tombstones have accumulated."""
+        if self.read_only:
+            return
+        if len(self.tombstones) < self.compaction_threshold:
+            return
+        if self._compaction_thread is not None and self._compaction_thread.is_alive():
+            return
+        
+        self._compaction_thread = threading.Thread(
+            target=self.compact,
+            name="vector-store-compaction",
+            daemon=True
+        )
+        self._compaction_thread.start()
+    
     def search(self, query_embedding: List[float], k: int = 10, 
-               similarity_threshold: float = 0.7) -> List[KnowledgeSearchResult]:
+               similarity_threshold: float = 0.7,
+               categories: Optional[List[str]] = None,
+               entry_types: Optional[List[Any]] = None,
+               tags: Optional[List[str]] = None,
+               id_filter: Optional[Set[int]] = None) -> List[KnowledgeSearchResult]:
         """
         Search for similar entries in the vector store.
         
+        Metadata filters are resolved through the inverted indexes and pushed into the
+        search itself, so a filtered query returns up to k matching entries instead of
+        filtering the global top k.
+        
         Args:
             query_embedding: The query embedding vector
             k: Number of results to return
             similarity_threshold: Minimum similarity score (0-1)
+            categories: Only return entries in these categories
+            entry_types: Only return entries of these types
+            tags: Only return entries with at least one of these tags
+            id_filter: Only return entries with these faiss ids (see select_ids)
             
         Returns:
             List of search results with similarity scores
         """
         try:
-            if self.index.ntotal == 0:
+            if not self._indexed_keys:
+                return []
+            
+            candidate_ids = self.select_ids(categories, entry_types, tags)
+            if id_filter is not None:
+                candidate_ids = set(id_filter) if candidate_ids is None else candidate_ids & id_filter
+            if candidate_ids is not None and not candidate_ids:
                 return []
             
             # Normalize query embedding
             query_array = np.array([query_embedding], dtype=np.float32)
             faiss.normalize_L2(query_array)
             
-            # Search in FAISS index
-            scores, indices = self.index.search(query_array, min(k, self.index.ntotal))
+            with self._lock:
+                if candidate_ids is not None:
+                    # Candidates come from the live-id indexes, so no tombstones to over-fetch for
+                    scores, indices = self._filtered_search(query_array, candidate_ids, k)
+                else:
+                    # Over-fetch so tombstoned hits don't shrink the result set
+                    scores, indices = self._index_search(query_array, k + len(self.tombstones))
             
-            results = []
-            for score, idx in zip(scores[0], indices[0]):
-                if idx == -1:  # No more results
-                    break
-                
-                similarity_score = float(score)
-                if similarity_score >= similarity_threshold:
-                    entry = self.entry_metadata.get(idx)
-                    if entry:
-                        results.append(KnowledgeSearchResult(
-                            entry=entry,
-                            similarity_score=similarity_score
-                        ))
+                # Keep live hits above the threshold, then load just those entries
+                hits = []
+                for score, idx in zip(scores[0], indices[0]):
+                    if idx == -1:  # No more results
+                        break
+                    if float(score) >= similarity_threshold and int(idx) in self._indexed_keys:
+                        hits.append((int(idx), float(score)))
+                        if len(hits) >= k:
+                            break
+                entries = self.metadata.get_many([faiss_id for faiss_id, _ in hits])
+            
+            results = [
+                KnowledgeSearchResult(entry=entries[faiss_id], similarity_score=similarity_score)
+                for faiss_id, similarity_score in hits
+                if faiss_id in entries
+            ]
             
             logger.debug(f"Vector search returned {len(results)} results")
             return results
@@ -228,6 +965,110 @@ class VectorStore:
             logger.error(f"Failed to search vector store: {e}")
             return []
     
+    def _index_search(self, query_array: np.ndarray, fetch_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find the top fetch_k vectors, live or tombstoned, for one query (caller holds the lock).
+        
+        ANN stores search their FAISS index; flat stores scan the memory-mapped vector file.
+        
+        Returns:
+            Scores and faiss ids shaped like Index.search output
+        """
+        if self.index is not None:
+            return self.index.search(query_array, min(fetch_k, self.index.ntotal))
+        
+        scores = self.vectors.scores(query_array[0])
+        fetch_k = min(fetch_k, len(scores))
+        if fetch_k == 0:
+            return np.empty((1, 0), dtype=np.float32), np.empty((1, 0), dtype=np.int64)
+        top = np.argpartition(-scores, fetch_k - 1)[:fetch_k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return scores[top][None, :], self.vectors.ids()[top][None, :]
+    
+    def _filtered_search(self, query_array: np.ndarray, candidate_ids: Set[int],
+                         k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Search only the given faiss ids.
+        
+        Flat stores and small candidate sets are scored directly from the candidates' stored
+        vectors; larger sets on an ANN index run the index scan restricted by an IDSelector
+        over the candidates' index positions.
+        
+        Returns:
+            Scores and faiss ids shaped like Index.search output
+        """
+        ids = np.fromiter(candidate_ids, dtype=np.int64, count=len(candidate_ids))
+        k = min(k, len(ids))
+        
+        if self.index is None or len(ids) <= self.prefilter_exact_limit:
+            scores = self._source_vectors(ids) @ query_array[0]
+            order = np.argsort(-scores, kind="stable")[:k]
+            return scores[order][None, :], ids[order][None, :]
+        
+        # IndexIDMap2 does not accept search parameters, so select on the wrapped index by position
+        id_map = faiss.vector_to_array(self.index.id_map)
+        positions = np.flatnonzero(np.isin(id_map, ids)).astype(np.int64)
+        params = self._search_params(faiss.IDSelectorBatch(positions))
+        scores, found = self.index.index.search(query_array, k, params=params)
+        return scores, np.where(found >= 0, id_map[np.maximum(found, 0)], -1)
+    
+    def _search_params(self, selector: faiss.IDSelector) -> faiss.SearchParameters:
+        """Build search parameters of the right type for the index, carrying the selector."""
+        kind = self._index_kind()
+        if kind == "hnsw":
+            return faiss.SearchParametersHNSW(sel=selector, efSearch=self.hnsw_ef_search)
+        if kind == "ivfpq":
+            return faiss.SearchParametersIVF(sel=selector, nprobe=self.ivf_nprobe)
+        return faiss.SearchParameters(sel=selector)
+    
+    def evaluate_recall(self, k: int = 10, num_queries: int = 100) -> Dict[str, Any]:
+        """
+        Measure the active index's recall@k against an exact flat baseline.
+        
+        Sampled stored vectors are used as queries. The baseline is brute-force inner
+        product over the exact stored vectors; the index is queried as search() would.
+        
+        Args:
+            k: Number of neighbours compared
+            num_queries: Number of sampled queries
+            
+        Returns:
+            Recall@k and per-query latency of the index and the exact baseline
+        """
+        with self._lock:
+            ids, vectors = self._live_vectors()
+            if len(ids) == 0:
+                return {'index_type': self._index_kind(), 'k': k, 'queries': 0, 'recall_at_k': None}
+            
+            k = min(k, len(ids))
+            rng = np.random.default_rng(0)
+            queries = vectors[rng.choice(len(ids), min(num_queries, len(ids)), replace=False)]
+            
+            recalls, index_ms, exact_ms = [], [], []
+            for query in queries:
+                started = time.perf_counter()
+                scores = vectors @ query
+                exact = set(ids[np.argpartition(-scores, k - 1)[:k]].tolist())
+                exact_ms.append((time.perf_counter() - started) * 1000)
+                
+                started = time.perf_counter()
+                _, found = self._index_search(query[None, :], k + len(self.tombstones))
+                index_ms.append((time.perf_counter() - started) * 1000)
+                approx = [int(i) for i in found[0] if i != -1 and int(i) not in self.tombstones][:k]
+                
+                recalls.append(len(exact.intersection(approx)) / k)
+        
+        return {
+            'index_type': self._index_kind(),
+            'k': k,
+            'queries': len(queries),
+            'recall_at_k': float(np.mean(recalls)),
+            'index_p50_ms': float(np.percentile(index_ms, 50)),
+            'index_p99_ms': float(np.percentile(index_ms, 99)),
+            'exact_p50_ms': float(np.percentile(exact_ms, 50)),
+            'exact_p99_ms': float(np.percentile(exact_ms, 99))
+        }
+    
     def get_entry(self, entry_id: str) -> Optional[KnowledgeEntry]:
         """
         Get a specific entry by ID.
@@ -239,17 +1080,46 @@ class VectorStore:
             The knowledge entry if found, None otherwise
         """
         try:
-            if entry_id in self.id_to_faiss_id:
-                faiss_id = self.id_to_faiss_id[entry_id]
-                return self.entry_metadata.get(faiss_id)
-            return None
+            return self.metadata.get(entry_id)
         except Exception as e:
             logger.error(f"Failed to get entry from vector store: {e}")
             return None
     
+    def get_entries(self, faiss_ids: List[int]) -> Dict[int, KnowledgeEntry]:
+        """
+        Load entries by faiss id.
+        
+        Args:
+            faiss_ids: Faiss ids, e.g. from get_live_vectors
+            
+        Returns:
+            Entries keyed by faiss id
+        """
+        try:
+            return self.metadata.get_many(faiss_ids)
+        except Exception as e:
+            logger.error(f"Failed to get entries from vector store: {e}")
+            return {}
+    
+    def get_entry_ids(self, faiss_ids: List[int]) -> Dict[int, str]:
+        """
+        Map faiss ids to entry ids without loading the entries.
+        
+        Args:
+            faiss_ids: Faiss ids, e.g. from get_live_vectors
+            
+        Returns:
+            Entry ids keyed by faiss id
+        """
+        try:
+            return self.metadata.get_entry_ids(faiss_ids)
+        except Exception as e:
+            logger.error(f"Failed to get entry ids from vector store: {e}")
+            return {}
+    
     def get_embedding(self, entry_id: str) -> Optional[List[float]]:
         """
-        Get the embedding for a specific entry.
+        Get the (normalized) embedding for a specific entry from the vector file.
         
         Args:
             entry_id: ID of the entry to get embedding for
@@ -258,14 +1128,25 @@ class VectorStore:
             The embedding vector if found, None otherwise
         """
         try:
-            entry = self.get_entry(entry_id)
-            if entry and hasattr(entry, 'embedding') and entry.embedding:
-                return entry.embedding
-            return None
+            with self._lock:
+                faiss_id = self.metadata.get_faiss_id(entry_id)
+                if faiss_id is None:
+                    return None
+                return self._source_vectors(np.array([faiss_id], dtype=np.int64))[0].tolist()
         except Exception as e:
             logger.error(f"Failed to get embedding from vector store: {e}")
             return None
     
+    def get_live_vectors(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Snapshot the live faiss ids and their normalized vectors.
+        
+        Returns:
+            Sorted faiss ids and a float32 matrix with one row per id
+        """
+        with self._lock:
+            return self._live_vectors()
+    
     def get_all_embeddings(self) -> Dict[str, List[float]]:
         """
         Get all embeddings in the vector store.
@@ -275,24 +1156,54 @@ class VectorStore:
         """
         try:
             embeddings = {}
-            for entry_id, faiss_id in self.id_to_faiss_id.items():
-                entry = self.entry_metadata.get(faiss_id)
-                if entry and hasattr(entry, 'embedding') and entry.embedding:
-                    embeddings[entry_id] = entry.embedding
+            faiss_ids, entries = [], []
+            for faiss_id, entry in self.metadata.iter_entries():
+                faiss_ids.append(faiss_id)
+                entries.append(entry)
+            
+            with self._lock:
+                vectors = self._source_vectors(np.array(faiss_ids, dtype=np.int64))
+            for entry, vector in zip(entries, vectors):
+                embeddings[entry.entry_id] = vector.tolist()
             return embeddings
         except Exception as e:
             logger.error(f"Failed to get all embeddings from vector store: {e}")
             return {}
     
-    def get_all_entries(self) -> List[KnowledgeEntry]:
+    def iter_entries(self, category: Optional[str] = None, entry_type: Optional[Any] = None,
+                     batch_size: int = 256) -> Iterator[KnowledgeEntry]:
+        """
+        Stream entries from the metadata store, optionally filtered, one batch at a time.
+        
+        Args:
+            category: Only yield entries in this category
+            entry_type: Only yield entries of this type
+            batch_size: Number of entries decoded per batch
+            
+        Yields:
+            Knowledge entries in insertion order
+        """
+        if entry_type is not None:
+            entry_type = self._filter_key(entry_type)
+        for _, entry in self.metadata.iter_entries(category, entry_type, batch_size):
+            yield entry
+    
+    def get_all_entries(self, category: Optional[str] = None,
+                        entry_type: Optional[Any] = None) -> List[KnowledgeEntry]:
         """
         Get all entries in the vector store.
         
+        Prefer iter_entries for large stores; this materializes the whole result.
+        
+        Args:
+            category: Only return entries in this category
+            entry_type: Only return entries of this type
+            
         Returns:
             List of all knowledge entries
         """
         try:
-            return list(self.entry_metadata.values())
+            return list(self.iter_entries(category, entry_type))
         except Exception as e:
             logger.error(f"Failed to get all entries from vector store: {e}")
             return []
@@ -301,15 +1212,27 @@ class VectorStore:
         """
         Get statistics about the vector store.
         
+        Counts come from aggregate queries over the metadata store's columns,
+        so no entries are loaded.
+        
         Returns:
             Dictionary with statistics
         """
         try:
+            last_updated = self.metadata.last_updated()
             return {
-                'total_entries': self.index.ntotal,
+                'total_entries': self._live_count(),
+                'entries_by_type': self.metadata.count_by('entry_type'),
+                'entries_by_category': self.metadata.count_by('category'),
+                'tombstoned_vectors': len(self.tombstones),
+                'stored_vectors': self.vectors.count,
+                'index_type': self._index_kind(),
+                'configured_index_type': self.index_type,
                 'dimension': self.dimension,
                 'index_size_mb': os.path.getsize(self.index_path) / (1024 * 1024) if os.path.exists(self.index_path) else 0,
-                'last_updated': datetime.utcnow().isoformat()
+                'vectors_size_mb': self.vectors.size_bytes() / (1024 * 1024),
+                'metadata_size_mb': self.metadata.size_bytes() / (1024 * 1024),
+                'last_updated': (last_updated or datetime.utcnow()).isoformat()
             }
         except Exception as e:
             logger.error(f"Failed to get vector store stats: {e}")
@@ -318,10 +1241,10 @@ class VectorStore:
     def clear(self) -> None:
         """Clear all entries from the vector store."""
         try:
-            self.index = faiss.IndexFlatIP(self.dimension)
-            self.entry_metadata = {}
-            self.id_to_faiss_id = {}
-            self.next_faiss_id = 0
+            self._check_writable()
+            with self._lock:
+                self._apply_clear()
+                self._journal('clear')
             self._save_index()
             logger.info("Cleared vector store")
         except Exception as e:
@@ -334,10 +1257,28 @@ _vector_store: Optional[VectorStore] = None
 
 
 def get_vector_store() -> VectorStore:
-    """Get the global vector store instance."""
+    """
+    Get the global vector store instance.
+    
+    Set VECTOR_STORE_READ_ONLY=true in processes that only search a store another
+    process owns (e.g. langgraph dev workers beside the API server).
+    """
     global _vector_store
     
     if _vector_store is None:
-        _vector_store = VectorStore()
+        _vector_store = VectorStore(
+            write_behind=True,
+            index_type=os.getenv("VECTOR_INDEX_TYPE", "flat"),
+            read_only=os.getenv("VECTOR_STORE_READ_ONLY", "false").lower() in ("1", "true", "yes")
+        )
+    
+    return _vector_store
+
+
+def shutdown_vector_store() -> None:
+    """Flush and close the global vector store instance."""
+    global _vector_store
     
-    return _vector_store
\ No newline at end of file
+    if _vector_store is not None:
+        _vector_store.close()
+        _vector_store = None
\ No newline at end of file
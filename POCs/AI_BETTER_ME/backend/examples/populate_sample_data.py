@@ -50,17 +50,8 @@ async def populate_sample_data():
             "tags": ["reflection", "mood"]
         }
     ]
-    # Example: create entries in the knowledge base
-    for entry in sample_entries:
-        await kb_service.create_entry(
-            entry_type=entry["entry_type"],
-            entry_sub_type=entry["entry_sub_type"],
-            category=entry["category"],
-            title=entry["title"],
-            content=entry["content"],
-            metadata=entry["metadata"],
-            tags=entry["tags"]
-        )
+    # Example: create entries in the knowledge base in one batch
+    await kb_service.create_entries_bulk(sample_entries)
     sample_entries = [
         {
             "type": KnowledgeEntryType.PREFERENCE,
@@ -145,6 +136,7 @@ async def populate_sample_data():
     ]
     
     created_count = 0
+    pending_entries = []
     # Fetch all existing entries once
     existing_entries = await kb_service.get_all_entries()
     for entry_data in sample_entries:
@@ -168,19 +160,23 @@ async def populate_sample_data():
         except Exception as enum_err:
             print(f"❌ Enum conversion error for '{entry_data['title']}': {enum_err}")
             continue
-        try:
-            entry = await kb_service.create_entry(
-                entry_type=entry_type,
-                category=entry_data["category"],
-                entry_sub_type=entry_sub_type,
-                title=entry_data["title"],
-                content=entry_data["content"],
-                tags=entry_data["tags"]
-            )
+        pending_entries.append({
+            "entry_type": entry_type,
+            "category": entry_data["category"],
+            "entry_sub_type": entry_sub_type,
+            "title": entry_data["title"],
+            "content": entry_data["content"],
+            "tags": entry_data["tags"]
+        })
+    
+    # Embed and index all new entries in one batch
+    results = await kb_service.create_entries_bulk(pending_entries)
+    for entry_fields, result in zip(pending_entries, results):
+        if result["success"]:
             created_count += 1
-            print(f"✅ Created: {entry.title}")
-        except Exception as e:
-            print(f"❌ Failed to create '{entry_data['title']}': {e}")
+            print(f"✅ Created: {entry_fields['title']}")
+        else:
+            print(f"❌ Failed to create '{entry_fields['title']}': {result['error']}")
     
     print(f"\n📊 Successfully created {created_count} knowledge base entries")
     
@@ -3,18 +3,22 @@
 
 import os
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import Optional, Any
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ValidationError
+from typing import Optional, Any, AsyncIterator
 import asyncio
 from app.langgraph.workflow import AgentGraphWorkflow
 import json
 from datetime import datetime
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, aclosing
 from app.agents.registry import get_agent_registry
 from app.llm import get_llm_service, reset_llm_service, ChatMessage, CompletionRequest
 from app.api.knowledge import router as knowledge_router
+from app.services.vector_store import shutdown_vector_store
+from app.llm.embedding_cache import shutdown_embedding_cache
+from app.services.post_processing import get_post_processing_pipeline, shutdown_post_processing_pipeline
 from app.agents.factory import initialize_agents
 from app.agents.base import AgentType
 import logging
@@ -40,7 +44,13 @@ async def lifespan(app: FastAPI):
         logger.warning(f"Could not initialize workflow with agents: {e}")
     
     yield
-    # (Optional) Add shutdown/cleanup logic here
+    
+    # Finish queued recording and extraction jobs while the stores are still open
+    await shutdown_post_processing_pipeline()
+    
+    # Checkpoint any write-behind vector store mutations before exiting
+    shutdown_vector_store()
+    shutdown_embedding_cache()
 
 app = FastAPI(
     title="AI Agent Ecosystem API",
@@ -90,28 +100,33 @@ async def api_health_check():
         "timestamp": datetime.now().isoformat()
     }
 
+def _build_chat_state(request: ChatRequest) -> Optional[dict]:
+    """Build the initial workflow state for a chat request, or None if no orchestrator is registered."""
+    registry = get_agent_registry()
+    # Find orchestrator agent by type
+    logger.info(f"{registry.get_agent_ids()}")
+    orchestrators = registry.get_agents_by_type(AgentType.ORCHESTRATOR)
+    if not orchestrators:
+        logging.error("Orchestrator agent not found in registry. Agent ecosystem may not be initialized.")
+        return None
+    return {
+        "user_input": request.message,
+        "context": {},
+        "conversation_id": request.conversation_id,
+        "agent": orchestrators[0].agent_id
+    }
+
 @app.post("/api/chat", response_model=ChatResponse)
 async def chat_endpoint(request: ChatRequest):
     try:
-        registry = get_agent_registry()
-        # Find orchestrator agent by type
-        logger.info(f"{registry.get_agent_ids()}")
-        orchestrators = registry.get_agents_by_type(AgentType.ORCHESTRATOR)
-        orchestrator = orchestrators[0] if orchestrators else None
-        if orchestrator is None:
-            logging.error("Orchestrator agent not found in registry. Agent ecosystem may not be initialized.")
+        state = _build_chat_state(request)
+        if state is None:
             return ChatResponse(
                 response="I'm the orchestrator agent. I encountered an issue: Orchestrator agent not found.",
                 agent="orchestrator",
                 reasoning="Error: Orchestrator agent not found in registry.",
                 timestamp=datetime.now()
             )
-        state = {
-            "user_input": request.message,
-            "context": {},
-            "conversation_id": request.conversation_id,
-            "agent": orchestrator.agent_id
-        }
         # Use LangGraph workflow for multi-agent orchestration
         graph_workflow = await get_workflow()
         result = await graph_workflow.run(state)
@@ -155,7 +170,7 @@ async def chat_endpoint(request: ChatRequest):
         logger.info(f"[DEBUG] Final reasoning type: {type(reasoning)} value: {reasoning}")
         return ChatResponse(
             response=response,
-            agent=state.get("agent", orchestrator.agent_id),
+            agent=state["agent"],
             reasoning=reasoning,
             timestamp=datetime.now()
         )
@@ -168,11 +183,67 @@ async def chat_endpoint(request: ChatRequest):
             timestamp=datetime.now()
         )
 
+async def _chat_events(request: ChatRequest) -> AsyncIterator[dict]:
+    """Run a chat request through the workflow, yielding its progress events (see AgentGraphWorkflow.stream)."""
+    state = _build_chat_state(request)
+    if state is None:
+        yield {"event": "error", "detail": "Orchestrator agent not found in registry."}
+        return
+    try:
+        graph_workflow = await get_workflow()
+        async with aclosing(graph_workflow.stream(state)) as events:
+            async for event in events:
+                if event["event"] == "final":
+                    event = {**event, "agent": state["agent"], "timestamp": datetime.now().isoformat()}
+                yield event
+    except Exception as e:
+        logging.error(f"Streaming chat failed: {e}")
+        yield {"event": "error", "detail": str(e)}
+
+@app.post("/api/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest):
+    """
+    Stream a chat response as server-sent events.
+    
+    Emits node, routing, context, token and reset events while the workflow runs (a reset
+    discards the draft tokens before the formatted answer is sent) and ends with
+    a final event (the same response and reasoning /api/chat returns) or an error event.
+    A client disconnect cancels the run, including any in-flight LLM stream.
+    """
+    async def event_stream():
+        async with aclosing(_chat_events(request)) as events:
+            async for event in events:
+                yield f"event: {event['event']}\ndata: {json.dumps(event, default=str)}\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.websocket("/api/chat/ws")
+async def chat_websocket(websocket: WebSocket):
+    """Chat over a WebSocket: each JSON ChatRequest is answered with the /api/chat/stream events as JSON messages."""
+    await websocket.accept()
+    try:
+        while True:
+            try:
+                request = ChatRequest(**await websocket.receive_json())
+            except (ValidationError, ValueError, TypeError) as e:
+                await websocket.send_json({"event": "error", "detail": f"Invalid chat request: {e}"})
+                continue
+            async with aclosing(_chat_events(request)) as events:
+                async for event in events:
+                    await websocket.send_text(json.dumps(event, default=str))
+    except WebSocketDisconnect:
+        logger.debug("Chat WebSocket disconnected")
+
 @app.get("/api/agents/status")
 async def get_agents_status():
     try:
         llm_service = await get_llm_service()
         health_status = await llm_service.health_check()
+        circuit_status = llm_service.get_circuit_status()
         current_provider = llm_service.get_current_provider()
         
         # Convert health status to the expected format
@@ -183,12 +254,18 @@ async def get_agents_status():
                 "is_healthy": health.is_healthy,
                 "model": health.model,
                 "response_time_ms": health.response_time_ms,
-                "error": health.error
+                "error": health.error,
+                "circuit": circuit_status.get(provider_type, {}).get("state", "closed")
             }
         
         return {
             "current_provider": str(current_provider).lower().replace('llmprovidertype.', ''),
             "health_status": formatted_health,
+            "routing": llm_service.get_routing_stats(),
+            "concurrency": llm_service.get_concurrency_stats(),
+            "response_cache": llm_service.get_response_cache_stats(),
+            "formatting": _workflow.get_formatting_stats() if _workflow else None,
+            "post_processing": get_post_processing_pipeline().get_stats(),
             "agents": {
                 "orchestrator": {"status": "active", "description": "Main coordination agent"},
                 "productivity": {"status": "active", "description": "Task and goal management"},
@@ -276,8 +353,14 @@ async def switch_provider(request: ProviderSwitchRequest):
                 new_service.factory._current_provider = provider
             
             # Update the global service reference
-            if llm_service_module._llm_service is not None:
-                await llm_service_module._llm_service.shutdown()
+            previous_service = llm_service_module._llm_service
+            if previous_service is not None:
+                # Drop cached vectors from the previous embedding model if it changed
+                previous_namespace = previous_service.get_embedding_namespace()
+                if (previous_service.embedding_cache and previous_namespace and
+                        previous_namespace != new_service.get_embedding_namespace()):
+                    previous_service.embedding_cache.invalidate(previous_namespace)
+                await previous_service.shutdown()
             llm_service_module._llm_service = new_service
             
             return {
@@ -338,6 +421,10 @@ async def get_llm_status():
                 except Exception as e:
                     logger.error(f"Error checking provider health: {e}")
         
+        # Embedding cache hit-rate metrics
+        if current_service:
+            status["embedding_cache"] = current_service.get_embedding_cache_stats()
+        
         # Always check Ollama availability
         try:
             import requests
@@ -409,11 +496,9 @@ async def get_workflow():
     return _workflow
 
 async def get_graph():
-    """Get the compiled graph for langgraph dev."""
-    global _graph
-    if _graph is None:
-        await get_workflow()
-    return _graph
+    """Get the compiled graph for langgraph dev (the workflow recompiles it when agents change)."""
+    workflow = await get_workflow()
+    return workflow.get_compiled_graph()
 
 # Global cache for LangGraph dev
 _dev_graph_cache = None
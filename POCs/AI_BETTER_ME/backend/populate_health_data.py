@@ -49,14 +49,21 @@ async def populate_health_data():
         ("I don't like very spicy food", "I'll keep seasonings mild and suggest alternatives to spicy ingredients.")
     ]
     
-    for user_input, agent_response in health_interactions:
-        await kb_service.add_interaction_history(
+    # Embed and index all interactions in one batch
+    results = await kb_service.create_entries_bulk([
+        kb_service.interaction_entry_fields(
             agent_type="health",
             user_input=user_input,
             agent_response=agent_response,
             context={"domain": "health", "populated": True}
         )
-        print(f"   ✅ Added interaction about: {user_input[:50]}...")
+        for user_input, agent_response in health_interactions
+    ])
+    for (user_input, _), result in zip(health_interactions, results):
+        if result["success"]:
+            print(f"   ✅ Added interaction about: {user_input[:50]}...")
+        else:
+            print(f"   ❌ Failed to add interaction about: {user_input[:50]}... ({result['error']})")
     
     print(f"\n🎉 Successfully populated knowledge base with:")
     print(f"   • {len(health_preferences)} health preferences")
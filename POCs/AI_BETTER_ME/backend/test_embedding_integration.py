@@ -62,7 +62,7 @@ async def test_embedding_integration():
         print("\n3. Testing vector store compatibility...")
         vector_store = get_vector_store()
         print(f"   ✅ Vector store dimension: {vector_store.dimension}")
-        print(f"   ✅ Total entries in vector store: {len(vector_store.entry_metadata)}")
+        print(f"   ✅ Total entries in vector store: {vector_store.get_stats()['total_entries']}")
         
         print("\n🎉 All embedding integration tests passed!")
         print("\n📋 Summary:")
@@ -2,11 +2,16 @@
 Unit tests for the agent framework components.
 """
 
+import re
+import json
+import time
 import pytest
 import asyncio
 from datetime import datetime, timedelta
 from unittest.mock import Mock, AsyncMock, patch
 
+from langchain_core.runnables import RunnableLambda
+
 from app.agents.base import (
     BaseAgent, AgentType, AgentStatus, AgentCapability, 
     AgentTask, AgentMessage, TaskPriority, TaskStatus
@@ -14,8 +19,12 @@ from app.agents.base import (
 from app.agents.registry import AgentRegistry
 from app.agents.communication import CommunicationProtocol, MessageType, MessagePriority
 from app.agents.orchestrator import OrchestratorAgent
+from app.agents.intent_router import EmbeddingIntentRouter
 from app.agents.factory import AgentFactory
 from app.agents.prompts import PromptLibrary
+from app.services.events import emit_event, stream_completion, suppress_answer_tokens, ROUTING_EVENT, STREAM_ANSWER_TOKENS
+from app.llm.base import CompletionRequest, ChatMessage
+from app.langgraph.workflow import AgentGraphWorkflow
 
 
 class MockAgent(BaseAgent):
@@ -369,6 +378,92 @@ class TestCommunicationProtocol:
         assert "pending_responses" in stats
         assert "conversation_threads" in stats
         assert "registered_handlers" in stats
+    
+    @pytest.mark.asyncio
+    async def test_messages_are_handled_by_priority(self, agent_registry):
+        """Test urgent messages overtake queued ones, keeping send order within a priority."""
+        agent_registry.register_agent(MockAgent(agent_id="agent2", agent_type=AgentType.GENERAL, capabilities=[], system_prompt=""))
+        protocol = CommunicationProtocol(workers=1)
+        protocol.registry = agent_registry
+        handled = []
+        
+        async def record(message):
+            handled.append(message.content)
+        
+        protocol.register_handler("agent2", MessageType.NOTIFICATION, record)
+        for content, priority in [("low", MessagePriority.LOW), ("normal 1", MessagePriority.NORMAL),
+                                  ("urgent", MessagePriority.URGENT), ("normal 2", MessagePriority.NORMAL),
+                                  ("high", MessagePriority.HIGH)]:
+            await protocol.send_message("agent1", "agent2", MessageType.NOTIFICATION, content, priority=priority)
+        
+        await protocol.start()
+        try:
+            assert await protocol.join(timeout=1)
+        finally:
+            await protocol.stop()
+        
+        assert handled == ["urgent", "high", "normal 1", "normal 2", "low"]
+    
+    @pytest.mark.asyncio
+    async def test_unanswered_request_resolves_without_timeout(self, communication_protocol):
+        """Test a request nobody can answer returns None right away instead of waiting out its timeout."""
+        await communication_protocol.start()
+        try:
+            started = time.perf_counter()
+            response = await communication_protocol.send_message(
+                "agent1", "missing_agent", MessageType.REQUEST, "Anyone?", requires_response=True, timeout_seconds=5
+            )
+            elapsed = time.perf_counter() - started
+        finally:
+            await communication_protocol.stop()
+        
+        assert response is None
+        assert elapsed < 0.5
+        assert communication_protocol.get_protocol_stats()["pending_responses"] == 0
+    
+    @pytest.mark.asyncio
+    async def test_request_response_benchmark(self, agent_registry):
+        """Benchmark agent-to-agent request/response round trips, sequential and concurrent."""
+        agent_registry.register_agent(MockAgent(agent_id="agent2", agent_type=AgentType.GENERAL, capabilities=[], system_prompt=""))
+        protocol = CommunicationProtocol(workers=4)
+        protocol.registry = agent_registry
+        running = {"now": 0, "peak": 0}
+        
+        async def echo(message):
+            running["now"] += 1
+            running["peak"] = max(running["peak"], running["now"])
+            try:
+                await asyncio.sleep(0.001)  # Stand-in for a handler doing real work
+            finally:
+                running["now"] -= 1
+            return AgentMessage(from_agent=message.to_agent, to_agent=message.from_agent,
+                                message_type="response", content=message.content)
+        
+        async def round_trip(i):
+            started = time.perf_counter()
+            response = await protocol.send_message("agent1", "agent2", MessageType.REQUEST, str(i),
+                                                   requires_response=True, timeout_seconds=5)
+            assert response.content == str(i)
+            return time.perf_counter() - started
+        
+        protocol.register_handler("agent2", MessageType.REQUEST, echo)
+        await protocol.start()
+        try:
+            latencies = sorted([await round_trip(i) for i in range(50)])
+            
+            started = time.perf_counter()
+            await asyncio.gather(*(round_trip(i) for i in range(400)))
+            throughput = 400 / (time.perf_counter() - started)
+        finally:
+            await protocol.stop()
+        
+        median, p95 = latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.95)]
+        print(f"\nAgent messaging: median round trip {median * 1000:.1f} ms, p95 {p95 * 1000:.1f} ms, "
+              f"{throughput:,.0f} requests/s with {protocol.workers} workers")
+        # Polling the queue and the responses every 100 ms put each round trip at 100-200 ms
+        assert median < 0.05
+        # The workers overlap the handlers, never running more of them at once than there are workers
+        assert running["peak"] == protocol.workers
 
 
 class TestOrchestratorAgent:
@@ -410,6 +505,293 @@ class TestOrchestratorAgent:
             # Test no match
             result = orchestrator._pattern_based_classification("Hello there")
             assert result["agent_type"] == AgentType.GENERAL
+    
+    # Realistic routing inputs, including the intent classification script's cases
+    INTENT_CORPUS = [
+        "Help with Meal Planning for Next Week 🍴",
+        "I need to organize my tasks for the project deadline",
+        "Track my monthly expenses and create a budget",
+        "Schedule a meeting with my team for next Tuesday",
+        "I want to reflect on my progress this week",
+        "What's the weather like today?",
+        "Can you help me plan work for the sprint and schedule task reviews?",
+        "I keep skipping my morning workout and my sleep routine is a mess",
+        "How much of my salary should go into retirement savings versus paying off credit card debt?",
+        "When am I free on Thursday to book a dentist appointment?",
+        "Write a gratitude journal entry about this week's breakthrough at work",
+        "I'm stressed about money and can't focus on my deliverables",
+        "Give me a high protein grocery list under my food budget",
+        "Remind me about the daily reflection and weekly reflection events",
+        "I want a self-care routine with yoga and meditation for mental health",
+        "Look back at my personal growth milestones this year and celebrate the achievement",
+        "I can't ſleep well",
+    ]
+    
+    @staticmethod
+    def _scan_per_pattern(intent_patterns, text):
+        """Reference scoring: compile every pattern and run one findall per pattern."""
+        scores = {}
+        for agent_type, patterns in intent_patterns.items():
+            score = sum(len(re.compile(pattern, flags=re.IGNORECASE).findall(text)) for pattern in patterns)
+            if score:
+                scores[agent_type] = score
+        return scores
+    
+    def test_pattern_matcher_counts_like_per_pattern_scan(self):
+        """Test the single-pass matcher scores every agent like one findall per pattern."""
+        with patch('app.agents.orchestrator.get_llm_service'):
+            orchestrator = OrchestratorAgent()
+        
+        for text in self.INTENT_CORPUS:
+            hits = orchestrator._intent_matcher.match(text)
+            assert {agent: result["score"] for agent, result in hits.items()} == \
+                self._scan_per_pattern(orchestrator.intent_patterns, text), text
+        
+        result = orchestrator._pattern_based_classification("Help with Meal Planning for Next Week")
+        assert result["agent_type"] == AgentType.HEALTH
+        assert "Meal Planning" in result["reason"]
+    
+    def test_detect_required_agents_for_cross_domain_requests(self, agent_registry):
+        """Test only requests with independent evidence for several domains fan out."""
+        for agent_type in [AgentType.HEALTH, AgentType.FINANCE, AgentType.SCHEDULING, AgentType.PRODUCTIVITY]:
+            agent_registry.register_agent(DelayedAgent(
+                agent_id=f"{agent_type.value}_agent", agent_type=agent_type, capabilities=[], system_prompt=""
+            ))
+        with patch('app.agents.orchestrator.get_llm_service'), \
+             patch('app.agents.orchestrator.get_agent_registry', return_value=agent_registry):
+            orchestrator = OrchestratorAgent()
+        
+        assert orchestrator._detect_required_agents("Plan my meals within my grocery budget around my schedule") == [
+            AgentType.SCHEDULING, AgentType.HEALTH, AgentType.FINANCE
+        ]
+        assert orchestrator._detect_required_agents("Schedule a meeting with my team for next Tuesday") == []
+        assert orchestrator._detect_required_agents("Track my monthly expenses and create a budget") == []
+    
+    @pytest.mark.asyncio
+    async def test_handle_complex_request_fans_out_in_parallel(self, agent_registry):
+        """Test specialists run concurrently within the timeout and one synthesis call merges their answers."""
+        delays = {AgentType.HEALTH: 0.2, AgentType.FINANCE: 0.2, AgentType.SCHEDULING: 5.0}
+        for agent_type, delay in delays.items():
+            agent = DelayedAgent(agent_id=f"{agent_type.value}_agent", agent_type=agent_type, capabilities=[], system_prompt="")
+            agent.delay = delay
+            agent_registry.register_agent(agent)
+        
+        llm_service = Mock()
+        llm_service.chat_completion = AsyncMock(return_value=Mock(content="Merged plan"))
+        with patch('app.agents.orchestrator.get_llm_service', AsyncMock(return_value=llm_service)), \
+             patch('app.agents.orchestrator.get_agent_registry', return_value=agent_registry):
+            orchestrator = OrchestratorAgent()
+            orchestrator.fan_out_timeout = 0.5
+            
+            started = time.perf_counter()
+            response, partials = await orchestrator._fan_out("Plan my meals", {}, list(delays))
+            elapsed = time.perf_counter() - started
+        
+        assert response == "Merged plan"
+        # Slowest answering agent plus the timed-out one's budget, not the sum of the delays
+        assert elapsed < 1.0
+        assert [partial["agent_type"] for partial in partials] == ["health", "finance", "scheduling"]
+        assert partials[2]["response"] is None and "Timed out" in partials[2]["error"]
+        
+        prompt = llm_service.chat_completion.call_args[0][0].messages[1].content
+        assert "health answer" in prompt and "finance answer" in prompt
+        assert "scheduling answer" not in prompt
+    
+    @pytest.mark.asyncio
+    async def test_context_prefetch_overlaps_classification(self, agent_registry):
+        """Test retrieval starts with the message, runs during classification and reaches the routed agent."""
+        agent = PrefetchRecordingAgent(agent_id="health_agent", agent_type=AgentType.HEALTH, capabilities=[], system_prompt="")
+        agent_registry.register_agent(agent)
+        
+        steps = []
+        classifying = asyncio.Event()
+        
+        async def prefetch_context(user_input):
+            steps.append("prefetch_started")
+            # Only completes once classification is under way, so a serial run would time out here
+            await asyncio.wait_for(classifying.wait(), 5)
+            steps.append("prefetch_finished")
+            return {"query_text": user_input, "query_embedding": [0.1], "preferences": {}}
+        
+        async def llm_classification(user_input, context):
+            steps.append("classification_started")
+            classifying.set()
+            await asyncio.sleep(0)
+            steps.append("classification_finished")
+            return {"agent_type": AgentType.HEALTH, "confidence": 0.9, "reason": "health", "method": "llm_based"}
+        
+        knowledge_base = Mock()
+        knowledge_base.get_user_preferences = AsyncMock(return_value={})
+        knowledge_base.prefetch_context = prefetch_context
+        with patch('app.agents.orchestrator.get_llm_service'), \
+             patch('app.agents.orchestrator.get_agent_registry', return_value=agent_registry), \
+             patch('app.agents.orchestrator.get_knowledge_base_service', return_value=knowledge_base):
+            orchestrator = OrchestratorAgent()
+            orchestrator._llm_based_classification = llm_classification
+            result = await orchestrator.execute({"user_input": "I want a healthy lunch", "context": {}})
+        
+        assert result["reasoning"]["finalAgent"] == "health"
+        assert agent.prefetched == {"query_text": "I want a healthy lunch", "query_embedding": [0.1], "preferences": {}}
+        # Retrieval starts before classification finishes instead of waiting for it (or vice versa)
+        assert steps.index("prefetch_started") < steps.index("classification_finished")
+        assert steps.index("classification_started") < steps.index("prefetch_finished")
+        # Preferences arrive with the prefetched context rather than a separate serial lookup
+        knowledge_base.get_user_preferences.assert_not_awaited()
+    
+    def test_pattern_classification_benchmark(self):
+        """Benchmark classifications per second against compiling and scanning every pattern per call."""
+        with patch('app.agents.orchestrator.get_llm_service'):
+            orchestrator = OrchestratorAgent()
+        rounds = 200
+        
+        started = time.perf_counter()
+        for _ in range(rounds):
+            for text in self.INTENT_CORPUS:
+                self._scan_per_pattern(orchestrator.intent_patterns, text)
+        per_pattern_rate = rounds * len(self.INTENT_CORPUS) / (time.perf_counter() - started)
+        
+        started = time.perf_counter()
+        for _ in range(rounds):
+            for text in self.INTENT_CORPUS:
+                orchestrator._pattern_based_classification(text)
+        single_pass_rate = rounds * len(self.INTENT_CORPUS) / (time.perf_counter() - started)
+        
+        print(f"\nIntent patterns: {per_pattern_rate:,.0f} classifications/s per pattern, "
+              f"{single_pass_rate:,.0f} classifications/s single pass")
+        assert single_pass_rate > per_pattern_rate
+    
+    @pytest.mark.asyncio
+    async def test_confident_embedding_router_skips_llm_classification(self):
+        """Test the router answers confident cases itself and learns from the LLM on uncertain ones."""
+        llm_service = Mock()
+        llm_service.get_embedding_namespace.return_value = "openai:ada:3"
+        with patch('app.agents.orchestrator.get_llm_service', AsyncMock(return_value=llm_service)):
+            orchestrator = OrchestratorAgent()
+            orchestrator._intent_router = EmbeddingIntentRouter()
+            orchestrator._intent_router.add_example("health", [1.0, 0.0, 0.0])
+            orchestrator._intent_router.add_example("finance", [0.0, 1.0, 0.0])
+            orchestrator._intent_router.namespace = "openai:ada:3"
+            orchestrator._llm_based_classification = AsyncMock(return_value={
+                "agent_type": AgentType.FINANCE, "confidence": 0.9, "reason": "money", "method": "llm_based"
+            })
+            
+            async def prefetched(embedding):
+                return {"query_text": "Something vague", "query_embedding": embedding, "preferences": {}}
+            
+            result = await orchestrator._classify_intent("Something vague", {}, asyncio.ensure_future(prefetched([0.9, 0.1, 0.0])))
+            assert result["method"] == "embedding_router"
+            assert result["agent_type"] == AgentType.HEALTH
+            assert result["confidence"] > 0.8
+            orchestrator._llm_based_classification.assert_not_called()
+            
+            # Halfway between the centroids: the LLM decides and the router learns its answer
+            result = await orchestrator._classify_intent("Something vague", {}, asyncio.ensure_future(prefetched([0.7, 0.7, 0.1])))
+            assert result["method"] == "llm_based"
+            await asyncio.gather(*orchestrator._learning_tasks)
+            assert orchestrator._intent_router.get_stats()["labels"]["finance"] == 2
+    
+    @pytest.mark.asyncio
+    async def test_embedding_model_switch_reseeds_router(self):
+        """Test centroids of another embedding model are never used and get rebuilt for the new one."""
+        llm_service = Mock()
+        llm_service.get_embedding_namespace.return_value = "ollama:llama3:3"
+        llm_service.generate_embeddings = AsyncMock(side_effect=TestEmbeddingIntentRouter.embed)
+        with patch('app.agents.orchestrator.get_llm_service', AsyncMock(return_value=llm_service)), \
+             patch('app.agents.orchestrator.SEED_EXAMPLES', [("health", "Plan a meal"), ("finance", "Make a budget")]):
+            orchestrator = OrchestratorAgent()
+            orchestrator._intent_router = EmbeddingIntentRouter()
+            orchestrator._intent_router.add_example("health", [0.0, 1.0, 0.0])
+            orchestrator._intent_router.add_example("finance", [1.0, 0.0, 0.0])
+            orchestrator._intent_router.namespace = "openai:ada:3"
+            orchestrator._llm_based_classification = AsyncMock(return_value={
+                "agent_type": AgentType.GENERAL, "confidence": 0.5, "reason": "unsure", "method": "llm_based"
+            })
+            
+            async def prefetched():
+                return {"query_text": "Something vague", "query_embedding": [1.0, 0.0, 0.0], "preferences": {}}
+            
+            result = await orchestrator._classify_intent("Something vague", {}, asyncio.ensure_future(prefetched()))
+            assert result["method"] == "llm_based"
+            await orchestrator._router_seeding
+            
+            assert orchestrator._intent_router.namespace == "ollama:llama3:3"
+            result = await orchestrator._classify_intent("Something vague", {}, asyncio.ensure_future(prefetched()))
+            assert result["method"] == "embedding_router"
+            assert result["agent_type"] == AgentType.HEALTH
+
+
+class TestEmbeddingIntentRouter:
+    """Test the nearest-centroid intent router."""
+    
+    @staticmethod
+    async def embed(texts):
+        """Toy embedding: one axis per topic word."""
+        axes = ["meal", "budget", "meeting"]
+        return [[float(word in text.lower()) for word in axes] for text in texts]
+    
+    @pytest.mark.asyncio
+    async def test_seed_and_route(self):
+        """Test seeding builds one centroid per label and routing reports the margin."""
+        router = EmbeddingIntentRouter(min_margin=0.2)
+        assert not router.ready
+        await router.seed([
+            ("health", "Plan a meal"), ("health", "Healthy meal ideas"),
+            ("finance", "Make a budget"), ("scheduling", "Book a meeting"),
+            ("general", "Hello there")  # Zero vector, rejected
+        ], self.embed)
+        
+        assert router.ready
+        assert router.get_stats()["labels"] == {"health": 2, "finance": 1, "scheduling": 1}
+        
+        routed = router.route([1.0, 0.1, 0.0])
+        assert routed["label"] == "health" and routed["confident"]
+        
+        routed = router.route([1.0, 1.0, 0.0])
+        assert routed["margin"] < 0.2 and not routed["confident"]
+        assert router.route([0.0, 0.0, 0.0]) is None
+        assert router.route([1.0, 0.0]) is None
+    
+    @pytest.mark.asyncio
+    async def test_learned_examples_are_logged_and_replayed(self, tmp_path):
+        """Test learned examples move the centroid online and survive a re-seed from the log."""
+        log_path = str(tmp_path / "routing_examples.jsonl")
+        router = EmbeddingIntentRouter(log_path=log_path)
+        await router.seed([("health", "Plan a meal"), ("finance", "Make a budget")], self.embed)
+        
+        assert await router.learn("finance", "Budget for my meal prep", [1.0, 1.0, 0.0])
+        assert not await router.learn("finance", "Hello", [0.0, 0.0, 0.0])
+        assert router.get_stats()["labels"]["finance"] == 2
+        
+        restarted = EmbeddingIntentRouter(log_path=log_path)
+        await restarted.seed([("health", "Plan a meal"), ("finance", "Make a budget")], self.embed)
+        assert restarted.get_stats()["labels"] == {"health": 1, "finance": 2}
+    
+    @pytest.mark.asyncio
+    async def test_seeding_trims_the_log_off_the_event_loop(self, tmp_path):
+        """Test seeding reads the log in a worker thread and rewrites it down to the replayed records."""
+        log_path = tmp_path / "routing_examples.jsonl"
+        records = [{"label": "health", "text": f"Plan meal {i}"} for i in range(4)] + [{"label": "finance", "text": "Set a budget"}]
+        log_path.write_text("".join(json.dumps(record) + "\n" for record in records) + '{"label": "fin', encoding="utf-8")
+        router = EmbeddingIntentRouter(log_path=str(log_path), max_logged_examples=2)
+        
+        with patch('app.agents.intent_router.asyncio.to_thread', wraps=asyncio.to_thread) as to_thread:
+            await router.seed([("finance", "Make a budget")], self.embed)
+        
+        to_thread.assert_awaited_once_with(router._load_log)
+        assert router.get_stats()["labels"] == {"health": 1, "finance": 2}
+        assert [json.loads(line) for line in log_path.read_text(encoding="utf-8").splitlines()] == records[-2:]
+    
+    def test_centroid_becomes_moving_average(self):
+        """Test a full centroid keeps a fixed weight so new examples keep moving it."""
+        router = EmbeddingIntentRouter(max_weight=2)
+        for _ in range(5):
+            router.add_example("health", [1.0, 0.0])
+        router.add_example("finance", [0.0, 1.0])
+        router.add_example("health", [0.0, 1.0])
+        
+        assert router.get_stats()["labels"]["health"] == 2
+        # Plain mean of 6 examples would still be 5:1 towards the first axis
+        assert router.route([1.0, 0.0])["similarity"] < 0.95
 
 
 class TestAgentFactory:
@@ -550,5 +932,297 @@ class TestAgentMessage:
         assert message.requires_response is False
 
 
+
+class DelayedAgent(BaseAgent):
+    """Specialist stand-in that answers after a delay."""
+    
+    delay = 0.0
+    
+    async def execute(self, state):
+        await asyncio.sleep(self.delay)
+        return {"response": f"{self.agent_type.value} answer", "reasoning": {"agent_type": self.agent_type.value}}
+
+
+class PrefetchRecordingAgent(BaseAgent):
+    """Specialist stand-in that records the prefetched context it was handed."""
+    
+    prefetched = None
+    
+    async def execute(self, state):
+        self.prefetched = state.get("prefetched_context")
+        return {"response": "Try a lentil salad.", "reasoning": {"agent_type": self.agent_type.value}}
+
+
+class StreamingOrchestrator(BaseAgent):
+    """Orchestrator stand-in that reports a routing decision and returns a draft answer."""
+    
+    async def execute(self, state):
+        await emit_event(ROUTING_EVENT, {"agent_type": "health", "delegated_to": "health"})
+        return {"response": "Drink water regularly.", "reasoning": {"finalAgent": "health"}}
+
+
+class DraftingOrchestrator(BaseAgent):
+    """Orchestrator stand-in that answers directly, streaming its draft."""
+    
+    def __init__(self, llm_service, **kwargs):
+        super().__init__(**kwargs)
+        self.llm_service = llm_service
+    
+    async def execute(self, state):
+        request = CompletionRequest(messages=[ChatMessage(role="user", content=state["user_input"])])
+        response = await stream_completion(self.llm_service, request)
+        return {"response": response.content, "reasoning": {"finalAgent": "health"}}
+
+
+class TestAgentGraphWorkflow:
+    """Test the LangGraph workflow's streaming interface."""
+    
+    @pytest.mark.asyncio
+    async def test_stream_emits_routing_tokens_and_final(self, agent_registry):
+        """Test routing events and formatter tokens stream before the final response."""
+        agent_registry.register_agent(StreamingOrchestrator(
+            agent_id="orchestrator_stream",
+            agent_type=AgentType.ORCHESTRATOR,
+            capabilities=[],
+            system_prompt="You are a test orchestrator."
+        ))
+        
+        async def fake_stream(request, **kwargs):
+            for token in ["Drink ", "water ", "regularly!"]:
+                yield token
+        
+        llm_service = Mock()
+        llm_service.chat_completion_stream = fake_stream
+        with patch('app.langgraph.workflow.get_agent_registry', return_value=agent_registry), \
+             patch('app.langgraph.workflow.get_llm_service', AsyncMock(return_value=llm_service)):
+            workflow = AgentGraphWorkflow()
+            events = [event async for event in workflow.stream({
+                "user_input": "How much water should I drink?",
+                "context": {},
+                "conversation_id": "conv-1",
+                "agent": "orchestrator_stream"
+            })]
+        
+        kinds = [event["event"] for event in events]
+        assert kinds.index("routing") < kinds.index("token") < kinds.index("final")
+        assert [event["node"] for event in events if event["event"] == "node"] == [
+            "orchestrator_stream", "format_response_final_step"
+        ]
+        assert kinds.index("reset") < kinds.index("token")
+        assert "".join(event["content"] for event in events if event["event"] == "token") == "Drink water regularly!"
+        assert events[-1]["response"] == "Drink water regularly!"
+        assert events[-1]["reasoning"] == {"finalAgent": "health"}
+    
+    @pytest.mark.asyncio
+    async def test_agent_draft_streams_before_formatting(self, agent_registry):
+        """Test the answering agent's tokens stream as generated and a reset precedes the final text."""
+        async def fake_stream(request, **kwargs):
+            for token in ["Drink ", "water."]:
+                yield token
+        
+        llm_service = Mock()
+        llm_service.chat_completion_stream = fake_stream
+        agent_registry.register_agent(DraftingOrchestrator(
+            llm_service,
+            agent_id="orchestrator_draft",
+            agent_type=AgentType.ORCHESTRATOR,
+            capabilities=[],
+            system_prompt="You are a test orchestrator."
+        ))
+        with patch('app.langgraph.workflow.get_agent_registry', return_value=agent_registry):
+            workflow = AgentGraphWorkflow(formatting_mode="off")
+            events = [event async for event in workflow.stream({
+                "user_input": "How much water should I drink?",
+                "context": {},
+                "conversation_id": "conv-1",
+                "agent": "orchestrator_draft"
+            })]
+        
+        relevant = [
+            event.get("content", event.get("node")) if event["event"] != "reset" else "<reset>"
+            for event in events if event["event"] in ("token", "reset", "node")
+        ]
+        assert relevant == [
+            "orchestrator_draft", "Drink ", "water.", "format_response_final_step", "<reset>", "Drink water."
+        ]
+        assert events[-1]["response"] == "Drink water."
+        
+        # A non-streaming run generates with chat_completion, which feeds latency routing
+        llm_service.chat_completion = AsyncMock(return_value=Mock(content="Drink water."))
+        response, _ = await workflow.run({"user_input": "How much water should I drink?", "context": {}, "agent": "orchestrator_draft"})
+        assert response == "Drink water."
+        llm_service.chat_completion.assert_awaited_once()
+    
+    @pytest.mark.asyncio
+    async def test_answer_tokens_stream_only_when_the_run_requests_them(self):
+        """Test agents stream only in runs configured for it and never inside fan-out branches."""
+        async def fake_stream(request, **kwargs):
+            yield "Streamed answer"
+        
+        llm_service = Mock()
+        llm_service.chat_completion = AsyncMock(return_value=Mock(content="Blocking answer"))
+        llm_service.chat_completion_stream = fake_stream
+        request = CompletionRequest(messages=[ChatMessage(role="user", content="Hi")])
+        
+        async def answer(_):
+            async def branch():
+                suppress_answer_tokens()
+                return await stream_completion(llm_service, request)
+            
+            return (await stream_completion(llm_service, request)).content, \
+                (await asyncio.create_task(branch())).content
+        
+        assert (await stream_completion(llm_service, request)).content == "Blocking answer"
+        assert await RunnableLambda(answer).ainvoke(None, config={"configurable": {STREAM_ANSWER_TOKENS: True}}) == (
+            "Streamed answer", "Blocking answer"
+        )
+        assert llm_service.chat_completion.await_count == 2
+    
+    @pytest.mark.asyncio
+    async def test_formatting_modes_skip_llm_pass_when_not_needed(self, agent_registry):
+        """Test off and deterministic paths make no LLM call and conditional mode only calls it for weak answers."""
+        agent_registry.register_agent(StreamingOrchestrator(
+            agent_id="orchestrator_stream",
+            agent_type=AgentType.ORCHESTRATOR,
+            capabilities=[],
+            system_prompt="You are a test orchestrator."
+        ))
+        calls = []
+        
+        async def fake_stream(request, **kwargs):
+            calls.append(request)
+            yield "Formatted by LLM"
+        
+        llm_service = Mock()
+        llm_service.chat_completion_stream = fake_stream
+        strong_answer = (
+            "You can try these steps to plan your week, for example:\n"
+            "1) List your top three goals\n2) Block focus time each morning\n\n\n\n"
+            "Consider reviewing the plan on Friday to plan your next week"
+        )
+        
+        with patch('app.langgraph.workflow.get_agent_registry', return_value=agent_registry), \
+             patch('app.langgraph.workflow.get_llm_service', AsyncMock(return_value=llm_service)):
+            off = AgentGraphWorkflow(formatting_mode="off")
+            state = await off._format_response_final_step({"user_input": "plan", "response": "Done."})
+            assert state["response"] == "Done."
+            
+            conditional = AgentGraphWorkflow(formatting_mode="conditional")
+            state = await conditional._format_response_final_step({
+                "user_input": "Help me plan my week",
+                "response": strong_answer,
+                "reasoning": {"finalAgent": "productivity"}
+            })
+            assert calls == []
+            assert state["response"].startswith("⚡ You can try")
+            assert "1. List your top three goals" in state["response"]
+            assert "\n\n\n" not in state["response"]
+            
+            state = await conditional._format_response_final_step({
+                "user_input": "Help me plan my week",
+                "response": "Ok.",
+                "reasoning": {"finalAgent": "productivity"}
+            })
+            assert len(calls) == 1
+            assert state["response"] == "Formatted by LLM"
+        
+        assert off.get_formatting_stats() == {"mode": "off", "counts": {"off": 1}}
+        assert conditional.get_formatting_stats()["counts"] == {"deterministic": 1, "llm": 1}
+    
+    @pytest.mark.asyncio
+    async def test_failed_llm_pass_resets_before_fallback(self, agent_registry):
+        """Test tokens from an LLM formatting pass that fails part-way are reset before the fallback text."""
+        agent_registry.register_agent(StreamingOrchestrator(
+            agent_id="orchestrator_stream",
+            agent_type=AgentType.ORCHESTRATOR,
+            capabilities=[],
+            system_prompt="You are a test orchestrator."
+        ))
+        
+        async def failing_stream(request, **kwargs):
+            yield "Partial "
+            raise Exception("stream dropped")
+        
+        llm_service = Mock()
+        llm_service.chat_completion_stream = failing_stream
+        emitted = AsyncMock()
+        with patch('app.langgraph.workflow.get_agent_registry', return_value=agent_registry), \
+             patch('app.langgraph.workflow.get_llm_service', AsyncMock(return_value=llm_service)), \
+             patch('app.langgraph.workflow.emit_event', emitted):
+            workflow = AgentGraphWorkflow(formatting_mode="always")
+            state = await workflow._format_response_final_step({
+                "user_input": "Help me plan my week",
+                "response": "Ok.",
+                "reasoning": {"finalAgent": "productivity"}
+            })
+        
+        events = [(call.args[0], call.args[1].get("content")) for call in emitted.await_args_list]
+        assert events == [
+            ("reset", None), ("token", "Partial "), ("reset", None), ("token", state["response"])
+        ]
+        assert state["response"].startswith("⚡ Ok.")
+        assert workflow.get_formatting_stats()["counts"] == {"llm_fallback": 1}
+    
+    @pytest.mark.asyncio
+    async def test_graph_is_compiled_once_and_swapped_on_agent_changes(self, agent_registry, test_agent):
+        """Test runs reuse the compiled graph and registry changes swap in a recompiled one."""
+        agent_registry.register_agent(StreamingOrchestrator(
+            agent_id="orchestrator_stream",
+            agent_type=AgentType.ORCHESTRATOR,
+            capabilities=[],
+            system_prompt="You are a test orchestrator."
+        ))
+        state = {"user_input": "Hi", "context": {}, "conversation_id": "conv-1"}
+        
+        with patch('app.langgraph.workflow.get_agent_registry', return_value=agent_registry):
+            workflow = AgentGraphWorkflow(formatting_mode="off")
+        compiled = workflow.get_compiled_graph()
+        
+        with patch.object(workflow.graph, "compile", side_effect=AssertionError("compiled per request")):
+            response, reasoning = await workflow.run(state)
+        assert response == "Drink water regularly."
+        assert workflow.get_compiled_graph() is compiled
+        
+        agent_registry.register_agent(test_agent)
+        assert workflow.get_compiled_graph() is not compiled
+        assert "test_agent_1" in workflow.get_compiled_graph().nodes
+        
+        agent_registry.unregister_agent("test_agent_1")
+        assert "test_agent_1" not in workflow.get_compiled_graph().nodes
+        assert (await workflow.run(state))[0] == "Drink water regularly."
+    
+    @pytest.mark.asyncio
+    async def test_workflow_overhead_benchmark(self, agent_registry):
+        """Benchmark per-request workflow overhead with a stub agent and no LLM formatting pass."""
+        agent_registry.register_agent(StreamingOrchestrator(
+            agent_id="orchestrator_stream",
+            agent_type=AgentType.ORCHESTRATOR,
+            capabilities=[],
+            system_prompt="You are a test orchestrator."
+        ))
+        state = {"user_input": "How much water should I drink?", "context": {}, "conversation_id": "conv-1"}
+        llm_service = Mock()
+        requests = 100
+        
+        with patch('app.langgraph.workflow.get_agent_registry', return_value=agent_registry), \
+             patch('app.langgraph.workflow.get_llm_service', AsyncMock(return_value=llm_service)):
+            workflow = AgentGraphWorkflow(formatting_mode="deterministic", log_sample_rate=0.0)
+            
+            # Before: compile the graph for every request
+            started = time.perf_counter()
+            for _ in range(requests):
+                await workflow.graph.compile().ainvoke(state)
+            per_request_before = (time.perf_counter() - started) / requests
+            
+            started = time.perf_counter()
+            for _ in range(requests):
+                await workflow.run(state)
+            per_request_after = (time.perf_counter() - started) / requests
+        
+        print(f"\nWorkflow overhead: {per_request_before * 1000:.2f}ms per request compiling per request, "
+              f"{per_request_after * 1000:.2f}ms with the precompiled graph")
+        assert llm_service.method_calls == []
+        assert per_request_after < per_request_before
+
 if __name__ == "__main__":
     pytest.main([__file__])
\ No newline at end of file
@@ -50,6 +50,16 @@ def mock_knowledge_service():
     
     mock_service.get_entry = mock_get_entry
     
+    # Mock create_entries_bulk
+    async def mock_create_entries_bulk(entries):
+        return [
+            {"index": i, "success": i == 0, "entry_id": "test-123" if i == 0 else None,
+             "error": None if i == 0 else "Embedding generation failed"}
+            for i in range(len(entries))
+        ]
+    
+    mock_service.create_entries_bulk = mock_create_entries_bulk
+    
     # Mock search
     async def mock_search(query):
         from app.models.knowledge import KnowledgeEntry, KnowledgeSearchResult
@@ -108,6 +118,25 @@ class TestKnowledgeAPI:
             assert data["title"] == "Test Entry"
             assert data["category"] == "test"
     
+    def test_create_entries_batch(self, client, mock_knowledge_service):
+        """Test creating knowledge entries in one batch via API."""
+        entry = {
+            "entry_type": "preference",
+            "entry_sub_type": "work preference",
+            "category": "productivity",
+            "title": "Work Schedule",
+            "content": "I prefer to work from 9 AM to 5 PM"
+        }
+        with patch('app.api.knowledge.get_knowledge_base_service', return_value=mock_knowledge_service):
+            response = client.post("/api/knowledge/entries:batch", json={"entries": [entry, entry]})
+            
+            assert response.status_code == 200
+            data = response.json()
+            assert data["created"] == 1
+            assert data["failed"] == 1
+            assert data["results"][0]["entry_id"] == "test-123"
+            assert data["results"][1]["error"] == "Embedding generation failed"
+    
     def test_get_entry(self, client, mock_knowledge_service):
         """Test retrieving a knowledge entry via API."""
         with patch('app.api.knowledge.get_knowledge_base_service', return_value=mock_knowledge_service):
@@ -4,19 +4,25 @@ Tests for the knowledge base and RAG system.
 
 import pytest
 import asyncio
+import sqlite3
 import tempfile
 import shutil
 from datetime import datetime
 from typing import List
 
+import numpy as np
+
 from app.models.knowledge import (
     KnowledgeEntry, 
+    KnowledgeEntrySubType,
     KnowledgeEntryType, 
     KnowledgeQuery,
     UserPreferences
 )
 from app.services.knowledge_base import KnowledgeBaseService
+from app.services.post_processing import PostProcessingPipeline
 from app.services.vector_store import VectorStore
+from app.services.vector_file import VectorFile
 from app.llm.service import LLMService
 from app.llm.config import LLMConfig
 
@@ -26,6 +32,7 @@ class MockLLMService:
     
     def __init__(self):
         self.embedding_calls = []
+        self.batch_calls = []
     
     def get_current_provider(self):
         """Mock method to return current provider."""
@@ -55,6 +62,12 @@ class MockLLMService:
                 self.embedding = embedding
         
         return MockResponse(embedding)
+    
+    async def generate_embeddings(self, texts):
+        """Generate mock embeddings for a batch of texts as a float32 matrix."""
+        self.batch_calls.append(list(texts))
+        responses = [await self.generate_embedding(type("Request", (), {"text": text})) for text in texts]
+        return np.array([response.embedding for response in responses], dtype=np.float32)
 
 
 @pytest.fixture
@@ -99,8 +112,8 @@ class TestVectorStore:
         """Test vector store initialization."""
         store = VectorStore(dimension=1536, index_path=f"{temp_dir}/test_index")
         assert store.dimension == 1536
-        assert store.index.ntotal == 0
-        assert len(store.entry_metadata) == 0
+        assert store.vectors.count == 0
+        assert store.get_stats()["total_entries"] == 0
     
     def test_add_and_get_entry(self, vector_store):
         """Test adding and retrieving entries."""
@@ -120,7 +133,7 @@ class TestVectorStore:
         vector_store.add_entry(entry, embedding)
         
         # Verify entry was added
-        assert vector_store.index.ntotal == 1
+        assert vector_store.vectors.count == 1
         retrieved_entry = vector_store.get_entry("test-1")
         assert retrieved_entry is not None
         assert retrieved_entry.entry_id == "test-1"
@@ -173,12 +186,12 @@ class TestVectorStore:
         vector_store.add_entry(entry1, [0.1] * 1536)
         vector_store.add_entry(entry2, [0.2] * 1536)
         
-        assert vector_store.index.ntotal == 2
+        assert vector_store.vectors.count == 2
         
         # Remove one entry
         success = vector_store.remove_entry("test-1")
         assert success
-        assert vector_store.index.ntotal == 1
+        assert vector_store.get_stats()["total_entries"] == 1
         assert vector_store.get_entry("test-1") is None
         assert vector_store.get_entry("test-2") is not None
     
@@ -213,6 +226,501 @@ class TestVectorStore:
         # Verify we get the expected entry (might not be in exact order due to normalization)
         found_ids = [r.entry.entry_id for r in results]
         assert "test-0" in found_ids
+    
+    def test_remove_tombstones_until_compaction(self, vector_store):
+        """Test that deletes are tombstoned and purged in one compaction pass."""
+        for i in range(3):
+            entry = KnowledgeEntry(
+                entry_id=f"test-{i}",
+                entry_type=KnowledgeEntryType.PREFERENCE,
+                entry_sub_type=KnowledgeEntrySubType.OTHER_PREFERENCE,
+                category="test",
+                title=f"Entry {i}",
+                content=f"Content {i}"
+            )
+            embedding = [0.0] * 1536
+            embedding[i] = 1.0
+            vector_store.add_entry(entry, embedding)
+        
+        assert vector_store.remove_entry("test-0")
+        assert not vector_store.remove_entry("test-0")
+        
+        # The vector is still stored but never surfaces in search
+        assert vector_store.vectors.count == 3
+        assert vector_store.tombstones == {0}
+        query = [0.0] * 1536
+        query[0] = 1.0
+        results = vector_store.search(query, k=3, similarity_threshold=-1.0)
+        assert "test-0" not in [r.entry.entry_id for r in results]
+        assert len(results) == 2
+        
+        assert vector_store.compact() == 1
+        assert vector_store.vectors.count == 2
+        assert vector_store.tombstones == set()
+        assert vector_store.get_entry("test-1") is not None
+    
+    def test_update_keeps_one_live_vector(self, vector_store):
+        """Test that an update tombstones the old vector and indexes the new one."""
+        entry = KnowledgeEntry(
+            entry_id="test-1",
+            entry_type=KnowledgeEntryType.PREFERENCE,
+            entry_sub_type=KnowledgeEntrySubType.OTHER_PREFERENCE,
+            category="test",
+            title="Original Title",
+            content="Original content"
+        )
+        vector_store.add_entry(entry, [0.1] * 1536)
+        
+        updated_entry = entry.model_copy()
+        updated_entry.title = "Updated Title"
+        vector_store.update_entry(updated_entry, [0.2] * 1536)
+        
+        assert vector_store.get_stats()["total_entries"] == 1
+        assert vector_store.get_entry("test-1").title == "Updated Title"
+        results = vector_store.search([0.2] * 1536, k=5, similarity_threshold=0.0)
+        assert [r.entry.entry_id for r in results] == ["test-1"]
+    
+    def test_persistence_and_legacy_migration(self, temp_dir):
+        """Test tombstones survive reloads and legacy flat indexes and pickled metadata are migrated."""
+        import os
+        import faiss
+        import pickle
+        
+        index_path = f"{temp_dir}/legacy_index"
+        legacy_index = faiss.IndexFlatIP(1536)
+        entries = {}
+        for i in range(2):
+            vector = [0.0] * 1536
+            vector[i] = 1.0
+            entries[i] = KnowledgeEntry(
+                entry_id=f"legacy-{i}",
+                entry_type=KnowledgeEntryType.MEMORY,
+                entry_sub_type=KnowledgeEntrySubType.CORE_MEMORY,
+                category="test",
+                title=f"Legacy {i}",
+                content=f"Legacy content {i}",
+                embedding=vector
+            )
+            legacy_index.add(np.array([vector], dtype=np.float32))
+        faiss.write_index(legacy_index, index_path)
+        with open(f"{index_path}_metadata.pkl", "wb") as f:
+            pickle.dump({
+                "entry_metadata": entries,
+                "id_to_faiss_id": {e.entry_id: fid for fid, e in entries.items()},
+                "next_faiss_id": 2
+            }, f)
+        
+        store = VectorStore(dimension=1536, index_path=index_path)
+        query = [0.0] * 1536
+        query[1] = 1.0
+        results = store.search(query, k=1, similarity_threshold=0.9)
+        assert [r.entry.entry_id for r in results] == ["legacy-1"]
+        assert results[0].entry.embedding is None
+        assert store.get_embedding("legacy-1") == query
+        assert not os.path.exists(f"{index_path}_metadata.pkl")
+        
+        assert store.remove_entry("legacy-1")
+        reloaded = VectorStore(dimension=1536, index_path=index_path)
+        assert reloaded.tombstones == {1}
+        assert reloaded.search(query, k=1, similarity_threshold=0.9) == []
+    
+    def test_background_compaction(self, temp_dir):
+        """Test that crossing the tombstone threshold compacts in the background."""
+        store = VectorStore(dimension=1536, index_path=f"{temp_dir}/bg_index", compaction_threshold=2)
+        for i in range(3):
+            entry = KnowledgeEntry(
+                entry_id=f"test-{i}",
+                entry_type=KnowledgeEntryType.INTERACTION,
+                entry_sub_type=KnowledgeEntrySubType.MISC_INTERACTION,
+                category="test",
+                title=f"Entry {i}",
+                content=f"Content {i}"
+            )
+            store.add_entry(entry, [0.1 * (i + 1)] * 1536)
+        
+        store.remove_entry("test-0")
+        store.remove_entry("test-1")
+        store._compaction_thread.join(timeout=5)
+        
+        assert store.vectors.count == 1
+        assert store.tombstones == set()
+    
+    def test_compaction_switches_generations_atomically(self, temp_dir):
+        """Test an interrupted compaction leaves the old pair in use and a finished one the new pair."""
+        import os
+        
+        path = f"{temp_dir}/gen_vectors"
+        vectors = VectorFile(path, 2)
+        vectors.append(np.arange(4, dtype=np.int64), np.eye(4, 2, dtype=np.float32) + np.arange(4)[:, None])
+        vectors.flush()
+        
+        # Crash after writing the compacted pair, before the manifest names it
+        stored_vectors, stored_ids = vectors.stored()
+        vectors.write_compacted(stored_vectors, stored_ids, np.array([True, False, True, True]))
+        reopened = VectorFile(path, 2)
+        assert reopened.ids().tolist() == [0, 1, 2, 3]
+        assert not os.path.exists(f"{path}.1.f32")
+        
+        stored_vectors, stored_ids = reopened.stored()
+        reopened.write_compacted(stored_vectors, stored_ids, np.array([True, False, True, True]))
+        reopened.replace_with(len(stored_ids))
+        assert not os.path.exists(f"{path}.f32")
+        
+        reopened = VectorFile(path, 2)
+        assert reopened.generation == 1
+        assert reopened.ids().tolist() == [0, 2, 3]
+        assert np.allclose(reopened.get(np.array([2, 3])), [[2.0, 2.0], [3.0, 3.0]])
+
+
+class TestMetadataPrefiltering:
+    """Test category, entry type and tag filters pushed into the vector search."""
+    
+    @staticmethod
+    def _populate(store: VectorStore) -> None:
+        # 20 close "work" matches crowd out the 3 more distant "health" entries
+        for i in range(23):
+            health = i >= 20
+            entry = KnowledgeEntry(
+                entry_id=f"pf-{i}",
+                entry_type=KnowledgeEntryType.PATTERN if health else KnowledgeEntryType.INTERACTION,
+                entry_sub_type=KnowledgeEntrySubType.MISC_INTERACTION,
+                category="health" if health else "work",
+                title=f"Entry {i}",
+                content=f"Content {i}",
+                tags=["sleep"] if i == 22 else []
+            )
+            embedding = [0.0] * 1536
+            embedding[0] = 1.0
+            embedding[1] = (1.0 if health else 0.1) + 0.01 * i
+            store.add_entry(entry, embedding)
+    
+    @pytest.mark.parametrize("exact_limit", [2048, 0])
+    def test_filtered_search_is_not_starved(self, temp_dir, exact_limit):
+        """Test filtered search finds matches outside the global top k, on both search paths."""
+        store = VectorStore(dimension=1536, index_path=f"{temp_dir}/pf_index", prefilter_exact_limit=exact_limit)
+        self._populate(store)
+        query = [1.0, 0.0] + [0.0] * 1534
+        
+        unfiltered = store.search(query, k=5, similarity_threshold=0.0)
+        assert all(r.entry.category == "work" for r in unfiltered)
+        
+        health = store.search(query, k=5, similarity_threshold=0.0, categories=["health"])
+        assert [r.entry.entry_id for r in health] == ["pf-20", "pf-21", "pf-22"]
+        assert health[0].similarity_score > health[1].similarity_score
+        
+        tagged = store.search(query, k=5, similarity_threshold=0.0,
+                              entry_types=[KnowledgeEntryType.PATTERN], tags=["sleep"])
+        assert [r.entry.entry_id for r in tagged] == ["pf-22"]
+        assert store.search(query, k=5, similarity_threshold=0.0, categories=["missing"]) == []
+    
+    def test_filter_indexes_follow_mutations(self, temp_dir):
+        """Test the inverted indexes track removes, in-place updates and reloads."""
+        store = VectorStore(dimension=1536, index_path=f"{temp_dir}/pf_index")
+        self._populate(store)
+        
+        store.remove_entry("pf-20")
+        entry = store.get_entry("pf-21")
+        entry.category = "sleep"
+        store.update_entry(entry, [0.5] * 1536)
+        
+        faiss_id = store.metadata.get_faiss_id
+        assert store.select_ids(categories=["health"]) == {faiss_id("pf-22")}
+        assert store.select_ids(categories=["sleep"]) == {faiss_id("pf-21")}
+        
+        reloaded = VectorStore(dimension=1536, index_path=f"{temp_dir}/pf_index")
+        assert reloaded.select_ids(categories=["health"]) == store.select_ids(categories=["health"])
+        assert reloaded.select_ids(entry_types=[KnowledgeEntryType.PATTERN]) == {
+            faiss_id("pf-21"), faiss_id("pf-22")
+        }
+
+
+class TestMetadataStore:
+    """Test the SQLite metadata store behind the vector store."""
+    
+    @staticmethod
+    def _populate(store: VectorStore, count: int) -> None:
+        entries = [
+            KnowledgeEntry(
+                entry_id=f"md-{i}",
+                entry_type=KnowledgeEntryType.PREFERENCE if i % 3 == 0 else KnowledgeEntryType.INTERACTION,
+                entry_sub_type=KnowledgeEntrySubType.MISC_INTERACTION,
+                category="health" if i % 2 == 0 else "work",
+                title=f"Entry {i}",
+                content=f"Content {i}",
+                tags=["tagged"] if i == 4 else []
+            )
+            for i in range(count)
+        ]
+        vectors = np.random.default_rng(0).standard_normal((count, store.dimension)).astype(np.float32)
+        store.add_entries(entries, vectors)
+    
+    def test_entries_are_stored_without_embeddings(self, temp_dir):
+        """Test entries round-trip through the store without their vectors and load by id."""
+        store = VectorStore(dimension=64, index_path=f"{temp_dir}/md_index")
+        self._populate(store, 6)
+        
+        entry = store.get_entry("md-4")
+        assert entry.title == "Entry 4" and entry.tags == ["tagged"]
+        assert entry.embedding is None
+        assert len(store.get_embedding("md-4")) == 64
+        assert store.get_entry("missing") is None
+        
+        reloaded = VectorStore(dimension=64, index_path=f"{temp_dir}/md_index")
+        assert reloaded.get_entry("md-4") == entry
+        assert reloaded.select_ids(tags=["tagged"]) == {store.metadata.get_faiss_id("md-4")}
+    
+    def test_listing_and_stats_query_the_store(self, temp_dir):
+        """Test filtered listings stream in insertion order and stats are aggregated."""
+        store = VectorStore(dimension=64, index_path=f"{temp_dir}/md_index")
+        self._populate(store, 10)
+        store.remove_entry("md-0")
+        
+        listed = list(store.iter_entries(category="health", entry_type=KnowledgeEntryType.PREFERENCE))
+        assert [e.entry_id for e in listed] == ["md-6"]
+        assert [e.entry_id for e in store.iter_entries(batch_size=3)] == [f"md-{i}" for i in range(1, 10)]
+        
+        stats = store.get_stats()
+        assert stats["total_entries"] == 9
+        assert stats["entries_by_category"] == {"health": 4, "work": 5}
+        assert stats["entries_by_type"] == {"preference": 3, "interaction": 6}
+    
+    def test_orphaned_entries_are_dropped_on_load(self, temp_dir):
+        """Test rows committed without a checkpointed vector are dropped when the store reopens."""
+        store = VectorStore(dimension=64, index_path=f"{temp_dir}/md_index")
+        self._populate(store, 3)
+        orphan = store.get_entry("md-2").model_copy(update={"entry_id": "orphan"})
+        store.metadata.put_many([(99, orphan)])
+        
+        reloaded = VectorStore(dimension=64, index_path=f"{temp_dir}/md_index")
+        assert reloaded.get_entry("orphan") is None
+        assert reloaded.get_stats()["total_entries"] == 3
+
+
+class TestAnnIndexes:
+    """Test the HNSW and IVF-PQ index modes."""
+    
+    @staticmethod
+    def _populate(store: VectorStore, count: int, offset: int = 0) -> np.ndarray:
+        vectors = np.random.default_rng(offset).standard_normal((count, store.dimension)).astype(np.float32)
+        entries = [
+            KnowledgeEntry(
+                entry_id=f"ann-{offset + i}",
+                entry_type=KnowledgeEntryType.INTERACTION,
+                entry_sub_type=KnowledgeEntrySubType.MISC_INTERACTION,
+                category="even" if i % 2 == 0 else "odd",
+                title=f"Entry {i}",
+                content=f"Content {i}"
+            )
+            for i in range(count)
+        ]
+        store.add_entries(entries, vectors)
+        return vectors
+    
+    def test_hnsw_search_and_compaction(self, temp_dir):
+        """Test HNSW search, filtered search and rebuild-based compaction."""
+        store = VectorStore(dimension=64, index_path=f"{temp_dir}/hnsw_index", index_type="hnsw")
+        vectors = self._populate(store, 200)
+        
+        assert store.get_stats()["index_type"] == "hnsw"
+        assert store.search(vectors[7].tolist(), k=1, similarity_threshold=0.0)[0].entry.entry_id == "ann-7"
+        odd = store.search(vectors[7].tolist(), k=3, similarity_threshold=0.0, categories=["odd"])
+        assert odd[0].entry.entry_id == "ann-7" and all(r.entry.category == "odd" for r in odd)
+        
+        store.remove_entry("ann-7")
+        assert store.compact() == 1
+        assert store.index.ntotal == 199 and store.tombstones == set()
+        assert store.search(vectors[7].tolist(), k=1, similarity_threshold=0.0)[0].entry.entry_id != "ann-7"
+    
+    def test_ivfpq_trains_once_enough_vectors(self, temp_dir):
+        """Test IVF-PQ stays flat until it can be trained, then rebuilds in the background."""
+        store = VectorStore(dimension=64, index_path=f"{temp_dir}/ivf_index", index_type="ivfpq",
+                            ann_min_vectors=300, ivf_nlist=4, ivf_nprobe=4, pq_m=8)
+        self._populate(store, 200)
+        assert store.get_stats()["index_type"] == "flat"
+        
+        vectors = self._populate(store, 200, offset=200)
+        store._rebuild_thread.join(timeout=30)
+        
+        assert store.get_stats()["index_type"] == "ivfpq"
+        assert store.index.ntotal == 400
+        hits = store.search(vectors[0].tolist(), k=10, similarity_threshold=0.0)
+        assert "ann-200" in [r.entry.entry_id for r in hits]
+        
+        store.remove_entry("ann-200")
+        assert store.compact() == 1
+        assert store.index.ntotal == 399
+        # Compaction keeps labels aligned with the surviving vectors
+        hits = store.search(vectors[1].tolist(), k=10, similarity_threshold=0.0)
+        assert "ann-201" in [r.entry.entry_id for r in hits]
+    
+    def test_migration_and_recall_report(self, temp_dir):
+        """Test an existing flat store migrates on reopen and reports recall against the flat baseline."""
+        flat = VectorStore(dimension=64, index_path=f"{temp_dir}/mig_index")
+        self._populate(flat, 300)
+        assert flat.evaluate_recall(k=5, num_queries=20)["recall_at_k"] == 1.0
+        
+        migrated = VectorStore(dimension=64, index_path=f"{temp_dir}/mig_index", index_type="hnsw")
+        migrated._rebuild_thread.join(timeout=30)
+        
+        assert migrated.get_stats()["index_type"] == "hnsw"
+        assert migrated.get_stats()["total_entries"] == 300
+        report = migrated.evaluate_recall(k=5, num_queries=20)
+        assert report["index_type"] == "hnsw"
+        assert report["queries"] == 20
+        assert report["recall_at_k"] >= 0.9
+        
+        # The migrated index was checkpointed, so the next open needs no rebuild
+        reopened = VectorStore(dimension=64, index_path=f"{temp_dir}/mig_index", index_type="hnsw")
+        assert reopened._rebuild_thread is None
+        assert reopened.get_stats()["index_type"] == "hnsw"
+
+
+class TestMemoryMappedVectors:
+    """Test the memory-mapped vector file behind the store."""
+    
+    def test_reopen_maps_vectors_instead_of_loading_them(self, temp_dir):
+        """Test a reopened flat store searches its memory-mapped vectors without a FAISS index file."""
+        import os
+        
+        store = VectorStore(dimension=64, index_path=f"{temp_dir}/mm_index")
+        vectors = TestAnnIndexes._populate(store, 50)
+        store.close()
+        
+        reopened = VectorStore(dimension=64, index_path=f"{temp_dir}/mm_index")
+        assert reopened.index is None and not os.path.exists(reopened.index_path)
+        assert isinstance(reopened.vectors.stored()[0], np.memmap)
+        hits = reopened.search(vectors[7].tolist(), k=1, similarity_threshold=0.0)
+        assert hits[0].entry.entry_id == "ann-7"
+    
+    def test_ivfpq_keeps_exact_vectors(self, temp_dir):
+        """Test embeddings come back exactly even when the index only holds PQ codes."""
+        store = VectorStore(dimension=64, index_path=f"{temp_dir}/mm_index", index_type="ivfpq",
+                            ann_min_vectors=256, ivf_nlist=4, ivf_nprobe=4, pq_m=8)
+        vectors = TestAnnIndexes._populate(store, 300)
+        store._rebuild_thread.join(timeout=30)
+        
+        assert store.get_stats()["index_type"] == "ivfpq"
+        expected = vectors[3] / np.linalg.norm(vectors[3])
+        assert np.allclose(store.get_embedding("ann-3"), expected, atol=1e-6)
+    
+    def test_read_only_store_shares_checkpoints(self, temp_dir):
+        """Test a read-only store sees checkpointed entries, refuses writes and refreshes."""
+        index_path = f"{temp_dir}/mm_index"
+        owner = VectorStore(dimension=64, index_path=index_path, write_behind=True,
+                            flush_every=1000, flush_interval=3600)
+        vectors = TestAnnIndexes._populate(owner, 20)
+        owner.flush()
+        
+        reader = VectorStore(dimension=64, index_path=index_path, read_only=True)
+        assert reader.search(vectors[2].tolist(), k=1, similarity_threshold=0.0)[0].entry.entry_id == "ann-2"
+        with pytest.raises(RuntimeError):
+            reader.add_entries([owner.get_entry("ann-0")], vectors[:1])
+        # The shared SQLite database is opened read-only as well
+        with pytest.raises(sqlite3.OperationalError):
+            reader.metadata._db.execute("CREATE TABLE probe (id INTEGER)")
+        
+        # Entries the owner has not checkpointed yet stay hidden until a refresh after its flush
+        more = TestAnnIndexes._populate(owner, 5, offset=20)
+        reader.refresh()
+        assert reader.get_stats()["total_entries"] == 20
+        owner.flush()
+        reader.refresh()
+        assert reader.get_stats()["total_entries"] == 25
+        assert reader.search(more[0].tolist(), k=1, similarity_threshold=0.0)[0].entry.entry_id == "ann-20"
+        owner.close()
+
+
+class TestWriteBehindPersistence:
+    """Test the journaled write-behind persistence mode."""
+    
+    @staticmethod
+    def _entry(i: int) -> KnowledgeEntry:
+        return KnowledgeEntry(
+            entry_id=f"wb-{i}",
+            entry_type=KnowledgeEntryType.INTERACTION,
+            entry_sub_type=KnowledgeEntrySubType.MISC_INTERACTION,
+            category="test",
+            title=f"Entry {i}",
+            content=f"Content {i}"
+        )
+    
+    @staticmethod
+    def _embedding(i: int) -> List[float]:
+        embedding = [0.0] * 1536
+        embedding[i] = 1.0
+        return embedding
+    
+    def test_mutations_are_journaled_not_checkpointed(self, temp_dir):
+        """Test that writes only append to the journal until a flush."""
+        import os
+        
+        store = VectorStore(index_path=f"{temp_dir}/wb_index", write_behind=True,
+                            flush_every=1000, flush_interval=3600)
+        store.add_entry(self._entry(0), self._embedding(0))
+        store.add_entry(self._entry(1), self._embedding(1))
+        
+        assert store.vectors.stored_count == 0
+        assert os.path.getsize(store.journal_path) > 0
+        
+        store.flush()
+        assert store.vectors.stored_count == 2
+        assert os.path.exists(store.vectors.vectors_path)
+        assert not os.path.exists(store.rotated_journal_path)
+        store.close()
+    
+    def test_recovery_replays_journal_over_checkpoint(self, temp_dir):
+        """Test that a crash after a checkpoint loses nothing that was journaled."""
+        index_path = f"{temp_dir}/wb_index"
+        store = VectorStore(index_path=index_path, write_behind=True,
+                            flush_every=1000, flush_interval=3600)
+        for i in range(3):
+            store.add_entry(self._entry(i), self._embedding(i))
+        store.flush()
+        
+        # Mutations after the checkpoint exist only in the journal
+        store.remove_entry("wb-0")
+        updated = self._entry(1).model_copy(update={"title": "Updated"})
+        store.update_entry(updated, self._embedding(4))
+        store.add_entry(self._entry(5), self._embedding(5))
+        
+        # Simulate a crash: reopen from disk without closing the first store
+        recovered = VectorStore(index_path=index_path)
+        assert recovered.get_entry("wb-0") is None
+        assert recovered.get_entry("wb-1").title == "Updated"
+        assert recovered.get_entry("wb-5") is not None
+        assert recovered.get_stats()["total_entries"] == 3
+        results = recovered.search(self._embedding(4), k=1, similarity_threshold=0.9)
+        assert [r.entry.entry_id for r in results] == ["wb-1"]
+    
+    def test_recovery_ignores_torn_tail(self, temp_dir):
+        """Test that a partially written journal record is dropped on replay."""
+        index_path = f"{temp_dir}/wb_index"
+        store = VectorStore(index_path=index_path, write_behind=True,
+                            flush_every=1000, flush_interval=3600)
+        store.add_entry(self._entry(0), self._embedding(0))
+        with open(store.journal_path, "ab") as f:
+            f.write(b"\x80\x04\x95partial")
+        
+        recovered = VectorStore(index_path=index_path)
+        assert recovered.get_entry("wb-0") is not None
+    
+    def test_background_flush_after_mutation_budget(self, temp_dir):
+        """Test that the flusher checkpoints once flush_every mutations accumulate."""
+        import os
+        import time
+        
+        store = VectorStore(index_path=f"{temp_dir}/wb_index", write_behind=True,
+                            flush_every=2, flush_interval=3600)
+        store.add_entry(self._entry(0), self._embedding(0))
+        store.add_entry(self._entry(1), self._embedding(1))
+        
+        deadline = time.time() + 5
+        while not os.path.exists(store.vectors.vectors_path) and time.time() < deadline:
+            time.sleep(0.01)
+        store.close()
+        
+        reloaded = VectorStore(index_path=store.index_path)
+        assert reloaded.get_stats()["total_entries"] == 2
 
 
 class TestKnowledgeBaseService:
@@ -238,6 +746,74 @@ class TestKnowledgeBaseService:
         assert len(mock_llm_service.embedding_calls) == 1
         assert "Work Schedule" in mock_llm_service.embedding_calls[0]
     
+    @pytest.mark.asyncio
+    async def test_create_entries_bulk(self, knowledge_service, mock_llm_service):
+        """Test bulk creation reports per-item results and indexes valid entries once."""
+        persisted = []
+        original_persist = knowledge_service.vector_store._persist
+        knowledge_service.vector_store._persist = lambda: persisted.append(True) or original_persist()
+        
+        results = await knowledge_service.create_entries_bulk([
+            {
+                "entry_type": KnowledgeEntryType.PREFERENCE,
+                "entry_sub_type": KnowledgeEntrySubType.WORK_PREFERENCE,
+                "category": "productivity",
+                "title": f"Bulk entry {i}",
+                "content": f"Bulk content {i}",
+                "tags": ["bulk"]
+            }
+            for i in range(3)
+        ] + [{"entry_type": "not-a-type", "category": "x", "title": "Bad", "content": "Bad"}])
+        
+        assert [result["success"] for result in results] == [True, True, True, False]
+        assert [result["index"] for result in results] == [0, 1, 2, 3]
+        assert "Invalid entry" in results[3]["error"]
+        assert len(mock_llm_service.batch_calls) == 1
+        assert len(persisted) == 1
+        
+        for result in results[:3]:
+            entry = await knowledge_service.get_entry(result["entry_id"])
+            assert entry is not None
+            assert knowledge_service.vector_store.get_embedding(result["entry_id"]) is not None
+    
+    @pytest.mark.asyncio
+    async def test_extract_preferences_batch(self, knowledge_service, mock_llm_service):
+        """Test extraction of several turns shares one LLM call, one preference save and one bulk write."""
+        prompts = []
+        options = []
+        
+        async def chat_completion(request, **kwargs):
+            prompts.append(request.messages[0].content)
+            options.append(kwargs)
+            return type("Response", (), {"content": (
+                '[{"conversation": 0, "category": "health", "key": "diet", "value": "vegetarian"},'
+                ' {"conversation": 0, "category": "user_id", "key": "name", "value": "Sam"},'
+                ' {"conversation": 1, "category": "finance", "key": ["budget"], "value": 100},'
+                ' {"conversation": 1, "category": "productivity", "key": "focus_time", "value": "mornings"}]'
+            )})()
+        
+        mock_llm_service.chat_completion = chat_completion
+        
+        # Malformed preferences (a non-dict category, a non-string key) are skipped, not fatal
+        entries = await knowledge_service.extract_and_store_preferences_batch([
+            {"user_input": "I don't eat meat", "agent_type": "health", "agent_response": "Noted."},
+            {"user_input": "I focus best in the morning", "agent_type": "productivity", "agent_response": "Got it."}
+        ])
+        
+        assert len(prompts) == 1
+        assert "Conversation 1" in prompts[0]
+        # Background extraction is never hedged: a duplicate would cost a whole long generation
+        assert not options[0].get("hedge")
+        assert [entry.metadata["agent_type"] for entry in entries] == ["health", "productivity"]
+        assert len(mock_llm_service.batch_calls) == 1
+        
+        preferences = (await knowledge_service.get_user_preferences()).model_dump()
+        assert preferences["health"]["diet"] == "vegetarian"
+        assert preferences["productivity"]["focus_time"] == "mornings"
+        assert preferences["user_id"] == "single_user"
+        system_entries = await knowledge_service.get_all_entries(category="system", entry_type=KnowledgeEntryType.PREFERENCE)
+        assert len(system_entries) == 1
+    
     @pytest.mark.asyncio
     async def test_get_and_update_entry(self, knowledge_service):
         """Test retrieving and updating entries."""
@@ -389,6 +965,59 @@ class TestKnowledgeBaseService:
         meeting_content = any("meeting" in r.entry.content.lower() for r in context)
         assert meeting_content
     
+    @pytest.mark.asyncio
+    async def test_contextual_knowledge_single_scan(self, knowledge_service, mock_llm_service):
+        """Test agent context embeds the query once, scans once and fills each bucket."""
+        # Identical embeddings for everything so every entry is a perfect match
+        async def constant_embedding(request):
+            mock_llm_service.embedding_calls.append(request.text)
+            return type("Response", (), {"embedding": [1.0] * 1536})()
+        mock_llm_service.generate_embedding = constant_embedding
+        
+        await knowledge_service.add_interaction_history(
+            agent_type="health",
+            user_input="Plan my meals",
+            agent_response="Here is a meal plan"
+        )
+        await knowledge_service.create_entry(
+            entry_type=KnowledgeEntryType.PREFERENCE,
+            entry_sub_type=KnowledgeEntrySubType.PERSONAL_PREFERENCE,
+            category="health",
+            title="Diet",
+            content="Low carb meals"
+        )
+        await knowledge_service.create_entry(
+            entry_type=KnowledgeEntryType.INSIGHT,
+            entry_sub_type=KnowledgeEntrySubType.IMPORTANT_INSIGHT,
+            category="journal",
+            title="Energy",
+            content="Energy is higher after light lunches"
+        )
+        
+        scans = []
+        original_search = knowledge_service.vector_store.search
+        knowledge_service.vector_store.search = lambda *args, **kwargs: scans.append(kwargs) or original_search(*args, **kwargs)
+        mock_llm_service.embedding_calls.clear()
+        
+        context = await knowledge_service.get_contextual_knowledge_for_agent("meal ideas", "health")
+        
+        assert len(mock_llm_service.embedding_calls) == 1
+        assert len(scans) == 1
+        assert scans[0]["similarity_threshold"] == 0.6
+        assert [i["content"] for i in context["relevant_interactions"]] == ["User: Plan my meals\nAgent (health): Here is a meal plan"]
+        assert [p["content"] for p in context["user_preferences"]] == ["Low carb meals"]
+        assert [p["content"] for p in context["patterns_and_insights"]] == ["Energy is higher after light lunches"]
+        assert "Found 2 related entries" in context["context_summary"]
+        
+        # A prefetched embedding is handed over instead of embedding the query again
+        mock_llm_service.embedding_calls.clear()
+        prefetched = await knowledge_service.prefetch_context("meal ideas")
+        prefetched_context = await knowledge_service.get_contextual_knowledge_for_agent(
+            "meal ideas", "health", prefetched=prefetched
+        )
+        assert mock_llm_service.embedding_calls == ["meal ideas"]
+        assert prefetched_context == context
+    
     @pytest.mark.asyncio
     async def test_get_all_entries_with_filters(self, knowledge_service):
         """Test retrieving entries with filters."""
@@ -449,6 +1078,44 @@ class TestKnowledgeBaseService:
         assert "health" in stats.entries_by_category
         assert isinstance(stats.last_updated, datetime)
 
+    @pytest.mark.asyncio
+    async def test_embeddings_visualization_streams_entries(self, knowledge_service):
+        """Test visualization data is streamed per entry with positions and similarity links."""
+        for i in range(3):
+            await knowledge_service.create_entry(
+                entry_type=KnowledgeEntryType.MEMORY,
+                entry_sub_type=KnowledgeEntrySubType.CORE_MEMORY,
+                category="journal",
+                title=f"Memory {i}",
+                content=f"Memory content {i}"
+            )
+
+        items = [item async for item in knowledge_service.iter_embeddings_visualization_data(batch_size=2)]
+
+        assert [item["title"] for item in items] == ["Memory 0", "Memory 1", "Memory 2"]
+        ids = {item["entry_id"] for item in items}
+        for item in items:
+            assert len(item["position_3d"]) == 3
+            assert len(item["embedding"]) == 10
+            assert all(link["target_id"] in ids - {item["entry_id"]} for link in item["similarities"])
+        
+        # A failure part-way reaches the consumer instead of silently ending the stream
+        get_entries = knowledge_service.vector_store.get_entries
+        calls = []
+        
+        def failing_get_entries(faiss_ids):
+            calls.append(faiss_ids)
+            if len(calls) > 1:
+                raise RuntimeError("metadata store unavailable")
+            return get_entries(faiss_ids)
+        
+        knowledge_service.vector_store.get_entries = failing_get_entries
+        streamed = []
+        with pytest.raises(RuntimeError):
+            async for item in knowledge_service.iter_embeddings_visualization_data(batch_size=2):
+                streamed.append(item)
+        assert len(streamed) == 2
+
 
 class TestRAGAccuracy:
     """Test RAG retrieval accuracy and relevance."""
@@ -546,5 +1213,93 @@ class TestRAGAccuracy:
         assert all(r.entry.category == "health" for r in health_context)
 
 
+class TestPostProcessingPipeline:
+    """Test the background post-processing pipeline."""
+    
+    class Recorder:
+        """Interaction recorder that fails a configurable number of times."""
+        
+        def __init__(self, failures=0):
+            self.failures = failures
+            self.recorded = []
+        
+        async def record_if_valuable(self, user_input, agent_response, agent_type):
+            if self.failures:
+                self.failures -= 1
+                raise RuntimeError("store unavailable")
+            self.recorded.append(user_input)
+    
+    class KnowledgeBase:
+        """Knowledge base stub whose batch extraction blocks until released."""
+        
+        def __init__(self):
+            self.batches = []
+            self.release = asyncio.Event()
+        
+        async def extract_and_store_preferences_batch(self, turns):
+            await self.release.wait()
+            self.batches.append([turn["user_input"] for turn in turns])
+            return []
+    
+    @pytest.fixture
+    def stubs(self, monkeypatch):
+        recorder, knowledge_base = self.Recorder(), self.KnowledgeBase()
+        monkeypatch.setattr("app.services.post_processing.get_interaction_recorder", lambda: recorder)
+        monkeypatch.setattr("app.services.post_processing.get_knowledge_base_service", lambda: knowledge_base)
+        return recorder, knowledge_base
+    
+    @pytest.mark.asyncio
+    async def test_submit_does_not_wait_and_batches_extractions(self, stubs):
+        """Test submitting returns at once and extractions of several turns share one batch."""
+        recorder, knowledge_base = stubs
+        pipeline = PostProcessingPipeline(workers=1, batch_size=8, batch_window=0.05)
+        
+        for i in range(3):
+            pipeline.submit(user_input=f"turn {i}", agent_response="ok", agent_type="health")
+        assert pipeline.get_stats()["submitted"] == 6
+        assert knowledge_base.batches == []
+        
+        knowledge_base.release.set()
+        assert await pipeline.flush(timeout=2.0)
+        
+        assert knowledge_base.batches == [["turn 0", "turn 1", "turn 2"]]
+        assert recorder.recorded == ["turn 0", "turn 1", "turn 2"]
+        assert pipeline.get_stats()["completed"] == 6
+        await pipeline.close()
+    
+    @pytest.mark.asyncio
+    async def test_full_queue_drops_oldest_job(self, stubs):
+        """Test a full queue drops its oldest job instead of blocking the caller."""
+        recorder, knowledge_base = stubs
+        pipeline = PostProcessingPipeline(max_queue_size=2, workers=1, batch_window=0.0)
+        
+        for i in range(3):
+            pipeline.submit(user_input=f"turn {i}", agent_response="ok", agent_type="health", extract_preferences=False)
+        assert pipeline.get_stats()["dropped_queue_full"] == 1
+        
+        assert await pipeline.flush(timeout=2.0)
+        assert recorder.recorded == ["turn 1", "turn 2"]
+        await pipeline.close()
+    
+    @pytest.mark.asyncio
+    async def test_failed_jobs_are_retried_then_dropped(self, stubs):
+        """Test failing jobs are retried with backoff and dropped after max_attempts."""
+        recorder, knowledge_base = stubs
+        recorder.failures = 1
+        pipeline = PostProcessingPipeline(workers=1, batch_window=0.0, max_attempts=2, retry_backoff=0.01)
+        
+        pipeline.submit(user_input="flaky", agent_response="ok", agent_type="health", extract_preferences=False)
+        assert await pipeline.flush(timeout=2.0)
+        assert recorder.recorded == ["flaky"]
+        assert pipeline.get_stats()["retried"] == 1
+        
+        recorder.failures = 2
+        pipeline.submit(user_input="broken", agent_response="ok", agent_type="health", extract_preferences=False)
+        assert await pipeline.flush(timeout=2.0)
+        assert recorder.recorded == ["flaky"]
+        assert pipeline.get_stats()["dropped_failed"] == 1
+        await pipeline.close()
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
\ No newline at end of file
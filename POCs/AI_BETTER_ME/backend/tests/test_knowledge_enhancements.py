@@ -113,7 +113,11 @@ class TestEmbeddingsVisualization:
             }
         ]
         
-        mock_knowledge_service.get_embeddings_visualization_data.return_value = mock_data
+        async def iter_visualization_data():
+            for item in mock_data:
+                yield item
+        
+        mock_knowledge_service.iter_embeddings_visualization_data = iter_visualization_data
         
         with patch('app.api.knowledge.get_knowledge_base_service', return_value=mock_knowledge_service):
             from fastapi import FastAPI
@@ -4,6 +4,7 @@ Unit tests for LLM providers, factory, and service.
 
 import pytest
 import asyncio
+import numpy as np
 from unittest.mock import Mock, AsyncMock, patch
 from typing import List
 
@@ -21,6 +22,11 @@ from app.llm.openai_provider import OpenAIProvider
 from app.llm.ollama_provider import OllamaProvider
 from app.llm.factory import LLMProviderFactory
 from app.llm.service import LLMService
+from app.llm.embedding_cache import EmbeddingCache
+from app.llm.circuit_breaker import CircuitBreaker
+from app.llm.latency import LatencyTracker, HedgeBudget
+from app.llm.concurrency import AdaptiveLimiter, CallPriority
+from app.llm.response_cache import ResponseCache
 
 
 class TestLLMConfig:
@@ -138,6 +144,36 @@ class TestOpenAIProvider:
             assert isinstance(response, EmbeddingResponse)
             assert response.embedding == mock_embedding
     
+    @pytest.mark.asyncio
+    async def test_batch_embedding_generation(self, openai_provider):
+        """Test batch embeddings are split by item limit and returned as one float32 matrix."""
+        mock_instance = AsyncMock()
+        mock_instance.aembed_documents.side_effect = lambda texts: [[float(len(text)), 1.0] for text in texts]
+        
+        openai_provider._embeddings_model = mock_instance
+        openai_provider._is_initialized = True
+        openai_provider.embedding_batch_size = 2
+        
+        texts = ["a", "bb", "ccc", "dddd", "eeeee"]
+        embeddings = await openai_provider.generate_embeddings(texts)
+        
+        assert embeddings.dtype == np.float32
+        assert embeddings.shape == (5, 2)
+        assert embeddings.flags["C_CONTIGUOUS"]
+        assert embeddings[:, 0].tolist() == [1.0, 2.0, 3.0, 4.0, 5.0]
+        assert mock_instance.aembed_documents.call_count == 3
+    
+    def test_embedding_batches_respect_token_limit(self, openai_provider):
+        """Test batch splitting closes a batch before it exceeds the token budget."""
+        openai_provider.embedding_batch_max_tokens = 10
+        texts = ["x" * 20, "x" * 20, "x" * 60, "short"]
+        
+        # Each 20-char text is ~6 tokens, the 60-char text alone exceeds the budget
+        assert openai_provider._split_embedding_batches(texts) == [(0, 1), (1, 2), (2, 3), (3, 4)]
+        
+        openai_provider.embedding_batch_max_tokens = 100
+        assert openai_provider._split_embedding_batches(texts) == [(0, 4)]
+    
     def test_get_available_models(self, openai_provider):
         """Test getting available models."""
         models = openai_provider.get_available_models()
@@ -171,44 +207,163 @@ class TestOllamaProvider:
             assert ollama_provider.is_initialized is True
     
     @pytest.mark.asyncio
-    async def test_chat_completion(self, ollama_provider):
+    async def test_chat_completion(self):
         """Test chat completion."""
-        mock_response = "Hello! How can I help you?"
-        
-        with patch('app.llm.ollama_provider.Ollama') as mock_ollama:
-            mock_instance = AsyncMock()
-            mock_instance.ainvoke.return_value = mock_response
-            mock_ollama.return_value = mock_instance
-            
-            ollama_provider._chat_model = mock_instance
-            ollama_provider._is_initialized = True
+        events = []
+        runner, endpoint = await self._start_chat_server(["Hello! ", "How can I help you?"], 0, events)
+        try:
+            provider = OllamaProvider(endpoint=endpoint, model="llama2")
+            provider._is_initialized = True
             
             request = CompletionRequest(
-                messages=[ChatMessage(role="user", content="Hello")]
+                messages=[ChatMessage(role="user", content="Hello")],
+                temperature=0.3
             )
             
-            response = await ollama_provider.chat_completion(request)
+            response = await provider.chat_completion(request)
             
             assert isinstance(response, CompletionResponse)
-            assert response.content == mock_response
+            assert response.content == "Hello! How can I help you?"
             assert response.model == "llama2"
+            assert response.usage["total_tokens"] == 7
+            body = events[1][1]
+            assert body["stream"] is False
+            assert body["options"]["temperature"] == 0.3
+            await provider.close()
+        finally:
+            await runner.cleanup()
     
-    def test_message_formatting(self, ollama_provider):
-        """Test message formatting for Ollama."""
-        messages = [
-            ChatMessage(role="system", content="You are a helpful assistant."),
-            ChatMessage(role="user", content="Hello"),
-            ChatMessage(role="assistant", content="Hi there!"),
-            ChatMessage(role="user", content="How are you?")
-        ]
+    @pytest.mark.asyncio
+    async def test_chat_completion_reuses_pooled_connection(self):
+        """Benchmark per-call overhead of the pooled session against a session per call."""
+        import time
+        import aiohttp
+        
+        events = []
+        runner, endpoint = await self._start_chat_server(["ok"], 0, events)
+        calls = 50
+        try:
+            provider = OllamaProvider(endpoint=endpoint, model="llama2")
+            provider._is_initialized = True
+            request = CompletionRequest(messages=[ChatMessage(role="user", content="Hi")], temperature=0.5)
+            payload = provider._chat_payload(request, False)
+            
+            # Before: a new client (and connection) for every call
+            started = time.perf_counter()
+            for _ in range(calls):
+                async with aiohttp.ClientSession() as session:
+                    async with session.post(f"{endpoint}/api/chat", json=payload) as response:
+                        await response.json()
+            per_call_before = (time.perf_counter() - started) / calls
+            connections_before = len({peer for kind, peer in events if kind == "peer"})
+            events.clear()
+            
+            # After: every call goes through the provider's pooled session
+            await provider.chat_completion(request)
+            started = time.perf_counter()
+            for _ in range(calls):
+                await provider.chat_completion(request)
+            per_call_after = (time.perf_counter() - started) / calls
+            connections_after = len({peer for kind, peer in events if kind == "peer"})
+            await provider.close()
+            
+            print(f"\nOllama per-call overhead: {per_call_before * 1000:.2f}ms with a session per call, "
+                  f"{per_call_after * 1000:.2f}ms pooled")
+            assert connections_before == calls
+            assert connections_after == 1
+            assert per_call_after < per_call_before
+        finally:
+            await runner.cleanup()
+    
+    @staticmethod
+    async def _start_chat_server(tokens, delay, events):
+        """Serve a fake /api/chat that streams one NDJSON line per token (or answers in one body)."""
+        import json
+        from aiohttp import web
+        
+        async def chat(request):
+            body = await request.json()
+            events.append(("peer", request.transport.get_extra_info("peername")))
+            events.append(("request", body))
+            if not body.get("stream", True):
+                return web.json_response({
+                    "message": {"role": "assistant", "content": "".join(tokens)},
+                    "done": True,
+                    "prompt_eval_count": 5,
+                    "eval_count": 2
+                })
+            response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+            await response.prepare(request)
+            try:
+                for token in tokens:
+                    line = {"message": {"role": "assistant", "content": token}, "done": False}
+                    await response.write((json.dumps(line) + "\n").encode())
+                    await asyncio.sleep(delay)
+                await response.write((json.dumps({"message": {"content": ""}, "done": True}) + "\n").encode())
+                events.append(("finished", None))
+            except (ConnectionResetError, asyncio.CancelledError):
+                events.append(("disconnected", None))
+                raise
+            return response
         
-        formatted = ollama_provider._format_messages_for_ollama(messages)
+        app = web.Application()
+        app.router.add_post("/api/chat", chat)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return runner, f"http://127.0.0.1:{port}"
+    
+    @pytest.mark.asyncio
+    async def test_chat_completion_stream_yields_tokens_incrementally(self):
+        """Test tokens are yielded as Ollama emits them, not after generation finishes."""
+        import time
         
-        assert "System: You are a helpful assistant." in formatted
-        assert "Human: Hello" in formatted
-        assert "Assistant: Hi there!" in formatted
-        assert "Human: How are you?" in formatted
-        assert formatted.endswith("Assistant:")
+        events = []
+        runner, endpoint = await self._start_chat_server(["Hel", "lo", "!"], 0.2, events)
+        try:
+            provider = OllamaProvider(endpoint=endpoint, model="llama2")
+            provider._is_initialized = True
+            request = CompletionRequest(messages=[ChatMessage(role="user", content="Hi")], temperature=0.1)
+            
+            started = time.perf_counter()
+            chunks, first_chunk_at = [], None
+            async for chunk in provider.chat_completion_stream(request):
+                first_chunk_at = first_chunk_at or time.perf_counter() - started
+                chunks.append(chunk)
+            
+            assert chunks == ["Hel", "lo", "!"]
+            assert first_chunk_at < 0.15
+            body = events[1][1]
+            assert body["stream"] is True
+            assert body["options"]["temperature"] == 0.1
+            assert body["messages"] == [{"role": "user", "content": "Hi"}]
+        finally:
+            await runner.cleanup()
+    
+    @pytest.mark.asyncio
+    async def test_chat_completion_stream_cancels_on_close(self):
+        """Test closing the stream early drops the connection so the server stops generating."""
+        events = []
+        runner, endpoint = await self._start_chat_server(["tok"] * 50, 0.02, events)
+        try:
+            provider = OllamaProvider(endpoint=endpoint, model="llama2")
+            provider._is_initialized = True
+            
+            stream = provider.chat_completion_stream(
+                CompletionRequest(messages=[ChatMessage(role="user", content="Hi")])
+            )
+            assert await stream.__anext__() == "tok"
+            await stream.aclose()
+            
+            for _ in range(100):
+                if len(events) > 2:
+                    break
+                await asyncio.sleep(0.02)
+            assert events[-1][0] == "disconnected"
+        finally:
+            await runner.cleanup()
     
     def test_get_available_models(self, ollama_provider):
         """Test getting available models."""
@@ -268,6 +423,8 @@ class TestLLMProviderFactory:
             assert factory._current_provider is not None
             assert factory._fallback_provider is not None
             assert len(factory._providers) == 2
+            
+            await factory.shutdown()
     
     @pytest.mark.asyncio
     async def test_provider_fallback(self, factory):
@@ -323,6 +480,269 @@ class TestLLMProviderFactory:
         
         assert success is True
         assert factory._current_provider == openai_provider
+    
+    @staticmethod
+    def _slow_provider(provider_type, delay, is_healthy=True):
+        """Create a mock provider whose health check takes delay seconds."""
+        async def health_check():
+            await asyncio.sleep(delay)
+            return HealthCheckResult(is_healthy=is_healthy, provider_type=provider_type, error=None if is_healthy else "down")
+        
+        provider = AsyncMock()
+        provider.provider_type = provider_type
+        provider.health_check = health_check
+        return provider
+    
+    @pytest.mark.asyncio
+    async def test_get_provider_does_not_wait_for_health_checks(self, factory):
+        """Test get_provider reads the snapshot while slow probes run in the background."""
+        primary = self._slow_provider(LLMProviderType.OPENAI, 5.0)
+        factory._providers = {LLMProviderType.OPENAI: primary}
+        factory._current_provider = primary
+        factory._start_health_monitor()
+        await asyncio.sleep(0)
+        
+        try:
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            provider = await factory.get_provider()
+            assert provider is primary
+            assert loop.time() - started < 0.1
+        finally:
+            await factory.shutdown()
+        assert factory._health_task is None
+    
+    @pytest.mark.asyncio
+    async def test_probes_run_concurrently_and_publish_snapshot(self, factory):
+        """Test a probe round checks providers in parallel and swaps in a new snapshot."""
+        factory._providers = {
+            LLMProviderType.OPENAI: self._slow_provider(LLMProviderType.OPENAI, 0.2, is_healthy=False),
+            LLMProviderType.OLLAMA: self._slow_provider(LLMProviderType.OLLAMA, 0.2)
+        }
+        factory._current_provider = factory._providers[LLMProviderType.OPENAI]
+        factory._fallback_provider = factory._providers[LLMProviderType.OLLAMA]
+        before = factory._health_status
+        
+        started = asyncio.get_running_loop().time()
+        await factory._probe_providers()
+        assert asyncio.get_running_loop().time() - started < 0.35
+        
+        assert before == {}
+        assert factory._health_status is not before
+        assert factory._is_provider_healthy(LLMProviderType.OLLAMA)
+        assert not factory._is_provider_healthy(LLMProviderType.OPENAI)
+        assert await factory.get_provider() is factory._providers[LLMProviderType.OLLAMA]
+    
+    @pytest.mark.asyncio
+    async def test_failing_calls_open_circuit_and_fall_back(self):
+        """Test passive failures open the primary's breaker and route to the fallback."""
+        config = LLMConfig(
+            provider=LLMProviderType.OPENAI,
+            fallback_provider=LLMProviderType.OLLAMA,
+            circuit_failure_threshold=2,
+            circuit_reset_timeout=0.05
+        )
+        factory = LLMProviderFactory(config)
+        primary = self._slow_provider(LLMProviderType.OPENAI, 0)
+        fallback = self._slow_provider(LLMProviderType.OLLAMA, 0)
+        factory._providers = {LLMProviderType.OPENAI: primary, LLMProviderType.OLLAMA: fallback}
+        factory._current_provider = primary
+        factory._fallback_provider = fallback
+        
+        factory.record_failure(LLMProviderType.OPENAI, "timeout")
+        assert await factory.get_provider() is primary
+        factory.record_failure(LLMProviderType.OPENAI, "timeout")
+        
+        assert factory.get_circuit_status()[LLMProviderType.OPENAI]["state"] == CircuitBreaker.OPEN
+        assert await factory.get_provider() is fallback
+        
+        # After the reset timeout a probe acts as the half-open trial and closes the breaker
+        await asyncio.sleep(0.06)
+        await factory._probe_providers()
+        assert factory.get_circuit_status()[LLMProviderType.OPENAI]["state"] == CircuitBreaker.CLOSED
+    
+    @pytest.mark.asyncio
+    async def test_latency_routing_prefers_consistently_faster_provider(self):
+        """Test calls go to a healthy provider whose EWMA latency is well below the preferred one's."""
+        factory = LLMProviderFactory(LLMConfig(latency_explore_ratio=0.0, latency_min_samples=5))
+        primary = self._slow_provider(LLMProviderType.OPENAI, 0)
+        fallback = self._slow_provider(LLMProviderType.OLLAMA, 0)
+        factory._providers = {LLMProviderType.OPENAI: primary, LLMProviderType.OLLAMA: fallback}
+        factory._current_provider = primary
+        factory._fallback_provider = fallback
+        
+        for _ in range(5):
+            factory.record_success(LLMProviderType.OPENAI, 1.0)
+        assert await factory.get_provider() is primary
+        
+        for _ in range(5):
+            factory.record_success(LLMProviderType.OLLAMA, 0.2)
+        assert await factory.get_provider() is fallback
+        assert factory._current_provider is primary
+        assert factory.get_hedge_delay(LLMProviderType.OPENAI) >= 1.0
+        
+        # A slower alternative within the switch ratio does not win
+        for _ in range(20):
+            factory.record_success(LLMProviderType.OLLAMA, 0.9)
+        assert await factory.get_provider() is primary
+    
+    def test_hedge_delay_follows_the_call_class(self):
+        """Test long generations on a provider do not raise the hedging delay of its short calls."""
+        factory = LLMProviderFactory(LLMConfig(latency_min_samples=5))
+        factory._providers = {LLMProviderType.OPENAI: self._slow_provider(LLMProviderType.OPENAI, 0)}
+        
+        for _ in range(20):
+            factory.record_success(LLMProviderType.OPENAI, 4.0, "preference_extraction")
+        for _ in range(5):
+            factory.record_success(LLMProviderType.OPENAI, 0.1, "intent_classification")
+        
+        assert factory.get_hedge_delay(LLMProviderType.OPENAI, "intent_classification") <= 0.15
+        assert factory.get_hedge_delay(LLMProviderType.OPENAI, "preference_extraction") >= 4.0
+        # Too few samples in a class: the configured minimum delay
+        factory.record_success(LLMProviderType.OPENAI, 0.5, "fan_out_synthesis")
+        assert factory.get_hedge_delay(LLMProviderType.OPENAI, "fan_out_synthesis") == factory.config.hedge_min_delay
+        
+        stats = factory.get_latency_stats()[LLMProviderType.OPENAI]
+        assert stats["samples"] == 26
+        assert stats["routes"]["intent_classification"]["samples"] == 5
+    
+    @pytest.mark.asyncio
+    async def test_embedding_provider_ignores_latency_routing(self):
+        """Test embeddings stay on the current provider however fast another one is, until it goes down."""
+        factory = LLMProviderFactory(LLMConfig(latency_explore_ratio=1.0, latency_min_samples=1))
+        primary = self._slow_provider(LLMProviderType.OPENAI, 0)
+        fallback = self._slow_provider(LLMProviderType.OLLAMA, 0)
+        factory._providers = {LLMProviderType.OPENAI: primary, LLMProviderType.OLLAMA: fallback}
+        factory._current_provider = primary
+        factory._fallback_provider = fallback
+        factory.record_success(LLMProviderType.OPENAI, 1.0)
+        factory.record_success(LLMProviderType.OLLAMA, 0.1)
+        
+        for _ in range(20):
+            assert await factory.get_embedding_provider() is primary
+        
+        factory._publish_health(LLMProviderType.OPENAI, HealthCheckResult(
+            is_healthy=False, provider_type=LLMProviderType.OPENAI, error="down"
+        ))
+        assert await factory.get_embedding_provider() is fallback
+
+
+class TestLatencyTracker:
+    """Test latency tracking and hedge budget."""
+    
+    def test_ewma_and_percentiles(self):
+        """Test the EWMA follows recent samples and percentiles come from the histogram."""
+        tracker = LatencyTracker(alpha=0.5)
+        for _ in range(95):
+            tracker.record(0.1)
+        for _ in range(5):
+            tracker.record(2.0)
+        
+        assert tracker.ewma > 1.0
+        assert 0.1 <= tracker.percentile(0.5) < 0.13
+        assert tracker.percentile(0.99) >= 2.0
+        assert tracker.get_stats()["samples"] == 100
+    
+    def test_hedge_budget_caps_hedges(self):
+        """Test the budget allows a burst and then roughly ratio hedges per request."""
+        budget = HedgeBudget(ratio=0.1, burst=2.0)
+        assert budget.try_spend() and budget.try_spend()
+        assert not budget.try_spend()
+        for _ in range(11):
+            budget.on_request()
+        assert budget.try_spend()
+        assert not budget.try_spend()
+
+
+class TestAdaptiveLimiter:
+    """Test adaptive concurrency limiting and priority admission."""
+    
+    @pytest.mark.asyncio
+    async def test_interactive_calls_admitted_before_background(self):
+        """Test queued calls are admitted by priority, then arrival, and cancelled waiters are skipped."""
+        limiter = AdaptiveLimiter(max_limit=4, initial_limit=1)
+        await limiter.acquire(CallPriority.INTERACTIVE)
+        admitted = []
+        
+        async def call(name, priority):
+            await limiter.acquire(priority)
+            admitted.append(name)
+        
+        tasks = [
+            asyncio.create_task(call("background", CallPriority.BACKGROUND)),
+            asyncio.create_task(call("cancelled", CallPriority.INTERACTIVE)),
+            asyncio.create_task(call("interactive", CallPriority.INTERACTIVE))
+        ]
+        await asyncio.sleep(0.01)
+        assert limiter.queued() == 3
+        tasks[1].cancel()
+        await asyncio.sleep(0)
+        
+        limiter.release()
+        await asyncio.sleep(0)
+        assert admitted == ["interactive"]
+        limiter.release()
+        await asyncio.gather(tasks[0], tasks[2])
+        assert admitted == ["interactive", "background"]
+        
+        stats = limiter.get_stats()
+        assert stats["in_flight"] == 1
+        assert stats["queues"]["interactive"]["admitted"] == 2
+        assert stats["queues"]["background"]["wait_max_ms"] > 0
+    
+    @pytest.mark.asyncio
+    async def test_limit_grows_when_saturated_and_backs_off_on_latency(self):
+        """Test additive increase under saturation at baseline latency and multiplicative decrease on slow calls."""
+        limiter = AdaptiveLimiter(max_limit=16, initial_limit=4, latency_tolerance=2.0, backoff=0.5)
+        await limiter.acquire()
+        limiter.release(0.01)
+        
+        for _ in range(20):
+            for _ in range(limiter.limit):
+                await limiter.acquire()
+            for _ in range(limiter.in_flight):
+                limiter.release(0.01)
+        grown = limiter.limit
+        assert grown > 4
+        
+        await limiter.acquire()
+        limiter.release(0.5)
+        assert limiter.limit == int(grown * 0.5)
+        
+        # A failure right after a cut is the same overload episode
+        await limiter.acquire()
+        limiter.release(None, success=False)
+        assert limiter.limit == int(grown * 0.5)
+
+
+class TestCircuitBreaker:
+    """Test circuit breaker state transitions."""
+    
+    def test_opens_at_threshold_and_allows_single_trial(self):
+        """Test the breaker opens after consecutive failures and lets one trial through when half-open."""
+        breaker = CircuitBreaker(failure_threshold=3, reset_timeout=0.05)
+        breaker.record_failure("a")
+        breaker.record_success()
+        for _ in range(3):
+            assert breaker.try_acquire()
+            breaker.record_failure("b")
+        
+        assert breaker.state == CircuitBreaker.OPEN
+        assert not breaker.try_acquire()
+        
+        import time
+        time.sleep(0.06)
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        assert breaker.try_acquire()
+        assert not breaker.try_acquire()
+        
+        breaker.record_failure("c")
+        assert breaker.state == CircuitBreaker.OPEN
+        time.sleep(0.06)
+        assert breaker.try_acquire()
+        breaker.record_success()
+        assert breaker.state == CircuitBreaker.CLOSED
+        assert breaker.get_stats()["consecutive_failures"] == 0
 
 
 class TestLLMService:
@@ -374,6 +794,98 @@ class TestLLMService:
             assert response == mock_response
             mock_provider.chat_completion.assert_called_once_with(request)
     
+    @staticmethod
+    def _timed_provider(provider_type, delay, content):
+        """Create a mock provider answering chat completions after delay seconds."""
+        async def chat_completion(request):
+            await asyncio.sleep(delay)
+            return CompletionResponse(content=content, model="test")
+        
+        provider = AsyncMock()
+        provider.provider_type = provider_type
+        provider.chat_completion = chat_completion
+        return provider
+    
+    @pytest.mark.asyncio
+    async def test_hedged_completion_returns_faster_backup(self):
+        """Test a slow hedged call is duplicated to the other provider and the first answer wins."""
+        service = LLMService(LLMConfig(hedge_min_delay=0.05, latency_routing_enabled=False))
+        primary = self._timed_provider(LLMProviderType.OLLAMA, 0.5, "primary")
+        backup = self._timed_provider(LLMProviderType.OPENAI, 0.01, "backup")
+        service.factory._providers = {LLMProviderType.OLLAMA: primary, LLMProviderType.OPENAI: backup}
+        service.factory._current_provider = primary
+        service.factory._fallback_provider = backup
+        service._hedge_budget = HedgeBudget(ratio=0.0, burst=1.0)
+        service._initialized = True
+        request = CompletionRequest(messages=[ChatMessage(role="user", content="Classify")])
+        
+        started = asyncio.get_running_loop().time()
+        response = await service.chat_completion(request, hedge=True)
+        assert response.content == "backup"
+        assert asyncio.get_running_loop().time() - started < 0.3
+        
+        # Budget exhausted: the next slow call waits for the primary
+        response = await service.chat_completion(request, hedge=True)
+        assert response.content == "primary"
+        
+        stats = service.get_routing_stats()
+        assert stats["hedges_sent"] == 1
+        assert stats["hedges_won"] == 1
+        assert stats["latency"]["openai"]["samples"] == 1
+        assert stats["latency"]["ollama"]["samples"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_concurrent_calls_queue_at_provider_limit(self):
+        """Test calls beyond the provider's concurrency limit wait and report queue time."""
+        service = LLMService(LLMConfig(ollama_max_concurrency=4, latency_routing_enabled=False))
+        provider = self._timed_provider(LLMProviderType.OLLAMA, 0.1, "ok")
+        service.factory._providers = {LLMProviderType.OLLAMA: provider}
+        service.factory._current_provider = provider
+        service._initialized = True
+        request = CompletionRequest(messages=[ChatMessage(role="user", content="Hi")])
+        
+        started = asyncio.get_running_loop().time()
+        await asyncio.gather(
+            service.chat_completion(request),
+            service.chat_completion(request, priority=CallPriority.BACKGROUND)
+        )
+        
+        # Ollama starts at a quarter of its maximum: one call at a time
+        assert asyncio.get_running_loop().time() - started >= 0.2
+        stats = service.get_concurrency_stats()["ollama"]
+        # The second call ran saturated at baseline latency, so the limit grew by one
+        assert stats["limit"] == 2
+        assert stats["queues"]["interactive"]["wait_max_ms"] == 0.0
+        assert stats["queues"]["background"]["wait_max_ms"] >= 90
+    
+    @pytest.mark.asyncio
+    async def test_stream_records_time_to_first_token(self):
+        """Test a streamed call records its time to first token apart from whole-call latencies."""
+        service = LLMService(LLMConfig(latency_routing_enabled=False, response_cache_enabled=False))
+        
+        async def chat_completion_stream(request):
+            await asyncio.sleep(0.05)
+            yield "Hello "
+            await asyncio.sleep(0.5)
+            yield "there"
+        
+        provider = AsyncMock()
+        provider.provider_type = LLMProviderType.OLLAMA
+        provider.chat_completion_stream = chat_completion_stream
+        service.factory._providers = {LLMProviderType.OLLAMA: provider}
+        service.factory._current_provider = provider
+        service._initialized = True
+        request = CompletionRequest(messages=[ChatMessage(role="user", content="Hi")])
+        
+        chunks = [chunk async for chunk in service.chat_completion_stream(request, cache_route="format_response")]
+        assert "".join(chunks) == "Hello there"
+        
+        stats = service.get_routing_stats()
+        assert stats["latency"] == {}
+        first_token = stats["first_token"]["ollama"]["format_response"]
+        assert first_token["samples"] == 1
+        assert 40 <= first_token["ewma_ms"] < 500
+    
     @pytest.mark.asyncio
     async def test_provider_switching_service(self, service):
         """Test provider switching through service."""
@@ -386,6 +898,29 @@ class TestLLMService:
             assert result is True
             mock_switch.assert_called_once_with(LLMProviderType.OLLAMA)
 
+    
+    @pytest.mark.asyncio
+    async def test_update_config_shuts_down_previous_factory(self, service):
+        """Test a config update shuts the replaced factory down and a failed one keeps it."""
+        previous = service.factory
+        with patch.object(LLMProviderFactory, 'initialize', AsyncMock()), \
+             patch.object(LLMProviderFactory, 'shutdown', AsyncMock()) as mock_shutdown:
+            new_config = LLMConfig(provider=LLMProviderType.OLLAMA)
+            assert await service.update_config(new_config) is True
+            
+            assert service.factory is not previous
+            assert service.config is new_config
+            mock_shutdown.assert_awaited_once()
+        
+        current = service.factory
+        with patch.object(LLMProviderFactory, 'initialize', AsyncMock(side_effect=Exception("no provider"))), \
+             patch.object(LLMProviderFactory, 'shutdown', AsyncMock()) as mock_shutdown:
+            assert await service.update_config(LLMConfig(provider=LLMProviderType.OPENAI)) is False
+            
+            assert service.factory is current
+            assert service.config is new_config
+            mock_shutdown.assert_awaited_once()
+
 
 # Integration test for provider switching and fallback scenarios
 class TestProviderIntegration:
@@ -432,5 +967,162 @@ class TestProviderIntegration:
                 pass
 
 
+class TestEmbeddingCache:
+    """Test the content-addressed embedding cache."""
+    
+    def test_lru_eviction_and_disk_tier(self, tmp_path):
+        """Test evicted entries are still served from the on-disk tier."""
+        cache = EmbeddingCache(max_entries=2, db_path=str(tmp_path / "cache.db"))
+        namespace = EmbeddingCache.make_namespace("openai", "text-embedding-ada-002", 3)
+        
+        cache.put_many(namespace, ["a", "b", "c"], np.eye(3, dtype=np.float32))
+        
+        assert cache.get_stats()["memory_entries"] == 2
+        assert cache.get(namespace, "a").tolist() == [1.0, 0.0, 0.0]
+        assert cache.get(namespace, "c").tolist() == [0.0, 0.0, 1.0]
+        assert cache.get(EmbeddingCache.make_namespace("ollama", "llama3", 3), "a") is None
+        
+        stats = cache.get_stats()
+        assert stats["disk_hits"] == 1
+        assert stats["memory_hits"] == 1
+        assert stats["misses"] == 1
+        
+        # A fresh process reads the on-disk tier
+        cache.close()
+        reopened = EmbeddingCache(max_entries=2, db_path=str(tmp_path / "cache.db"))
+        assert reopened.get(namespace, "b").tolist() == [0.0, 1.0, 0.0]
+    
+    def test_invalidate_namespace(self, tmp_path):
+        """Test invalidation only drops the given namespace from both tiers."""
+        cache = EmbeddingCache(db_path=str(tmp_path / "cache.db"))
+        cache.put("openai:a:2", "text", [1.0, 2.0])
+        cache.put("ollama:b:2", "text", [3.0, 4.0])
+        
+        cache.invalidate("openai:a:2")
+        
+        assert cache.get("openai:a:2", "text") is None
+        assert cache.get("ollama:b:2", "text").tolist() == [3.0, 4.0]
+    
+    @pytest.mark.asyncio
+    async def test_service_serves_repeat_embeddings_from_cache(self):
+        """Test LLMService embeds a text once and serves repeats from the cache."""
+        service = LLMService(LLMConfig(provider=LLMProviderType.OPENAI, openai_api_key="test-key"))
+        service._embedding_cache = EmbeddingCache(db_path=None)
+        service._initialized = True
+        
+        provider = OpenAIProvider(api_key="test-key")
+        provider._is_initialized = True
+        provider._embeddings_model = AsyncMock()
+        provider._embeddings_model.aembed_query.return_value = [0.5, 0.5]
+        provider._embeddings_model.aembed_documents.side_effect = lambda texts: [[float(len(t)), 0.0] for t in texts]
+        
+        with patch.object(service.factory, 'get_embedding_provider', AsyncMock(return_value=provider)):
+            first = await service.generate_embedding(EmbeddingRequest(text="hello"))
+            second = await service.generate_embedding(EmbeddingRequest(text="hello"))
+            matrix = await service.generate_embeddings(["hello", "hey", "hey"])
+        
+        assert first.embedding == second.embedding == [0.5, 0.5]
+        assert provider._embeddings_model.aembed_query.call_count == 1
+        provider._embeddings_model.aembed_documents.assert_called_once_with(["hey"])
+        assert matrix.tolist() == [[0.5, 0.5], [3.0, 0.0], [3.0, 0.0]]
+        assert service.get_embedding_cache_stats()["hit_rate"] > 0
+
+
+class TestResponseCache:
+    """Test the chat response cache."""
+    
+    @staticmethod
+    def _request(*messages, temperature=0.0):
+        """Build a completion request from (role, content) pairs."""
+        return CompletionRequest(
+            messages=[ChatMessage(role=role, content=content) for role, content in messages],
+            temperature=temperature,
+            max_tokens=100
+        )
+    
+    def test_exact_tier_normalizes_whitespace_and_expires(self):
+        """Test formatting-only differences share an entry and entries expire after their TTL."""
+        import time
+        
+        cache = ResponseCache(max_entries=2)
+        key, _, _ = cache.make_keys("ollama:llama3", self._request(("user", "Plan  my\nday")), 0.0)
+        same, _, _ = cache.make_keys("ollama:llama3", self._request(("user", " Plan my day ")), 0.0)
+        other_model, _, _ = cache.make_keys("openai:gpt-4", self._request(("user", "Plan my day")), 0.0)
+        assert key == same != other_model
+        
+        cache.put(key, CompletionResponse(content="Start with your top task."), ttl=0.05)
+        assert cache.get(key, "plan").content == "Start with your top task."
+        time.sleep(0.06)
+        assert cache.get(key, "plan") is None
+        
+        for i in range(3):
+            cache.put(f"k{i}", CompletionResponse(content=str(i)))
+        assert cache.get("k0") is None
+        assert cache.get_stats()["entries"] == 2
+    
+    def test_semantic_tier_requires_same_context(self):
+        """Test a similar query hits only when the earlier messages and parameters match."""
+        cache = ResponseCache(similarity_threshold=0.9)
+        request = self._request(("system", "Classify intents."), ("user", "I need to save money"))
+        exact_key, context_key, query = cache.make_keys("ollama:llama3", request, 0.0)
+        assert query == "I need to save money"
+        cache.put(exact_key, CompletionResponse(content="FINANCE"), context_key, [1.0, 0.0, 0.0])
+        
+        _, paraphrase_context, _ = cache.make_keys(
+            "ollama:llama3", self._request(("system", "Classify intents."), ("user", "Help me save cash")), 0.0
+        )
+        _, other_context, _ = cache.make_keys(
+            "ollama:llama3", self._request(("system", "Summarize."), ("user", "Help me save cash")), 0.0
+        )
+        assert paraphrase_context == context_key
+        assert cache.get_similar(context_key, [0.95, 0.1, 0.0], "intent").content == "FINANCE"
+        assert cache.get_similar(context_key, [0.0, 1.0, 0.0], "intent") is None
+        assert cache.get_similar(other_context, [1.0, 0.0, 0.0], "intent") is None
+        assert cache.get_stats()["routes"]["intent"]["semantic_hits"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_service_caches_deterministic_requests_per_route(self):
+        """Test chat_completion reuses greedy answers, samples only on opt-in, and reports saved tokens."""
+        service = LLMService(LLMConfig(response_cache_semantic_enabled=True, response_cache_similarity_threshold=0.9))
+        service._initialized = True
+        provider = AsyncMock()
+        provider.provider_type = LLMProviderType.OLLAMA
+        provider.model = "llama3"
+        provider.chat_completion.return_value = CompletionResponse(
+            content="FINANCE", usage={"total_tokens": 120}
+        )
+        
+        embeddings = {"I need to save money": [1.0, 0.0], "Help me save money": [0.98, 0.05], "Walk more": [0.0, 1.0]}
+        
+        async def generate_embedding(request):
+            return EmbeddingResponse(embedding=embeddings[request.text])
+        
+        with patch.object(service.factory, 'get_provider', AsyncMock(return_value=provider)), \
+             patch.object(service, 'generate_embedding', generate_embedding):
+            greedy = self._request(("user", "I need to save money"))
+            await service.chat_completion(greedy, cache_route="intent")
+            await service.chat_completion(greedy, cache_route="intent")
+            await service.chat_completion(self._request(("user", "Help me save money")), cache_route="intent")
+            await service.chat_completion(self._request(("user", "Walk more")), cache_route="intent")
+            assert provider.chat_completion.call_count == 2
+            
+            await service.chat_completion(greedy, cache=False)
+            sampled = self._request(("user", "I need to save money"), temperature=0.7)
+            await service.chat_completion(sampled)
+            await service.chat_completion(sampled)
+            assert provider.chat_completion.call_count == 5
+            
+            await service.chat_completion(sampled, cache=True, cache_route="canned")
+            await service.chat_completion(sampled, cache=True, cache_route="canned")
+            assert provider.chat_completion.call_count == 6
+        
+        routes = service.get_response_cache_stats()["routes"]
+        assert routes["intent"] == {
+            "exact_hits": 1, "semantic_hits": 1, "misses": 2, "saved_tokens": 240, "hit_rate": 0.5
+        }
+        assert routes["canned"]["exact_hits"] == 1
+        assert "default" not in routes
+
+
 if __name__ == "__main__":
-    pytest.main([__file__])
\ No newline at end of file
+    pytest.main([__file__])